@@ -1,10 +1,56 @@
 # app/api/dependencies.py
-from typing import Generator
-from app.db.base import SessionLocal
+import time
+from typing import AsyncGenerator, Generator
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from app.core.metrics import POOL_ESPERA_SEGUNDOS, POOL_TIMEOUTS
+from app.core.security import TokenInvalido, decodificar_token
+from app.db import base as db_base
+from app.schemas.user import UsuarioToken
 
 def get_db() -> Generator:
-    db = SessionLocal()
+    db = db_base.SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def _sesion(fabrica: async_sessionmaker, pool: str) -> AsyncGenerator[AsyncSession, None]:
+    async with fabrica() as db:
+        # Tomamos la conexión de entrada para medir cuánto se esperó al pool
+        inicio = time.perf_counter()
+        try:
+            await db.connection()
+        except PoolTimeoutError:
+            # Pool agotado: mejor un 503 rápido que apilar requests colgados
+            POOL_TIMEOUTS.labels(pool).inc()
+            raise HTTPException(
+                status_code=503,
+                detail="Base de datos saturada, reintente en unos segundos",
+                headers={"Retry-After": "2"}
+            )
+        POOL_ESPERA_SEGUNDOS.labels(pool).observe(time.perf_counter() - inicio)
+        yield db
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async for db in _sesion(db_base.AsyncSessionLocal, "primario"):
+        yield db
+
+async def get_async_read_db() -> AsyncGenerator[AsyncSession, None]:
+    """Solo lectura: va a la réplica si DATABASE_READ_URL está definida (puede ir unos ms atrasada)."""
+    async for db in _sesion(db_base.AsyncReadSessionLocal, "lectura"):
+        yield db
+
+_bearer = HTTPBearer(auto_error=False)
+
+def get_usuario_actual(credenciales: HTTPAuthorizationCredentials | None = Depends(_bearer)) -> UsuarioToken:
+    """Autenticación por request: valida el JWT (con caché de claims) sin consultar la tabla usuarios."""
+    if credenciales is None:
+        raise HTTPException(status_code=401, detail="Falta el token", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        claims = decodificar_token(credenciales.credentials)
+    except TokenInvalido:
+        raise HTTPException(status_code=401, detail="Token inválido o vencido", headers={"WWW-Authenticate": "Bearer"})
+    return UsuarioToken(id=claims["sub"], username=claims.get("username", ""))
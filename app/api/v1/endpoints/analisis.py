@@ -1,199 +1,398 @@
-import json, re
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session, joinedload
-from datetime import datetime
+import asyncio
+import base64
+import json
+import uuid
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only, selectinload
 
-from app.api.dependencies import get_db
-from app.db.base import Base, engine # Solo para el reset-db
+from app.api.dependencies import get_async_db, get_async_read_db
+from app.config.settings import settings
+from app.core.metrics import etapa
+from app.db import base as db_base
+from app.db.base import Base
+from app.db.esquema import sincronizar_esquema
 from app.models.analisis import (
     Analisis, SnapshotRecibido, EstadoAnalisis, 
-    ResultadoAnalisis, ObservacionGenerada, 
-    DatoProyecto, DatoEtapa, DatoAvance, DatoSeguridad,
-    InvocacionLLM, PromptGenerado, RespuestaLLM
+    ResultadoAnalisis, InvocacionLLM, LoteAnalisis, PromptGenerado, DatoEtapa
 )
-from app.schemas.snapshot import SnapshotCreate
-from app.services.llm_client import LLMClient
-from app.services.prompt_builder import PromptBuilder
-from app.services.webhook_client import WebhookClient
+from app.schemas.analisis import (
+    AnalisisResumen, PaginaAnalisis, AnalisisDetalle, DatosObraOut,
+    ProyectoOut, AvanceOut, SeguridadOut, InvocacionOut, PromptOut, ResultadoOut, EstadisticasOut
+)
+from app.schemas.snapshot import SnapshotCreate, LoteCreate
+from app.services.analisis_service import AnalisisService, consulta_listado
+from app.services.analisis_worker import contar_pendientes
+from app.services import archivo_auditoria, estadisticas_diarias
+from app.services.estadisticas_modelos import estadisticas_modelos
+from app.services.llm_cache import llm_cache
+from app.services.procesador_analisis import ProcesadorAnalisis
+from app.services.webhook_dispatcher import contar_por_estado
 import logging # Usamos el logging estándar configurado en core
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-@router.post("/iniciar", tags=["Procesamiento"])
-async def iniciar_analisis(snapshot_in: SnapshotCreate, db: Session = Depends(get_db)):
-    """Inicia el proceso de persistencia de datos y análisis con IA."""
-    logger.info(f"📥 Recibida solicitud para proyecto: {snapshot_in.proyecto_codigo}")
+@router.post("/iniciar", status_code=status.HTTP_202_ACCEPTED, tags=["Procesamiento"])
+async def iniciar_analisis(snapshot_in: SnapshotCreate, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    Persiste el snapshot y encola el análisis con IA.
+    Responde 202 al instante; el resultado se consulta en /detalle/{id}.
+    """
+    logger.info("📥 Recibida solicitud para proyecto: %s", snapshot_in.proyecto_codigo,
+                extra={"proyecto_codigo": snapshot_in.proyecto_codigo})
+
+    # Backpressure: si la cola está llena pedimos al cliente que reintente más tarde
+    if await contar_pendientes(db) >= settings.ANALISIS_COLA_MAXIMA:
+        logger.warning("🚦 Cola de análisis llena, rechazando solicitud")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Cola de análisis llena, reintente más tarde",
+            headers={"Retry-After": str(int(settings.ANALISIS_POLL_SEGUNDOS * 5))}
+        )
     
-    nuevo_analisis = Analisis(
-        proyecto_codigo=snapshot_in.proyecto_codigo, 
-        estado=EstadoAnalisis.PROCESANDO
-    )
-    db.add(nuevo_analisis)
-    db.flush() 
+    try:
+        # 1. PERSISTENCIA DE DATOS ESTRUCTURADOS (inserciones en bloque)
+        with etapa("persistencia", proyecto=snapshot_in.proyecto_codigo):
+            nuevo_analisis = await AnalisisService(db).crear_analisis(snapshot_in)
+            await db.commit()
+        logger.info("💾 Datos guardados. Análisis %s encolado", nuevo_analisis.id,
+                    extra={"analisis_id": str(nuevo_analisis.id), "proyecto_codigo": snapshot_in.proyecto_codigo})
+
+    except Exception as e:
+        await db.rollback()
+        logger.error("❌ Error: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
 
+    # 2. El procesamiento con IA lo hace el worker pool; despertamos a los locales
+    worker = getattr(request.app.state, "analisis_worker", None)
+    if worker:
+        worker.despertar()
+
+    return {
+        "analisis_id": nuevo_analisis.id,
+        "estado": EstadoAnalisis.PENDIENTE,
+        "detalle_url": f"{settings.API_V1_STR}/analisis/detalle/{nuevo_analisis.id}"
+    }
+
+@router.post("/iniciar/stream", tags=["Procesamiento"])
+async def iniciar_analisis_stream(snapshot_in: SnapshotCreate, db: AsyncSession = Depends(get_async_db)):
+    """
+    Persiste el snapshot y ejecuta el análisis en streaming (Server-Sent Events).
+    Emite `inicio`, un `riesgo` por cada riesgo apenas el modelo lo termina de
+    generar, y al final `resultado` (objeto completo) o `error`.
+    """
+    logger.info("📥 Recibida solicitud en streaming para proyecto: %s", snapshot_in.proyecto_codigo)
     try:
-        # 1. PERSISTENCIA DE DATOS ESTRUCTURADOS
-        nuevo_snapshot = SnapshotRecibido(
-            analisis_id=nuevo_analisis.id,
-            payload_completo=json.dumps(snapshot_in.datos)
-        )
-        db.add(nuevo_snapshot)
-        db.flush() 
-
-        datos_json = snapshot_in.datos
-        
-        # Mapeos de Snapshot (Proyecto, Etapas, Avances, Seguridad)
-        db.add(DatoProyecto(
-            snapshot_id=nuevo_snapshot.id,
-            codigo=datos_json.get("proyecto", {}).get("codigo"),
-            nombre=datos_json.get("proyecto", {}).get("nombre"),
-            responsable_tecnico=datos_json.get("proyecto", {}).get("responsable_tecnico")
-        ))
-
-        for etapa in datos_json.get("etapas", []):
-            if isinstance(etapa, dict):
-                db.add(DatoEtapa(
-                    snapshot_id=nuevo_snapshot.id,
-                    nombre=etapa.get("nombre"),
-                    estado=etapa.get("estado"),
-                    avance_estimado=etapa.get("avance_estimado")
-                ))
-
-        for avance in datos_json.get("registros_avance", []):
-            if isinstance(avance, dict):
-                fecha_obj = None
-                try: fecha_obj = datetime.strptime(avance.get("fecha"), "%Y-%m-%d").date()
-                except: pass
-                db.add(DatoAvance(
-                    snapshot_id=nuevo_snapshot.id,
-                    fecha_registro=fecha_obj,
-                    supervisor=avance.get("supervisor"),
-                    porcentaje_avance=avance.get("porcentaje_avance"),
-                    presenta_desvios=avance.get("presenta_desvios", False),
-                    tareas_ejecutadas=avance.get("tareas_ejecutadas", []),
-                    oficios_activos=avance.get("oficios_activos", [])
-                ))
-
-        lista_seguridad = datos_json.get("medidas_seguridad", [])
-        if lista_seguridad:
-            total = len(lista_seguridad)
-            cumple = sum(1 for m in lista_seguridad if isinstance(m, dict) and m.get("cumple") is True)
-            db.add(DatoSeguridad(
-                snapshot_id=nuevo_snapshot.id,
-                fecha_registro=datetime.now().date(),
-                medidas_implementadas=lista_seguridad,
-                total_medidas_chequeadas=total,
-                cumple_todas=(total == cumple)
-            ))
-
-        db.commit()
-        logger.info(f"💾 Datos guardados exitosamente")
-
-        # 2. PROCESAMIENTO CON IA Y AUDITORÍA
-        prompt_builder = PromptBuilder()
-        system_p, user_p = prompt_builder.construir_instrucciones(snapshot_in.model_dump())
-        
-        invocacion = InvocacionLLM(
-            analisis_id=nuevo_analisis.id,
-            modelo_usado="gpt-4o-mini",
-            invocado_at=datetime.utcnow()
-        )
-        db.add(invocacion)
-        db.flush()
-
-        db.add(PromptGenerado(invocacion_id=invocacion.id, system_prompt=system_p, user_prompt=user_p))
-
-        llm_client = LLMClient()
-        start_time = datetime.utcnow()
-        respuesta_raw = await llm_client.enviar_prompt(system_p, user_p)
-        end_time = datetime.utcnow()
-
-        invocacion.duracion_ms = int((end_time - start_time).total_seconds() * 1000)
-        
-        if "choices" not in respuesta_raw:
-             invocacion.exitosa = False
-             invocacion.error_detalle = str(respuesta_raw)
-             db.commit()
-             raise Exception("Fallo en respuesta de IA")
-
-        string_contenido = respuesta_raw['choices'][0]['message']['content']
-        invocacion.tokens_prompt = respuesta_raw.get("usage", {}).get("prompt_tokens")
-        invocacion.tokens_respuesta = respuesta_raw.get("usage", {}).get("completion_tokens")
-
-        contenido_ia = {}
-        try:
-            contenido_ia = json.loads(string_contenido)
-        except:
-            match = re.search(r"(\{.*\})", string_contenido, re.DOTALL)
-            if match: contenido_ia = json.loads(match.group(1))
-
-        db.add(RespuestaLLM(invocacion_id=invocacion.id, respuesta_raw=string_contenido, respuesta_parseada=contenido_ia))
-
-        # 3. RESULTADOS DE NEGOCIO
-        resultado = ResultadoAnalisis(
-            analisis_id=nuevo_analisis.id,
-            resumen_general=contenido_ia.get('resumen'),
-            score_coherencia=contenido_ia.get('score_coherencia'),
-            detecta_riesgos=len(contenido_ia.get('riesgos', [])) > 0
-        )
-        db.add(resultado)
-        db.flush()
+        with etapa("persistencia", proyecto=snapshot_in.proyecto_codigo):
+            nuevo_analisis = await AnalisisService(db).crear_analisis(snapshot_in, estado=EstadoAnalisis.PROCESANDO)
+            nuevo_analisis.procesando_desde = datetime.utcnow()
+            await db.commit()
+    except Exception as e:
+        await db.rollback()
+        logger.error("❌ Error: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    analisis_id = nuevo_analisis.id
+
+    def evento_sse(nombre: str, datos) -> str:
+        return f"event: {nombre}\ndata: {json.dumps(datos, default=str, ensure_ascii=False)}\n\n"
 
-        for riesgo in contenido_ia.get('riesgos', []):
-            db.add(ObservacionGenerada(
-                resultado_id=resultado.id,
-                titulo=riesgo.get('titulo'),
-                descripcion=riesgo.get('descripcion'),
-                nivel=riesgo.get('nivel')
-            ))
+    async def eventos():
+        yield evento_sse("inicio", {"analisis_id": analisis_id})
+        # Sesión propia: la del request puede cerrarse antes de que termine el stream
+        async with db_base.AsyncSessionLocal() as db_stream:
+            analisis = (await db_stream.execute(
+                select(Analisis).options(selectinload(Analisis.snapshot)).where(Analisis.id == analisis_id)
+            )).scalars().one()
+            async for nombre, datos in ProcesadorAnalisis(db_stream).procesar_stream(analisis):
+                yield evento_sse(nombre, datos)
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-        nuevo_analisis.estado = EstadoAnalisis.COMPLETADO
-        db.commit()
-        
-        webhook = WebhookClient()
-        await webhook.notificar_finalizacion(nuevo_analisis.id, nuevo_analisis.proyecto_codigo, nuevo_analisis.estado)
+@router.post("/lote", status_code=status.HTTP_202_ACCEPTED, tags=["Procesamiento"])
+async def iniciar_lote(lote_in: LoteCreate, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    Persiste muchos snapshots en una sola transacción y los encola como un lote.
+    Los workers procesan como máximo `max_concurrencia` análisis del lote a la vez.
+    """
+    total = len(lote_in.snapshots)
+    if total == 0 or total > settings.LOTE_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"El lote debe tener entre 1 y {settings.LOTE_MAX_ITEMS} snapshots"
+        )
+    logger.info("📥 Recibido lote de %s snapshots", total)
 
-        return {"analisis_id": nuevo_analisis.id, "resultado": contenido_ia}
+    if await contar_pendientes(db) + total > settings.ANALISIS_COLA_MAXIMA:
+        logger.warning("🚦 Cola de análisis sin lugar para el lote, rechazando solicitud")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Cola de análisis llena, reintente más tarde",
+            headers={"Retry-After": str(int(settings.ANALISIS_POLL_SEGUNDOS * 5))}
+        )
 
+    try:
+        with etapa("persistencia_lote", items=total):
+            lote, ids_analisis = await AnalisisService(db).crear_lote(lote_in)
+            await db.commit()
+        logger.info("💾 Lote %s guardado con %s análisis encolados", lote.id, total)
     except Exception as e:
-        db.rollback() 
-        nuevo_analisis.estado = EstadoAnalisis.ERROR
-        db.commit()
-        logger.error(f"❌ Error: {str(e)}")
+        await db.rollback()
+        logger.error("❌ Error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/detalle/{analisis_id}", tags=["Consultas"])
-async def obtener_analisis_completo(analisis_id: str, db: Session = Depends(get_db)):
-    """Obtiene la radiografía completa de un análisis y su auditoría."""
-    analisis = db.query(Analisis).options(
-        joinedload(Analisis.snapshot).joinedload(SnapshotRecibido.proyecto),
-        joinedload(Analisis.snapshot).joinedload(SnapshotRecibido.etapas),
-        joinedload(Analisis.resultado).joinedload(ResultadoAnalisis.observaciones),
-        joinedload(Analisis.invocaciones).joinedload(InvocacionLLM.respuesta)
-    ).filter(Analisis.id == analisis_id).first()
-
-    if not analisis:
+    worker = getattr(request.app.state, "analisis_worker", None)
+    if worker:
+        worker.despertar()
+
+    return {
+        "lote_id": lote.id,
+        "total": total,
+        "max_concurrencia": lote.max_concurrencia,
+        "analisis_ids": ids_analisis,
+        "estado_url": f"{settings.API_V1_STR}/analisis/lote/{lote.id}"
+    }
+
+def _codificar_cursor(fecha: datetime, analisis_id: uuid.UUID) -> str:
+    return base64.urlsafe_b64encode(f"{fecha.isoformat()}|{analisis_id}".encode()).decode()
+
+def _decodificar_cursor(cursor: str) -> tuple:
+    try:
+        fecha, analisis_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(fecha), uuid.UUID(analisis_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+@router.get("", response_model=PaginaAnalisis, tags=["Consultas"])
+async def listar_analisis(
+    proyecto_codigo: Optional[str] = None,
+    estado: Optional[EstadoAnalisis] = None,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    detecta_riesgos: Optional[bool] = None,
+    nivel: Optional[str] = Query(None, description="Solo análisis con alguna observación de este nivel (ej: CRITICO)"),
+    cursor: Optional[str] = None,
+    limite: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Lista análisis del más reciente al más antiguo con paginación por keyset
+    sobre (fecha_solicitud, id): cada página cuesta lo mismo sin importar la
+    profundidad. Para seguir, pasar `siguiente_cursor` como `cursor`.
+    """
+    consulta = consulta_listado(
+        proyecto_codigo=proyecto_codigo,
+        estado=estado,
+        desde=datetime.combine(desde, time.min) if desde else None,
+        hasta=datetime.combine(hasta, time.max) if hasta else None,
+        detecta_riesgos=detecta_riesgos,
+        nivel=nivel,
+        despues_de=_decodificar_cursor(cursor) if cursor else None
+    )
+
+    # Pedimos una fila de más para saber si hay página siguiente sin un COUNT
+    filas = (await db.execute(consulta.limit(limite + 1))).all()
+
+    siguiente_cursor = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente_cursor = _codificar_cursor(filas[-1].fecha_solicitud, filas[-1].id)
+
+    return PaginaAnalisis(
+        items=[AnalisisResumen.model_validate(fila) for fila in filas],
+        siguiente_cursor=siguiente_cursor
+    )
+
+@router.get("/lote/{lote_id}", tags=["Consultas"])
+async def estado_lote(lote_id: uuid.UUID, db: AsyncSession = Depends(get_async_read_db)):
+    """Progreso agregado de un lote: conteo por estado y porcentaje terminado."""
+    lote = await db.get(LoteAnalisis, lote_id)
+    if not lote:
         raise HTTPException(status_code=404, detail="No encontrado")
 
+    filas = (await db.execute(
+        select(Analisis.estado, func.count(Analisis.id))
+        .where(Analisis.lote_id == lote_id)
+        .group_by(Analisis.estado)
+    )).all()
+    por_estado = {estado.value: 0 for estado in EstadoAnalisis}
+    por_estado.update({estado.value: cantidad for estado, cantidad in filas})
+
+    terminados = por_estado[EstadoAnalisis.COMPLETADO.value] + por_estado[EstadoAnalisis.ERROR.value]
     return {
-        "id": analisis.id,
-        "estado": analisis.estado,
-        "datos_obra": {
-            "proyecto": analisis.snapshot.proyecto[0] if analisis.snapshot and analisis.snapshot.proyecto else None,
-            "etapas": len(analisis.snapshot.etapas) if analisis.snapshot else 0
-        },
-        "auditoria": [
-            {"modelo": i.modelo_usado, "tokens": (i.tokens_prompt or 0) + (i.tokens_respuesta or 0)} 
-            for i in analisis.invocaciones
-        ],
-        "resultado": analisis.resultado
+        "lote_id": lote.id,
+        "creado_at": lote.creado_at,
+        "total": lote.total_items,
+        "por_estado": por_estado,
+        "progreso_pct": round(100 * terminados / lote.total_items, 1) if lote.total_items else 100.0,
+        "finalizado": terminados == lote.total_items
     }
 
+@router.get("/estadisticas", response_model=EstadisticasOut, response_model_exclude_none=True, tags=["Consultas"])
+async def estadisticas(
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    proyecto_codigo: Optional[str] = None,
+    modelo: Optional[str] = None,
+    agrupar_por: str = Query("dia", description="Dimensiones separadas por coma: proyecto, dia, modelo"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Invocaciones, tokens, latencia, score y riesgos por día UTC, leídos solo de
+    los rollups de estadistica_diaria: el costo depende del rango pedido, no
+    del volumen de la auditoría.
+    """
+    dimensiones = [parte.strip() for parte in agrupar_por.split(",") if parte.strip()]
+    desconocidas = set(dimensiones) - set(estadisticas_diarias.AGRUPACIONES)
+    if desconocidas:
+        raise HTTPException(status_code=400, detail=f"agrupar_por no soportado: {', '.join(sorted(desconocidas))}")
+    # Orden canónico y sin repetidos, sea cual sea el del parámetro
+    dimensiones = tuple(d for d in estadisticas_diarias.AGRUPACIONES if d in dimensiones)
+
+    hasta = hasta or datetime.utcnow().date()
+    desde = desde or hasta - timedelta(days=settings.ESTADISTICAS_DIAS_POR_DEFECTO - 1)
+    if desde > hasta:
+        raise HTTPException(status_code=400, detail="desde es posterior a hasta")
+    if (hasta - desde).days + 1 > settings.ESTADISTICAS_MAX_DIAS:
+        raise HTTPException(status_code=400, detail=f"El rango supera {settings.ESTADISTICAS_MAX_DIAS} días")
+
+    filas = await estadisticas_diarias.consultar(db, desde, hasta, dimensiones, proyecto_codigo, modelo)
+    return EstadisticasOut(desde=desde, hasta=hasta, agrupar_por=list(dimensiones), filas=filas)
+
+INCLUDES_DETALLE = {"avances", "seguridad", "prompts"}
+
+@router.get("/detalle/{analisis_id}", response_model=AnalisisDetalle, response_model_exclude_unset=True, tags=["Consultas"])
+async def obtener_analisis_completo(
+    analisis_id: uuid.UUID,
+    include: Optional[str] = Query(None, description="Expansiones separadas por coma: avances, seguridad, prompts"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Obtiene la radiografía completa de un análisis y su auditoría."""
+    expansiones = {parte.strip() for parte in include.split(",") if parte.strip()} if include else set()
+    desconocidas = expansiones - INCLUDES_DETALLE
+    if desconocidas:
+        raise HTTPException(status_code=400, detail=f"include no soportado: {', '.join(sorted(desconocidas))}")
+
+    # Una consulta por colección (selectinload) en lugar de un JOIN que multiplica
+    # etapas x observaciones x invocaciones; de las etapas solo se cuenta. Los textos grandes (payload, respuesta
+    # cruda, prompts) no se traen salvo que se pidan.
+    cantidad_etapas = (
+        select(func.count(DatoEtapa.id))
+        .join(SnapshotRecibido, DatoEtapa.snapshot_id == SnapshotRecibido.id)
+        .where(SnapshotRecibido.analisis_id == Analisis.id)
+        .scalar_subquery()
+    )
+    opciones = [
+        load_only(
+            Analisis.id, Analisis.proyecto_codigo, Analisis.fecha_solicitud, Analisis.estado,
+            Analisis.modo, Analisis.analisis_base_id
+        ),
+        selectinload(Analisis.snapshot).load_only(SnapshotRecibido.id),
+        selectinload(Analisis.snapshot).selectinload(SnapshotRecibido.proyecto),
+        selectinload(Analisis.resultado).selectinload(ResultadoAnalisis.observaciones),
+        selectinload(Analisis.invocaciones).load_only(
+            InvocacionLLM.modelo_usado, InvocacionLLM.tokens_prompt, InvocacionLLM.tokens_prompt_estimados,
+            InvocacionLLM.tokens_respuesta,
+            InvocacionLLM.exitosa, InvocacionLLM.desde_cache, InvocacionLLM.duracion_ms, InvocacionLLM.espera_cola_ms,
+            InvocacionLLM.invocado_at
+        )
+    ]
+    if "avances" in expansiones:
+        opciones.append(selectinload(Analisis.snapshot).selectinload(SnapshotRecibido.avances))
+    if "seguridad" in expansiones:
+        opciones.append(selectinload(Analisis.snapshot).selectinload(SnapshotRecibido.seguridad))
+    if "prompts" in expansiones:
+        opciones.append(
+            selectinload(Analisis.invocaciones).selectinload(InvocacionLLM.prompts)
+            .load_only(PromptGenerado.system_prompt, PromptGenerado.user_prompt)
+        )
+
+    fila = (await db.execute(
+        select(Analisis, cantidad_etapas).options(*opciones).where(Analisis.id == analisis_id)
+    )).first()
+
+    if not fila:
+        raise HTTPException(status_code=404, detail="No encontrado")
+    analisis, etapas = fila
+    snapshot = analisis.snapshot
+
+    datos_obra = DatosObraOut(
+        proyecto=ProyectoOut.model_validate(snapshot.proyecto[0]) if snapshot and snapshot.proyecto else None,
+        etapas=etapas or 0
+    )
+    if "avances" in expansiones:
+        datos_obra.avances = [AvanceOut.model_validate(a) for a in snapshot.avances] if snapshot else []
+    if "seguridad" in expansiones:
+        datos_obra.seguridad = [SeguridadOut.model_validate(s) for s in snapshot.seguridad] if snapshot else []
+
+    # Prompts de meses ya archivados: se leen del NDJSON.gz, solo el bloque de cada invocación
+    archivados = {}
+    if "prompts" in expansiones and settings.AUDITORIA_RETENCION_MESES > 0:
+        faltantes = [(i.id, i.invocado_at) for i in analisis.invocaciones if i.prompts is None]
+        if faltantes:
+            archivados = await asyncio.to_thread(archivo_auditoria.leer_archivadas, "prompt_generado", faltantes)
+
+    auditoria = []
+    for i in analisis.invocaciones:
+        invocacion = InvocacionOut(
+            modelo=i.modelo_usado,
+            tokens=(i.tokens_prompt or 0) + (i.tokens_respuesta or 0),
+            tokens_prompt=i.tokens_prompt,
+            tokens_prompt_estimados=i.tokens_prompt_estimados,
+            exitosa=i.exitosa,
+            desde_cache=i.desde_cache,
+            duracion_ms=i.duracion_ms,
+            espera_cola_ms=i.espera_cola_ms,
+            invocado_at=i.invocado_at
+        )
+        if "prompts" in expansiones:
+            if i.prompts:
+                invocacion.prompt = PromptOut.model_validate(i.prompts)
+            else:
+                archivado = archivados.get(str(i.id))
+                invocacion.prompt = PromptOut.model_validate(archivado) if archivado else None
+        auditoria.append(invocacion)
+
+    return AnalisisDetalle(
+        id=analisis.id,
+        proyecto_codigo=analisis.proyecto_codigo,
+        fecha_solicitud=analisis.fecha_solicitud,
+        estado=analisis.estado,
+        modo=analisis.modo,
+        analisis_base_id=analisis.analisis_base_id,
+        datos_obra=datos_obra,
+        auditoria=auditoria,
+        resultado=ResultadoOut.model_validate(analisis.resultado) if analisis.resultado else None
+    )
+
+@router.get("/cache", tags=["Mantenimiento"])
+async def estadisticas_cache():
+    """Aciertos/fallos de la caché de respuestas LLM y ahorro estimado (por réplica)."""
+    return llm_cache.estadisticas()
+
+@router.get("/modelos", tags=["Mantenimiento"])
+async def estado_modelos():
+    """Latencia EWMA, tasa de error y estado del circuit breaker de cada modelo (por réplica)."""
+    return estadisticas_modelos.resumen()
+
+@router.get("/webhooks", tags=["Mantenimiento"])
+async def estado_webhooks(db: AsyncSession = Depends(get_async_read_db)):
+    """Notificaciones del outbox por estado (MUERTO = agotó los reintentos)."""
+    return await contar_por_estado(db)
+
 @router.post("/reset-db", tags=["Mantenimiento"])
 def reset_database():
     """Limpia y recrea la base de datos."""
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.drop_all(bind=db_base.engine) # engine síncrono: solo para el reset-db
+    with db_base.engine.begin() as conexion:
+        sincronizar_esquema(conexion) # create_all + particiones de la auditoría en Postgres
     return {"mensaje": "Base de datos reseteada"}
\ No newline at end of file
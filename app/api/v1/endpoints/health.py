@@ -1,19 +1,23 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 from datetime import datetime
 import logging
 
-from app.api.dependencies import get_db
+from app.api.dependencies import get_async_read_db
 from app.config.settings import settings
+from app.db import base as db_base
+from app.db.base import estadisticas_pool
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 @router.get("/health", tags=["Mantenimiento"])
-async def health_check(db: Session = Depends(get_db)):
+async def health_check(db: AsyncSession = Depends(get_async_read_db)):
     """
     Diagnóstico Profesional: Verifica el estado de la API y de la Base de Datos.
+    Con réplica configurada la consulta va a la réplica; `pools` muestra el
+    uso de cada pool de conexiones de este proceso.
     """
     health_status = {
         "status": "healthy",
@@ -23,16 +27,19 @@ async def health_check(db: Session = Depends(get_db)):
         "components": {
             "api": "up",
             "database": "unknown"
-        }
+        },
+        "pools": {"primario": estadisticas_pool(db_base.async_engine)}
     }
+    if db_base.async_read_engine is not db_base.async_engine:
+        health_status["pools"]["lectura"] = estadisticas_pool(db_base.async_read_engine)
 
     try:
         # Ejecutamos una consulta mínima para validar la conexión real a Postgres
-        db.execute(text("SELECT 1"))
+        await db.execute(text("SELECT 1"))
         health_status["components"]["database"] = "up"
     except Exception as e:
         # Si la DB falla, el estado general de la API pasa a 'unhealthy'
-        logger.error(f"Error en Health Check de Base de Datos: {str(e)}")
+        logger.error("Error en Health Check de Base de Datos: %s", e)
         health_status["components"]["database"] = "down"
         health_status["status"] = "unhealthy"
 
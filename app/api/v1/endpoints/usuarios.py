@@ -1,28 +1,66 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.api.dependencies import get_db # Inyección centralizada
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api.dependencies import get_async_db, get_usuario_actual # Inyección centralizada
+from app.config.settings import settings
 from app.models.analisis import User
-from app.schemas.user import UserCreate, UserOut
-from app.core.security import get_password_hash
+from app.schemas.user import LoginIn, Token, UserCreate, UserOut, UsuarioToken
+from app.core.security import AuthSaturada, crear_token_acceso, hashear_password, verificar_password
 
 router = APIRouter()
 
+def _saturada() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Autenticación saturada, reintente en unos segundos",
+        headers={"Retry-After": "1"}
+    )
+
 @router.post("/register", response_model=UserOut, tags=["Usuarios"])
-def registrar_usuario(user_in: UserCreate, db: Session = Depends(get_db)):
-    # 1. Verificar si ya existe
-    user_db = db.query(User).filter(User.email == user_in.email).first()
-    if user_db:
-        raise HTTPException(status_code=400, detail="El email ya está registrado")
-    
-    # 2. Hashear password y crear objeto
-    hashed_pw = get_password_hash(user_in.password)
+async def registrar_usuario(user_in: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    # 1. Hashear password (pool de procesos, fuera del event loop) y crear objeto
+    try:
+        hashed_pw = await hashear_password(user_in.password)
+    except AuthSaturada:
+        raise _saturada()
     nuevo_usuario = User(
         username=user_in.username,
         email=user_in.email,
         hashed_password=hashed_pw
     )
-    
+
+    # 2. Los índices únicos de email/username deciden si ya existe (sin consulta previa ni carrera)
     db.add(nuevo_usuario)
-    db.commit()
-    db.refresh(nuevo_usuario)
-    return nuevo_usuario
\ No newline at end of file
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="El email o el nombre de usuario ya está registrado")
+    return nuevo_usuario
+
+@router.post("/login", response_model=Token, tags=["Usuarios"])
+async def login(credenciales: LoginIn, db: AsyncSession = Depends(get_async_db)):
+    """Emite un JWT; los requests siguientes se autentican con él sin volver a la base."""
+    if not settings.SECRET_KEY:
+        raise HTTPException(status_code=503, detail="Autenticación no configurada (SECRET_KEY)")
+
+    fila = (await db.execute(
+        select(User.id, User.username, User.hashed_password, User.is_active).where(User.email == credenciales.email)
+    )).first()
+    # Liberamos la conexión antes del bcrypt: no hace falta retenerla esos ~200 ms
+    await db.close()
+
+    try:
+        valido = await verificar_password(credenciales.password, fila.hashed_password if fila else None)
+    except AuthSaturada:
+        raise _saturada()
+    if not valido or not fila.is_active:
+        raise HTTPException(status_code=401, detail="Credenciales inválidas", headers={"WWW-Authenticate": "Bearer"})
+
+    token, expira_en = crear_token_acceso(fila.id, fila.username)
+    return Token(access_token=token, expires_in=expira_en)
+
+@router.get("/me", response_model=UsuarioToken, tags=["Usuarios"])
+async def usuario_actual(usuario: UsuarioToken = Depends(get_usuario_actual)):
+    return usuario
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import List
+from typing import List, Optional
 import logging
 
 class Settings(BaseSettings):
@@ -11,15 +11,159 @@ class Settings(BaseSettings):
 
     # --- Security & DB ---
     DATABASE_URL: str
+    # Opcional: si no se define se deriva de DATABASE_URL usando el driver asyncpg
+    DATABASE_ASYNC_URL: Optional[str] = None
+    # Réplica de lectura para /detalle, listados y health; si no se define todo va al primario
+    DATABASE_READ_URL: Optional[str] = None
+    DATABASE_READ_ASYNC_URL: Optional[str] = None
+
+    # --- Pool de conexiones (por proceso y por engine: total = procesos x (POOL_SIZE + MAX_OVERFLOW)) ---
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SEGUNDOS: float = 10.0 # Espera máxima por una conexión; luego 503
+    DB_POOL_RECYCLE_SEGUNDOS: int = 1800 # Reabre conexiones viejas (PgBouncer/balanceadores cortan las ociosas)
+    DB_POOL_PRE_PING: bool = True # Descarta conexiones muertas antes de usarlas
+
+    # --- Esquema (se sincroniza en el arranque, no al importar) ---
+    DB_CREAR_ESQUEMA_AL_INICIAR: bool = True # False si el despliegue corre `python -m app.db.esquema` aparte
+    DB_ESPERA_INICIO_SEGUNDOS: float = 30.0 # Reintentos mientras la base no responde al arrancar
+
+    # --- Autenticación (JWT + bcrypt fuera del event loop) ---
+    SECRET_KEY: Optional[str] = None # Firma de los JWT; sin ella /auth/login responde 503
+    ALGORITHM: str = "HS256"
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    AUTH_BCRYPT_PROCESOS: int = 2 # Pool de procesos dedicado: no compite con el threadpool de los endpoints sync
+    AUTH_BCRYPT_MAX_PENDIENTES: int = 32 # Hash/verificaciones en cola o en curso; más allá se responde 503
+    AUTH_CACHE_TOKENS: int = 1024 # LRU de claims ya validados (por proceso)
+
     OPENROUTER_API_KEY: str
     OPENROUTER_BASE_URL: str = "https://openrouter.ai/api/v1"
     
+    # --- Clientes HTTP (un pool compartido por upstream) ---
+    HTTP_MAX_CONEXIONES: int = 100
+    HTTP_MAX_KEEPALIVE: int = 20
+    HTTP_KEEPALIVE_EXPIRY_SEGUNDOS: float = 30.0
+    HTTP2_HABILITADO: bool = True # Requiere el extra httpx[http2]; si falta se usa HTTP/1.1
+    LLM_CONNECT_TIMEOUT_SEGUNDOS: float = 5.0
+    LLM_READ_TIMEOUT_SEGUNDOS: float = 45.0 # Un poco más de tiempo para modelos gratuitos
+    WEBHOOK_CONNECT_TIMEOUT_SEGUNDOS: float = 2.0
+    WEBHOOK_READ_TIMEOUT_SEGUNDOS: float = 5.0
+
+    # --- Webhooks (outbox + despachador en segundo plano) ---
+    WEBHOOK_URL: Optional[str] = None # Backend principal; si no se define no se encolan notificaciones
+    WEBHOOK_SECRET: Optional[str] = None # Si se define, cada envío va firmado (HMAC-SHA256)
+    API_URL_PUBLICA: str = "http://localhost:8000" # Base para el resultado_url que viaja en el webhook
+    WEBHOOK_DESPACHADOR_HABILITADO: bool = True
+    WEBHOOK_LOTE: int = 50 # Notificaciones tomadas por ciclo del despachador
+    WEBHOOK_CONCURRENCIA_POR_HOST: int = 4
+    WEBHOOK_MAX_INTENTOS: int = 8 # Luego pasa a MUERTO (dead letter)
+    WEBHOOK_BACKOFF_BASE_SEGUNDOS: float = 2.0 # Espera = base * 2^intentos (con jitter)
+    WEBHOOK_BACKOFF_MAX_SEGUNDOS: float = 900.0
+    WEBHOOK_POLL_SEGUNDOS: float = 2.0
+
+    # --- Cascada de modelos LLM ---
+    LLM_MODO_CASCADA: str = "hedge" # "secuencial", "hedge" o "carrera"
+    LLM_HEDGE_RETRASO_SEGUNDOS: float = 8.0 # Latencia tras la cual se suma el siguiente modelo
+    LLM_MAX_PARALELO: int = 2 # Modelos corriendo a la vez como máximo (hedge/carrera)
+    LLM_PAUSA_FALLBACK_SEGUNDOS: float = 0.5 # Solo en modo secuencial, entre modelos
+    LLM_EWMA_ALFA: float = 0.3 # Peso de la última muestra en latencia/tasa de error
+    LLM_CIRCUITO_FALLOS: int = 3 # Fallos consecutivos que abren el circuito de un modelo
+    LLM_CIRCUITO_ENFRIAMIENTO_SEGUNDOS: int = 60
+
+    # --- Limitador de OpenRouter (cubetas por modelo + tope de solicitudes en vuelo) ---
+    LLM_LIMITADOR_HABILITADO: bool = True
+    LLM_LIMITADOR_COORDINACION: str = "db" # "db" (tabla compartida entre procesos) o "memoria" (por proceso)
+    LLM_SOLICITUDES_POR_MINUTO: int = 20 # Límite de los modelos :free de OpenRouter
+    LLM_TOKENS_POR_MINUTO: int = 100_000 # 0 = sin límite de tokens
+    LLM_LIMITES_POR_MODELO: dict = {} # Excepciones, ej: {"openrouter/free": {"rpm": 10, "tpm": 50000}}
+    LLM_MAX_EN_VUELO_POR_PROCESO: int = 8 # Solicitudes simultáneas a OpenRouter por proceso (total = procesos x este valor)
+    LLM_ESPERA_MAXIMA_SEGUNDOS: float = 60.0 # Si el cupo de un modelo tarda más, se pasa al siguiente
+    LLM_TOKENS_RESPUESTA_ESTIMADOS: int = 800 # Se suman al prompt al reservar; luego se corrige con el uso real
+
+    # --- Salida estructurada del LLM ---
+    # Modelos a los que se pide response_format json_schema (OpenRouter lo ignora si el proveedor no lo soporta).
+    # "openrouter/free" enruta a cualquier modelo: queda afuera y depende del parser + reparación.
+    LLM_MODELOS_JSON_SCHEMA: List[str] = [
+        "google/gemma-3-27b-it:free",
+        "meta-llama/llama-3.3-70b-instruct:free",
+        "mistralai/mistral-small-3.1-24b-instruct:free"
+    ]
+    LLM_REPARACION_HABILITADA: bool = True # Un único re-pedido barato (sin el snapshot) si la respuesta no valida
+    LLM_REPARACION_MAX_CARACTERES: int = 12000 # De la respuesta inválida que se reenvía para corregir
+
+    # --- Caché de respuestas LLM (memoria + tablas de auditoría) ---
+    LLM_CACHE_HABILITADO: bool = True
+    LLM_CACHE_TTL_SEGUNDOS: int = 86400 # 24 h: pasado esto se vuelve a consultar al modelo
+    LLM_CACHE_MAX_ENTRADAS: int = 1000
+    LLM_CACHE_MAX_BYTES: int = 50_000_000 # Tope de memoria aproximado del nivel en proceso
+
+    # --- Compactación del prompt ---
+    PROMPT_COMPACTACION_HABILITADA: bool = True # False = volcado crudo del snapshot (comportamiento anterior)
+    PROMPT_FORMATO: str = "json" # "json" (JSON compacto) o "tabla" (filas separadas por |)
+    PROMPT_PRESUPUESTO_TOKENS: int = 6000 # Tokens para los datos del snapshot
+    PROMPT_PRESUPUESTO_POR_MODELO: dict = {} # Excepciones por modelo, ej: {"openrouter/free": 3000}
+    PROMPT_MAX_AVANCES_DETALLE: int = 30 # Últimos registros de avance que se envían completos
+
+    # --- Análisis incremental (delta contra el último snapshot del proyecto) ---
+    ANALISIS_INCREMENTAL_HABILITADO: bool = True
+    ANALISIS_INCREMENTAL_IGNORAR: List[str] = [] # Claves de primer nivel que no cuentan como cambio (ej: timestamps)
+
+    # --- Pre-análisis local (reglas vectorizadas, sin LLM) ---
+    REGLAS_MODO: str = "rapido" # "apagado", "senales" (solo alimentan el prompt) o "rapido" (sin LLM si no hay ambigüedad)
+    REGLAS_MIN_AVANCES: int = 5 # Con menos registros de avance decide el LLM
+    REGLAS_VENTANA_DESVIOS: int = 30 # Últimos registros donde se miden los desvíos recientes
+    REGLAS_DESVIOS_RATIO_CRITICO: float = 0.3 # Fracción de la ventana con desvíos que pasa a CRITICO
+    REGLAS_ESTANCAMIENTO_REGISTROS: int = 10 # Registros finales sin cambio de avance (el doble = CRITICO)
+    REGLAS_SEGURIDAD_RATIO_CRITICO: float = 0.8 # Cumplimiento de medidas por debajo del cual es CRITICO
+    REGLAS_ETAPA_ATRASO_PP: float = 25.0 # Puntos de avance bajo lo esperado por calendario (el doble = CRITICO)
+    REGLAS_MARGEN_AMBIGUEDAD: float = 0.15 # Señal a menos de ±15% de un umbral: se escala al LLM
+    REGLAS_PROMPT_MAX_AVANCES: int = 10 # Avances detallados en el prompt cuando van las señales calculadas
+
+    # --- Cola de Análisis (Worker Pool) ---
+    # Si es False, la API solo encola y un proceso aparte (python -m app.worker) consume
+    ANALISIS_WORKERS_HABILITADOS: bool = True
+    ANALISIS_WORKERS_CONCURRENCIA: int = 4 # Análisis procesados en paralelo por proceso
+    ANALISIS_COLA_MAXIMA: int = 200 # Pendientes permitidos antes de responder 429
+    ANALISIS_POLL_SEGUNDOS: float = 2.0 # Espera entre sondeos cuando la cola está vacía
+    ANALISIS_TIMEOUT_PROCESANDO_SEGUNDOS: int = 600 # Tras esto, un PROCESANDO se considera huérfano
+    ANALISIS_MAX_INTENTOS: int = 3 # Reintentos por caída del worker antes de marcar ERROR
+
+    # --- Lotes de Análisis ---
+    LOTE_MAX_ITEMS: int = 500
+    LOTE_CONCURRENCIA_DEFECTO: int = 4 # Análisis de un mismo lote procesándose a la vez
+
+    # --- Ingesta de Snapshots ---
+    SNAPSHOT_COPY_UMBRAL: int = 5000 # Desde cuántos avances se usa COPY (solo asyncpg)
+    SNAPSHOT_ALMACENAMIENTO: str = "jsonb" # "jsonb", "zstd" (requiere zstandard) o "texto" (legado)
+    SNAPSHOT_ZSTD_NIVEL: int = 3
+
+    # --- Auditoría LLM: particiones mensuales, retención y archivo frío (solo Postgres) ---
+    AUDITORIA_PARTICIONES_ADELANTE: int = 3 # Meses futuros con partición ya creada
+    AUDITORIA_RETENCION_MESES: int = 0 # Prompts y respuestas: meses completos en la base (0 = no se archiva)
+    AUDITORIA_RETENCION_INVOCACIONES_MESES: int = 0 # Invocaciones (filas chicas); 0 = no se archivan
+    AUDITORIA_ARCHIVO_DIR: str = "archivo_auditoria" # NDJSON.gz por tabla y mes; compartido si hay varias réplicas
+    AUDITORIA_MANTENIMIENTO_HABILITADO: bool = True # Tarea periódica: crea particiones y archiva las vencidas
+    AUDITORIA_MANTENIMIENTO_HORAS: float = 6.0
+
+    # --- Estadísticas agregadas (rollups por proyecto, día y modelo) ---
+    ESTADISTICAS_HABILITADAS: bool = True # False = no se acumula al completar (reconstruir luego con el script)
+    ESTADISTICAS_DIAS_POR_DEFECTO: int = 7 # Rango de GET /analisis/estadisticas sin fechas
+    ESTADISTICAS_MAX_DIAS: int = 366 # Rango máximo consultable de una vez
+
+    # --- Observabilidad ---
+    METRICAS_HABILITADAS: bool = True # Expone GET /metrics (formato Prometheus)
+    TRAZAS_HABILITADAS: bool = False # Spans OpenTelemetry por etapa (requiere opentelemetry-api + SDK)
+
     # --- CORS ---
     CORS_ORIGINS: List[str] = ["*"]
 
     # --- Logging ---
     # Permite cambiar a DEBUG, INFO, WARNING o ERROR desde el .env
     LOG_LEVEL: str = "INFO"
+    LOG_FORMATO: str = "texto" # "texto" o "json" (una línea JSON con analisis_id, modelo y tiempos como campos)
+    LOG_COLA_MAXIMA: int = 10000 # Records pendientes de escribir; con la cola llena se descartan (0 = sin tope)
+    LOG_MUESTREO_DEBUG: float = 1.0 # Fracción de los DEBUG que se escriben (0.01 = uno de cada cien)
+    LOG_MUESTREO_POR_LOGGER: dict = {} # Excepciones por prefijo de logger, ej: {"app.services.llm_client": 0.1}
 
     model_config = SettingsConfigDict(
         env_file=".env", 
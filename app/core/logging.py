@@ -1,18 +1,188 @@
+"""
+Única configuración de logs del proceso (API, worker y scripts). Se llama
+explícitamente al arrancar: los módulos solo piden su logger con
+logging.getLogger(__name__), sin tocar handlers al importarse.
+
+Quien loguea no escribe: el record pasa por un QueueHandler a una cola y un
+QueueListener (un hilo) lo formatea y lo vuelca a stdout. Si stdout se traba
+(back-pressure del runtime de contenedores) el event loop sigue; con la cola
+llena los records se descartan y se cuentan en vez de bloquear.
+
+Los mensajes van en estilo % (logger.info("... %s", valor)): un DEBUG apagado
+o descartado por muestreo no formatea nada. Con LOG_FORMATO="json" cada línea
+es un objeto JSON con los campos de `extra=` y del contexto del análisis en
+curso (analisis_id, modelo, tiempos por etapa) como claves propias.
+"""
+import atexit
+import contextvars
+import copy
+from contextlib import contextmanager
 import logging
+import queue
+import random
 import sys
+from logging.handlers import QueueHandler, QueueListener
+
+import orjson
+
 from app.config.settings import settings
+from app.core.metrics import LOGS_DESCARTADOS, tiempos_etapas
+
+# Campos del análisis en curso (los fija el worker/procesador); se copian a cada record
+contexto_log: contextvars.ContextVar[dict] = contextvars.ContextVar("contexto_log", default=None)
+
+# Atributos propios de LogRecord: todo lo demás vino por extra= y va como campo
+_ATRIBUTOS_RECORD = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_listener: QueueListener = None
+descartados = 0 # También en la métrica logs_descartados_total
+
+class FormateadorJSON(logging.Formatter):
+    """Una línea JSON por record: fecha, nivel, logger, mensaje y los campos extra."""
+    def format(self, record: logging.LogRecord) -> str:
+        registro = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensaje": record.getMessage(),
+        }
+        for clave, valor in vars(record).items():
+            if clave not in _ATRIBUTOS_RECORD and not clave.startswith("_"):
+                registro[clave] = valor
+        if record.exc_info:
+            registro["excepcion"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            registro["excepcion"] = record.exc_text
+        return orjson.dumps(registro, default=str).decode()
+
+class FiltroContexto(logging.Filter):
+    """Suma al record los campos de `contexto_log` (sin pisar los de extra=)."""
+    def filter(self, record: logging.LogRecord) -> bool:
+        contexto = contexto_log.get()
+        if contexto:
+            for clave, valor in contexto.items():
+                if not hasattr(record, clave):
+                    setattr(record, clave, valor)
+        return True
+
+class FiltroMuestreo(logging.Filter):
+    """
+    Deja pasar una fracción de los DEBUG (LOG_MUESTREO_DEBUG, con excepciones
+    por logger en LOG_MUESTREO_POR_LOGGER). INFO y superiores pasan siempre.
+    """
+    def __init__(self, tasa: float, por_logger: dict):
+        super().__init__()
+        self.tasa = tasa
+        self.por_logger = por_logger
+
+    def _tasa(self, nombre: str) -> float:
+        # El prefijo más largo configurado gana ("app.services" cubre "app.services.llm_client")
+        mejor, largo = self.tasa, -1
+        for prefijo, tasa in self.por_logger.items():
+            if (nombre == prefijo or nombre.startswith(prefijo + ".")) and len(prefijo) > largo:
+                mejor, largo = tasa, len(prefijo)
+        return mejor
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        tasa = self._tasa(record.name)
+        return tasa >= 1 or random.random() < tasa
+
+class ManejadorCola(QueueHandler):
+    """QueueHandler que nunca espera: con la cola llena descarta y cuenta."""
+    def enqueue(self, record):
+        global descartados
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            descartados += 1
+            LOGS_DESCARTADOS.inc()
+
+    def prepare(self, record):
+        # Solo se resuelve msg % args (los args pueden mutar después) y el traceback;
+        # el formato de la línea (texto o JSON) lo hace el hilo del listener. Sobre
+        # una copia, como QueueHandler: otros handlers (pytest, Sentry) ven el original.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _formato_excepcion.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class EscritorCola(QueueListener):
+    """
+    QueueListener que se puede detener con la cola llena: el original encola la
+    marca de fin con put_nowait y falla con queue.Full. Acá se espera a que el
+    hilo haga lugar y, si stdout sigue trabado, se abandona (el hilo es daemon).
+    """
+    ESPERA_CIERRE_SEGUNDOS = 5.0
+
+    def stop(self):
+        if self._thread is None:
+            return
+        try:
+            self.queue.put(self._sentinel, timeout=self.ESPERA_CIERRE_SEGUNDOS)
+        except queue.Full:
+            sys.stderr.write(f"⚠️ Logging detenido sin vaciar la cola ({self.queue.qsize()} records pendientes)\n")
+        else:
+            self._thread.join()
+        self._thread = None
+
+_formato_excepcion = logging.Formatter()
+
+@contextmanager
+def contexto_analisis(analisis_id):
+    """
+    Marca los logs del bloque con el analisis_id y acumula el tiempo de cada
+    etapa (app.core.metrics.etapa); devuelve ese dict de milisegundos.
+    """
+    token_log = contexto_log.set({**(contexto_log.get() or {}), "analisis_id": str(analisis_id)})
+    token_tiempos = tiempos_etapas.set({})
+    try:
+        yield tiempos_etapas.get()
+    finally:
+        tiempos_etapas.reset(token_tiempos)
+        contexto_log.reset(token_log)
+
+def crear_formateador() -> logging.Formatter:
+    if settings.LOG_FORMATO == "json":
+        return FormateadorJSON()
+    return logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+def detener_logging():
+    """Vacía la cola y detiene el hilo escritor (se registra con atexit)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def setup_logging(stream=None):
+    """Configura el root logger (idempotente: una nueva llamada reemplaza la anterior)."""
+    global _listener
+    detener_logging()
+
+    salida = logging.StreamHandler(stream or sys.stdout)
+    salida.setFormatter(crear_formateador())
+
+    cola = queue.Queue(maxsize=settings.LOG_COLA_MAXIMA) if settings.LOG_COLA_MAXIMA > 0 else queue.SimpleQueue()
+    manejador = ManejadorCola(cola)
+    manejador.addFilter(FiltroMuestreo(settings.LOG_MUESTREO_DEBUG, settings.LOG_MUESTREO_POR_LOGGER))
+    manejador.addFilter(FiltroContexto())
+
+    raiz = logging.getLogger()
+    raiz.handlers = [manejador]
+    raiz.setLevel(settings.LOGGING_LEVEL) # Nivel dinámico desde el .env
+    # uvicorn trae sus propios StreamHandler (síncronos): sus logs también van por la cola
+    for nombre in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        logging.getLogger(nombre).handlers = []
+        logging.getLogger(nombre).propagate = True
+
+    _listener = EscritorCola(cola, salida, respect_handler_level=True)
+    _listener.start()
 
-def setup_logging():
-    # Eliminamos configuraciones previas para evitar duplicidad
-    logging.root.handlers = []
-    
-    logging.basicConfig(
-        level=settings.LOGGING_LEVEL, # Nivel dinámico desde el .env
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        handlers=[
-            logging.StreamHandler(sys.stdout)
-        ],
-    )
+atexit.register(detener_logging)
 
 # Logger para usar en el resto de la aplicación
-logger = logging.getLogger("app")
\ No newline at end of file
+logger = logging.getLogger("app")
@@ -0,0 +1,197 @@
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+from app.config.settings import settings
+
+# OpenTelemetry es opcional: si no está instalado (o TRAZAS_HABILITADAS=False)
+# las etapas solo alimentan los histogramas de Prometheus. Solo se importa si
+# las trazas están habilitadas, para no pagarlo en el arranque.
+_tracer = None
+if settings.TRAZAS_HABILITADAS:
+    try:
+        from opentelemetry import trace as _otel_trace
+        _tracer = _otel_trace.get_tracer("app")
+    except ImportError:  # pragma: no cover
+        pass
+
+# Buckets pensados para el rango de cada cosa: DB en ms, LLM en decenas de segundos
+_BUCKETS_ETAPAS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+_BUCKETS_LLM = (0.5, 1, 2, 4, 8, 15, 30, 45, 60, 90, 120)
+_BUCKETS_POOL = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+
+ETAPA_SEGUNDOS = Histogram(
+    "analisis_etapa_segundos",
+    "Duración de cada etapa del pipeline de análisis",
+    ["etapa"],
+    buckets=_BUCKETS_ETAPAS
+)
+LLM_LATENCIA_SEGUNDOS = Histogram(
+    "llm_invocacion_segundos",
+    "Latencia de cada intento contra un modelo de OpenRouter",
+    ["modelo"],
+    buckets=_BUCKETS_LLM
+)
+LLM_INVOCACIONES = Counter(
+    "llm_invocaciones_total",
+    "Intentos contra modelos de OpenRouter por resultado (exito, fallo, cancelada)",
+    ["modelo", "resultado"]
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Tokens consumidos por modelo y tipo (prompt, respuesta)",
+    ["modelo", "tipo"]
+)
+LLM_ESPERA_LIMITADOR_SEGUNDOS = Histogram(
+    "llm_espera_limitador_segundos",
+    "Espera por cupo del limitador (cubetas por modelo + tope en vuelo) antes de cada intento",
+    ["modelo"],
+    buckets=_BUCKETS_ETAPAS
+)
+POOL_ESPERA_SEGUNDOS = Histogram(
+    "db_pool_checkout_espera_segundos",
+    "Tiempo esperando una conexión del pool de SQLAlchemy (primario o lectura)",
+    ["pool"],
+    buckets=_BUCKETS_POOL
+)
+POOL_CONEXIONES_EN_USO = Gauge(
+    "db_pool_conexiones_en_uso",
+    "Conexiones del pool asyncio prestadas en este momento",
+    ["pool"]
+)
+POOL_TIMEOUTS = Counter(
+    "db_pool_timeouts_total",
+    "Solicitudes que agotaron DB_POOL_TIMEOUT_SEGUNDOS esperando conexión (respondidas con 503)",
+    ["pool"]
+)
+SOLICITUDES_EN_CURSO = Gauge(
+    "http_solicitudes_en_curso",
+    "Solicitudes HTTP siendo atendidas en este proceso"
+)
+SOLICITUD_SEGUNDOS = Histogram(
+    "http_solicitud_segundos",
+    "Duración de las solicitudes HTTP por ruta",
+    ["metodo", "ruta", "estado"],
+    buckets=_BUCKETS_ETAPAS
+)
+LOGS_DESCARTADOS = Counter(
+    "logs_descartados_total",
+    "Records de log descartados porque la cola del escritor estaba llena (LOG_COLA_MAXIMA)"
+)
+WEBHOOK_ENTREGAS = Counter(
+    "webhook_entregas_total",
+    "Intentos de entrega del outbox de webhooks por resultado (entregado, reintento, muerto)",
+    ["resultado"]
+)
+ANALISIS_POR_MODO = Counter(
+    "analisis_modo_total",
+    "Análisis resueltos por modo (COMPLETO, DELTA, SIN_CAMBIOS, REGLAS)",
+    ["modo"]
+)
+LLM_RESPUESTAS_PARSEO = Counter(
+    "llm_respuestas_parseo_total",
+    "Respuestas del LLM por forma de interpretarlas (directo, extraido, reparado, invalido)",
+    ["via"]
+)
+AUTH_BCRYPT_SEGUNDOS = Histogram(
+    "auth_bcrypt_segundos",
+    "Duración de hash/verificación bcrypt en el pool de procesos (incluye la cola)",
+    ["operacion"],
+    buckets=_BUCKETS_ETAPAS
+)
+AUTH_TOKENS_CACHE = Counter(
+    "auth_tokens_cache_total",
+    "Validaciones de JWT por resultado de la caché de claims (hit, miss)",
+    ["resultado"]
+)
+ANALISIS_EN_PROCESO = Gauge(
+    "analisis_en_proceso",
+    "Análisis que los workers de este proceso están ejecutando"
+)
+
+# Milisegundos por etapa del análisis en curso (los fija app.core.logging.contexto_analisis)
+tiempos_etapas: ContextVar[dict] = ContextVar("tiempos_etapas", default=None)
+
+def observar_etapa(nombre: str, segundos: float):
+    """Histograma de la etapa y, si hay un análisis en curso, su acumulado para el log final."""
+    ETAPA_SEGUNDOS.labels(nombre).observe(segundos)
+    tiempos = tiempos_etapas.get()
+    if tiempos is not None:
+        tiempos[nombre] = round(tiempos.get(nombre, 0) + segundos * 1000, 1)
+
+@contextmanager
+def etapa(nombre: str, **atributos):
+    """
+    Mide una etapa del pipeline (histograma `analisis_etapa_segundos`) y, si hay
+    OpenTelemetry, la envuelve en un span para desglosar un análisis lento.
+    """
+    span = (
+        _tracer.start_as_current_span(f"analisis.{nombre}", attributes={k: str(v) for k, v in atributos.items()})
+        if _tracer else nullcontext()
+    )
+    inicio = time.perf_counter()
+    with span:
+        try:
+            yield
+        finally:
+            observar_etapa(nombre, time.perf_counter() - inicio)
+
+def registrar_invocacion_llm(registro: dict):
+    """Vuelca a métricas un registro de intento de LLMClient (el mismo que se audita en DB)."""
+    modelo = registro["modelo"]
+    if registro["exitosa"]:
+        resultado = "exito"
+    elif (registro["error"] or "").startswith("CANCELADA"):
+        resultado = "cancelada"
+    else:
+        resultado = "fallo"
+    LLM_INVOCACIONES.labels(modelo, resultado).inc()
+    if registro["duracion_ms"] is not None and resultado != "cancelada":
+        LLM_LATENCIA_SEGUNDOS.labels(modelo).observe(registro["duracion_ms"] / 1000)
+    if registro["tokens_prompt"]:
+        LLM_TOKENS.labels(modelo, "prompt").inc(registro["tokens_prompt"])
+    if registro["tokens_respuesta"]:
+        LLM_TOKENS.labels(modelo, "respuesta").inc(registro["tokens_respuesta"])
+
+class MetricasMiddleware:
+    """
+    Middleware ASGI puro (sin BaseHTTPMiddleware, que agrega una tarea por request):
+    gauge de solicitudes en curso y duración por plantilla de ruta.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        estado = {"codigo": 500}
+
+        async def send_con_estado(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado["codigo"] = mensaje["status"]
+            await send(mensaje)
+
+        SOLICITUDES_EN_CURSO.inc()
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_con_estado)
+        finally:
+            SOLICITUDES_EN_CURSO.dec()
+            # La plantilla (/detalle/{analisis_id}) y no la URL real, para no explotar la cardinalidad
+            ruta = getattr(scope.get("route"), "path", "sin_ruta")
+            SOLICITUD_SEGUNDOS.labels(scope["method"], ruta, str(estado["codigo"])).observe(
+                time.perf_counter() - inicio
+            )
+
+def observar_pool(pool, nombre: str = "primario"):
+    """Expone las conexiones prestadas del pool (se lee al momento del scrape, sin costo por request)."""
+    if hasattr(pool, "checkedout"):
+        POOL_CONEXIONES_EN_USO.labels(nombre).set_function(pool.checkedout)
+
+def exportar() -> tuple:
+    """Cuerpo y content-type del formato de texto de Prometheus."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,12 +1,112 @@
+import asyncio
+import multiprocessing
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import jwt
 from passlib.context import CryptContext
 
+from app.config.settings import settings
+from app.core.metrics import AUTH_BCRYPT_SEGUNDOS, AUTH_TOKENS_CACHE
+
 # Configuramos el algoritmo de encriptación (bcrypt)
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Hash de una clave aleatoria descartada: se verifica contra él cuando el usuario
+# no existe, para que el login tarde lo mismo y no revele qué emails están registrados
+_HASH_FICTICIO = "$2b$12$Rw0ubHNsJYo0hBgFkoLrCeilL/apA.BOjF7MGk2G3Srd/0HimoZk2"
+
+class AuthSaturada(Exception):
+    """Hay AUTH_BCRYPT_MAX_PENDIENTES operaciones bcrypt en curso: se rechaza en lugar de encolar."""
+
+class TokenInvalido(Exception):
+    """JWT mal formado, con firma inválida o vencido."""
+
 def get_password_hash(password: str) -> str:
     """Convierte texto plano en un hash seguro."""
     return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifica si la clave ingresada coincide con el hash guardado."""
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+    return pwd_context.verify(plain_password, hashed_password)
+
+# --- bcrypt en un pool de procesos propio ---
+# bcrypt son ~100-300 ms de CPU: en el threadpool por defecto le quitaría hilos
+# a los endpoints sync y retendría el GIL. Se crea en el primer uso (no al
+# importar) y con "spawn" para no heredar el event loop ni conexiones abiertas
+# (los scripts que registren usuarios necesitan el guard `if __name__ == "__main__"`).
+_pool_bcrypt: ProcessPoolExecutor | None = None
+_pendientes = 0
+
+def _pool() -> ProcessPoolExecutor:
+    global _pool_bcrypt
+    if _pool_bcrypt is None:
+        _pool_bcrypt = ProcessPoolExecutor(
+            max_workers=settings.AUTH_BCRYPT_PROCESOS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool_bcrypt
+
+async def _en_pool(operacion: str, funcion, *argumentos):
+    global _pendientes
+    if _pendientes >= settings.AUTH_BCRYPT_MAX_PENDIENTES:
+        raise AuthSaturada(f"{_pendientes} operaciones bcrypt pendientes")
+    _pendientes += 1
+    inicio = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_pool(), funcion, *argumentos)
+    finally:
+        _pendientes -= 1
+        AUTH_BCRYPT_SEGUNDOS.labels(operacion).observe(time.perf_counter() - inicio)
+
+async def hashear_password(password: str) -> str:
+    return await _en_pool("hash", get_password_hash, password)
+
+async def verificar_password(plain_password: str, hashed_password: str | None) -> bool:
+    """Con hashed_password=None (usuario inexistente) verifica igual contra un hash ficticio y devuelve False."""
+    valido = await _en_pool("verificar", verify_password, plain_password, hashed_password or _HASH_FICTICIO)
+    return valido and hashed_password is not None
+
+def cerrar_pool_bcrypt():
+    global _pool_bcrypt
+    if _pool_bcrypt is not None:
+        _pool_bcrypt.shutdown(wait=False, cancel_futures=True)
+        _pool_bcrypt = None
+
+# --- JWT ---
+
+def crear_token_acceso(usuario_id: uuid.UUID, username: str) -> tuple[str, int]:
+    """Devuelve (token, segundos de validez)."""
+    ahora = int(time.time())
+    duracion = settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    claims = {"sub": str(usuario_id), "username": username, "iat": ahora, "exp": ahora + duracion}
+    return jwt.encode(claims, settings.SECRET_KEY, algorithm=settings.ALGORITHM), duracion
+
+# Claims ya validados por token: el mismo token llega en cada request de la sesión
+# y así solo se paga una verificación de firma por token y proceso
+_claims_validados: OrderedDict[str, dict] = OrderedDict()
+
+def decodificar_token(token: str) -> dict:
+    """Valida el JWT sin tocar la base (stateless); el vencimiento se controla también en los hits de caché."""
+    claims = _claims_validados.get(token)
+    if claims is not None:
+        if claims["exp"] > time.time():
+            _claims_validados.move_to_end(token)
+            AUTH_TOKENS_CACHE.labels("hit").inc()
+            return claims
+        del _claims_validados[token]
+
+    AUTH_TOKENS_CACHE.labels("miss").inc()
+    if not settings.SECRET_KEY:
+        raise TokenInvalido("SECRET_KEY no configurada")
+    try:
+        claims = jwt.decode(
+            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM], options={"require": ["exp", "sub"]}
+        )
+    except jwt.PyJWTError as e:
+        raise TokenInvalido(str(e)) from e
+
+    _claims_validados[token] = claims
+    while len(_claims_validados) > settings.AUTH_CACHE_TOKENS:
+        _claims_validados.popitem(last=False)
+    return claims
@@ -1,18 +1,123 @@
+import orjson
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.config.settings import settings
 
 # 1. Usamos la URL desde los settings (centralizado y seguro)
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
-# 2. Configuración del Engine
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+def _a_url_async(url: str) -> str:
+    """Traduce la URL síncrona (psycopg2) a su driver asyncio equivalente."""
+    for prefijo_sync, prefijo_async in (
+        ("postgresql+psycopg2://", "postgresql+asyncpg://"),
+        ("postgresql://", "postgresql+asyncpg://"),
+        ("postgres://", "postgresql+asyncpg://"),
+        ("sqlite://", "sqlite+aiosqlite://"),
+    ):
+        if url.startswith(prefijo_sync):
+            return prefijo_async + url[len(prefijo_sync):]
+    return url
 
-# 3. Sesión local
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SQLALCHEMY_ASYNC_DATABASE_URL = settings.DATABASE_ASYNC_URL or _a_url_async(SQLALCHEMY_DATABASE_URL)
+SQLALCHEMY_READ_ASYNC_URL = settings.DATABASE_READ_ASYNC_URL or (
+    _a_url_async(settings.DATABASE_READ_URL) if settings.DATABASE_READ_URL else None
+)
 
-# 4. Base para los modelos
+def _opciones_pool(url: str) -> dict:
+    """Pool configurable desde Settings (por defecto SQLAlchemy usa 5 + 10 sin pre-ping ni recycle)."""
+    opciones = {"pool_pre_ping": settings.DB_POOL_PRE_PING, "pool_recycle": settings.DB_POOL_RECYCLE_SEGUNDOS}
+    # SQLite en memoria usa un pool de una sola conexión: tamaño/overflow/timeout no aplican
+    if url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith(":")):
+        return opciones
+    return {
+        **opciones,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SEGUNDOS
+    }
+
+def _json_serializer(valor) -> str:
+    return orjson.dumps(valor, option=orjson.OPT_NON_STR_KEYS).decode()
+
+# Columnas JSON/JSONB (payloads, avances, respuestas LLM) con orjson en lugar de json
+_OPCIONES_JSON = {"json_serializer": _json_serializer, "json_deserializer": orjson.loads}
+
+# 2-4. Engines y sesiones: se construyen en el arranque (lifespan de la API y del
+# worker) con crear_engines() y se liberan con cerrar_engines(), no al importar.
+# Quien los usa los lee del módulo al momento (`from app.db import base as db_base`,
+# `db_base.AsyncSessionLocal()`); tooling, scripts y benchmarks que no pasan por un
+# lifespan los obtienen igual: el primer acceso a cualquiera de estos nombres los crea.
+#   engine / SessionLocal: síncronos, para tooling (create_all, reset-db, scripts)
+#   y endpoints `def` que corren en el threadpool.
+#   async_engine / AsyncSessionLocal: endpoints `async def` y workers, para no
+#   bloquear el event loop en cada flush/commit.
+#   async_read_engine / AsyncReadSessionLocal: réplica de lectura (opcional) para
+#   los endpoints de solo lectura. Sin réplica apuntan al primario.
+_PEREZOSOS = ("engine", "SessionLocal", "async_engine", "AsyncSessionLocal", "async_read_engine", "AsyncReadSessionLocal")
+
+def crear_engines() -> None:
+    """Construye engines y fábricas de sesión (idempotente)."""
+    estado = globals()
+    if "engine" in estado:
+        return
+    sync_engine = create_engine(SQLALCHEMY_DATABASE_URL, **_OPCIONES_JSON, **_opciones_pool(SQLALCHEMY_DATABASE_URL))
+    primario = create_async_engine(
+        SQLALCHEMY_ASYNC_DATABASE_URL, **_OPCIONES_JSON, **_opciones_pool(SQLALCHEMY_ASYNC_DATABASE_URL)
+    )
+    sesiones = async_sessionmaker(bind=primario, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    lectura, sesiones_lectura = primario, sesiones
+    if SQLALCHEMY_READ_ASYNC_URL:
+        lectura = create_async_engine(
+            SQLALCHEMY_READ_ASYNC_URL, **_OPCIONES_JSON, **_opciones_pool(SQLALCHEMY_READ_ASYNC_URL)
+        )
+        sesiones_lectura = async_sessionmaker(bind=lectura, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    estado.update({
+        "engine": sync_engine,
+        "SessionLocal": sessionmaker(autocommit=False, autoflush=False, bind=sync_engine),
+        "async_engine": primario,
+        "AsyncSessionLocal": sesiones,
+        "async_read_engine": lectura,
+        "AsyncReadSessionLocal": sesiones_lectura,
+    })
+
+async def cerrar_engines() -> None:
+    """Cierra los pools (apagado del lifespan). Un acceso posterior vuelve a crearlos."""
+    estado = globals()
+    if "engine" not in estado:
+        return
+    primario, lectura, sync_engine = estado["async_engine"], estado["async_read_engine"], estado["engine"]
+    for nombre in _PEREZOSOS:
+        del estado[nombre]
+    await primario.dispose()
+    if lectura is not primario:
+        await lectura.dispose()
+    sync_engine.dispose()
+
+def __getattr__(nombre: str):
+    if nombre in _PEREZOSOS:
+        crear_engines()
+        return globals()[nombre]
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
+
+def estadisticas_pool(engine_async) -> dict:
+    """Estado del pool de un engine asyncio (health y soak test)."""
+    pool = engine_async.sync_engine.pool
+    estadisticas = {"clase": type(pool).__name__}
+    for nombre, metodo in (("tamano", "size"), ("en_uso", "checkedout"), ("libres", "checkedin")):
+        if hasattr(pool, metodo):
+            estadisticas[nombre] = getattr(pool, metodo)()
+    if hasattr(pool, "overflow"):
+        # overflow() es negativo mientras el pool no llenó su tamaño base
+        estadisticas["abiertas"] = pool.size() + pool.overflow()
+    # max_overflow=-1 es "sin tope": no hay saturación posible
+    if getattr(pool, "_max_overflow", -1) >= 0 and "tamano" in estadisticas:
+        estadisticas["maximo"] = estadisticas["tamano"] + pool._max_overflow
+        estadisticas["saturado"] = estadisticas["en_uso"] >= estadisticas["maximo"]
+    return estadisticas
+
+# 5. Base para los modelos
 Base = declarative_base()
 
-# NOTA: La función get_db() se ha movido a app/api/dependencies.py 
-# para seguir el estándar de organización granular del template.
\ No newline at end of file
+# NOTA: Las funciones get_db()/get_async_db() están en app/api/dependencies.py 
+# para seguir el estándar de organización granular del template.
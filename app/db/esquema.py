@@ -0,0 +1,144 @@
+"""
+Creación y actualización del esquema, fuera del import de la aplicación.
+
+Corre una sola vez por arranque (lifespan de la API y del worker) o como paso
+explícito de despliegue:
+
+    python -m app.db.esquema
+
+En Postgres se serializa con un advisory lock de transacción: si arrancan
+varias réplicas a la vez, una crea y las demás esperan y encuentran todo hecho.
+Con el esquema al día cuesta una inspección (sin DDL). create_all no altera
+tablas existentes, así que las columnas e índices agregados al modelo después
+de creada la tabla se suman acá (solo columnas opcionales; una obligatoria
+nueva requiere migración manual). En Postgres también suma a los ENUM nativos
+los valores nuevos del modelo (ej: ModoAnalisis.REGLAS) y deja creadas las
+particiones mensuales de la auditoría LLM (app.db.particiones).
+"""
+import asyncio
+import logging
+import time
+from sqlalchemy import inspect, literal, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.types import Enum, SchemaType
+
+from app.config.settings import settings
+from app.db import base as db_base
+from app.db.base import Base
+from app.db.particiones import asegurar_particiones
+import app.models.analisis  # noqa: F401 (registra las tablas en Base.metadata)
+
+logger = logging.getLogger(__name__)
+
+# Clave arbitraria (int64) del advisory lock que serializa la creación del esquema
+CLAVE_LOCK_ESQUEMA = 7_204_118_305
+
+def _default_sql(columna, dialecto) -> str:
+    """DEFAULT para filas existentes cuando el modelo tiene un default escalar simple."""
+    default = columna.default
+    if default is None or not default.is_scalar or not isinstance(default.arg, (bool, int, float, str)):
+        return ""
+    valor = default.arg.value if hasattr(default.arg, "value") else default.arg
+    return " DEFAULT " + str(literal(valor, columna.type).compile(dialect=dialecto, compile_kwargs={"literal_binds": True}))
+
+def _agregar_columna(conexion, columna) -> None:
+    tabla = columna.table.name
+    if isinstance(columna.type, SchemaType):
+        columna.type.create(conexion, checkfirst=True) # ENUM nativo de Postgres
+    tipo = columna.type.compile(dialect=conexion.dialect)
+    ddl = f"ALTER TABLE {tabla} ADD COLUMN {columna.name} {tipo}{_default_sql(columna, conexion.dialect)}"
+    for fk in columna.foreign_keys:
+        ddl += f" REFERENCES {fk.column.table.name}({fk.column.name})"
+    conexion.execute(text(ddl))
+
+def _agregar_valores_enum(conexion) -> list:
+    """Valores del modelo que faltan en los ENUM nativos de Postgres (ALTER TYPE ... ADD VALUE)."""
+    agregados = []
+    tipos = {
+        columna.type.name: columna.type
+        for tabla in Base.metadata.sorted_tables for columna in tabla.columns
+        if isinstance(columna.type, Enum) and columna.type.native_enum and columna.type.name
+    }
+    for nombre, tipo in tipos.items():
+        existentes = set(conexion.execute(
+            text("SELECT e.enumlabel FROM pg_enum e JOIN pg_type t ON t.oid = e.enumtypid WHERE t.typname = :nombre"),
+            {"nombre": nombre}
+        ).scalars())
+        if not existentes:
+            continue # El tipo todavía no existe: lo crea create_all / _agregar_columna
+        for valor in tipo.enums:
+            if valor not in existentes:
+                conexion.execute(text(f"ALTER TYPE {nombre} ADD VALUE IF NOT EXISTS '{valor}'"))
+                agregados.append(f"{nombre}.{valor}")
+    return agregados
+
+def sincronizar_esquema(conexion) -> dict:
+    """Crea tablas, columnas opcionales e índices faltantes. Síncrona: usar con run_sync."""
+    if conexion.dialect.name == "postgresql":
+        conexion.execute(text("SELECT pg_advisory_xact_lock(:clave)"), {"clave": CLAVE_LOCK_ESQUEMA})
+
+    inspector = inspect(conexion)
+    existentes = set(inspector.get_table_names())
+    cambios = {"tablas": [], "columnas": [], "indices": [], "enums": [], "particiones": []}
+
+    faltantes = [tabla for tabla in Base.metadata.sorted_tables if tabla.name not in existentes]
+    if faltantes:
+        Base.metadata.create_all(conexion, tables=faltantes)
+        cambios["tablas"] = [tabla.name for tabla in faltantes]
+
+    for tabla in Base.metadata.sorted_tables:
+        if tabla.name not in existentes:
+            continue
+        columnas = {c["name"] for c in inspector.get_columns(tabla.name)}
+        for columna in tabla.columns:
+            if columna.name in columnas:
+                continue
+            if not columna.nullable and columna.server_default is None and not _default_sql(columna, conexion.dialect):
+                logger.warning("⚠️ %s.%s es obligatoria y no existe: requiere migración manual", tabla.name, columna.name)
+                continue
+            _agregar_columna(conexion, columna)
+            cambios["columnas"].append(f"{tabla.name}.{columna.name}")
+
+        indices = {i["name"] for i in inspector.get_indexes(tabla.name)}
+        for indice in tabla.indexes:
+            if indice.name not in indices:
+                indice.create(conexion)
+                cambios["indices"].append(indice.name)
+
+    if conexion.dialect.name == "postgresql":
+        cambios["enums"] = _agregar_valores_enum(conexion)
+        # Una madre particionada sin particiones rechaza todos los INSERT
+        cambios["particiones"] = asegurar_particiones(conexion)
+    return cambios
+
+async def asegurar_esquema() -> dict:
+    """
+    Tarea de arranque: sincroniza el esquema reintentando con backoff mientras
+    la base no responda (ej: Postgres levantando junto con la API en compose),
+    hasta DB_ESPERA_INICIO_SEGUNDOS.
+    """
+    limite = time.monotonic() + settings.DB_ESPERA_INICIO_SEGUNDOS
+    espera = 0.5
+    while True:
+        try:
+            async with db_base.async_engine.begin() as conexion:
+                cambios = await conexion.run_sync(sincronizar_esquema)
+            break
+        except (DBAPIError, OSError) as e:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                raise
+            espera = min(espera, restante)
+            logger.warning("⏳ Base no disponible para sincronizar el esquema (%s), reintento en %.1fs", e.__class__.__name__, espera)
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, 5)
+
+    if any(cambios.values()):
+        logger.info("🧱 Esquema actualizado: %s", cambios)
+    return cambios
+
+if __name__ == "__main__":
+    from app.core.logging import setup_logging
+
+    setup_logging()
+    asyncio.run(asegurar_esquema())
@@ -0,0 +1,118 @@
+"""
+Particiones mensuales (RANGE) de las tablas de auditoría LLM en Postgres.
+
+Una partición por tabla y mes, llamada `<tabla>_pAAAA_MM`. Las crea por
+adelantado `asegurar_particiones` (arranque y mantenimiento periódico); las
+vencidas las exporta y las suelta app.services.archivo_auditoria. En SQLite
+las tablas son comunes y todo esto no hace nada.
+
+Bases creadas antes de particionar se convierten con
+`python -m app.scripts.particionar_auditoria`.
+"""
+import re
+from datetime import date, datetime
+from sqlalchemy import func, select, text
+
+from app.config.settings import settings
+from app.db.base import Base
+
+# Tabla -> columna de partición (fecha de alta de la fila)
+TABLAS_PARTICIONADAS = {
+    "invocacion_llm": "invocado_at",
+    "prompt_generado": "generado_at",
+    "respuesta_llm": "recibida_at",
+}
+
+_SUFIJO = re.compile(r"_p(\d{4})_(\d{2})$")
+
+def inicio_mes(fecha) -> date:
+    return date(fecha.year, fecha.month, 1)
+
+def sumar_meses(mes: date, meses: int) -> date:
+    total = mes.year * 12 + mes.month - 1 + meses
+    return date(total // 12, total % 12 + 1, 1)
+
+def nombre_particion(tabla: str, mes: date) -> str:
+    return f"{tabla}_p{mes:%Y_%m}"
+
+def es_particionada(conexion, tabla: str) -> bool:
+    if conexion.dialect.name != "postgresql":
+        return False
+    return conexion.execute(text("""
+        SELECT 1 FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        WHERE c.relname = :tabla AND c.relnamespace = current_schema()::regnamespace
+    """), {"tabla": tabla}).first() is not None
+
+def particiones(conexion, tabla: str) -> list:
+    """[(nombre, mes)] de las particiones mensuales de la tabla, ordenadas por mes."""
+    filas = conexion.execute(text("""
+        SELECT hija.relname FROM pg_inherits i
+        JOIN pg_class hija ON hija.oid = i.inhrelid
+        JOIN pg_class madre ON madre.oid = i.inhparent
+        WHERE madre.relname = :tabla AND madre.relnamespace = current_schema()::regnamespace
+    """), {"tabla": tabla}).scalars()
+    resultado = []
+    for nombre in filas:
+        coincidencia = _SUFIJO.search(nombre)
+        if coincidencia:
+            resultado.append((nombre, date(int(coincidencia[1]), int(coincidencia[2]), 1)))
+    return sorted(resultado, key=lambda p: p[1])
+
+def crear_particiones(conexion, desde: date, hasta: date) -> list:
+    """Crea las particiones mensuales faltantes de [desde, hasta] en cada tabla particionada."""
+    creadas = []
+    for tabla in TABLAS_PARTICIONADAS:
+        if not es_particionada(conexion, tabla):
+            continue
+        existentes = {mes for _, mes in particiones(conexion, tabla)}
+        mes = inicio_mes(desde)
+        while mes <= hasta:
+            if mes not in existentes:
+                nombre = nombre_particion(tabla, mes)
+                conexion.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {nombre} PARTITION OF {tabla} "
+                    f"FOR VALUES FROM ('{mes.isoformat()}') TO ('{sumar_meses(mes, 1).isoformat()}')"
+                ))
+                creadas.append(nombre)
+            mes = sumar_meses(mes, 1)
+    return creadas
+
+def asegurar_particiones(conexion) -> list:
+    """Mes actual y AUDITORIA_PARTICIONES_ADELANTE meses siguientes. Idempotente."""
+    actual = inicio_mes(datetime.utcnow())
+    return crear_particiones(conexion, actual, sumar_meses(actual, settings.AUDITORIA_PARTICIONES_ADELANTE))
+
+def convertir_tabla(conexion, tabla: str, conservar_legado: bool = False) -> dict:
+    """
+    Convierte una tabla común existente en particionada, dentro de la
+    transacción de `conexion` (bloquea la tabla mientras copia):
+    la renombra a <tabla>_legado (con sus índices), crea la madre desde el
+    modelo, las particiones que cubren sus datos, copia las filas y borra la vieja.
+    """
+    columna = TABLAS_PARTICIONADAS[tabla]
+    legado = f"{tabla}_legado"
+    conexion.execute(text(f"ALTER TABLE {tabla} RENAME TO {legado}"))
+    # Los nombres de índices son por esquema: los viejos no pueden chocar con los nuevos
+    indices = conexion.execute(
+        text("SELECT indexname FROM pg_indexes WHERE tablename = :tabla AND schemaname = current_schema()"),
+        {"tabla": legado}
+    ).scalars().all()
+    for indice in indices:
+        conexion.execute(text(f"ALTER INDEX {indice} RENAME TO {indice[:50]}_legado"))
+
+    # Filas viejas sin fecha (no debería haber: la columna tiene default) caen en el mes actual
+    ahora = datetime.utcnow()
+    conexion.execute(text(f"UPDATE {legado} SET {columna} = :ahora WHERE {columna} IS NULL"), {"ahora": ahora})
+    minimo = conexion.execute(select(func.min(text(columna))).select_from(text(legado))).scalar() or ahora
+
+    modelo = Base.metadata.tables[tabla]
+    modelo.create(conexion)
+    creadas = crear_particiones(conexion, minimo, sumar_meses(inicio_mes(ahora), settings.AUDITORIA_PARTICIONES_ADELANTE))
+
+    columnas = ", ".join(c.name for c in modelo.columns)
+    copiadas = conexion.execute(text(f"INSERT INTO {tabla} ({columnas}) SELECT {columnas} FROM {legado}")).rowcount
+    if not conservar_legado:
+        # CASCADE: se lleva las FK viejas entre tablas de auditoría
+        conexion.execute(text(f"DROP TABLE {legado} CASCADE"))
+    return {"tabla": tabla, "filas": copiadas, "particiones": len(creadas)}
@@ -1,23 +1,61 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.config.settings import settings
 from app.core.logging import setup_logging
-from app.db.base import Base, engine
+from app.core.security import cerrar_pool_bcrypt
+from app.core.metrics import MetricasMiddleware, exportar, observar_pool
+from app.db import base as db_base
+from app.db.esquema import asegurar_esquema
 from app.api.v1.endpoints import analisis, usuarios, health
+from app.services.analisis_worker import AnalisisWorker
+from app.services.archivo_auditoria import MantenimientoAuditoria
+from app.services.http_clients import iniciar_clientes, cerrar_clientes
+from app.services.webhook_dispatcher import DespachadorWebhooks
 
 # 1. Configuración de logs profesional
 setup_logging()
 
-# 2. Sincronización de Base de Datos
-Base.metadata.create_all(bind=engine)
+# 2. Ciclo de vida: engines y pools de la base, esquema (una vez, con lock),
+# clientes HTTP compartidos, worker pool de análisis, despachador de webhooks y
+# mantenimiento de la auditoría (particiones y archivo). Nada de esto corre al importar.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    db_base.crear_engines()
+    if settings.METRICAS_HABILITADAS:
+        observar_pool(db_base.async_engine.sync_engine.pool, "primario")
+        if db_base.async_read_engine is not db_base.async_engine:
+            observar_pool(db_base.async_read_engine.sync_engine.pool, "lectura")
+    if settings.DB_CREAR_ESQUEMA_AL_INICIAR:
+        await asegurar_esquema()
+    await iniciar_clientes()
+    worker = AnalisisWorker()
+    app.state.analisis_worker = worker
+    despachador = DespachadorWebhooks()
+    app.state.despachador_webhooks = despachador
+    mantenimiento = MantenimientoAuditoria(db_base.engine)
+    if settings.ANALISIS_WORKERS_HABILITADOS:
+        await worker.iniciar()
+    if settings.WEBHOOK_DESPACHADOR_HABILITADO:
+        await despachador.iniciar()
+    if settings.AUDITORIA_MANTENIMIENTO_HABILITADO:
+        await mantenimiento.iniciar()
+    yield
+    await worker.detener()
+    await despachador.detener()
+    await mantenimiento.detener()
+    await cerrar_clientes()
+    cerrar_pool_bcrypt()
+    await db_base.cerrar_engines()
 
 # 3. Inicialización de FastAPI
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
     description="API profesional para análisis de obras con auditoría LLM.",
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
 # 4. Configuración de CORS
@@ -29,7 +67,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 5. Inclusión de Routers con prefijos consistentes
+# 5. Métricas: gauge de solicitudes en curso y duración por ruta
+if settings.METRICAS_HABILITADAS:
+    app.add_middleware(MetricasMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metricas():
+        cuerpo, tipo = exportar()
+        return Response(content=cuerpo, media_type=tipo)
+
+# 6. Inclusión de Routers con prefijos consistentes
 app.include_router(health.router, prefix=settings.API_V1_STR)
 app.include_router(usuarios.router, prefix=f"{settings.API_V1_STR}/auth")
 app.include_router(analisis.router, prefix=f"{settings.API_V1_STR}/analisis")
@@ -2,8 +2,8 @@ import uuid
 import enum
 from datetime import datetime
 from sqlalchemy import Column, String, DateTime, Enum, ForeignKey, Text, Float, Boolean
-from sqlalchemy import Integer, Date, JSON
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import BigInteger, Integer, Date, JSON, Index, LargeBinary
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import relationship
 from app.db.base import Base
 
@@ -13,6 +13,17 @@ class EstadoAnalisis(str, enum.Enum):
     COMPLETADO = "COMPLETADO"
     ERROR = "ERROR"
 
+class EstadoWebhook(str, enum.Enum):
+    PENDIENTE = "PENDIENTE"
+    ENTREGADO = "ENTREGADO"
+    MUERTO = "MUERTO" # Agotó WEBHOOK_MAX_INTENTOS (dead letter)
+
+class ModoAnalisis(str, enum.Enum):
+    COMPLETO = "COMPLETO" # Snapshot entero al LLM
+    DELTA = "DELTA" # Solo los cambios + resultado previo como contexto
+    SIN_CAMBIOS = "SIN_CAMBIOS" # Nada material cambió: se reutilizó el resultado previo
+    REGLAS = "REGLAS" # Resuelto por el pre-análisis local, sin LLM (señales no ambiguas)
+
 class Analisis(Base):
     __tablename__ = "analisis"
 
@@ -20,22 +31,68 @@ class Analisis(Base):
     proyecto_codigo = Column(String, index=True)
     fecha_solicitud = Column(DateTime, default=datetime.utcnow)
     estado = Column(Enum(EstadoAnalisis), default=EstadoAnalisis.PENDIENTE)
+
+    # Control de la cola: cuándo lo tomó un worker y cuántas veces se intentó
+    procesando_desde = Column(DateTime, nullable=True)
+    intentos = Column(Integer, default=0)
+
+    # Lote al que pertenece (solo si llegó por POST /analisis/lote)
+    lote_id = Column(UUID(as_uuid=True), ForeignKey("lote_analisis.id"), nullable=True, index=True)
+
+    # Modo incremental: cómo se resolvió y contra qué análisis previo del proyecto
+    modo = Column(Enum(ModoAnalisis), nullable=True)
+    analisis_base_id = Column(UUID(as_uuid=True), ForeignKey("analisis.id"), nullable=True)
     
     # Relaciones
     # uselist=False indica que es una relación 1 a 1
     snapshot = relationship("SnapshotRecibido", back_populates="analisis", uselist=False)
     resultado = relationship("ResultadoAnalisis", back_populates="analisis", uselist=False)
     invocaciones = relationship("InvocacionLLM", backref="analisis")
+    lote = relationship("LoteAnalisis", back_populates="analisis")
+
+    # Índices compuestos: cola FIFO de los workers y listados con keyset (fecha, id)
+    __table_args__ = (
+        Index("ix_analisis_estado_fecha", "estado", "fecha_solicitud"),
+        Index("ix_analisis_fecha_id", "fecha_solicitud", "id"),
+        Index("ix_analisis_proyecto_fecha_id", "proyecto_codigo", "fecha_solicitud", "id"),
+    )
+
+class LoteAnalisis(Base):
+    __tablename__ = "lote_analisis"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    creado_at = Column(DateTime, default=datetime.utcnow)
+    total_items = Column(Integer, default=0)
+    # Tope de análisis del lote procesándose a la vez (protege el rate limit de OpenRouter)
+    max_concurrencia = Column(Integer, nullable=False)
+
+    analisis = relationship("Analisis", back_populates="lote")
+
+class PayloadSnapshot(Base):
+    """
+    Contenido del snapshot, direccionado por hash (sha256 del JSON canónico).
+    Payloads idénticos de distintos análisis comparten una sola fila.
+    """
+    __tablename__ = "payload_snapshot"
+
+    hash = Column(String(64), primary_key=True)
+    formato = Column(String(10), nullable=False) # "jsonb" o "zstd"
+    contenido_json = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=True)
+    contenido_zstd = Column(LargeBinary, nullable=True)
+    tamano_original = Column(Integer) # Bytes del JSON sin comprimir
+    creado_at = Column(DateTime, default=datetime.utcnow)
 
 class SnapshotRecibido(Base):
     __tablename__ = "snapshot_recibido"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     analisis_id = Column(UUID(as_uuid=True), ForeignKey("analisis.id"))
-    payload_completo = Column(Text) 
+    payload_completo = Column(Text, nullable=True) # Legado (SNAPSHOT_ALMACENAMIENTO="texto")
+    payload_hash = Column(String(64), ForeignKey("payload_snapshot.hash"), nullable=True, index=True)
     recibido_at = Column(DateTime, default=datetime.utcnow)
 
     analisis = relationship("Analisis", back_populates="snapshot")
+    payload = relationship("PayloadSnapshot")
     proyecto = relationship("DatoProyecto", backref="snapshot")
     etapas = relationship("DatoEtapa", backref="snapshot")
     avances = relationship("DatoAvance", backref="snapshot")
@@ -66,6 +123,11 @@ class ObservacionGenerada(Base):
     
     resultado = relationship("ResultadoAnalisis", back_populates="observaciones")
 
+    # Filtro "análisis con riesgos CRITICO": se resuelve solo con el índice
+    __table_args__ = (
+        Index("ix_observacion_resultado_nivel", "resultado_id", "nivel"),
+    )
+
 class DatoProyecto(Base):
     __tablename__ = "dato_proyecto"
     id = Column(Integer, primary_key=True, index=True)
@@ -114,44 +176,149 @@ class DatoSeguridad(Base):
 
 # --- TABLAS PARA PASO 3: AUDITORÍA LLM ---
 
+# Las tres tablas de auditoría (las que más crecen: prompts y completions
+# completos) van particionadas por mes en Postgres (app/db/particiones.py). La
+# clave de partición tiene que ser parte de la PK, por eso la fecha se suma al
+# id; la identidad ORM sigue siendo solo el id. Entre ellas no hay FK (Postgres
+# exigiría referenciar la PK compuesta): el vínculo es invocacion_id indexado.
+
 class InvocacionLLM(Base):
     __tablename__ = "invocacion_llm"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    analisis_id = Column(UUID(as_uuid=True), ForeignKey("analisis.id"))
+    analisis_id = Column(UUID(as_uuid=True), ForeignKey("analisis.id"), index=True) # Índice local por partición: /detalle busca sin clave de partición y consulta el de cada una
     modelo_usado = Column(String) # ej: "gpt-4o" o "llama-3"
     tokens_prompt = Column(Integer, nullable=True)
+    tokens_prompt_estimados = Column(Integer, nullable=True) # Estimación local previa al envío (para calibrar)
     tokens_respuesta = Column(Integer, nullable=True)
     duracion_ms = Column(Integer, nullable=True)
     exitosa = Column(Boolean, default=True)
     error_detalle = Column(Text, nullable=True)
-    invocado_at = Column(DateTime, default=datetime.utcnow)
+    desde_cache = Column(Boolean, default=False) # True si la respuesta salió de la caché (0 tokens)
+    espera_cola_ms = Column(Integer, nullable=True) # Tiempo esperando cupo del limitador antes de enviar
+    invocado_at = Column(DateTime, primary_key=True, default=datetime.utcnow) # Clave de partición
 
     # Relaciones
-    prompts = relationship("PromptGenerado", back_populates="invocacion", uselist=False)
-    respuesta = relationship("RespuestaLLM", back_populates="invocacion", uselist=False)
+    prompts = relationship(
+        "PromptGenerado", primaryjoin="InvocacionLLM.id == foreign(PromptGenerado.invocacion_id)",
+        back_populates="invocacion", uselist=False
+    )
+    respuesta = relationship(
+        "RespuestaLLM", primaryjoin="InvocacionLLM.id == foreign(RespuestaLLM.invocacion_id)",
+        back_populates="invocacion", uselist=False
+    )
+
+    __table_args__ = {"postgresql_partition_by": "RANGE (invocado_at)"}
+    __mapper_args__ = {"primary_key": [id]}
 
 class PromptGenerado(Base):
     __tablename__ = "prompt_generado"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    invocacion_id = Column(UUID(as_uuid=True), ForeignKey("invocacion_llm.id"))
+    invocacion_id = Column(UUID(as_uuid=True), index=True)
     system_prompt = Column(Text)
     user_prompt = Column(Text)
-    generado_at = Column(DateTime, default=datetime.utcnow)
+    # sha256(snapshot canónico + prompts + modelo): clave de la caché persistente
+    cache_key = Column(String(64), index=True, nullable=True)
+    generado_at = Column(DateTime, primary_key=True, default=datetime.utcnow) # Clave de partición
+
+    invocacion = relationship(
+        "InvocacionLLM", primaryjoin="foreign(PromptGenerado.invocacion_id) == InvocacionLLM.id",
+        back_populates="prompts"
+    )
 
-    invocacion = relationship("InvocacionLLM", back_populates="prompts")
+    __table_args__ = {"postgresql_partition_by": "RANGE (generado_at)"}
+    __mapper_args__ = {"primary_key": [id]}
 
 class RespuestaLLM(Base):
     __tablename__ = "respuesta_llm"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    invocacion_id = Column(UUID(as_uuid=True), ForeignKey("invocacion_llm.id"))
+    invocacion_id = Column(UUID(as_uuid=True), index=True)
     respuesta_raw = Column(Text) # El JSON string tal cual vino de la IA
-    respuesta_parseada = Column(JSON) # El objeto ya convertido
-    recibida_at = Column(DateTime, default=datetime.utcnow)
+    respuesta_parseada = Column(JSON(none_as_null=True)) # El objeto ya convertido; NULL si no validó
+    recibida_at = Column(DateTime, primary_key=True, default=datetime.utcnow) # Clave de partición
+
+    invocacion = relationship(
+        "InvocacionLLM", primaryjoin="foreign(RespuestaLLM.invocacion_id) == InvocacionLLM.id",
+        back_populates="respuesta"
+    )
+
+    __table_args__ = {"postgresql_partition_by": "RANGE (recibida_at)"}
+    __mapper_args__ = {"primary_key": [id]}
+
+class CupoModeloLLM(Base):
+    """
+    Estado compartido de las cubetas del limitador de OpenRouter (una fila por
+    modelo). Los procesos la leen y actualizan con SELECT ... FOR UPDATE.
+    """
+    __tablename__ = "cupo_modelo_llm"
+
+    modelo = Column(String, primary_key=True)
+    solicitudes = Column(Float, nullable=False) # Fichas disponibles (pueden quedar negativas: deuda de la cola)
+    tokens = Column(Float, nullable=False)
+    actualizado = Column(Float, nullable=False) # Epoch en segundos de la última recarga
+    pausa_hasta = Column(Float, default=0.0) # Retry-After / X-RateLimit-Reset recibido
+
+# --- ESTADÍSTICAS AGREGADAS (rollups) ---
+
+class EstadisticaDiaria(Base):
+    """
+    Acumulados por (proyecto, día UTC, modelo), sumados en la misma transacción
+    que audita las invocaciones o que completa el análisis. Los tableros leen solo
+    esta tabla: su tamaño crece con proyectos x días x modelos, no con la auditoría.
+    Todas las columnas son sumas para que el upsert sea un simple incremento.
+    """
+    __tablename__ = "estadistica_diaria"
+
+    proyecto_codigo = Column(String, primary_key=True)
+    dia = Column(Date, primary_key=True)
+    modelo = Column(String, primary_key=True) # "sin_cambios" para resultados reutilizados
+
+    # Invocaciones a OpenRouter (incluye fallidas y canceladas por hedging)
+    invocaciones = Column(Integer, nullable=False, default=0)
+    invocaciones_exitosas = Column(Integer, nullable=False, default=0)
+    invocaciones_cache = Column(Integer, nullable=False, default=0) # Hits de caché / reutilizaciones, sin LLM
+    tokens_prompt = Column(BigInteger, nullable=False, default=0)
+    tokens_respuesta = Column(BigInteger, nullable=False, default=0)
+    duracion_ms_total = Column(BigInteger, nullable=False, default=0)
+
+    # Análisis completados con la respuesta de este modelo
+    analisis_completados = Column(Integer, nullable=False, default=0)
+    score_total = Column(Float, nullable=False, default=0.0)
+    riesgos_critico = Column(Integer, nullable=False, default=0)
+    riesgos_atencion = Column(Integer, nullable=False, default=0)
+    riesgos_informativo = Column(Integer, nullable=False, default=0)
+
+    # Rangos de fechas sin filtrar por proyecto (tablero general)
+    __table_args__ = (
+        Index("ix_estadistica_diaria_dia", "dia"),
+    )
+
+# --- OUTBOX DE WEBHOOKS ---
+
+class WebhookOutbox(Base):
+    """
+    Notificación pendiente de entrega. Se escribe en la misma transacción que
+    deja el análisis COMPLETADO y la entrega el despachador en segundo plano.
+    """
+    __tablename__ = "webhook_outbox"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    analisis_id = Column(UUID(as_uuid=True), ForeignKey("analisis.id"), index=True)
+    url = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    estado = Column(Enum(EstadoWebhook), default=EstadoWebhook.PENDIENTE)
+    intentos = Column(Integer, default=0)
+    proximo_intento_at = Column(DateTime, default=datetime.utcnow)
+    ultimo_error = Column(Text, nullable=True)
+    creado_at = Column(DateTime, default=datetime.utcnow)
+    entregado_at = Column(DateTime, nullable=True)
 
-    invocacion = relationship("InvocacionLLM", back_populates="respuesta")
+    # El despachador busca PENDIENTES vencidos por orden de próximo intento
+    __table_args__ = (
+        Index("ix_webhook_outbox_estado_proximo", "estado", "proximo_intento_at"),
+    )
 
 # --- NUEVA TABLA: SEGURIDAD Y USUARIOS ---
 
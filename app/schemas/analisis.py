@@ -0,0 +1,170 @@
+import unicodedata
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+from typing import Any, List, Literal, Optional
+from uuid import UUID
+from datetime import date, datetime
+
+from app.models.analisis import EstadoAnalisis, ModoAnalisis
+
+# Proyección liviana para listados: solo columnas, sin cargar el grafo ORM
+class AnalisisResumen(BaseModel):
+    id: UUID
+    proyecto_codigo: str
+    fecha_solicitud: datetime
+    estado: EstadoAnalisis
+    detecta_riesgos: Optional[bool] = None
+    score_coherencia: Optional[float] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class PaginaAnalisis(BaseModel):
+    items: List[AnalisisResumen]
+    # Cursor opaco para pedir la página siguiente (None si no hay más)
+    siguiente_cursor: Optional[str] = None
+
+# --- Detalle de un análisis (GET /analisis/detalle/{id}) ---
+
+class ProyectoOut(BaseModel):
+    codigo: Optional[str] = None
+    nombre: Optional[str] = None
+    responsable_tecnico: Optional[str] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class AvanceOut(BaseModel):
+    fecha_registro: Optional[date] = None
+    supervisor: Optional[str] = None
+    porcentaje_avance: Optional[int] = None
+    presenta_desvios: Optional[bool] = None
+    tareas_ejecutadas: Optional[List[Any]] = None
+    oficios_activos: Optional[List[Any]] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class SeguridadOut(BaseModel):
+    fecha_registro: Optional[date] = None
+    medidas_implementadas: Optional[List[Any]] = None
+    total_medidas_chequeadas: Optional[int] = None
+    cumple_todas: Optional[bool] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class DatosObraOut(BaseModel):
+    proyecto: Optional[ProyectoOut] = None
+    etapas: int = 0 # Cantidad de etapas (las filas no se cargan)
+    # Solo presentes con ?include=avances / ?include=seguridad
+    avances: Optional[List[AvanceOut]] = None
+    seguridad: Optional[List[SeguridadOut]] = None
+
+class PromptOut(BaseModel):
+    system_prompt: Optional[str] = None
+    user_prompt: Optional[str] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class InvocacionOut(BaseModel):
+    modelo: Optional[str] = None
+    tokens: int = 0
+    tokens_prompt: Optional[int] = None
+    tokens_prompt_estimados: Optional[int] = None # Estimación local antes del envío
+    exitosa: Optional[bool] = None
+    desde_cache: Optional[bool] = None
+    duracion_ms: Optional[int] = None
+    espera_cola_ms: Optional[int] = None # Espera por cupo del limitador antes del envío
+    invocado_at: Optional[datetime] = None
+    prompt: Optional[PromptOut] = None # Solo con ?include=prompts
+
+class ObservacionOut(BaseModel):
+    titulo: Optional[str] = None
+    descripcion: Optional[str] = None
+    nivel: Optional[str] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class ResultadoOut(BaseModel):
+    resumen_general: Optional[str] = None
+    score_coherencia: Optional[float] = None
+    detecta_riesgos: Optional[bool] = None
+    generado_at: Optional[datetime] = None
+    observaciones: List[ObservacionOut] = []
+
+    model_config = ConfigDict(from_attributes=True)
+
+class AnalisisDetalle(BaseModel):
+    id: UUID
+    proyecto_codigo: Optional[str] = None
+    fecha_solicitud: Optional[datetime] = None
+    estado: EstadoAnalisis
+    modo: Optional[ModoAnalisis] = None
+    analisis_base_id: Optional[UUID] = None # Análisis previo contra el que se calculó el delta
+    datos_obra: DatosObraOut
+    auditoria: List[InvocacionOut]
+    resultado: Optional[ResultadoOut] = None
+
+# --- Estadísticas agregadas (GET /analisis/estadisticas) ---
+
+class EstadisticaFila(BaseModel):
+    # Solo vienen las dimensiones pedidas en agrupar_por
+    proyecto: Optional[str] = None
+    dia: Optional[date] = None
+    modelo: Optional[str] = None
+    invocaciones: int
+    invocaciones_exitosas: int
+    invocaciones_cache: int
+    tokens_prompt: int
+    tokens_respuesta: int
+    duracion_ms_total: int
+    duracion_ms_promedio: Optional[float] = None
+    analisis_completados: int
+    score_total: float
+    score_promedio: Optional[float] = None
+    riesgos_critico: int
+    riesgos_atencion: int
+    riesgos_informativo: int
+
+class EstadisticasOut(BaseModel):
+    desde: date
+    hasta: date
+    agrupar_por: List[str]
+    filas: List[EstadisticaFila]
+
+# --- Respuesta del LLM (contrato {resumen, score_coherencia, riesgos}) ---
+
+# Variantes que los modelos devuelven en lugar de los tres niveles pedidos
+_SINONIMOS_NIVEL = {
+    "CRITICA": "CRITICO", "ALTO": "CRITICO", "ALTA": "CRITICO",
+    "MEDIO": "ATENCION", "MEDIA": "ATENCION", "MODERADO": "ATENCION", "ADVERTENCIA": "ATENCION",
+    "BAJO": "INFORMATIVO", "BAJA": "INFORMATIVO", "INFO": "INFORMATIVO", "INFORMATIVA": "INFORMATIVO",
+}
+
+class RiesgoIA(BaseModel):
+    titulo: str = Field(min_length=1)
+    descripcion: str = ""
+    nivel: Literal["CRITICO", "ATENCION", "INFORMATIVO"]
+
+    @field_validator("nivel", mode="before")
+    @classmethod
+    def normalizar_nivel(cls, valor):
+        if not isinstance(valor, str):
+            return valor
+        # "Crítico", " atención " -> CRITICO, ATENCION
+        limpio = unicodedata.normalize("NFKD", valor).encode("ascii", "ignore").decode().strip().upper()
+        return _SINONIMOS_NIVEL.get(limpio, limpio)
+
+class RespuestaIA(BaseModel):
+    resumen: str = Field(min_length=1)
+    score_coherencia: int = Field(ge=0, le=100)
+    riesgos: List[RiesgoIA] = []
+
+    @field_validator("score_coherencia", mode="before")
+    @classmethod
+    def redondear_score(cls, valor):
+        # 78.5 o "78" son respuestas usables: se redondean en lugar de rechazarse
+        if isinstance(valor, str):
+            try:
+                valor = float(valor.strip().rstrip("%"))
+            except ValueError:
+                return valor
+        if isinstance(valor, float):
+            return round(valor)
+        return valor
@@ -1,6 +1,11 @@
-from pydantic import BaseModel
-from typing import List, Dict, Any
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any, Optional
 
 class SnapshotCreate(BaseModel):
     proyecto_codigo: str
-    datos: Dict[str, Any] # Aquí recibiremos todo el JSON complejo
\ No newline at end of file
+    datos: Dict[str, Any] # Aquí recibiremos todo el JSON complejo
+
+class LoteCreate(BaseModel):
+    snapshots: List[SnapshotCreate]
+    # Si no se indica se usa LOTE_CONCURRENCIA_DEFECTO
+    max_concurrencia: Optional[int] = Field(default=None, ge=1)
@@ -16,4 +16,19 @@ class UserOut(BaseModel):
     is_active: bool
     created_at: datetime
 
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+# Credenciales para POST /auth/login
+class LoginIn(BaseModel):
+    email: EmailStr
+    password: str
+
+class Token(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+    expires_in: int # Segundos
+
+# Usuario autenticado según los claims del JWT (sin consultar la tabla usuarios)
+class UsuarioToken(BaseModel):
+    id: UUID
+    username: str
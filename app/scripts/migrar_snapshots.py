@@ -0,0 +1,84 @@
+"""
+Migración: snapshot_recibido.payload_completo (texto) -> payload_snapshot.
+
+1. Crea la tabla payload_snapshot y la columna snapshot_recibido.payload_hash
+   si no existen (app.db.esquema, el mismo paso que corre en el arranque).
+2. Recorre en lotes los snapshots con payload de texto, guarda su contenido
+   en payload_snapshot (deduplicado por hash) y vacía el texto legado.
+
+Uso:
+    python -m app.scripts.migrar_snapshots --formato jsonb --lote 500
+    python -m app.scripts.migrar_snapshots --formato zstd --conservar-texto
+"""
+import argparse
+import orjson
+from sqlalchemy import select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.core.logging import setup_logging
+from app.db.base import engine
+from app.db.esquema import sincronizar_esquema
+from app.models.analisis import PayloadSnapshot, SnapshotRecibido
+from app.services.snapshot_store import armar_fila
+import logging
+
+logger = logging.getLogger(__name__)
+
+def migrar(formato: str, lote: int, conservar_texto: bool) -> dict:
+    insertar = postgresql.insert if engine.dialect.name == "postgresql" else sqlite.insert
+    migrados = bytes_antes = 0
+    hashes = set()
+    ultimo_id = None
+
+    while True:
+        with Session(engine) as db:
+            consulta = (
+                select(SnapshotRecibido.id, SnapshotRecibido.payload_completo)
+                .where(SnapshotRecibido.payload_hash.is_(None), SnapshotRecibido.payload_completo.is_not(None))
+                .order_by(SnapshotRecibido.id)
+                .limit(lote)
+            )
+            # Las filas con --conservar-texto o inválidas siguen matcheando: avanzamos por id
+            if ultimo_id is not None:
+                consulta = consulta.where(SnapshotRecibido.id > ultimo_id)
+            filas = db.execute(consulta).all()
+            if not filas:
+                break
+
+            for snapshot_id, payload_completo in filas:
+                try:
+                    fila = armar_fila(orjson.loads(payload_completo), formato)
+                except orjson.JSONDecodeError:
+                    logger.warning("⚠️ Snapshot %s con payload inválido, se deja como texto", snapshot_id)
+                    continue
+                db.execute(insertar(PayloadSnapshot).values(**fila).on_conflict_do_nothing(index_elements=["hash"]))
+                valores = {"payload_hash": fila["hash"]}
+                if not conservar_texto:
+                    valores["payload_completo"] = None
+                db.execute(update(SnapshotRecibido).where(SnapshotRecibido.id == snapshot_id).values(**valores))
+                bytes_antes += len(payload_completo.encode("utf-8"))
+                hashes.add(fila["hash"])
+                migrados += 1
+            db.commit()
+
+        ultimo_id = filas[-1][0]
+        logger.info("📦 %s snapshots migrados (%s payloads únicos)", migrados, len(hashes))
+
+    return {"snapshots": migrados, "payloads_unicos": len(hashes), "bytes_texto_original": bytes_antes}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--formato", choices=["jsonb", "zstd"], default="jsonb")
+    parser.add_argument("--lote", type=int, default=500)
+    parser.add_argument("--conservar-texto", action="store_true", help="No vaciar payload_completo (permite volver atrás)")
+    args = parser.parse_args()
+
+    setup_logging()
+    with engine.begin() as conexion:
+        sincronizar_esquema(conexion)
+    resumen = migrar(args.formato, args.lote, args.conservar_texto)
+    logger.info("✅ Migración terminada: %s", resumen)
+
+if __name__ == "__main__":
+    main()
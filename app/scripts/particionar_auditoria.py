@@ -0,0 +1,63 @@
+"""
+Particionado mensual de la auditoría LLM (invocacion_llm, prompt_generado,
+respuesta_llm). Solo Postgres.
+
+1. Convierte las tablas que todavía son comunes (bases creadas antes del
+   particionado): una transacción por tabla, que la bloquea mientras copia.
+2. Crea las particiones del mes actual y de los AUDITORIA_PARTICIONES_ADELANTE
+   siguientes (lo mismo que hace el arranque y el mantenimiento periódico).
+3. Con --archivar, exporta a AUDITORIA_ARCHIVO_DIR y suelta las particiones
+   vencidas según AUDITORIA_RETENCION_MESES / AUDITORIA_RETENCION_INVOCACIONES_MESES.
+
+La poda por mes la verifica tests/test_particiones.py (EXPLAIN contra TEST_POSTGRES_URL).
+
+Uso:
+    python -m app.scripts.particionar_auditoria
+    python -m app.scripts.particionar_auditoria --conservar-legado
+    python -m app.scripts.particionar_auditoria --archivar
+"""
+import argparse
+import sys
+
+from app.core.logging import setup_logging
+from app.db.base import engine
+from app.db.esquema import sincronizar_esquema
+from app.db.particiones import TABLAS_PARTICIONADAS, convertir_tabla, es_particionada
+from app.services.archivo_auditoria import archivar_vencidas
+import logging
+
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conservar-legado", action="store_true", help="No borra <tabla>_legado tras copiar (borrarla a mano luego)")
+    parser.add_argument("--archivar", action="store_true", help="Exporta y suelta las particiones vencidas")
+    args = parser.parse_args()
+
+    setup_logging()
+    if engine.dialect.name != "postgresql":
+        logger.error("❌ El particionado de la auditoría requiere Postgres")
+        sys.exit(1)
+
+    for tabla in TABLAS_PARTICIONADAS:
+        with engine.begin() as conexion:
+            if not conexion.dialect.has_table(conexion, tabla):
+                continue # La crea particionada sincronizar_esquema
+            if es_particionada(conexion, tabla):
+                logger.info("✅ %s ya está particionada", tabla)
+                continue
+            logger.info("🔄 Convirtiendo %s...", tabla)
+            resumen = convertir_tabla(conexion, tabla, args.conservar_legado)
+        logger.info("✅ %s: %s filas en %s particiones", tabla, resumen['filas'], resumen['particiones'])
+
+    with engine.begin() as conexion:
+        sincronizar_esquema(conexion)
+    if args.archivar:
+        archivadas = archivar_vencidas(engine)
+        for archivada in archivadas:
+            logger.info("🗄️ %s: %s filas archivadas", archivada['particion'], archivada['filas'])
+        if not archivadas:
+            logger.info("✅ No hay particiones vencidas")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Backfill: recalcula estadistica_diaria desde la auditoría (invocacion_llm,
+resultado_analisis, observacion_generada).
+
+1. Crea la tabla si no existe (app.db.esquema, el mismo paso del arranque).
+2. Borra los rollups del rango (todos, o desde --desde) y los vuelve a sumar
+   con GROUP BY, en una sola transacción: quien consulte ve los valores
+   viejos o los nuevos, nunca una mezcla.
+
+Sirve para la carga inicial, tras correr con ESTADISTICAS_HABILITADAS=False o
+si se sospecha que los acumulados divergieron. Con retención de invocaciones
+(AUDITORIA_RETENCION_INVOCACIONES_MESES) solo se recalcula desde el primer mes
+que sigue en la base: los rollups anteriores son lo único que queda de ese período.
+
+Uso:
+    python -m app.scripts.reconstruir_estadisticas
+    python -m app.scripts.reconstruir_estadisticas --desde 2026-01-01
+"""
+import argparse
+import time
+from datetime import date
+
+from app.core.logging import setup_logging
+from app.db.base import engine
+from app.db.esquema import sincronizar_esquema
+from app.services.archivo_auditoria import limite_retencion
+from app.services.estadisticas_diarias import reconstruir
+import logging
+
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--desde", type=date.fromisoformat, default=None, help="Día UTC (AAAA-MM-DD) desde el que recalcular")
+    parser.add_argument("--lote", type=int, default=1000, help="Filas por upsert")
+    args = parser.parse_args()
+
+    setup_logging()
+    conservado = limite_retencion("invocacion_llm") if engine.dialect.name == "postgresql" else None
+    if conservado and (args.desde is None or args.desde < conservado):
+        logger.warning("⚠️ Invocaciones archivadas antes de %s: se recalcula desde esa fecha", conservado)
+        args.desde = conservado
+    with engine.begin() as conexion:
+        sincronizar_esquema(conexion)
+
+    inicio = time.perf_counter()
+    with engine.begin() as conexion:
+        resumen = reconstruir(conexion, args.desde, args.lote)
+    logger.info("✅ Estadísticas reconstruidas en %.1fs: %s", time.perf_counter() - inicio, resumen)
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,186 @@
-from sqlalchemy.orm import Session
-from app.models.analisis import Analisis, SnapshotRecibido, EstadoAnalisis
-from app.schemas.snapshot import SnapshotCreate
 import json
+import uuid
+from datetime import datetime
+from sqlalchemy import exists, insert, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.settings import settings
+from app.models.analisis import (
+    Analisis, SnapshotRecibido, EstadoAnalisis, LoteAnalisis,
+    DatoProyecto, DatoEtapa, DatoAvance, DatoSeguridad,
+    ResultadoAnalisis, ObservacionGenerada
+)
+from app.schemas.snapshot import SnapshotCreate, LoteCreate
+from app.services.snapshot_store import guardar_payload, serializar
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _parsear_fecha(valor):
+    try:
+        return datetime.strptime(valor, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+
+def consulta_listado(proyecto_codigo: str = None, estado: EstadoAnalisis = None,
+                     desde: datetime = None, hasta: datetime = None,
+                     detecta_riesgos: bool = None, nivel: str = None, despues_de: tuple = None):
+    """
+    SELECT del listado de análisis (solo columnas, sin grafo ORM), ordenado del
+    más reciente al más antiguo. `despues_de` es el (fecha_solicitud, id) de la
+    última fila de la página anterior: paginación por keyset, sin OFFSET.
+    """
+    consulta = (
+        select(
+            Analisis.id, Analisis.proyecto_codigo, Analisis.fecha_solicitud, Analisis.estado,
+            ResultadoAnalisis.detecta_riesgos, ResultadoAnalisis.score_coherencia
+        )
+        .outerjoin(ResultadoAnalisis, ResultadoAnalisis.analisis_id == Analisis.id)
+    )
+
+    if proyecto_codigo:
+        consulta = consulta.where(Analisis.proyecto_codigo == proyecto_codigo)
+    if estado:
+        consulta = consulta.where(Analisis.estado == estado)
+    if desde:
+        consulta = consulta.where(Analisis.fecha_solicitud >= desde)
+    if hasta:
+        consulta = consulta.where(Analisis.fecha_solicitud <= hasta)
+    if detecta_riesgos is not None:
+        consulta = consulta.where(ResultadoAnalisis.detecta_riesgos.is_(detecta_riesgos))
+    if nivel:
+        consulta = consulta.where(exists().where(
+            ObservacionGenerada.resultado_id == ResultadoAnalisis.id,
+            ObservacionGenerada.nivel == nivel.upper()
+        ))
+    if despues_de:
+        consulta = consulta.where(tuple_(Analisis.fecha_solicitud, Analisis.id) < despues_de)
+
+    return consulta.order_by(Analisis.fecha_solicitud.desc(), Analisis.id.desc())
 
 class AnalisisService:
-    def __init__(self, db: Session):
+    """
+    Persistencia de snapshots. Las filas hijas (etapas, avances, seguridad) se
+    insertan en bloque: un executemany por tabla (o COPY en PostgreSQL para
+    snapshots grandes) en lugar de un db.add por fila.
+    """
+    def __init__(self, db: AsyncSession):
         self.db = db
 
-    def crear_analisis(self, datos: SnapshotCreate) -> Analisis:
-        # 1. Crear la entidad Analisis
+    async def crear_analisis(self, snapshot_in: SnapshotCreate, estado: EstadoAnalisis = EstadoAnalisis.PENDIENTE,
+                             lote_id: uuid.UUID = None) -> Analisis:
+        """Crea el Analisis y su snapshot estructurado. No hace commit (lo decide el llamador)."""
+        # 1. Ids generados del lado de Python: evitamos un flush por cada padre
         nuevo_analisis = Analisis(
-            proyecto_codigo=datos.proyecto.proyecto_codigo,
-            estado=EstadoAnalisis.PENDIENTE
+            id=uuid.uuid4(),
+            proyecto_codigo=snapshot_in.proyecto_codigo,
+            estado=estado,
+            lote_id=lote_id
         )
-        self.db.add(nuevo_analisis)
-        self.db.flush() # Para obtener el ID generado
-
-        # 2. Guardar el Snapshot (Inmutabilidad)
-        # Convertimos el objeto Pydantic a JSON string para guardarlo
-        payload_str = json.dumps(datos.model_dump(), default=str)
-        
-        snapshot = SnapshotRecibido(
-            analisis_id=nuevo_analisis.id,
-            payload_completo=payload_str
+        snapshot = SnapshotRecibido(id=uuid.uuid4(), analisis_id=nuevo_analisis.id)
+        if settings.SNAPSHOT_ALMACENAMIENTO == "texto":
+            snapshot.payload_completo = serializar(snapshot_in.datos).decode()
+        else:
+            # Contenido direccionado por hash: payloads repetidos se guardan una vez
+            snapshot.payload_hash = await guardar_payload(self.db, snapshot_in.datos)
+        self.db.add_all([nuevo_analisis, snapshot])
+        await self.db.flush()
+
+        # 2. Filas hijas en bloque
+        await self.persistir_datos(snapshot.id, snapshot_in.datos)
+        return nuevo_analisis
+
+    async def crear_lote(self, lote_in: LoteCreate) -> tuple:
+        """
+        Crea el lote y todos sus análisis en la transacción en curso (sin commit).
+        Devuelve (lote, ids de análisis en el mismo orden que los snapshots).
+        """
+        lote = LoteAnalisis(
+            id=uuid.uuid4(),
+            total_items=len(lote_in.snapshots),
+            max_concurrencia=lote_in.max_concurrencia or settings.LOTE_CONCURRENCIA_DEFECTO
         )
-        self.db.add(snapshot)
-        
-        # 3. Commit de la transacción
-        self.db.commit()
-        self.db.refresh(nuevo_analisis)
-        
-        return nuevo_analisis
\ No newline at end of file
+        self.db.add(lote)
+        await self.db.flush()
+
+        ids_analisis = []
+        for snapshot_in in lote_in.snapshots:
+            analisis = await self.crear_analisis(snapshot_in, lote_id=lote.id)
+            ids_analisis.append(analisis.id)
+        return lote, ids_analisis
+
+    async def persistir_datos(self, snapshot_id: uuid.UUID, datos_json: dict):
+        proyecto = datos_json.get("proyecto", {}) or {}
+        await self.db.execute(insert(DatoProyecto), [{
+            "snapshot_id": snapshot_id,
+            "codigo": proyecto.get("codigo"),
+            "nombre": proyecto.get("nombre"),
+            "responsable_tecnico": proyecto.get("responsable_tecnico")
+        }])
+
+        etapas = [
+            {
+                "snapshot_id": snapshot_id,
+                "nombre": etapa.get("nombre"),
+                "estado": etapa.get("estado"),
+                "avance_estimado": etapa.get("avance_estimado")
+            }
+            for etapa in datos_json.get("etapas", []) if isinstance(etapa, dict)
+        ]
+        if etapas:
+            await self.db.execute(insert(DatoEtapa), etapas)
+
+        avances = [
+            {
+                "snapshot_id": snapshot_id,
+                "fecha_registro": _parsear_fecha(avance.get("fecha")),
+                "supervisor": avance.get("supervisor"),
+                "porcentaje_avance": avance.get("porcentaje_avance"),
+                "presenta_desvios": avance.get("presenta_desvios", False),
+                "tareas_ejecutadas": avance.get("tareas_ejecutadas", []),
+                "oficios_activos": avance.get("oficios_activos", [])
+            }
+            for avance in datos_json.get("registros_avance", []) if isinstance(avance, dict)
+        ]
+        if avances:
+            copiado = len(avances) >= settings.SNAPSHOT_COPY_UMBRAL and await self._copiar_avances(avances)
+            if not copiado:
+                await self.db.execute(insert(DatoAvance), avances)
+
+        lista_seguridad = datos_json.get("medidas_seguridad", [])
+        if lista_seguridad:
+            total = len(lista_seguridad)
+            cumple = sum(1 for m in lista_seguridad if isinstance(m, dict) and m.get("cumple") is True)
+            await self.db.execute(insert(DatoSeguridad), [{
+                "snapshot_id": snapshot_id,
+                "fecha_registro": datetime.now().date(),
+                "medidas_implementadas": lista_seguridad,
+                "total_medidas_chequeadas": total,
+                "cumple_todas": (total == cumple)
+            }])
+
+    async def _copiar_avances(self, avances: list) -> bool:
+        """
+        COPY binario vía asyncpg para snapshots muy grandes.
+        Devuelve False si el driver no es asyncpg (se usa executemany).
+        """
+        conexion = await self.db.connection()
+        raw = await conexion.get_raw_connection()
+        driver = getattr(raw, "driver_connection", None)
+        if driver is None or not hasattr(driver, "copy_records_to_table"):
+            return False
+
+        columnas = [
+            "snapshot_id", "fecha_registro", "supervisor", "porcentaje_avance",
+            "presenta_desvios", "tareas_ejecutadas", "oficios_activos"
+        ]
+        registros = [
+            (
+                a["snapshot_id"], a["fecha_registro"], a["supervisor"], a["porcentaje_avance"],
+                a["presenta_desvios"], json.dumps(a["tareas_ejecutadas"]), json.dumps(a["oficios_activos"])
+            )
+            for a in avances
+        ]
+        await driver.copy_records_to_table(DatoAvance.__tablename__, records=registros, columns=columnas)
+        logger.debug("📦 COPY de %s avances", len(registros))
+        return True
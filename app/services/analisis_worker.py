@@ -0,0 +1,162 @@
+import asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app.config.settings import settings
+from app.core.logging import contexto_analisis
+from app.core.metrics import ANALISIS_EN_PROCESO, observar_etapa
+from app.db import base as db_base
+from app.models.analisis import Analisis, EstadoAnalisis, LoteAnalisis
+from app.services.procesador_analisis import ProcesadorAnalisis
+import logging
+
+logger = logging.getLogger(__name__)
+
+async def contar_pendientes(db: AsyncSession) -> int:
+    """Cantidad de análisis esperando worker (usado para el backpressure del endpoint)."""
+    return await db.scalar(
+        select(func.count(Analisis.id)).where(Analisis.estado == EstadoAnalisis.PENDIENTE)
+    ) or 0
+
+def consulta_reclamo():
+    """SELECT con el que un worker toma el PENDIENTE más antiguo (índice estado + fecha)."""
+    # Lotes que ya tienen su max_concurrencia en PROCESANDO: sus items esperan.
+    # Es un tope blando (dos réplicas pueden reclamar a la vez), suficiente para
+    # que un lote grande no acapare todo el cupo de OpenRouter.
+    lotes_saturados = (
+        select(Analisis.lote_id)
+        .join(LoteAnalisis, LoteAnalisis.id == Analisis.lote_id)
+        .where(Analisis.estado == EstadoAnalisis.PROCESANDO)
+        .group_by(Analisis.lote_id, LoteAnalisis.max_concurrencia)
+        .having(func.count(Analisis.id) >= LoteAnalisis.max_concurrencia)
+    )
+    # selectinload (y no joinedload): FOR UPDATE no admite el lado nullable de un OUTER JOIN
+    return (
+        select(Analisis)
+        .options(selectinload(Analisis.snapshot))
+        .where(
+            Analisis.estado == EstadoAnalisis.PENDIENTE,
+            or_(Analisis.lote_id.is_(None), Analisis.lote_id.not_in(lotes_saturados))
+        )
+        .order_by(Analisis.fecha_solicitud)
+        .with_for_update(skip_locked=True)
+        .limit(1)
+    )
+
+class AnalisisWorker:
+    """
+    Pool de workers asyncio que drena la cola de análisis PENDIENTES.
+
+    Cada worker reclama filas con SELECT ... FOR UPDATE SKIP LOCKED, por lo que
+    varias réplicas (API o procesos `python -m app.worker`) comparten la misma
+    cola sin pisarse. La concurrencia está acotada por ANALISIS_WORKERS_CONCURRENCIA.
+    """
+    def __init__(self, concurrencia: int = None):
+        self.concurrencia = concurrencia or settings.ANALISIS_WORKERS_CONCURRENCIA
+        self._tareas: list[asyncio.Task] = []
+        self._hay_trabajo = asyncio.Event()
+        self._detenido = asyncio.Event()
+
+    async def iniciar(self):
+        # Antes de arrancar devolvemos a la cola lo que quedó colgado por una caída
+        await self.rescatar_huerfanos()
+        self._detenido.clear()
+        self._tareas = [
+            asyncio.create_task(self._bucle(n), name=f"analisis-worker-{n}")
+            for n in range(self.concurrencia)
+        ]
+        self._tareas.append(asyncio.create_task(self._bucle_rescate(), name="analisis-rescate"))
+        logger.info("👷 Worker pool iniciado con %s workers", self.concurrencia)
+
+    async def detener(self):
+        self._detenido.set()
+        self._hay_trabajo.set()
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
+        logger.info("🛑 Worker pool detenido")
+
+    def despertar(self):
+        """Avisa a los workers locales que hay trabajo nuevo (evita esperar al próximo sondeo)."""
+        self._hay_trabajo.set()
+
+    async def _reclamar(self, db: AsyncSession):
+        """Toma el PENDIENTE más antiguo que no esté bloqueado por otra réplica."""
+        analisis = (await db.execute(consulta_reclamo())).scalars().first()
+        if not analisis:
+            await db.rollback()
+            return None
+
+        analisis.estado = EstadoAnalisis.PROCESANDO
+        analisis.procesando_desde = datetime.utcnow()
+        analisis.intentos = (analisis.intentos or 0) + 1
+        await db.commit()
+        return analisis
+
+    async def _bucle(self, numero: int):
+        while not self._detenido.is_set():
+            try:
+                async with db_base.AsyncSessionLocal() as db:
+                    await self._ciclo(db, numero)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("⚠️ Error inesperado en worker %s: %s", numero, e)
+                await asyncio.sleep(settings.ANALISIS_POLL_SEGUNDOS)
+
+    async def _ciclo(self, db: AsyncSession, numero: int):
+        analisis = await self._reclamar(db)
+        if analisis is None:
+            # Cola vacía: dormimos hasta el próximo sondeo o hasta que nos despierten
+            self._hay_trabajo.clear()
+            try:
+                await asyncio.wait_for(self._hay_trabajo.wait(), timeout=settings.ANALISIS_POLL_SEGUNDOS)
+            except asyncio.TimeoutError:
+                pass
+            return
+
+        # Todo lo que se loguee procesándolo lleva el analisis_id; el log final suma los tiempos por etapa
+        with contexto_analisis(analisis.id):
+            logger.info("⚙️ Worker %s procesando análisis %s", numero, analisis.id)
+            if analisis.fecha_solicitud:
+                observar_etapa("espera_cola", (analisis.procesando_desde - analisis.fecha_solicitud).total_seconds())
+            ANALISIS_EN_PROCESO.inc()
+            try:
+                await ProcesadorAnalisis(db).procesar(analisis)
+            finally:
+                ANALISIS_EN_PROCESO.dec()
+
+    async def _bucle_rescate(self):
+        while not self._detenido.is_set():
+            await asyncio.sleep(settings.ANALISIS_TIMEOUT_PROCESANDO_SEGUNDOS / 4)
+            try:
+                await self.rescatar_huerfanos()
+            except Exception as e:
+                logger.error("⚠️ Error rescatando análisis huérfanos: %s", e)
+
+    async def rescatar_huerfanos(self) -> int:
+        """
+        Recuperación ante caídas: los PROCESANDO que superaron el timeout vuelven a
+        PENDIENTE, salvo que hayan agotado ANALISIS_MAX_INTENTOS (pasan a ERROR).
+        """
+        limite = datetime.utcnow() - timedelta(seconds=settings.ANALISIS_TIMEOUT_PROCESANDO_SEGUNDOS)
+        async with db_base.AsyncSessionLocal() as db:
+            huerfanos = (await db.execute(
+                select(Analisis)
+                .where(
+                    Analisis.estado == EstadoAnalisis.PROCESANDO,
+                    Analisis.procesando_desde < limite
+                )
+                .with_for_update(skip_locked=True)
+            )).scalars().all()
+            for analisis in huerfanos:
+                agotado = (analisis.intentos or 0) >= settings.ANALISIS_MAX_INTENTOS
+                analisis.estado = EstadoAnalisis.ERROR if agotado else EstadoAnalisis.PENDIENTE
+                analisis.procesando_desde = None
+            await db.commit()
+            if huerfanos:
+                logger.warning("♻️ %s análisis huérfanos recuperados", len(huerfanos))
+            return len(huerfanos)
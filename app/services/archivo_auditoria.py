@@ -0,0 +1,257 @@
+"""
+Retención de la auditoría LLM: las particiones mensuales vencidas se exportan a
+NDJSON comprimido en disco local y luego se sueltan (DETACH + DROP).
+
+Estructura en AUDITORIA_ARCHIVO_DIR:
+    <tabla>/<AAAA-MM>.ndjson.gz      una fila JSON por línea
+    <tabla>/<AAAA-MM>.indice.json    clave -> offsets de bloque
+
+El .gz es gzip multi-miembro (un miembro cada ARCHIVO_FILAS_POR_BLOQUE filas):
+`zcat` lo lee entero, y /detalle descomprime solo el bloque que necesita
+buscando la clave en el índice (invocacion_id para prompts y respuestas, id
+para invocaciones).
+"""
+import asyncio
+import gzip
+import os
+import zlib
+from datetime import datetime
+from functools import lru_cache
+
+import orjson
+from sqlalchemy import text
+
+from app.config.settings import settings
+from app.db.base import Base
+from app.db.particiones import (
+    TABLAS_PARTICIONADAS, asegurar_particiones, es_particionada, inicio_mes, particiones, sumar_meses
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+ARCHIVO_FILAS_POR_BLOQUE = 500
+CLAVE_INDICE = {
+    "invocacion_llm": "id",
+    "prompt_generado": "invocacion_id",
+    "respuesta_llm": "invocacion_id",
+}
+# Clave fija de pg_try_advisory_lock: una sola réplica archiva a la vez
+_LOCK_ARCHIVO = 0x61756469
+
+def _rutas(tabla: str, mes) -> tuple:
+    carpeta = os.path.join(settings.AUDITORIA_ARCHIVO_DIR, tabla)
+    return (
+        os.path.join(carpeta, f"{mes:%Y-%m}.ndjson.gz"),
+        os.path.join(carpeta, f"{mes:%Y-%m}.indice.json"),
+    )
+
+def _escribir_atomico(ruta: str, escribir):
+    """Escribe en <ruta>.tmp, fsync y rename: nunca queda un archivo a medias con el nombre final."""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f"{ruta}.tmp"
+    with open(temporal, "wb") as f:
+        escribir(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta)
+
+def escribir_archivo(tabla: str, mes, filas) -> int:
+    """Vuelca un iterable de filas (dicts) al archivo del mes. Devuelve cuántas escribió."""
+    ruta_datos, ruta_indice = _rutas(tabla, mes)
+    clave = CLAVE_INDICE[tabla]
+    indice: dict[str, list] = {}
+    total = 0
+
+    def escribir(f):
+        nonlocal total
+        bloque = []
+        for fila in filas:
+            bloque.append(fila)
+            if len(bloque) >= ARCHIVO_FILAS_POR_BLOQUE:
+                total += _volcar_bloque(f, bloque, clave, indice)
+                bloque = []
+        if bloque:
+            total += _volcar_bloque(f, bloque, clave, indice)
+
+    _escribir_atomico(ruta_datos, escribir)
+    _escribir_atomico(ruta_indice, lambda f: f.write(orjson.dumps({"filas": total, "claves": indice})))
+    return total
+
+def _volcar_bloque(f, bloque: list, clave: str, indice: dict) -> int:
+    offset = f.tell()
+    f.write(gzip.compress(b"".join(orjson.dumps(fila) + b"\n" for fila in bloque)))
+    for fila in bloque:
+        valor = str(fila[clave])
+        offsets = indice.setdefault(valor, [])
+        if offset not in offsets:
+            offsets.append(offset)
+    return len(bloque)
+
+def exportar_particion(conexion, tabla: str, nombre: str, mes) -> int:
+    """
+    Exporta la partición del mes y la suelta, dentro de la transacción de
+    `conexion`: si el conteo no coincide o falla el DROP, la partición queda.
+    """
+    columna = TABLAS_PARTICIONADAS[tabla]
+    modelo = Base.metadata.tables[tabla]
+    esperadas = conexion.execute(text(f"SELECT count(*) FROM {nombre}")).scalar()
+    # Rango sobre la tabla madre (poda a una partición) y cursor de servidor: no se carga el mes en memoria
+    resultado = conexion.execution_options(stream_results=True, yield_per=ARCHIVO_FILAS_POR_BLOQUE).execute(
+        modelo.select().where(modelo.c[columna] >= mes, modelo.c[columna] < sumar_meses(mes, 1))
+    )
+    escritas = escribir_archivo(tabla, mes, (dict(fila) for fila in resultado.mappings()))
+    if escritas != esperadas:
+        raise RuntimeError(f"{nombre}: se exportaron {escritas} filas de {esperadas}")
+
+    conexion.execute(text(f"ALTER TABLE {tabla} DETACH PARTITION {nombre}"))
+    conexion.execute(text(f"DROP TABLE {nombre}"))
+    return escritas
+
+def limite_retencion(tabla: str, ahora: datetime = None):
+    """Primer mes que se conserva en la base, o None si la tabla no se archiva."""
+    meses = (
+        settings.AUDITORIA_RETENCION_INVOCACIONES_MESES if tabla == "invocacion_llm"
+        else settings.AUDITORIA_RETENCION_MESES
+    )
+    if meses <= 0:
+        return None
+    return sumar_meses(inicio_mes(ahora or datetime.utcnow()), -meses)
+
+def archivar_vencidas(engine, ahora: datetime = None) -> list:
+    """Exporta y suelta las particiones anteriores al límite de retención de cada tabla (solo Postgres)."""
+    archivadas = []
+    if engine.dialect.name != "postgresql":
+        return archivadas
+    with engine.connect() as conexion:
+        if not conexion.execute(text("SELECT pg_try_advisory_lock(:clave)"), {"clave": _LOCK_ARCHIVO}).scalar():
+            logger.info("⏭️ Otra réplica está archivando la auditoría")
+            conexion.rollback()
+            return archivadas
+        conexion.commit()
+        try:
+            for tabla in TABLAS_PARTICIONADAS:
+                limite = limite_retencion(tabla, ahora)
+                if limite is None or not es_particionada(conexion, tabla):
+                    conexion.rollback()
+                    continue
+                vencidas = [(nombre, mes) for nombre, mes in particiones(conexion, tabla) if mes < limite]
+                conexion.rollback()
+                for nombre, mes in vencidas:
+                    # Una transacción por partición: lo ya archivado no se pierde si falla la siguiente
+                    with conexion.begin():
+                        filas = exportar_particion(conexion, tabla, nombre, mes)
+                    logger.info("🗄️ %s archivada (%s filas)", nombre, filas)
+                    archivadas.append({"tabla": tabla, "particion": nombre, "filas": filas})
+        finally:
+            conexion.execute(text("SELECT pg_advisory_unlock(:clave)"), {"clave": _LOCK_ARCHIVO})
+            conexion.commit()
+    return archivadas
+
+def mantener(engine, ahora: datetime = None) -> dict:
+    """Un ciclo completo: particiones por adelantado y archivo de las vencidas."""
+    if engine.dialect.name != "postgresql":
+        return {"creadas": [], "archivadas": []}
+    with engine.begin() as conexion:
+        creadas = asegurar_particiones(conexion)
+    return {"creadas": creadas, "archivadas": archivar_vencidas(engine, ahora)}
+
+# --- Lectura perezosa (para /detalle) ---
+
+@lru_cache(maxsize=64)
+def _cargar_indice(ruta: str, modificado: float) -> dict:
+    with open(ruta, "rb") as f:
+        return orjson.loads(f.read())["claves"]
+
+def _indice(tabla: str, mes):
+    ruta_datos, ruta_indice = _rutas(tabla, mes)
+    try:
+        # El mtime en la clave invalida la caché si el mes se vuelve a exportar
+        return ruta_datos, _cargar_indice(ruta_indice, os.path.getmtime(ruta_indice))
+    except FileNotFoundError:
+        return ruta_datos, None
+
+def _leer_bloque(ruta: str, offset: int) -> list:
+    """Descomprime solo el miembro gzip que empieza en `offset`."""
+    descompresor = zlib.decompressobj(wbits=31)
+    partes = []
+    with open(ruta, "rb") as f:
+        f.seek(offset)
+        while not descompresor.eof:
+            crudo = f.read(64 * 1024)
+            if not crudo:
+                break
+            partes.append(descompresor.decompress(crudo))
+    return [orjson.loads(linea) for linea in b"".join(partes).splitlines() if linea]
+
+def leer_archivadas(tabla: str, claves: list) -> dict:
+    """
+    Filas archivadas por clave. `claves` es [(clave, fecha aproximada)]: se busca
+    en el mes de la fecha y en los vecinos (el alta de la fila puede caer en otro mes
+    que la de la invocación). Devuelve {str(clave): fila}.
+    """
+    campo = CLAVE_INDICE[tabla]
+    por_bloque: dict[tuple, set] = {}
+    for clave, fecha in claves:
+        if fecha is None:
+            continue
+        mes = inicio_mes(fecha)
+        for candidato in (mes, sumar_meses(mes, 1), sumar_meses(mes, -1)):
+            ruta, indice = _indice(tabla, candidato)
+            offsets = indice.get(str(clave)) if indice else None
+            if offsets:
+                for offset in offsets:
+                    por_bloque.setdefault((ruta, offset), set()).add(str(clave))
+                break
+
+    encontradas = {}
+    for (ruta, offset), buscadas in por_bloque.items():
+        for fila in _leer_bloque(ruta, offset):
+            valor = str(fila.get(campo))
+            if valor in buscadas:
+                encontradas.setdefault(valor, fila)
+    return encontradas
+
+class MantenimientoAuditoria:
+    """
+    Tarea periódica (cada AUDITORIA_MANTENIMIENTO_HORAS) que crea las particiones
+    de los meses siguientes y archiva las vencidas. Corre el trabajo con el engine
+    sync en un hilo; en SQLite no arranca.
+    """
+    def __init__(self, engine):
+        self._engine = engine
+        self._tarea: asyncio.Task = None
+        self._detenido = asyncio.Event()
+
+    async def iniciar(self):
+        if self._engine.dialect.name != "postgresql":
+            return
+        self._detenido.clear()
+        self._tarea = asyncio.create_task(self._bucle(), name="auditoria-mantenimiento")
+        logger.info("🗄️ Mantenimiento de auditoría iniciado")
+
+    async def detener(self):
+        self._detenido.set()
+        if self._tarea:
+            self._tarea.cancel()
+            await asyncio.gather(self._tarea, return_exceptions=True)
+            self._tarea = None
+            logger.info("🛑 Mantenimiento de auditoría detenido")
+
+    async def _bucle(self):
+        while not self._detenido.is_set():
+            try:
+                resumen = await asyncio.to_thread(mantener, self._engine)
+                if resumen["creadas"] or resumen["archivadas"]:
+                    logger.info(
+                        "🗄️ Auditoría: %s particiones creadas, %s archivadas",
+                        len(resumen["creadas"]), len(resumen["archivadas"])
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("⚠️ Error en el mantenimiento de auditoría: %s", e)
+            try:
+                await asyncio.wait_for(self._detenido.wait(), timeout=settings.AUDITORIA_MANTENIMIENTO_HORAS * 3600)
+            except asyncio.TimeoutError:
+                pass
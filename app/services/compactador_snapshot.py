@@ -0,0 +1,177 @@
+import json
+import math
+from collections import Counter
+
+# Aproximación sin tokenizer: ~3.5 caracteres por token para JSON en español.
+# InvocacionLLM guarda estimado vs real para ir calibrándola.
+CARACTERES_POR_TOKEN = 3.5
+
+def estimar_tokens(texto: str) -> int:
+    return math.ceil(len(texto) / CARACTERES_POR_TOKEN)
+
+def json_compacto(valor) -> str:
+    return json.dumps(valor, ensure_ascii=False, separators=(",", ":"), default=str)
+
+def _recortar(texto, largo: int):
+    if isinstance(texto, str) and len(texto) > largo:
+        return texto[:largo - 1] + "…"
+    return texto
+
+def _limpiar(valor, largo: int):
+    """Quita nulos y vacíos y recorta strings largos (determinístico)."""
+    if isinstance(valor, dict):
+        limpio = {k: _limpiar(v, largo) for k, v in valor.items()}
+        return {k: v for k, v in limpio.items() if v not in (None, "", [], {})}
+    if isinstance(valor, list):
+        return [_limpiar(v, largo) for v in valor]
+    return _recortar(valor, largo)
+
+def resumir_avances(avances: list) -> dict:
+    """Estadísticas de todo el historial: lo que el modelo necesita sin leer cada registro."""
+    porcentajes = [a.get("porcentaje_avance") for a in avances if isinstance(a.get("porcentaje_avance"), (int, float))]
+    con_desvio = [a.get("fecha") for a in avances if a.get("presenta_desvios")]
+    ventana = porcentajes[-30:]
+    resumen = {
+        "registros": len(avances),
+        "desde": avances[0].get("fecha"),
+        "hasta": avances[-1].get("fecha"),
+        "registros_con_desvio": len(con_desvio),
+        "ultimas_fechas_con_desvio": con_desvio[-5:],
+        "supervisores": dict(Counter(a.get("supervisor") for a in avances if a.get("supervisor")).most_common(10)),
+        "tareas_frecuentes": dict(Counter(t for a in avances for t in a.get("tareas_ejecutadas") or []).most_common(10)),
+        "oficios_frecuentes": dict(Counter(o for a in avances for o in a.get("oficios_activos") or []).most_common(10)),
+    }
+    if porcentajes:
+        # Registros al final sin cambio de porcentaje: señal de obra estancada
+        estancados = 0
+        for p in reversed(porcentajes[:-1]):
+            if p != porcentajes[-1]:
+                break
+            estancados += 1
+        resumen.update({
+            "porcentaje_inicial": porcentajes[0],
+            "porcentaje_final": porcentajes[-1],
+            "tendencia_pp_por_registro_ultimos_30": round((ventana[-1] - ventana[0]) / max(len(ventana) - 1, 1), 2),
+            "registros_finales_sin_avance": estancados,
+        })
+    return resumen
+
+def resumir_medidas(medidas: list) -> dict:
+    cumplen = [m for m in medidas if m.get("cumple") is True]
+    incumplidas = sorted({str(m.get("item")) for m in medidas if m.get("cumple") is not True})
+    return {
+        "total": len(medidas),
+        "cumplen": len(cumplen),
+        "ratio_cumplimiento": round(len(cumplen) / len(medidas), 2) if medidas else None,
+        "incumplidas": incumplidas[:20],
+    }
+
+class Leyenda:
+    """Reemplaza strings repetidos por códigos cortos (~1, ~2...) y guarda el diccionario."""
+    def __init__(self, valores: list, minimo_repeticiones: int = 2, largo_minimo: int = 6):
+        conteo = Counter(v for v in valores if isinstance(v, str) and len(v) >= largo_minimo)
+        # Orden por frecuencia y luego alfabético: mismo input, mismos códigos
+        repetidos = sorted((v for v, n in conteo.items() if n >= minimo_repeticiones), key=lambda v: (-conteo[v], v))
+        self.codigos = {v: f"~{i + 1}" for i, v in enumerate(repetidos)}
+
+    def __call__(self, valor):
+        if isinstance(valor, list):
+            return [self.codigos.get(v, v) for v in valor]
+        return self.codigos.get(valor, valor)
+
+    def diccionario(self) -> dict:
+        return {codigo: valor for valor, codigo in self.codigos.items()}
+
+class CompactadorSnapshot:
+    """
+    Renderiza el snapshot para el prompt dentro de un presupuesto de tokens.
+
+    El historial de avances se resume con estadísticas y solo se detallan los
+    últimos registros; strings repetidos van a una leyenda. Si no entra, se
+    reduce en pasos fijos (registros detallados, etapas, largo de textos) y,
+    como último recurso, se corta el texto. Sin azar: mismo snapshot y
+    presupuesto producen el mismo prompt (importa para la caché de respuestas).
+    """
+    COLUMNAS_AVANCE = ["fecha", "supervisor", "porcentaje_avance", "presenta_desvios", "tareas_ejecutadas", "oficios_activos"]
+    COLUMNAS_ETAPA = ["nombre", "estado", "avance_estimado"]
+
+    def __init__(self, presupuesto_tokens: int, formato: str = "json",
+                 max_avances_detalle: int = 30, max_etapas: int = 100, max_largo_texto: int = 200,
+                 incluir_seguridad: bool = True):
+        self.presupuesto_tokens = presupuesto_tokens
+        self.formato = formato
+        self.max_avances_detalle = max_avances_detalle
+        self.max_etapas = max_etapas
+        self.max_largo_texto = max_largo_texto
+        self.incluir_seguridad = incluir_seguridad # False cuando las señales calculadas ya traen el cumplimiento
+
+    def compactar(self, datos: dict) -> str:
+        detalle, etapas, largo = self.max_avances_detalle, self.max_etapas, self.max_largo_texto
+        while True:
+            texto = self._renderizar(datos, detalle, etapas, largo)
+            if estimar_tokens(texto) <= self.presupuesto_tokens:
+                return texto
+            if detalle > 0:
+                detalle //= 2
+            elif etapas > 0:
+                etapas //= 2
+            elif largo > 40:
+                largo //= 2
+            else:
+                break
+        marca = "…[truncado]"
+        maximo = int(self.presupuesto_tokens * CARACTERES_POR_TOKEN)
+        # Con un presupuesto menor que la marca, se corta también la marca
+        return (texto[:max(maximo - len(marca), 0)] + marca)[:maximo]
+
+    def _renderizar(self, datos: dict, detalle: int, max_etapas: int, largo: int) -> str:
+        datos = _limpiar(datos, largo)
+        avances = [a for a in datos.get("registros_avance", []) if isinstance(a, dict)]
+        lista_etapas = [e for e in datos.get("etapas", []) if isinstance(e, dict)]
+        medidas = [m for m in datos.get("medidas_seguridad", []) if isinstance(m, dict)]
+        otros = {k: v for k, v in datos.items() if k not in ("proyecto", "etapas", "registros_avance", "medidas_seguridad")}
+
+        recientes = avances[-detalle:] if detalle else []
+        leyenda = Leyenda(
+            [a.get("supervisor") for a in recientes]
+            + [v for a in recientes for v in (a.get("tareas_ejecutadas") or []) + (a.get("oficios_activos") or [])]
+        )
+        filas_avance = [[leyenda(a.get(c)) for c in self.COLUMNAS_AVANCE] for a in recientes]
+        filas_etapa = [[e.get(c) for c in self.COLUMNAS_ETAPA] for e in lista_etapas[:max_etapas]]
+
+        secciones = {"proyecto": datos.get("proyecto")}
+        if lista_etapas:
+            secciones["etapas"] = {"columnas": self.COLUMNAS_ETAPA, "filas": filas_etapa}
+            if len(lista_etapas) > max_etapas:
+                secciones["etapas"]["omitidas"] = len(lista_etapas) - max_etapas
+                secciones["etapas"]["por_estado"] = dict(Counter(e.get("estado") for e in lista_etapas))
+        if len(avances) > len(recientes):
+            secciones["resumen_avances"] = resumir_avances(avances)
+        if recientes:
+            secciones["avances_recientes"] = {"columnas": self.COLUMNAS_AVANCE, "filas": filas_avance}
+        if medidas and self.incluir_seguridad:
+            secciones["seguridad"] = resumir_medidas(medidas)
+        if otros:
+            secciones["otros"] = otros
+        if leyenda.codigos:
+            secciones["leyenda"] = leyenda.diccionario()
+
+        if self.formato == "tabla":
+            return self._como_tabla(secciones)
+        return json_compacto(secciones)
+
+    def _como_tabla(self, secciones: dict) -> str:
+        """Tablas separadas por | para las secciones tabulares; JSON compacto para el resto."""
+        lineas = []
+        for nombre, contenido in secciones.items():
+            if isinstance(contenido, dict) and "columnas" in contenido:
+                lineas.append(f"{nombre.upper()}:")
+                lineas.append("|".join(contenido["columnas"]))
+                for fila in contenido["filas"]:
+                    lineas.append("|".join(json_compacto(v) if isinstance(v, list) else ("" if v is None else str(v)) for v in fila))
+                extras = {k: v for k, v in contenido.items() if k not in ("columnas", "filas")}
+                if extras:
+                    lineas.append(json_compacto(extras))
+            else:
+                lineas.append(f"{nombre.upper()}: {json_compacto(contenido)}")
+        return "\n".join(lineas)
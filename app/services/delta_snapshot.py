@@ -0,0 +1,89 @@
+from app.services.snapshot_store import calcular_hash, serializar
+
+SECCIONES = ("proyecto", "etapas", "registros_avance", "medidas_seguridad")
+
+def _huella(registro) -> str:
+    return calcular_hash(serializar(registro)) if isinstance(registro, dict) else repr(registro)
+
+def _por_clave(items: list, clave: str) -> tuple:
+    """
+    {(clave, n° de aparición): item} y si hubo claves repetidas. Dos "Casco"
+    no se pisan: el segundo es ("Casco", 2).
+    """
+    por_clave, vistas = {}, {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        valor = str(item.get(clave))
+        vistas[valor] = vistas.get(valor, 0) + 1
+        por_clave[(valor, vistas[valor])] = item
+    return por_clave, any(n > 1 for n in vistas.values())
+
+def _nombre(clave: tuple) -> str:
+    valor, aparicion = clave
+    return valor if aparicion == 1 else f"{valor} (#{aparicion})"
+
+def _cambios_campos(antes: dict, ahora: dict) -> dict:
+    campos = sorted(set(antes) | set(ahora))
+    return {c: [antes.get(c), ahora.get(c)] for c in campos if antes.get(c) != ahora.get(c)}
+
+def calcular_delta(anterior: dict, actual: dict, ignorar: list = ()) -> dict:
+    """
+    Diferencias entre dos snapshots del mismo proyecto. Devuelve solo las
+    secciones que cambiaron; un dict vacío significa "nada material".
+
+    - proyecto: campos modificados como [antes, ahora]
+    - etapas (por nombre) y medidas_seguridad (por item): nuevas, eliminadas, modificadas.
+      Los nombres repetidos se aparean por orden de aparición; si una sección
+      con repetidos cambió, "claves_duplicadas" la lista (el apareo puede no
+      ser el real: el procesador manda el snapshot completo en vez del delta)
+    - registros_avance: registros nuevos (comparados por contenido) y cantidad de eliminados
+    - cualquier otra clave de primer nivel: valor nuevo si cambió
+    """
+    anterior, actual = anterior or {}, actual or {}
+    delta = {}
+
+    cambios = _cambios_campos(anterior.get("proyecto") or {}, actual.get("proyecto") or {})
+    if cambios:
+        delta["proyecto"] = cambios
+
+    for seccion, clave in (("etapas", "nombre"), ("medidas_seguridad", "item")):
+        antes, repetidas_antes = _por_clave(anterior.get(seccion) or [], clave)
+        ahora, repetidas_ahora = _por_clave(actual.get(seccion) or [], clave)
+        diferencias = {
+            "nuevas": [ahora[k] for k in ahora if k not in antes],
+            "eliminadas": [_nombre(k) for k in antes if k not in ahora],
+            "modificadas": {
+                _nombre(k): _cambios_campos(antes[k], ahora[k])
+                for k in ahora if k in antes and antes[k] != ahora[k]
+            },
+        }
+        diferencias = {k: v for k, v in diferencias.items() if v}
+        if diferencias:
+            delta[seccion] = diferencias
+            if repetidas_antes or repetidas_ahora:
+                delta.setdefault("claves_duplicadas", []).append(seccion)
+
+    # Multiconjunto por huella: dos registros idénticos cuentan dos veces
+    pendientes = {}
+    for registro in anterior.get("registros_avance") or []:
+        huella = _huella(registro)
+        pendientes[huella] = pendientes.get(huella, 0) + 1
+    nuevos = []
+    for registro in actual.get("registros_avance") or []:
+        huella = _huella(registro)
+        if pendientes.get(huella):
+            pendientes[huella] -= 1
+        else:
+            nuevos.append(registro)
+    eliminados = sum(pendientes.values())
+    if nuevos or eliminados:
+        delta["registros_avance"] = {"nuevos": nuevos, "eliminados": eliminados}
+
+    for clave in sorted(set(anterior) | set(actual)):
+        if clave in SECCIONES or clave in ignorar:
+            continue
+        if anterior.get(clave) != actual.get(clave):
+            delta.setdefault("otros", {})[clave] = actual.get(clave)
+
+    return delta
@@ -0,0 +1,204 @@
+"""
+Rollups por (proyecto, día, modelo) en `estadistica_diaria`.
+
+- En vivo: ProcesadorAnalisis suma cada lote de invocaciones y cada resultado
+  con un upsert incremental dentro de su propia transacción, así que el
+  acumulado nunca diverge de la auditoría (si esta hace rollback, el rollup también).
+- Reconstrucción: `reconstruir()` recalcula desde la auditoría con GROUP BY
+  (ver app/scripts/reconstruir_estadisticas.py).
+- Consulta: `consultar()` lee solo los rollups.
+"""
+from collections import defaultdict
+from datetime import date, datetime
+from sqlalchemy import Text, case, cast, delete, func, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.analisis import (
+    Analisis, EstadoAnalisis, EstadisticaDiaria, InvocacionLLM, ObservacionGenerada,
+    ResultadoAnalisis, RespuestaLLM
+)
+
+CLAVE = ("proyecto_codigo", "dia", "modelo")
+METRICAS = (
+    "invocaciones", "invocaciones_exitosas", "invocaciones_cache", "tokens_prompt",
+    "tokens_respuesta", "duracion_ms_total", "analisis_completados", "score_total",
+    "riesgos_critico", "riesgos_atencion", "riesgos_informativo"
+)
+NIVELES = {"CRITICO": "riesgos_critico", "ATENCION": "riesgos_atencion", "INFORMATIVO": "riesgos_informativo"}
+AGRUPACIONES = ("proyecto", "dia", "modelo")
+
+def _dia(valor) -> date:
+    # SQLite devuelve func.date() como texto
+    if isinstance(valor, str):
+        return date.fromisoformat(valor[:10])
+    if isinstance(valor, datetime):
+        return valor.date()
+    return valor or datetime.utcnow().date()
+
+def sentencia_upsert(dialecto: str, filas: dict):
+    """
+    INSERT ... ON CONFLICT DO UPDATE SET columna = columna + excluded.columna.
+    Las filas van ordenadas por clave: dos transacciones que tocan las mismas
+    claves las bloquean en el mismo orden y no se traban entre sí.
+    """
+    insertar = postgresql.insert if dialecto == "postgresql" else sqlite.insert
+    valores = [
+        {**dict(zip(CLAVE, clave)), **{m: metricas.get(m, 0) for m in METRICAS}}
+        for clave, metricas in sorted(filas.items())
+    ]
+    sentencia = insertar(EstadisticaDiaria).values(valores)
+    tabla = EstadisticaDiaria.__table__
+    return sentencia.on_conflict_do_update(
+        index_elements=list(CLAVE),
+        set_={m: tabla.c[m] + sentencia.excluded[m] for m in METRICAS}
+    )
+
+async def _acumular(db: AsyncSession, filas: dict):
+    if filas:
+        await db.execute(sentencia_upsert(db.bind.dialect.name, filas))
+
+# "ninguno": marcador de auditoría cuando la cascada no llegó a intentar nada
+async def acumular_invocaciones(db: AsyncSession, proyecto_codigo: str, invocaciones: list):
+    """Suma un lote de InvocacionLLM recién auditadas (intentos reales o hits de caché)."""
+    filas = defaultdict(lambda: defaultdict(int))
+    for inv in invocaciones:
+        if inv.modelo_usado == "ninguno":
+            continue
+        fila = filas[(proyecto_codigo, _dia(inv.invocado_at), inv.modelo_usado)]
+        if inv.desde_cache:
+            fila["invocaciones_cache"] += 1
+            continue
+        fila["invocaciones"] += 1
+        fila["invocaciones_exitosas"] += 1 if inv.exitosa else 0
+        fila["tokens_prompt"] += inv.tokens_prompt or 0
+        fila["tokens_respuesta"] += inv.tokens_respuesta or 0
+        fila["duracion_ms_total"] += inv.duracion_ms or 0
+    await _acumular(db, filas)
+
+async def acumular_resultado(db: AsyncSession, proyecto_codigo: str, modelo: str, contenido_ia: dict):
+    """Suma un análisis completado: score y riesgos por nivel, atribuidos al modelo de la respuesta usada."""
+    fila = defaultdict(int, analisis_completados=1, score_total=contenido_ia.get("score_coherencia") or 0)
+    for riesgo in contenido_ia.get("riesgos", []):
+        columna = NIVELES.get(str(riesgo.get("nivel", "")).upper())
+        if columna:
+            fila[columna] += 1
+    await _acumular(db, {(proyecto_codigo, datetime.utcnow().date(), modelo): fila})
+
+async def consultar(db: AsyncSession, desde: date, hasta: date, agrupar_por: tuple,
+                    proyecto_codigo: str = None, modelo: str = None) -> list:
+    """Totales y promedios del rango, agrupados por cualquier combinación de proyecto, día y modelo."""
+    tabla = EstadisticaDiaria
+    columnas_grupo = [{"proyecto": tabla.proyecto_codigo, "dia": tabla.dia, "modelo": tabla.modelo}[g] for g in agrupar_por]
+    consulta = (
+        select(*columnas_grupo, *(func.sum(getattr(tabla, m)).label(m) for m in METRICAS))
+        .where(tabla.dia >= desde, tabla.dia <= hasta)
+        .group_by(*columnas_grupo)
+        .order_by(*columnas_grupo)
+    )
+    if proyecto_codigo:
+        consulta = consulta.where(tabla.proyecto_codigo == proyecto_codigo)
+    if modelo:
+        consulta = consulta.where(tabla.modelo == modelo)
+
+    resultado = []
+    for fila in (await db.execute(consulta)).mappings():
+        item = {g: fila[c.key] for g, c in zip(agrupar_por, columnas_grupo)}
+        item.update({m: fila[m] or 0 for m in METRICAS})
+        item["duracion_ms_promedio"] = round(item["duracion_ms_total"] / item["invocaciones"], 1) if item["invocaciones"] else None
+        item["score_promedio"] = round(item["score_total"] / item["analisis_completados"], 1) if item["analisis_completados"] else None
+        resultado.append(item)
+    return resultado
+
+# --- Reconstrucción desde la auditoría (síncrona: la usa el script de backfill) ---
+
+def _filas_invocaciones(conexion, desde: date = None) -> dict:
+    dia = func.date(func.coalesce(InvocacionLLM.invocado_at, Analisis.fecha_solicitud))
+    real = InvocacionLLM.desde_cache.is_not(True)
+    consulta = (
+        select(
+            Analisis.proyecto_codigo, dia.label("dia"), InvocacionLLM.modelo_usado,
+            func.sum(case((real, 1), else_=0)),
+            func.sum(case((real & InvocacionLLM.exitosa.is_(True), 1), else_=0)),
+            func.sum(case((real, 0), else_=1)),
+            func.sum(case((real, func.coalesce(InvocacionLLM.tokens_prompt, 0)), else_=0)),
+            func.sum(case((real, func.coalesce(InvocacionLLM.tokens_respuesta, 0)), else_=0)),
+            func.sum(case((real, func.coalesce(InvocacionLLM.duracion_ms, 0)), else_=0)),
+        )
+        .join(Analisis, Analisis.id == InvocacionLLM.analisis_id)
+        .where(InvocacionLLM.modelo_usado != "ninguno")
+        .group_by(Analisis.proyecto_codigo, dia, InvocacionLLM.modelo_usado)
+    )
+    if desde:
+        consulta = consulta.where(func.coalesce(InvocacionLLM.invocado_at, Analisis.fecha_solicitud) >= desde)
+    columnas = METRICAS[:6]
+    return {
+        (proyecto, _dia(d), modelo): dict(zip(columnas, valores))
+        for proyecto, d, modelo, *valores in conexion.execute(consulta)
+    }
+
+def _filas_resultados(conexion, desde: date = None) -> dict:
+    # Modelo de la respuesta usada, como en vivo: el de la invocación cuya respuesta validó. Las que no
+    # validaron también tienen RespuestaLLM y pueden ser de otro modelo (ej: un intento previo retomado)
+    modelo_por_analisis = (
+        select(InvocacionLLM.analisis_id, func.min(InvocacionLLM.modelo_usado).label("modelo"))
+        .join(RespuestaLLM, RespuestaLLM.invocacion_id == InvocacionLLM.id)
+        .where(RespuestaLLM.respuesta_parseada.isnot(None), cast(RespuestaLLM.respuesta_parseada, Text) != "null")
+        .group_by(InvocacionLLM.analisis_id)
+        .subquery()
+    )
+    nivel = func.upper(ObservacionGenerada.nivel)
+    riesgos = (
+        select(
+            ObservacionGenerada.resultado_id,
+            *(func.sum(case((nivel == n, 1), else_=0)).label(n) for n in NIVELES)
+        )
+        .group_by(ObservacionGenerada.resultado_id)
+        .subquery()
+    )
+    dia = func.date(ResultadoAnalisis.generado_at)
+    consulta = (
+        select(
+            Analisis.proyecto_codigo, dia.label("dia"), func.coalesce(modelo_por_analisis.c.modelo, "desconocido"),
+            func.count(ResultadoAnalisis.id),
+            func.sum(func.coalesce(ResultadoAnalisis.score_coherencia, 0)),
+            *(func.sum(func.coalesce(riesgos.c[n], 0)) for n in NIVELES),
+        )
+        .join(Analisis, Analisis.id == ResultadoAnalisis.analisis_id)
+        .outerjoin(modelo_por_analisis, modelo_por_analisis.c.analisis_id == Analisis.id)
+        .outerjoin(riesgos, riesgos.c.resultado_id == ResultadoAnalisis.id)
+        .where(Analisis.estado == EstadoAnalisis.COMPLETADO)
+        .group_by(Analisis.proyecto_codigo, dia, modelo_por_analisis.c.modelo)
+    )
+    if desde:
+        consulta = consulta.where(ResultadoAnalisis.generado_at >= desde)
+    columnas = ("analisis_completados", "score_total", *NIVELES.values())
+    return {
+        (proyecto, _dia(d), modelo): dict(zip(columnas, valores))
+        for proyecto, d, modelo, *valores in conexion.execute(consulta)
+    }
+
+def reconstruir(conexion, desde: date = None, lote: int = 1000) -> dict:
+    """
+    Borra y recalcula los rollups (todos, o desde `desde`) dentro de la
+    transacción de `conexion`. En Postgres toma la tabla en modo EXCLUSIVE: los
+    workers que completen análisis mientras tanto esperan y suman encima del
+    recálculo, sin contar dos veces ni perder nada.
+    """
+    if conexion.dialect.name == "postgresql":
+        conexion.execute(text("LOCK TABLE estadistica_diaria IN EXCLUSIVE MODE"))
+    borrar = delete(EstadisticaDiaria)
+    if desde:
+        borrar = borrar.where(EstadisticaDiaria.dia >= desde)
+    conexion.execute(borrar)
+
+    filas = defaultdict(dict)
+    for clave, metricas in _filas_invocaciones(conexion, desde).items():
+        filas[clave].update(metricas)
+    for clave, metricas in _filas_resultados(conexion, desde).items():
+        filas[clave].update(metricas)
+
+    claves = sorted(filas)
+    for i in range(0, len(claves), lote):
+        conexion.execute(sentencia_upsert(conexion.dialect.name, {c: filas[c] for c in claves[i:i + lote]}))
+    return {"filas": len(claves), "proyectos": len({c[0] for c in claves})}
@@ -0,0 +1,73 @@
+import time
+from app.config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+class EstadisticasModelos:
+    """
+    Salud de cada modelo de la cascada, por proceso.
+
+    Mantiene una EWMA de latencia y de tasa de error para reordenar la lista de
+    fallback, y un circuit breaker que saltea modelos con fallos consecutivos
+    durante LLM_CIRCUITO_ENFRIAMIENTO_SEGUNDOS.
+    """
+    def __init__(self):
+        self._modelos: dict[str, dict] = {}
+
+    def _estado(self, modelo: str) -> dict:
+        if modelo not in self._modelos:
+            self._modelos[modelo] = {
+                "latencia_ewma_ms": None,
+                "tasa_error_ewma": 0.0,
+                "fallos_consecutivos": 0,
+                "abierto_hasta": 0.0
+            }
+        return self._modelos[modelo]
+
+    def registrar_exito(self, modelo: str, duracion_ms: float):
+        alfa = settings.LLM_EWMA_ALFA
+        estado = self._estado(modelo)
+        previa = estado["latencia_ewma_ms"]
+        estado["latencia_ewma_ms"] = duracion_ms if previa is None else alfa * duracion_ms + (1 - alfa) * previa
+        estado["tasa_error_ewma"] = (1 - alfa) * estado["tasa_error_ewma"]
+        estado["fallos_consecutivos"] = 0
+        estado["abierto_hasta"] = 0.0
+
+    def registrar_fallo(self, modelo: str):
+        alfa = settings.LLM_EWMA_ALFA
+        estado = self._estado(modelo)
+        estado["tasa_error_ewma"] = alfa + (1 - alfa) * estado["tasa_error_ewma"]
+        estado["fallos_consecutivos"] += 1
+        if estado["fallos_consecutivos"] >= settings.LLM_CIRCUITO_FALLOS:
+            estado["abierto_hasta"] = time.monotonic() + settings.LLM_CIRCUITO_ENFRIAMIENTO_SEGUNDOS
+            logger.warning("🔌 Circuito abierto para %s tras %s fallos", modelo, estado['fallos_consecutivos'])
+
+    def circuito_abierto(self, modelo: str) -> bool:
+        return self._estado(modelo)["abierto_hasta"] > time.monotonic()
+
+    def _puntaje(self, modelo: str) -> float:
+        estado = self._estado(modelo)
+        # Modelos sin historial van primero para medirlos; luego pesa latencia y errores
+        if estado["latencia_ewma_ms"] is None and estado["tasa_error_ewma"] == 0.0:
+            return 0.0
+        latencia = estado["latencia_ewma_ms"] or settings.LLM_READ_TIMEOUT_SEGUNDOS * 1000
+        return latencia * (1 + 4 * estado["tasa_error_ewma"])
+
+    def ordenar(self, modelos: list) -> list:
+        """Ordena por salud y saltea circuitos abiertos (si todos lo están, los devuelve igual)."""
+        disponibles = [m for m in modelos if not self.circuito_abierto(m)]
+        if not disponibles:
+            logger.warning("⚠️ Todos los circuitos abiertos, se intentan igual")
+            disponibles = list(modelos)
+        posicion = {m: i for i, m in enumerate(modelos)}
+        return sorted(disponibles, key=lambda m: (self._puntaje(m), posicion[m]))
+
+    def resumen(self) -> dict:
+        return {
+            modelo: {**estado, "circuito_abierto": self.circuito_abierto(modelo)}
+            for modelo, estado in self._modelos.items()
+        }
+
+# Instancia única por proceso, compartida por todos los LLMClient
+estadisticas_modelos = EstadisticasModelos()
@@ -0,0 +1,70 @@
+import importlib.util
+import httpx
+from app.config.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Un único AsyncClient por upstream: reutiliza conexiones (keep-alive / HTTP/2)
+# en lugar de pagar un handshake TCP+TLS en cada llamada.
+_clientes: dict[str, httpx.AsyncClient] = {}
+
+def _http2_disponible() -> bool:
+    if not settings.HTTP2_HABILITADO:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        logger.warning("⚠️ HTTP2_HABILITADO pero falta el paquete 'h2'; se usará HTTP/1.1")
+        return False
+    return True
+
+def _limites() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONEXIONES,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SEGUNDOS
+    )
+
+def _crear_cliente(nombre: str) -> httpx.AsyncClient:
+    if nombre == "llm":
+        return httpx.AsyncClient(
+            base_url=settings.OPENROUTER_BASE_URL,
+            limits=_limites(),
+            http2=_http2_disponible(),
+            timeout=httpx.Timeout(
+                settings.LLM_READ_TIMEOUT_SEGUNDOS,
+                connect=settings.LLM_CONNECT_TIMEOUT_SEGUNDOS
+            )
+        )
+    if nombre == "webhook":
+        return httpx.AsyncClient(
+            limits=_limites(),
+            http2=_http2_disponible(),
+            timeout=httpx.Timeout(
+                settings.WEBHOOK_READ_TIMEOUT_SEGUNDOS,
+                connect=settings.WEBHOOK_CONNECT_TIMEOUT_SEGUNDOS
+            )
+        )
+    raise ValueError(f"Cliente HTTP desconocido: {nombre}")
+
+async def iniciar_clientes():
+    """Crea los clientes compartidos. Se llama desde el lifespan de FastAPI o del worker."""
+    for nombre in ("llm", "webhook"):
+        if nombre not in _clientes:
+            _clientes[nombre] = _crear_cliente(nombre)
+    logger.info("🔌 Clientes HTTP compartidos listos: %s", list(_clientes))
+
+async def cerrar_clientes():
+    """Cierra los pools de conexiones al apagar la aplicación."""
+    while _clientes:
+        _, cliente = _clientes.popitem()
+        await cliente.aclose()
+
+def obtener_cliente(nombre: str) -> httpx.AsyncClient:
+    """
+    Devuelve el cliente compartido del upstream. Si el lifespan no corrió
+    (scripts, consola) se crea en el momento y queda registrado para reuso.
+    """
+    cliente = _clientes.get(nombre)
+    if cliente is None or cliente.is_closed:
+        cliente = _clientes[nombre] = _crear_cliente(nombre)
+    return cliente
@@ -0,0 +1,240 @@
+import asyncio
+import time
+import weakref
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.config.settings import settings
+from app.core.metrics import LLM_ESPERA_LIMITADOR_SEGUNDOS
+from app.db import base as db_base
+from app.models.analisis import CupoModeloLLM
+import logging
+
+logger = logging.getLogger(__name__)
+
+class CupoAgotado(Exception):
+    """El cupo del modelo no se libera dentro de LLM_ESPERA_MAXIMA_SEGUNDOS."""
+
+def limites(modelo: str) -> tuple:
+    """(solicitudes/min, tokens/min) del modelo; 0 = sin límite."""
+    propios = settings.LLM_LIMITES_POR_MODELO.get(modelo, {})
+    return (
+        propios.get("rpm", settings.LLM_SOLICITUDES_POR_MINUTO),
+        propios.get("tpm", settings.LLM_TOKENS_POR_MINUTO)
+    )
+
+def _recargar(estado: dict, ahora: float, rpm: int, tpm: int):
+    transcurrido = max(ahora - estado["actualizado"], 0)
+    for clave, limite in (("solicitudes", rpm), ("tokens", tpm)):
+        if limite:
+            estado[clave] = min(limite, estado[clave] + transcurrido * limite / 60)
+    estado["actualizado"] = ahora
+
+def _op_reservar(tokens: int, max_espera: float):
+    """
+    Cubeta con deuda: la reserva se descuenta ya aunque deje el saldo negativo y
+    el llamador duerme lo que tarda en recargarse. Cada nuevo llamador hereda la
+    deuda de los anteriores, así que los turnos salen en orden de llegada.
+    """
+    def aplicar(estado: dict, ahora: float, rpm: int, tpm: int):
+        _recargar(estado, ahora, rpm, tpm)
+        pedido = {"solicitudes": 1, "tokens": min(tokens, tpm) if tpm else 0}
+        espera = max(estado["pausa_hasta"] - ahora, 0)
+        for clave, limite in (("solicitudes", rpm), ("tokens", tpm)):
+            faltante = pedido[clave] - estado[clave]
+            if limite and faltante > 0:
+                espera = max(espera, faltante * 60 / limite)
+        if espera > max_espera:
+            return None
+        for clave, limite in (("solicitudes", rpm), ("tokens", tpm)):
+            if limite:
+                estado[clave] -= pedido[clave]
+        return espera
+    return aplicar
+
+def _op_ajustar(solicitudes: float, tokens: float):
+    """Devuelve (valores positivos) o cobra (negativos) fichas: uso real distinto del estimado o turno cancelado."""
+    def aplicar(estado: dict, ahora: float, rpm: int, tpm: int):
+        _recargar(estado, ahora, rpm, tpm)
+        if rpm:
+            estado["solicitudes"] = min(rpm, estado["solicitudes"] + solicitudes)
+        if tpm:
+            estado["tokens"] = min(tpm, estado["tokens"] + tokens)
+    return aplicar
+
+def _op_pausar(hasta: float):
+    def aplicar(estado: dict, ahora: float, rpm: int, tpm: int):
+        _recargar(estado, ahora, rpm, tpm)
+        estado["pausa_hasta"] = max(estado["pausa_hasta"], hasta)
+        # Lo que creíamos disponible no lo estaba: el que siga hace cola detrás de la pausa
+        estado["solicitudes"] = min(estado["solicitudes"], 0)
+    return aplicar
+
+def segundos_de_pausa(status_code: int, headers) -> float:
+    """
+    Cuánto frenar un modelo según la respuesta: Retry-After (segundos o fecha
+    HTTP) o X-RateLimit-Remaining=0 con X-RateLimit-Reset (epoch en ms, como
+    lo manda OpenRouter). 0 si no hay que frenar.
+    """
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return max(float(retry_after), 0)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0)
+            except (TypeError, ValueError):
+                pass
+    reset = headers.get("x-ratelimit-reset")
+    if reset and (headers.get("x-ratelimit-remaining") == "0" or status_code == 429):
+        try:
+            valor = float(reset)
+        except ValueError:
+            valor = 0
+        if valor > 1e12: # epoch en ms
+            return max(valor / 1000 - time.time(), 0)
+        if valor > 1e9: # epoch en s
+            return max(valor - time.time(), 0)
+        return max(valor, 0)
+    return 0
+
+class CoordinadorMemoria:
+    """Cubetas en el proceso: sin await entre leer y escribir, el event loop las hace atómicas."""
+    def __init__(self):
+        self._estados: dict[str, dict] = {}
+
+    async def aplicar(self, modelo: str, operacion):
+        rpm, tpm = limites(modelo)
+        ahora = time.time()
+        estado = self._estados.setdefault(modelo, {
+            "solicitudes": float(rpm), "tokens": float(tpm), "actualizado": ahora, "pausa_hasta": 0.0
+        })
+        return operacion(estado, ahora, rpm, tpm)
+
+class CoordinadorDB:
+    """
+    Cubetas en la tabla cupo_modelo_llm, compartidas por todas las réplicas y
+    workers. Cada operación es una transacción corta sobre la fila del modelo
+    (SELECT ... FOR UPDATE): los procesos se turnan sin lock distribuido aparte.
+    """
+    CAMPOS = ("solicitudes", "tokens", "actualizado", "pausa_hasta")
+
+    async def aplicar(self, modelo: str, operacion):
+        rpm, tpm = limites(modelo)
+        async with db_base.AsyncSessionLocal() as db:
+            fila = await db.get(CupoModeloLLM, modelo, with_for_update=True)
+            if fila is None:
+                valores = {"modelo": modelo, "solicitudes": rpm, "tokens": tpm, "actualizado": time.time(), "pausa_hasta": 0.0}
+                dialecto = db.bind.dialect.name
+                if dialecto in ("postgresql", "sqlite"):
+                    insertar = postgresql.insert if dialecto == "postgresql" else sqlite.insert
+                    await db.execute(insertar(CupoModeloLLM).values(**valores).on_conflict_do_nothing(index_elements=["modelo"]))
+                else:
+                    db.add(CupoModeloLLM(**valores))
+                    await db.flush()
+                fila = await db.get(CupoModeloLLM, modelo, with_for_update=True, populate_existing=True)
+            # El reloj se toma con la fila ya bloqueada para que nadie recargue "hacia atrás"
+            ahora = time.time()
+            estado = {campo: getattr(fila, campo) or 0.0 for campo in self.CAMPOS}
+            resultado = operacion(estado, ahora, rpm, tpm)
+            for campo, valor in estado.items():
+                setattr(fila, campo, valor)
+            await db.commit()
+        return resultado
+
+@dataclass
+class Reserva:
+    modelo: str
+    tokens: int
+    espera_ms: int
+
+class LimitadorLLM:
+    """
+    Gobierna el acceso a OpenRouter: cubetas de solicitudes/min y tokens/min
+    por modelo (coordinadas por tabla entre procesos) y un tope de solicitudes
+    en vuelo que es por proceso: con N réplicas puede haber hasta
+    N x LLM_MAX_EN_VUELO_POR_PROCESO a la vez; lo que se respeta entre todas
+    son las cubetas. Los llamadores esperan su turno en orden en lugar de
+    disparar todos juntos y comerse un 429; solo si la espera supera
+    LLM_ESPERA_MAXIMA_SEGUNDOS se corta con CupoAgotado y la cascada prueba
+    el siguiente modelo.
+    """
+    def __init__(self):
+        self._coordinador = CoordinadorDB() if settings.LLM_LIMITADOR_COORDINACION == "db" else CoordinadorMemoria()
+        self._respaldo = CoordinadorMemoria()
+        self._sin_coordinacion = False
+        # Locks y semáforo por event loop (asyncio los ata al primero que los usa): la
+        # instancia es global y el proceso puede correr más de un loop (tests, scripts)
+        self._por_loop = weakref.WeakKeyDictionary()
+
+    def _primitivas(self) -> dict:
+        loop = asyncio.get_running_loop()
+        primitivas = self._por_loop.get(loop)
+        if primitivas is None:
+            primitivas = self._por_loop[loop] = {
+                # Dentro del proceso las operaciones de un modelo van de a una (asyncio.Lock es FIFO):
+                # una ráfaga no acapara el pool de conexiones esperando el lock de la misma fila
+                "turnos": {},
+                "en_vuelo": asyncio.Semaphore(settings.LLM_MAX_EN_VUELO_POR_PROCESO),
+            }
+        return primitivas
+
+    async def _aplicar(self, modelo: str, operacion):
+        try:
+            async with self._primitivas()["turnos"].setdefault(modelo, asyncio.Lock()):
+                resultado = await self._coordinador.aplicar(modelo, operacion)
+            if self._sin_coordinacion:
+                logger.info("✅ Limitador: coordinación compartida restablecida")
+                self._sin_coordinacion = False
+            return resultado
+        except Exception as e:
+            # Sin base no frenamos el análisis: el proceso sigue limitándose solo
+            if not self._sin_coordinacion:
+                logger.warning("⚠️ Limitador sin coordinación compartida (%s); se usa el estado local", e)
+                self._sin_coordinacion = True
+            return await self._respaldo.aplicar(modelo, operacion)
+
+    @asynccontextmanager
+    async def cupo(self, modelo: str, tokens: int):
+        """Espera turno para `modelo` y ocupa un lugar en vuelo mientras dura el bloque."""
+        if not settings.LLM_LIMITADOR_HABILITADO:
+            yield Reserva(modelo, tokens, 0)
+            return
+
+        inicio = time.perf_counter()
+        espera = await self._aplicar(modelo, _op_reservar(tokens, settings.LLM_ESPERA_MAXIMA_SEGUNDOS))
+        if espera is None:
+            raise CupoAgotado(f"{modelo}: cupo no disponible en {settings.LLM_ESPERA_MAXIMA_SEGUNDOS}s")
+        en_vuelo = self._primitivas()["en_vuelo"]
+        try:
+            if espera > 0:
+                await asyncio.sleep(espera)
+            await en_vuelo.acquire()
+        except asyncio.CancelledError:
+            # Turno abandonado (ej: perdió el hedging): devolvemos lo reservado
+            await self._aplicar(modelo, _op_ajustar(1, tokens))
+            raise
+
+        try:
+            espera_total = time.perf_counter() - inicio
+            LLM_ESPERA_LIMITADOR_SEGUNDOS.labels(modelo).observe(espera_total)
+            yield Reserva(modelo, tokens, int(espera_total * 1000))
+        finally:
+            en_vuelo.release()
+
+    async def ajustar(self, reserva: Reserva, tokens_reales: int):
+        """Corrige la cubeta de tokens con el consumo informado por OpenRouter."""
+        if settings.LLM_LIMITADOR_HABILITADO and tokens_reales:
+            await self._aplicar(reserva.modelo, _op_ajustar(0, reserva.tokens - tokens_reales))
+
+    async def registrar_respuesta(self, modelo: str, status_code: int, headers):
+        """Aplica Retry-After / X-RateLimit-* para que nadie más le pegue al modelo antes de tiempo."""
+        segundos = segundos_de_pausa(status_code, headers)
+        if settings.LLM_LIMITADOR_HABILITADO and segundos > 0:
+            logger.warning("🚦 %s pidió frenar %.1fs (status %s)", modelo, segundos, status_code)
+            await self._aplicar(modelo, _op_pausar(time.time() + segundos))
+
+# Instancia única por proceso, compartida por todos los LLMClient
+limitador_llm = LimitadorLLM()
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import Text, cast, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.settings import settings
+from app.models.analisis import InvocacionLLM, PromptGenerado, RespuestaLLM
+import logging
+
+logger = logging.getLogger(__name__)
+
+def canonicalizar(datos: dict) -> dict:
+    """Devuelve una copia con las claves ordenadas para que el orden de llegada no cambie el hash ni el prompt."""
+    return json.loads(json.dumps(datos, sort_keys=True, default=str))
+
+def calcular_clave(datos: dict, system_prompt: str, user_prompt: str, modelo: str) -> str:
+    """Hash estable (sha256) de snapshot canónico + prompts + modelo."""
+    contenido = json.dumps(
+        [datos, system_prompt, user_prompt, modelo],
+        sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+class CacheLRU:
+    """LRU en memoria con TTL y límite por cantidad de entradas y por bytes."""
+    def __init__(self, max_entradas: int, max_bytes: int, ttl_segundos: int):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.ttl_segundos = ttl_segundos
+        self._datos: OrderedDict = OrderedDict()
+        self.bytes_usados = 0
+
+    def obtener(self, clave: str):
+        item = self._datos.get(clave)
+        if item is None:
+            return None
+        expira_en, tamano, valor = item
+        if expira_en < time.monotonic():
+            self._quitar(clave)
+            return None
+        self._datos.move_to_end(clave)
+        return valor
+
+    def guardar(self, clave: str, valor: dict, tamano: int):
+        if tamano > self.max_bytes:
+            return
+        if clave in self._datos:
+            self._quitar(clave)
+        self._datos[clave] = (time.monotonic() + self.ttl_segundos, tamano, valor)
+        self.bytes_usados += tamano
+        # Desalojo por antigüedad de uso hasta respetar ambos límites
+        while len(self._datos) > self.max_entradas or self.bytes_usados > self.max_bytes:
+            self._quitar(next(iter(self._datos)))
+
+    def _quitar(self, clave: str):
+        _, tamano, _ = self._datos.pop(clave)
+        self.bytes_usados -= tamano
+
+    def __len__(self):
+        return len(self._datos)
+
+class LLMCache:
+    """
+    Caché de respuestas del LLM direccionada por contenido.
+
+    Nivel 1: LRU en memoria del proceso. Nivel 2: las tablas de auditoría
+    (PromptGenerado.cache_key indexado -> RespuestaLLM), compartidas entre réplicas.
+    """
+    def __init__(self):
+        self.memoria = CacheLRU(
+            settings.LLM_CACHE_MAX_ENTRADAS,
+            settings.LLM_CACHE_MAX_BYTES,
+            settings.LLM_CACHE_TTL_SEGUNDOS
+        )
+        self.hits_memoria = 0
+        self.hits_db = 0
+        self.misses = 0
+        self.tokens_ahorrados = 0
+        self.latencia_ahorrada_ms = 0
+
+    async def buscar(self, db: AsyncSession, claves: dict):
+        """
+        `claves` es {modelo: clave} en el orden de preferencia de la cascada.
+        Devuelve la entrada cacheada o None.
+        """
+        for clave in claves.values():
+            entrada = self.memoria.obtener(clave)
+            if entrada:
+                self.hits_memoria += 1
+                self._contabilizar_ahorro(entrada)
+                return entrada
+
+        limite = datetime.utcnow() - timedelta(seconds=settings.LLM_CACHE_TTL_SEGUNDOS)
+        fila = (await db.execute(
+            select(
+                PromptGenerado.cache_key,
+                InvocacionLLM.modelo_usado,
+                InvocacionLLM.tokens_prompt,
+                InvocacionLLM.tokens_respuesta,
+                InvocacionLLM.duracion_ms,
+                RespuestaLLM.respuesta_raw,
+                RespuestaLLM.respuesta_parseada
+            )
+            .join(InvocacionLLM, PromptGenerado.invocacion_id == InvocacionLLM.id)
+            .join(RespuestaLLM, RespuestaLLM.invocacion_id == InvocacionLLM.id)
+            .where(
+                PromptGenerado.cache_key.in_(list(claves.values())),
+                PromptGenerado.generado_at >= limite,
+                InvocacionLLM.exitosa.is_(True),
+                InvocacionLLM.desde_cache.is_(False),
+                # Una respuesta que no validó nunca se sirve desde caché (las filas
+                # anteriores a none_as_null guardaron el JSON 'null' en vez de NULL)
+                RespuestaLLM.respuesta_parseada.isnot(None),
+                cast(RespuestaLLM.respuesta_parseada, Text) != "null"
+            )
+            .order_by(PromptGenerado.generado_at.desc())
+            .limit(1)
+        )).first()
+
+        if fila is None:
+            self.misses += 1
+            return None
+
+        entrada = {
+            "clave": fila.cache_key,
+            "modelo": fila.modelo_usado,
+            "respuesta_raw": fila.respuesta_raw,
+            "respuesta_parseada": fila.respuesta_parseada,
+            "tokens_prompt": fila.tokens_prompt or 0,
+            "tokens_respuesta": fila.tokens_respuesta or 0,
+            "duracion_ms": fila.duracion_ms or 0
+        }
+        self.hits_db += 1
+        self._contabilizar_ahorro(entrada)
+        self.guardar(entrada)
+        return entrada
+
+    def guardar(self, entrada: dict):
+        tamano = len((entrada.get("respuesta_raw") or "").encode("utf-8")) * 2
+        self.memoria.guardar(entrada["clave"], entrada, tamano)
+
+    def _contabilizar_ahorro(self, entrada: dict):
+        self.tokens_ahorrados += entrada["tokens_prompt"] + entrada["tokens_respuesta"]
+        self.latencia_ahorrada_ms += entrada["duracion_ms"]
+        logger.info("♻️ Respuesta LLM servida desde caché (%s)", entrada['modelo'])
+
+    def estadisticas(self) -> dict:
+        consultas = self.hits_memoria + self.hits_db + self.misses
+        return {
+            "habilitado": settings.LLM_CACHE_HABILITADO,
+            "hits_memoria": self.hits_memoria,
+            "hits_db": self.hits_db,
+            "misses": self.misses,
+            "tasa_acierto": round((self.hits_memoria + self.hits_db) / consultas, 4) if consultas else 0.0,
+            "tokens_ahorrados": self.tokens_ahorrados,
+            "latencia_ahorrada_ms": self.latencia_ahorrada_ms,
+            "entradas_memoria": len(self.memoria),
+            "bytes_memoria": self.memoria.bytes_usados
+        }
+
+# Instancia única por proceso (los contadores son por réplica)
+llm_cache = LLMCache()
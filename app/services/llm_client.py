@@ -1,14 +1,37 @@
 import httpx
 import asyncio
-import json # <--- Nuevo para formatear logs
+import json
+import time
+from datetime import datetime
 from app.config.settings import settings
-from app.utils.logger import logger
+from app.core.metrics import registrar_invocacion_llm
+from app.services.compactador_snapshot import estimar_tokens
+from app.services.estadisticas_modelos import estadisticas_modelos
+from app.services.http_clients import obtener_cliente
+from app.services.limitador_llm import CupoAgotado, limitador_llm
+from app.services.parser_respuesta import FORMATO_RESPUESTA
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _campos(registro: dict) -> dict:
+    """Campos estructurados de un intento para el log (LOG_FORMATO=json)."""
+    return {
+        "modelo": registro["modelo"],
+        "duracion_ms": registro["duracion_ms"],
+        "espera_cola_ms": registro["espera_cola_ms"],
+        "tokens_prompt": registro["tokens_prompt"],
+        "tokens_respuesta": registro["tokens_respuesta"],
+    }
 
 class LLMClient:
-    def __init__(self):
+    def __init__(self, client: httpx.AsyncClient = None):
         self.api_key = settings.OPENROUTER_API_KEY
-        self.url = "https://openrouter.ai/api/v1/chat/completions"
-        logger.info(f"🚀 LLMClient iniciado. Proyecto: {settings.PROJECT_NAME}")
+        # Ruta relativa al base_url (OPENROUTER_BASE_URL) del cliente compartido
+        self.url = "/chat/completions"
+        self.client = client or obtener_cliente("llm")
+        self.modelo_exitoso = None # Modelo de la cascada que respondió en la última llamada
+        logger.debug("🚀 LLMClient iniciado. Proyecto: %s", settings.PROJECT_NAME)
 
         # Lista de modelos para rotar si uno falla
         self.modelos_fallback = [
@@ -18,61 +41,258 @@ class LLMClient:
             "openrouter/free"                          # Tu red de seguridad
         ]
 
-    async def enviar_prompt(self, system_prompt: str, user_prompt: str):
-        headers = {
+    def _headers(self) -> dict:
+        return {
             "Authorization": f"Bearer {self.api_key}",
             "HTTP-Referer": "https://github.com/langermanaxel/my_ai_api",
             "X-Title": settings.PROJECT_NAME,
             "Content-Type": "application/json"
         }
 
-        intentos_fallidos = []
-
-        for modelo in self.modelos_fallback:
-            logger.debug(f"Intentando con modelo: {modelo}...")
-            
-            payload = {
-                "model": modelo,
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ]
-            }
+    @staticmethod
+    def _payload(modelo: str, system_prompt: str, user_prompt: str, **extra) -> dict:
+        payload = {
+            "model": modelo,
+            **extra,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ]
+        }
+        # Salida estructurada: el proveedor valida el JSON contra el esquema antes de devolverlo
+        if modelo in settings.LLM_MODELOS_JSON_SCHEMA:
+            payload["response_format"] = FORMATO_RESPUESTA
+        return payload
 
-            try:
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(
-                        self.url, 
-                        headers=headers, 
-                        json=payload, 
-                        timeout=45.0 # Un poco más de tiempo para modelos gratuitos
-                    )
-                    
-                    datos = response.json()
-
-                    if response.status_code == 200 and "error" not in datos:
-                        logger.info(f"✅ ÉXITO con modelo: {modelo}")
-                        return datos
-                    
-                    # Capturamos el error específico de la API
-                    msg_error = datos.get("error", {}).get("message", "Sin mensaje de error")
-                    logger.warning(f"❌ FALLÓ {modelo} (Status {response.status_code}): {msg_error}")
-                    intentos_fallidos.append(f"{modelo}: {msg_error}")
-                    
-                    await asyncio.sleep(0.5)
-                    
-            except Exception as e:
-                logger.error(f"⚠️ Excepción de red con {modelo}: {str(e)}")
-                intentos_fallidos.append(f"{modelo}: Error de red")
-                continue
+    @staticmethod
+    def _tokens_a_reservar(system_prompt: str, user_prompt: str) -> int:
+        return estimar_tokens(system_prompt) + estimar_tokens(user_prompt) + settings.LLM_TOKENS_RESPUESTA_ESTIMADOS
+
+    async def _intentar(self, modelo: str, system_prompt: str, user_prompt: str, intentos: list):
+        """
+        Un intento contra un modelo. Devuelve la respuesta si fue válida o None.
+        Siempre deja su registro en `intentos`, incluso si lo cancelan (hedging).
+        """
+        logger.debug("Intentando con modelo: %s...", modelo, extra={"modelo": modelo})
+        payload = self._payload(modelo, system_prompt, user_prompt)
+        registro = {
+            "modelo": modelo,
+            "invocado_at": datetime.utcnow(),
+            "exitosa": False,
+            "ganadora": False,
+            "error": None,
+            "tokens_prompt": None,
+            "tokens_respuesta": None,
+            "duracion_ms": None,
+            "espera_cola_ms": None
+        }
+        intentos.append(registro)
+        inicio = time.perf_counter()
+        try:
+            async with limitador_llm.cupo(modelo, self._tokens_a_reservar(system_prompt, user_prompt)) as reserva:
+                # La duración del intento no incluye la espera por cupo (va aparte)
+                registro["espera_cola_ms"] = reserva.espera_ms
+                registro["invocado_at"] = datetime.utcnow()
+                inicio = time.perf_counter()
+                # Timeouts de conexión/lectura vienen configurados en el cliente compartido
+                response = await self.client.post(self.url, headers=self._headers(), json=payload)
+                registro["duracion_ms"] = int((time.perf_counter() - inicio) * 1000)
+                await limitador_llm.registrar_respuesta(modelo, response.status_code, response.headers)
+                datos = response.json()
+
+                if response.status_code == 200 and "error" not in datos and "choices" in datos:
+                    registro["exitosa"] = True
+                    registro["tokens_prompt"] = datos.get("usage", {}).get("prompt_tokens")
+                    registro["tokens_respuesta"] = datos.get("usage", {}).get("completion_tokens")
+                    logger.info("✅ ÉXITO con modelo: %s", modelo, extra=_campos(registro))
+                    await limitador_llm.ajustar(reserva, (registro["tokens_prompt"] or 0) + (registro["tokens_respuesta"] or 0))
+                    estadisticas_modelos.registrar_exito(modelo, registro["duracion_ms"])
+                    return datos
+
+            # Capturamos el error específico de la API
+            msg_error = datos.get("error", {}).get("message", "Sin mensaje de error")
+            registro["error"] = f"Status {response.status_code}: {msg_error}"
+            logger.warning("❌ FALLÓ %s (Status %s): %s", modelo, response.status_code, msg_error, extra=_campos(registro))
+        except CupoAgotado as e:
+            # No es culpa del modelo: no cuenta para el circuit breaker
+            logger.warning("🚦 Sin cupo para %s, se pasa al siguiente", modelo, extra={"modelo": modelo})
+            registro["error"] = f"LIMITE: {str(e)}"
+            return None
+        except asyncio.CancelledError:
+            registro["error"] = "CANCELADA: otro modelo respondió primero"
+            raise
+        except Exception as e:
+            logger.error("⚠️ Excepción de red con %s: %s", modelo, e, extra={"modelo": modelo})
+            registro["error"] = f"Error de red: {str(e)}"
+        finally:
+            if registro["duracion_ms"] is None:
+                registro["duracion_ms"] = int((time.perf_counter() - inicio) * 1000)
+            registrar_invocacion_llm(registro)
+
+        estadisticas_modelos.registrar_fallo(modelo)
+        return None
+
+    async def enviar_prompt(self, system_prompt: str, user_prompt: str, intentos: list = None):
+        """
+        Recorre la cascada de modelos según LLM_MODO_CASCADA:
+          - "secuencial": uno por vez, en orden de salud.
+          - "hedge": si el modelo en curso no responde en LLM_HEDGE_RETRASO_SEGUNDOS
+            se lanza el siguiente en paralelo; gana la primera respuesta válida.
+          - "carrera": se lanzan LLM_MAX_PARALELO modelos a la vez desde el inicio.
+        Los perdedores se cancelan. Cada intento queda registrado en `intentos`.
+        """
+        intentos = intentos if intentos is not None else []
+        modo = settings.LLM_MODO_CASCADA
+        max_paralelo = 1 if modo == "secuencial" else max(1, settings.LLM_MAX_PARALELO)
+        retraso = 0 if modo == "carrera" else settings.LLM_HEDGE_RETRASO_SEGUNDOS
+
+        cola = estadisticas_modelos.ordenar(self.modelos_fallback)
+        activas: dict[asyncio.Task, str] = {}
+        ganador = None
+
+        def lanzar():
+            modelo = cola.pop(0)
+            tarea = asyncio.create_task(self._intentar(modelo, system_prompt, user_prompt, intentos))
+            activas[tarea] = modelo
+
+        try:
+            while (cola or activas) and ganador is None:
+                # Sin nada en curso (o en modo carrera) lanzamos hasta llenar el cupo
+                while cola and len(activas) < max_paralelo and (not activas or retraso == 0):
+                    lanzar()
+
+                # En hedge esperamos como máximo el retraso antes de sumar otro modelo
+                espera = retraso if (cola and len(activas) < max_paralelo and retraso > 0) else None
+                terminadas, _ = await asyncio.wait(activas, timeout=espera, return_when=asyncio.FIRST_COMPLETED)
+                if not terminadas:
+                    logger.info("⏱️ Hedging: sin respuesta tras %ss, se suma %s", retraso, cola[0])
+                    lanzar()
+                    continue
+
+                for tarea in terminadas:
+                    modelo = activas.pop(tarea)
+                    datos = tarea.result()
+                    registro = next(r for r in intentos if r["modelo"] == modelo)
+                    if datos is not None and ganador is None:
+                        ganador = datos
+                        self.modelo_exitoso = modelo
+                        registro["ganadora"] = True
+                    elif datos is not None:
+                        registro["error"] = "DESCARTADA: otro modelo respondió primero"
+
+                if ganador is None and modo == "secuencial" and cola:
+                    await asyncio.sleep(settings.LLM_PAUSA_FALLBACK_SEGUNDOS)
+        finally:
+            # Cancelamos a los perdedores y esperamos a que registren su cancelación
+            for tarea in activas:
+                tarea.cancel()
+            await asyncio.gather(*activas, return_exceptions=True)
+
+        if ganador is not None:
+            return ganador
 
         # --- LOG CRÍTICO ANTES DE MORIR ---
         # Si llegamos aquí, nada funcionó. Imprimimos el resumen de por qué.
-        logger.error(f"🚨 TODOS LOS MODELOS FALLARON. Resumen: {intentos_fallidos}")
+        intentos_fallidos = [f"{r['modelo']}: {r['error']}" for r in intentos]
+        logger.error("🚨 TODOS LOS MODELOS FALLARON. Resumen: %s", intentos_fallidos)
         
         return {
             "error": {
                 "message": "Fallo total en cascada de modelos.",
                 "details": intentos_fallidos
             }
-        }
\ No newline at end of file
+        }
+
+    async def reparar(self, modelo: str, system_prompt: str, user_prompt: str, intentos: list = None):
+        """
+        Re-pedido de reparación: un solo intento contra `modelo` (el que dio la
+        respuesta inválida), sin cascada ni hedging. Mismo formato de retorno que enviar_prompt.
+        """
+        intentos = intentos if intentos is not None else []
+        datos = await self._intentar(modelo, system_prompt, user_prompt, intentos)
+        if datos is None:
+            return {"error": {"message": "Falló el re-pedido de reparación.", "details": [intentos[-1]["error"]]}}
+        intentos[-1]["ganadora"] = True
+        return datos
+
+    async def enviar_prompt_stream(self, system_prompt: str, user_prompt: str, intentos: list = None):
+        """
+        Variante en streaming (OpenRouter `stream: true`). Genera los fragmentos de
+        texto a medida que llegan. Los modelos se prueban en orden hasta que uno
+        empieza a responder; una vez emitido el primer token ya no se cambia de modelo.
+        Al terminar, `self.modelo_exitoso` y `self.ultimo_uso` quedan cargados.
+        """
+        intentos = intentos if intentos is not None else []
+        self.ultimo_uso = {}
+
+        for modelo in estadisticas_modelos.ordenar(self.modelos_fallback):
+            # OpenRouter envía el consumo en el último chunk con usage.include
+            payload = self._payload(modelo, system_prompt, user_prompt, stream=True, usage={"include": True})
+            registro = {
+                "modelo": modelo,
+                "invocado_at": datetime.utcnow(),
+                "exitosa": False,
+                "ganadora": False,
+                "error": None,
+                "tokens_prompt": None,
+                "tokens_respuesta": None,
+                "duracion_ms": None,
+                "espera_cola_ms": None
+            }
+            intentos.append(registro)
+            inicio = time.perf_counter()
+            emitio = False
+            try:
+                async with limitador_llm.cupo(modelo, self._tokens_a_reservar(system_prompt, user_prompt)) as reserva:
+                    registro["espera_cola_ms"] = reserva.espera_ms
+                    registro["invocado_at"] = datetime.utcnow()
+                    inicio = time.perf_counter()
+                    async with self.client.stream("POST", self.url, headers=self._headers(), json=payload) as response:
+                        await limitador_llm.registrar_respuesta(modelo, response.status_code, response.headers)
+                        if response.status_code != 200:
+                            cuerpo = (await response.aread()).decode("utf-8", "replace")
+                            raise RuntimeError(f"Status {response.status_code}: {cuerpo[:300]}")
+
+                        async for linea in response.aiter_lines():
+                            # Formato SSE: "data: {...}"; las líneas ": ..." son keep-alive de OpenRouter
+                            if not linea.startswith("data:"):
+                                continue
+                            dato = linea[5:].strip()
+                            if dato == "[DONE]":
+                                break
+                            chunk = json.loads(dato)
+                            if "error" in chunk:
+                                raise RuntimeError(chunk["error"].get("message", "Error en stream"))
+                            if chunk.get("usage"):
+                                self.ultimo_uso = chunk["usage"]
+                            delta = (chunk.get("choices") or [{}])[0].get("delta", {}).get("content")
+                            if delta:
+                                emitio = True
+                                yield delta
+
+                    registro["duracion_ms"] = int((time.perf_counter() - inicio) * 1000)
+                    registro["exitosa"] = registro["ganadora"] = True
+                    registro["tokens_prompt"] = self.ultimo_uso.get("prompt_tokens")
+                    registro["tokens_respuesta"] = self.ultimo_uso.get("completion_tokens")
+                    await limitador_llm.ajustar(reserva, (registro["tokens_prompt"] or 0) + (registro["tokens_respuesta"] or 0))
+                estadisticas_modelos.registrar_exito(modelo, registro["duracion_ms"])
+                registrar_invocacion_llm(registro)
+                self.modelo_exitoso = modelo
+                logger.info("✅ ÉXITO (stream) con modelo: %s", modelo, extra=_campos(registro))
+                return
+            except CupoAgotado as e:
+                registro["duracion_ms"] = 0
+                registro["error"] = f"LIMITE: {str(e)}"
+                registrar_invocacion_llm(registro)
+                logger.warning("🚦 Sin cupo para %s (stream), se pasa al siguiente", modelo, extra={"modelo": modelo})
+            except Exception as e:
+                registro["duracion_ms"] = int((time.perf_counter() - inicio) * 1000)
+                registro["error"] = f"Stream: {str(e)}"
+                estadisticas_modelos.registrar_fallo(modelo)
+                registrar_invocacion_llm(registro)
+                logger.warning("❌ FALLÓ stream %s: %s", modelo, e, extra=_campos(registro))
+                # Si ya emitimos texto no podemos cambiar de modelo a mitad de respuesta
+                if emitio:
+                    raise
+
+        raise RuntimeError("Fallo total en cascada de modelos (stream).")
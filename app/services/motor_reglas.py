@@ -0,0 +1,286 @@
+"""
+Pre-análisis local: señales de riesgo que salen directo de los datos del
+snapshot, sin LLM.
+
+Las reglas corren vectorizadas con NumPy sobre los registros aplanados de uno
+o muchos snapshots a la vez (`evaluar_lote`): cada fila lleva el índice de su
+snapshot y los agregados salen de bincount / maximum.at, sin bucles por fila.
+
+  - Seguridad: medidas con cumple != true (ratio de cumplimiento).
+  - Desvíos: presenta_desvios en los últimos REGLAS_VENTANA_DESVIOS registros.
+  - Estancamiento: registros finales sin cambio de porcentaje_avance (< 100).
+  - Retrocesos: porcentaje_avance que baja entre registros consecutivos.
+  - Etapas atrasadas: avance_estimado contra el avance esperado por calendario
+    (si la etapa trae fecha_inicio y fecha_fin; referencia = último registro).
+  - Etapas finalizadas con avance_estimado < 100.
+
+Cada snapshot devuelve indicadores (van al prompt en lugar de parte de los
+datos crudos), hallazgos con la forma de ObservacionGenerada y un score base.
+`ambigua` indica si hace falta el LLM: pocos datos, campos que las reglas no
+interpretan (texto libre) o alguna señal a menos de REGLAS_MARGEN_AMBIGUEDAD
+de su umbral.
+"""
+from datetime import date
+
+import numpy as np
+
+from app.config.settings import settings
+
+REGLAS = ("seguridad", "desvios", "estancamiento", "retrocesos", "etapas_atrasadas", "etapas_incoherentes")
+CLAVES_CONOCIDAS = {"proyecto", "etapas", "registros_avance", "medidas_seguridad"}
+CAMPOS_AVANCE = {"fecha", "supervisor", "porcentaje_avance", "presenta_desvios", "tareas_ejecutadas", "oficios_activos"}
+CAMPOS_ETAPA = {"nombre", "estado", "avance_estimado", "fecha_inicio", "fecha_fin", "fecha_fin_estimada"}
+CAMPOS_MEDIDA = {"item", "cumple"}
+ESTADOS_FINALIZADOS = {"FINALIZADA", "FINALIZADO", "COMPLETADA", "COMPLETADO", "TERMINADA", "TERMINADO"}
+PENALIDAD = {"CRITICO": 25, "ATENCION": 10, "INFORMATIVO": 3}
+MAX_NOMBRES = 10 # Ítems/etapas listados en la descripción de un hallazgo
+
+def _aplanar(lista_datos: list, clave: str, campos: set):
+    """Filas dict de `clave` de todos los snapshots, su índice de snapshot y los campos con texto que no se conocen."""
+    filas, segmento, desconocidos = [], [], []
+    for i, datos in enumerate(lista_datos):
+        propias = [f for f in (datos.get(clave) or []) if isinstance(f, dict)] if isinstance(datos, dict) else []
+        filas.extend(propias)
+        segmento.extend([i] * len(propias))
+        # Unión de claves en C; los valores solo se miran si aparece alguna clave desconocida
+        extra = set().union(*propias) - campos if propias else set()
+        desconocidos.append({k for k in extra if any(isinstance(f.get(k), str) and f[k].strip() for f in propias)})
+    return filas, np.asarray(segmento, dtype=np.intp), desconocidos
+
+def _numeros(valores) -> np.ndarray:
+    return np.array(
+        [float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else np.nan for v in valores],
+        dtype=np.float64
+    )
+
+def _fechas(valores) -> np.ndarray:
+    """Días desde epoch (int64); NaT para vacíos o inválidos."""
+    textos = [v[:10] if isinstance(v, str) and v else "NaT" for v in valores]
+    try:
+        return np.array(textos, dtype="datetime64[D]")
+    except ValueError:
+        salida = np.full(len(textos), np.datetime64("NaT"), dtype="datetime64[D]")
+        for i, texto in enumerate(textos):
+            try:
+                salida[i] = np.datetime64(texto, "D")
+            except ValueError:
+                pass
+        return salida
+
+def _cerca(valor: np.ndarray, umbral: float) -> np.ndarray:
+    """Señal en la zona gris alrededor del umbral: ahí decide el LLM."""
+    margen = abs(umbral) * settings.REGLAS_MARGEN_AMBIGUEDAD
+    return np.abs(valor - umbral) <= margen
+
+def _nombres(indices, filas: list, campo: str) -> list:
+    return [str(filas[i].get(campo)) for i in indices[:MAX_NOMBRES]]
+
+def _agrupar(indices: np.ndarray, segmento: np.ndarray, n: int) -> list:
+    """Índices de fila agrupados por snapshot (solo para los pocos casos que van al texto)."""
+    grupos = [[] for _ in range(n)]
+    for i in indices.tolist():
+        grupos[segmento[i]].append(i)
+    return grupos
+
+def evaluar_lote(lista_datos: list, hoy: date = None) -> list:
+    """Señales de cada snapshot (el dict `datos` de SnapshotCreate), en el mismo orden."""
+    n = len(lista_datos)
+    hoy = np.datetime64(hoy or date.today(), "D")
+    ventana = settings.REGLAS_VENTANA_DESVIOS
+    umbral_estancado = settings.REGLAS_ESTANCAMIENTO_REGISTROS
+    umbral_atraso = settings.REGLAS_ETAPA_ATRASO_PP
+
+    # --- Avances: desvíos recientes, estancamiento y retrocesos ---
+    avances, seg_av, desconocidos_av = _aplanar(lista_datos, "registros_avance", CAMPOS_AVANCE)
+    registros = np.bincount(seg_av, minlength=n)
+    fin_av = np.cumsum(registros)
+    desde_fin = fin_av[seg_av] - 1 - np.arange(len(avances))
+    desvio = np.fromiter((a.get("presenta_desvios") is True for a in avances), dtype=bool, count=len(avances))
+    desvios = np.bincount(seg_av, weights=desvio, minlength=n)
+    recientes = desde_fin < ventana
+    desvios_recientes = np.bincount(seg_av[recientes], weights=desvio[recientes], minlength=n)
+    ratio_desvios = np.divide(desvios_recientes, np.minimum(registros, ventana), out=np.zeros(n), where=registros > 0)
+
+    porcentaje = _numeros(a.get("porcentaje_avance") for a in avances)
+    validos = ~np.isnan(porcentaje)
+    pct, seg_pct = porcentaje[validos], seg_av[validos]
+    con_pct = np.bincount(seg_pct, minlength=n)
+    fin_pct = np.cumsum(con_pct)
+    tiene_pct = con_pct > 0
+    porcentaje_final = np.full(n, np.nan)
+    porcentaje_final[tiene_pct] = pct[fin_pct[tiene_pct] - 1]
+    mismo = seg_pct[1:] == seg_pct[:-1]
+    paso = np.diff(pct)
+    retrocesos = np.bincount(seg_pct[1:][mismo & (paso < 0)], minlength=n)
+    # Último índice donde cambió el porcentaje; sin cambios, el primero del snapshot
+    ultimo_cambio = fin_pct - con_pct
+    cambio = np.flatnonzero(mismo & (paso != 0)) + 1
+    np.maximum.at(ultimo_cambio, seg_pct[cambio], cambio)
+    sin_avance = np.where(tiene_pct, fin_pct - 1 - ultimo_cambio, 0)
+    estancado = tiene_pct & (porcentaje_final < 100)
+
+    # Fecha de referencia del calendario: último registro de avance (si no hay, hoy)
+    fechas_av = _fechas(a.get("fecha") for a in avances).astype(np.int64)
+    nat = np.datetime64("NaT").astype(np.int64)
+    referencia = np.full(n, nat, dtype=np.int64)
+    con_fecha = fechas_av != nat
+    np.maximum.at(referencia, seg_av[con_fecha], fechas_av[con_fecha])
+    referencia[referencia == nat] = hoy.astype(np.int64)
+
+    # --- Seguridad ---
+    medidas, seg_med, desconocidos_med = _aplanar(lista_datos, "medidas_seguridad", CAMPOS_MEDIDA)
+    cumple = np.fromiter((m.get("cumple") is True for m in medidas), dtype=bool, count=len(medidas))
+    total_medidas = np.bincount(seg_med, minlength=n)
+    cumplen = np.bincount(seg_med, weights=cumple, minlength=n)
+    ratio_cumplimiento = np.divide(cumplen, total_medidas, out=np.ones(n), where=total_medidas > 0)
+    incumplidas = _agrupar(np.flatnonzero(~cumple), seg_med, n)
+
+    # --- Etapas: atraso contra calendario y estado incoherente ---
+    etapas, seg_et, desconocidos_et = _aplanar(lista_datos, "etapas", CAMPOS_ETAPA)
+    avance_etapa = _numeros(e.get("avance_estimado") for e in etapas)
+    inicio = _fechas(e.get("fecha_inicio") for e in etapas).astype(np.int64)
+    fin = _fechas(e.get("fecha_fin") or e.get("fecha_fin_estimada") for e in etapas).astype(np.int64)
+    duracion = fin - inicio
+    con_calendario = (inicio != nat) & (fin != nat) & (duracion > 0) & ~np.isnan(avance_etapa)
+    esperado = np.clip((referencia[seg_et] - inicio) / np.where(con_calendario, duracion, 1), 0, 1) * 100
+    atraso = np.where(con_calendario, esperado - avance_etapa, -np.inf)
+    max_atraso = np.full(n, -np.inf)
+    np.maximum.at(max_atraso, seg_et, atraso)
+    atrasadas = _agrupar(np.flatnonzero(atraso >= umbral_atraso), seg_et, n)
+    finalizada = np.fromiter(
+        (str(e.get("estado") or "").upper() in ESTADOS_FINALIZADOS for e in etapas), dtype=bool, count=len(etapas)
+    )
+    incoherentes = _agrupar(np.flatnonzero(finalizada & (avance_etapa < 100)), seg_et, n)
+    etapas_con_calendario = np.bincount(seg_et, weights=con_calendario, minlength=n)
+
+    # --- Ambigüedad (vectorizada por señal) ---
+    cerca_desvios = (registros > 0) & _cerca(ratio_desvios, settings.REGLAS_DESVIOS_RATIO_CRITICO) & (desvios_recientes > 0)
+    cerca_estancado = estancado & (_cerca(sin_avance, umbral_estancado) | _cerca(sin_avance, 2 * umbral_estancado))
+    cerca_seguridad = (total_medidas > 0) & (cumplen < total_medidas) & _cerca(ratio_cumplimiento, settings.REGLAS_SEGURIDAD_RATIO_CRITICO)
+    atraso_finito = np.where(np.isfinite(max_atraso), max_atraso, -1e9)
+    cerca_atraso = _cerca(atraso_finito, umbral_atraso) | _cerca(atraso_finito, 2 * umbral_atraso)
+
+    resultados = []
+    for i in range(n):
+        datos = lista_datos[i] if isinstance(lista_datos[i], dict) else {}
+        hallazgos = []
+        if cumplen[i] < total_medidas[i]:
+            nombres = _nombres(incumplidas[i], medidas, "item")
+            hallazgos.append({
+                "titulo": "Medidas de seguridad incumplidas",
+                "descripcion": (
+                    f"{int(total_medidas[i] - cumplen[i])} de {int(total_medidas[i])} medidas sin cumplir "
+                    f"({ratio_cumplimiento[i]:.0%} de cumplimiento): {', '.join(nombres)}."
+                ),
+                "nivel": "CRITICO" if ratio_cumplimiento[i] < settings.REGLAS_SEGURIDAD_RATIO_CRITICO else "ATENCION"
+            })
+        if desvios_recientes[i] > 0:
+            hallazgos.append({
+                "titulo": "Desvíos recientes en el avance",
+                "descripcion": (
+                    f"{int(desvios_recientes[i])} de los últimos {int(min(registros[i], ventana))} registros "
+                    f"presentan desvíos ({int(desvios[i])} en todo el historial)."
+                ),
+                "nivel": "CRITICO" if ratio_desvios[i] >= settings.REGLAS_DESVIOS_RATIO_CRITICO else "ATENCION"
+            })
+        elif desvios[i] > 0:
+            hallazgos.append({
+                "titulo": "Desvíos en el historial",
+                "descripcion": f"{int(desvios[i])} registros con desvíos, ninguno en los últimos {ventana}.",
+                "nivel": "INFORMATIVO"
+            })
+        if estancado[i] and sin_avance[i] >= umbral_estancado:
+            hallazgos.append({
+                "titulo": "Obra estancada",
+                "descripcion": (
+                    f"El avance se mantiene en {porcentaje_final[i]:.0f}% durante los últimos "
+                    f"{int(sin_avance[i]) + 1} registros."
+                ),
+                "nivel": "CRITICO" if sin_avance[i] >= 2 * umbral_estancado else "ATENCION"
+            })
+        if retrocesos[i] > 0:
+            hallazgos.append({
+                "titulo": "Retrocesos en el porcentaje de avance",
+                "descripcion": f"El porcentaje de avance baja {int(retrocesos[i])} veces entre registros consecutivos.",
+                "nivel": "ATENCION"
+            })
+        if atrasadas[i]:
+            detalle = [
+                f"{etapas[j].get('nombre')}: {avance_etapa[j]:.0f}% vs {esperado[j]:.0f}% esperado"
+                for j in sorted(atrasadas[i], key=lambda j: -atraso[j])[:MAX_NOMBRES]
+            ]
+            hallazgos.append({
+                "titulo": "Etapas atrasadas respecto del calendario",
+                "descripcion": f"{len(atrasadas[i])} etapas por debajo de lo esperado a la fecha: {'; '.join(detalle)}.",
+                "nivel": "CRITICO" if max_atraso[i] >= 2 * umbral_atraso else "ATENCION"
+            })
+        if incoherentes[i]:
+            hallazgos.append({
+                "titulo": "Etapas finalizadas con avance incompleto",
+                "descripcion": f"Estado finalizado con avance_estimado < 100%: {', '.join(_nombres(incoherentes[i], etapas, 'nombre'))}.",
+                "nivel": "INFORMATIVO"
+            })
+
+        motivos = []
+        if registros[i] < settings.REGLAS_MIN_AVANCES:
+            motivos.append(f"solo {int(registros[i])} registros de avance")
+        elif con_pct[i] < 0.8 * registros[i]:
+            motivos.append("porcentajes de avance incompletos")
+        otros = sorted(k for k, v in datos.items() if k not in CLAVES_CONOCIDAS and v not in (None, "", [], {}))
+        texto_libre = sorted(desconocidos_av[i] | desconocidos_et[i] | desconocidos_med[i])
+        if otros or texto_libre:
+            motivos.append(f"campos sin reglas: {', '.join(otros + texto_libre)}")
+        for cerca, senal in ((cerca_desvios, "desvíos"), (cerca_estancado, "estancamiento"),
+                             (cerca_seguridad, "seguridad"), (cerca_atraso, "atraso de etapas")):
+            if cerca[i]:
+                motivos.append(f"{senal} cerca del umbral")
+
+        indicadores = {
+            "registros_avance": int(registros[i]),
+            "porcentaje_final": None if np.isnan(porcentaje_final[i]) else float(porcentaje_final[i]),
+            "registros_finales_sin_avance": int(sin_avance[i]),
+            "retrocesos": int(retrocesos[i]),
+            "desvios": int(desvios[i]),
+            "desvios_ultimos_registros": int(desvios_recientes[i]),
+            "medidas_seguridad": int(total_medidas[i]),
+            "ratio_cumplimiento_seguridad": round(float(ratio_cumplimiento[i]), 2) if total_medidas[i] else None,
+            "medidas_incumplidas": _nombres(incumplidas[i], medidas, "item"),
+            "etapas_con_calendario": int(etapas_con_calendario[i]),
+            "max_atraso_etapa_pp": round(float(max_atraso[i]), 1) if np.isfinite(max_atraso[i]) else None,
+        }
+        resultados.append({
+            "indicadores": indicadores,
+            "hallazgos": hallazgos,
+            "score_base": max(0, 100 - sum(PENALIDAD[h["nivel"]] for h in hallazgos)),
+            "ambigua": bool(motivos),
+            "motivos_ambiguedad": motivos,
+        })
+    return resultados
+
+def evaluar(datos: dict, hoy: date = None) -> dict:
+    return evaluar_lote([datos], hoy)[0]
+
+def para_prompt(senales: dict) -> dict:
+    """Lo que ve el modelo: indicadores exactos y hallazgos preliminares (sin los motivos internos)."""
+    return {
+        "indicadores": senales["indicadores"],
+        "hallazgos_preliminares": senales["hallazgos"],
+        "score_base": senales["score_base"],
+    }
+
+def respuesta_local(senales: dict) -> dict:
+    """Resultado con la forma de RespuestaIA para el camino rápido (sin LLM)."""
+    indicadores, hallazgos = senales["indicadores"], senales["hallazgos"]
+    criticos = sum(1 for h in hallazgos if h["nivel"] == "CRITICO")
+    partes = [f"Pre-análisis automático sobre {indicadores['registros_avance']} registros de avance"]
+    if indicadores["porcentaje_final"] is not None:
+        partes.append(f"avance actual {indicadores['porcentaje_final']:.0f}%")
+    if hallazgos:
+        partes.append(f"{len(hallazgos)} hallazgos ({criticos} críticos): " + "; ".join(h["titulo"] for h in hallazgos))
+    else:
+        partes.append("sin desvíos, incumplimientos de seguridad ni atrasos detectados")
+    return {
+        "resumen": ", ".join(partes) + ".",
+        "score_coherencia": senales["score_base"],
+        "riesgos": hallazgos,
+    }
@@ -0,0 +1,101 @@
+import json
+from collections import deque
+
+class ParserRiesgosIncremental:
+    """
+    Parser incremental del objeto {resumen, score_coherencia, riesgos[]} que
+    devuelve el LLM en streaming.
+
+    Se alimenta con fragmentos de texto a medida que llegan los tokens y devuelve
+    cada objeto de `riesgos` en cuanto se cierra su llave, sin esperar al resto
+    de la respuesta. Recorre cada carácter una sola vez y solo retiene los
+    fragmentos de lo que sigue abierto (O(n) total).
+    """
+    def __init__(self):
+        self.buffer = []
+        self._pos = 0 # Caracteres ya recorridos (índice global del próximo fragmento)
+        self._vivos = deque() # (inicio global, fragmento) que todavía pueden hacer falta para recortar
+        self._profundidad = 0
+        self._en_string = False
+        self._escape = False
+        self._inicio_string = None
+        self._ultimo_string_raiz = None
+        self._profundidad_riesgos = None # Profundidad del array "riesgos" cuando está abierto
+        self._inicio_riesgo = None
+
+    @property
+    def texto(self) -> str:
+        return "".join(self.buffer)
+
+    def _recortar(self, desde: int, hasta: int) -> str:
+        """texto[desde:hasta] uniendo solo los fragmentos que lo cubren."""
+        partes = []
+        for inicio, fragmento in self._vivos:
+            if inicio >= hasta:
+                break
+            if inicio + len(fragmento) > desde:
+                partes.append(fragmento[max(desde - inicio, 0):hasta - inicio])
+        return "".join(partes)
+
+    def _podar(self, hasta: int):
+        """Suelta los fragmentos que terminan antes de `hasta` o de lo que sigue abierto (un riesgo o un string raíz)."""
+        if self._inicio_riesgo is not None:
+            hasta = min(hasta, self._inicio_riesgo)
+        elif self._en_string and self._profundidad == 1:
+            hasta = min(hasta, self._inicio_string)
+        while self._vivos and self._vivos[0][0] + len(self._vivos[0][1]) <= hasta:
+            self._vivos.popleft()
+
+    def alimentar(self, fragmento: str) -> list:
+        """Agrega texto y devuelve la lista de riesgos completados en este fragmento."""
+        self.buffer.append(fragmento)
+        self._vivos.append((self._pos, fragmento))
+        base = self._pos
+        completos = []
+
+        # Solo se recorre el fragmento nuevo; lo anterior se recorta de _vivos al cerrar un riesgo
+        for j, c in enumerate(fragmento):
+            i = base + j
+            if self._en_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._en_string = False
+                    if self._profundidad == 1:
+                        # Solo interesa saber si la clave es "riesgos": no se recortan valores largos
+                        largo = i - self._inicio_string - 1
+                        self._ultimo_string_raiz = self._recortar(self._inicio_string + 1, i) if largo == len("riesgos") else None
+                continue
+
+            if c == '"':
+                if self._profundidad > 0:
+                    self._en_string = True
+                    self._inicio_string = i
+            elif c in "{[":
+                # Texto antes del objeto raíz (prosa, ```json) se ignora
+                if self._profundidad == 0 and c == "[":
+                    continue
+                self._profundidad += 1
+                if c == "[" and self._profundidad == 2 and self._ultimo_string_raiz == "riesgos":
+                    self._profundidad_riesgos = 2
+                elif c == "{" and self._profundidad_riesgos and self._profundidad == self._profundidad_riesgos + 1:
+                    self._inicio_riesgo = i
+            elif c in "}]":
+                if self._profundidad == 0:
+                    continue
+                if c == "}" and self._inicio_riesgo is not None and self._profundidad == self._profundidad_riesgos + 1:
+                    try:
+                        completos.append(json.loads(self._recortar(self._inicio_riesgo, i + 1)))
+                    except ValueError:
+                        pass
+                    self._inicio_riesgo = None
+                    self._podar(i + 1)
+                if c == "]" and self._profundidad == self._profundidad_riesgos:
+                    self._profundidad_riesgos = None
+                self._profundidad -= 1
+
+        self._pos = base + len(fragmento)
+        self._podar(self._pos)
+        return completos
@@ -0,0 +1,152 @@
+import json
+import re
+import orjson
+from pydantic import ValidationError
+
+from app.schemas.analisis import RespuestaIA
+
+# Esquema para `response_format: json_schema` de OpenRouter. Escrito a mano (no
+# RespuestaIA.model_json_schema()) para que sea plano y válido en modo strict.
+ESQUEMA_RESPUESTA = {
+    "type": "object",
+    "properties": {
+        "resumen": {"type": "string"},
+        "score_coherencia": {"type": "integer", "minimum": 0, "maximum": 100},
+        "riesgos": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "titulo": {"type": "string"},
+                    "descripcion": {"type": "string"},
+                    "nivel": {"type": "string", "enum": ["CRITICO", "ATENCION", "INFORMATIVO"]}
+                },
+                "required": ["titulo", "descripcion", "nivel"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["resumen", "score_coherencia", "riesgos"],
+    "additionalProperties": False
+}
+
+FORMATO_RESPUESTA = {
+    "type": "json_schema",
+    "json_schema": {"name": "auditoria_obra", "strict": True, "schema": ESQUEMA_RESPUESTA}
+}
+
+class RespuestaInvalida(Exception):
+    """La respuesta del LLM no contiene un objeto JSON que cumpla RespuestaIA."""
+
+def quitar_fences(texto: str) -> str:
+    """Devuelve el contenido del primer bloque ```...``` (con o sin etiqueta de lenguaje); si no hay, el texto tal cual."""
+    inicio = texto.find("```")
+    if inicio == -1:
+        return texto
+    salto = texto.find("\n", inicio + 3)
+    if salto == -1:
+        return texto
+    fin = texto.find("```", salto + 1)
+    return texto[salto + 1:fin if fin != -1 else len(texto)]
+
+# Solo estos caracteres cambian el estado del escáner: el resto se saltea en C
+_ESPECIALES = re.compile(r'[{}"\\]')
+_DECODIFICADOR = json.JSONDecoder()
+# Un objeto JSON solo puede empezar con {" o {}: el resto de las llaves ni se prueba
+_INICIO_OBJETO = re.compile(r'\{\s*["}]')
+
+def _decodificar_desde_llaves(texto: str, desde: int):
+    """
+    Plan B cuando un candidato nunca cierra (ej: "use {placeholder" en la prosa):
+    raw_decode en cada '{' desde `desde`, pero solo en llaves externas. Si un
+    candidato falla, lo que decodificó hasta el error es suyo: los objetos que
+    empiezan ahí adentro (ej: un riesgo de una respuesta truncada seguida de
+    prosa) están anidados y no se prueban. Cada intento arranca después del
+    error anterior, así que el costo sigue siendo lineal.
+    """
+    siguiente = desde
+    for m in _INICIO_OBJETO.finditer(texto, desde):
+        if m.start() < siguiente:
+            continue
+        try:
+            valor, siguiente = _DECODIFICADOR.raw_decode(texto, m.start())
+        except json.JSONDecodeError as e:
+            siguiente = max(e.pos, m.start() + 1)
+            continue
+        except (RecursionError, ValueError):
+            # Anidamiento más profundo que el límite de recursión: no hay objeto utilizable
+            return None
+        if isinstance(valor, dict):
+            return valor
+    return None
+
+def extraer_objeto_json(texto: str):
+    """
+    Primer objeto JSON de primer nivel que se pueda decodificar, ignorando la
+    prosa alrededor. Recorre el texto una sola vez contando llaves fuera de los
+    strings; si un candidato balanceado no decodifica (ej: "{x}" en la prosa)
+    sigue desde donde terminó, así que el costo es lineal en el largo. Una llave
+    suelta que nunca cierra pasa a `_decodificar_desde_llaves`.
+    """
+    profundidad = 0
+    inicio = -1
+    en_string = False
+    escapado = -1 # Posición del carácter escapado por la última barra dentro de un string
+    for m in _ESPECIALES.finditer(texto):
+        i = m.start()
+        c = texto[i]
+        if en_string:
+            if i == escapado:
+                continue
+            if c == "\\":
+                escapado = i + 1
+            elif c == '"':
+                en_string = False
+        elif c == '"':
+            # Las comillas solo abren string dentro de un candidato: en la prosa no cuentan
+            en_string = profundidad > 0
+        elif c == "{":
+            if profundidad == 0:
+                inicio = i
+            profundidad += 1
+        elif c == "}" and profundidad > 0:
+            profundidad -= 1
+            if profundidad == 0:
+                try:
+                    valor = orjson.loads(texto[inicio:i + 1])
+                except orjson.JSONDecodeError:
+                    continue
+                if isinstance(valor, dict):
+                    return valor
+    if profundidad > 0:
+        return _decodificar_desde_llaves(texto, inicio)
+    return None
+
+def decodificar(texto: str) -> tuple:
+    """(objeto, via): via es "directo" si el texto ya era JSON o "extraido" si hubo que limpiarlo."""
+    try:
+        valor = orjson.loads(texto)
+        if isinstance(valor, dict):
+            return valor, "directo"
+    except orjson.JSONDecodeError:
+        pass
+    sin_fences = quitar_fences(texto)
+    valor = extraer_objeto_json(sin_fences)
+    if valor is None and sin_fences is not texto:
+        # Fence sin cerrar o JSON fuera del bloque: probamos con el texto completo
+        valor = extraer_objeto_json(texto)
+    if valor is None:
+        raise RespuestaInvalida("No se encontró un objeto JSON completo en la respuesta")
+    return valor, "extraido"
+
+def parsear_respuesta(texto: str) -> tuple:
+    """
+    Decodifica y valida la respuesta del LLM. Devuelve (dict normalizado, via)
+    o lanza RespuestaInvalida con el motivo (para el re-pedido de reparación).
+    """
+    valor, via = decodificar(texto or "")
+    try:
+        return RespuestaIA.model_validate(valor).model_dump(), via
+    except ValidationError as e:
+        errores = "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()[:5])
+        raise RespuestaInvalida(f"El JSON no cumple el esquema ({errores})") from e
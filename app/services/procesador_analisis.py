@@ -0,0 +1,468 @@
+import json
+import time
+from datetime import datetime
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.config.settings import settings
+from app.core.metrics import ANALISIS_POR_MODO, LLM_RESPUESTAS_PARSEO, etapa, observar_etapa, tiempos_etapas
+from app.models.analisis import (
+    Analisis, EstadoAnalisis, ModoAnalisis, ResultadoAnalisis, ObservacionGenerada,
+    InvocacionLLM, PromptGenerado, RespuestaLLM
+)
+from app.services.llm_cache import llm_cache, calcular_clave, canonicalizar
+from app.services.compactador_snapshot import estimar_tokens
+from app.services import estadisticas_diarias, motor_reglas
+from app.services.delta_snapshot import calcular_delta
+from app.services.llm_client import LLMClient
+from app.services.parser_incremental import ParserRiesgosIncremental
+from app.services.parser_respuesta import RespuestaInvalida, parsear_respuesta
+from app.services.prompt_builder import PromptBuilder
+from app.services.snapshot_store import leer_payload
+from app.services.webhook_client import WebhookClient
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ProcesadorAnalisis:
+    """
+    Ejecuta la fase de IA de un análisis ya persistido: prompt, invocación al LLM,
+    auditoría y resultados de negocio. Lo usan los workers de la cola y el
+    endpoint de streaming.
+    """
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.tokens_estimados = None # Del último prompt armado; se guarda junto al real en InvocacionLLM
+        self.base = None # Análisis previo del proyecto usado en modo incremental
+        self.senales = None # Pre-análisis local (app.services.motor_reglas) del snapshot en curso
+        self.senales_ms = 0
+        self.intento = None # `intentos` del reclamo en curso: cerrar el análisis exige que siga siendo nuestro
+
+    async def _buscar_base(self, analisis: Analisis):
+        """Último análisis COMPLETADO del mismo proyecto (recorre ix_analisis_proyecto_fecha_id hacia atrás)."""
+        return (await self.db.execute(
+            select(Analisis)
+            .options(
+                selectinload(Analisis.snapshot),
+                selectinload(Analisis.resultado).selectinload(ResultadoAnalisis.observaciones)
+            )
+            .where(
+                Analisis.proyecto_codigo == analisis.proyecto_codigo,
+                Analisis.id != analisis.id,
+                Analisis.estado == EstadoAnalisis.COMPLETADO,
+                Analisis.fecha_solicitud <= analisis.fecha_solicitud
+            )
+            .order_by(Analisis.fecha_solicitud.desc(), Analisis.id.desc())
+            .limit(1)
+        )).scalars().first()
+
+    async def _calcular_delta(self, analisis: Analisis, datos: dict):
+        """Devuelve (base, delta); (None, None) si no hay contra qué comparar. Delta vacío = sin cambios."""
+        if not settings.ANALISIS_INCREMENTAL_HABILITADO:
+            return None, None
+        base = await self._buscar_base(analisis)
+        if base is None or base.resultado is None or base.snapshot is None:
+            return None, None
+        # Mismo hash de contenido: ni hace falta decodificar el payload anterior
+        if base.snapshot.payload_hash and base.snapshot.payload_hash == analisis.snapshot.payload_hash:
+            return base, {}
+        anterior = canonicalizar(await leer_payload(self.db, base.snapshot))
+        return base, calcular_delta(anterior, datos, settings.ANALISIS_INCREMENTAL_IGNORAR)
+
+    @staticmethod
+    def _resultado_previo(base: Analisis) -> dict:
+        resultado = base.resultado
+        return {
+            "resumen": resultado.resumen_general,
+            "score_coherencia": resultado.score_coherencia,
+            "riesgos": [
+                {"titulo": o.titulo, "descripcion": o.descripcion, "nivel": o.nivel}
+                for o in resultado.observaciones
+            ]
+        }
+
+    async def _preparar(self, analisis: Analisis):
+        """
+        Reconstruye la entrada desde el snapshot inmutable y arma prompts y claves de caché.
+        Deja en `analisis.modo` cómo se va a resolver: si es SIN_CAMBIOS o REGLAS no hay prompt.
+        """
+        datos_entrada = {
+            "proyecto_codigo": analisis.proyecto_codigo,
+            "datos": canonicalizar(await leer_payload(self.db, analisis.snapshot))
+        }
+        llm_client = LLMClient()
+        with etapa("delta", analisis_id=analisis.id):
+            self.base, delta = await self._calcular_delta(analisis, datos_entrada["datos"])
+        if self.base is not None and not delta:
+            analisis.modo, analisis.analisis_base_id = ModoAnalisis.SIN_CAMBIOS, self.base.id
+            return llm_client, None, None, {}
+
+        if settings.REGLAS_MODO != "apagado":
+            inicio = time.perf_counter()
+            with etapa("reglas", analisis_id=analisis.id):
+                self.senales = motor_reglas.evaluar(datos_entrada["datos"])
+            self.senales_ms = round((time.perf_counter() - inicio) * 1000)
+            # Camino rápido: señales claras, el LLM no aportaría más que redacción
+            if settings.REGLAS_MODO == "rapido" and not self.senales["ambigua"]:
+                analisis.modo, analisis.analisis_base_id = ModoAnalisis.REGLAS, None
+                return llm_client, None, None, {}
+            logger.debug("🧮 Análisis %s escala al LLM: %s", analisis.id, self.senales["motivos_ambiguedad"])
+
+        builder = PromptBuilder(PromptBuilder.presupuesto_para(llm_client.modelos_fallback))
+        with etapa("prompt", analisis_id=analisis.id):
+            system_p, user_p = builder.construir_instrucciones(datos_entrada, self.senales)
+            analisis.modo, analisis.analisis_base_id = ModoAnalisis.COMPLETO, None
+            # Con nombres repetidos el apareo del delta es ambiguo: va el snapshot completo
+            if self.base is not None and not delta.get("claves_duplicadas"):
+                system_d, user_d = builder.construir_instrucciones_delta(
+                    datos_entrada, delta, self._resultado_previo(self.base), self.senales
+                )
+                # El snapshot completo ya va compactado: con muchos cambios el delta puede salir más caro
+                if estimar_tokens(user_d) < estimar_tokens(user_p):
+                    system_p, user_p = system_d, user_d
+                    analisis.modo, analisis.analisis_base_id = ModoAnalisis.DELTA, self.base.id
+        self.tokens_estimados = estimar_tokens(system_p) + estimar_tokens(user_p)
+
+        claves = {
+            modelo: calcular_clave(datos_entrada["datos"], system_p, user_p, modelo)
+            for modelo in llm_client.modelos_fallback
+        }
+        return llm_client, system_p, user_p, claves
+
+    async def _acumular_invocaciones(self, analisis: Analisis, invocaciones: list):
+        # Mismo flush/commit que la auditoría: el rollup no puede contar algo que no quedó registrado
+        if settings.ESTADISTICAS_HABILITADAS:
+            await estadisticas_diarias.acumular_invocaciones(self.db, analisis.proyecto_codigo, invocaciones)
+
+    async def _confirmar_auditoria(self):
+        # Commit propio: si algo falla después, el rollback de `_marcar_error` no se lleva
+        # la auditoría (ni su rollup) de las llamadas que justo hay que poder revisar
+        await self.db.commit()
+
+    async def _registrar_cache(self, analisis: Analisis, cacheada: dict, system_p: str, user_p: str):
+        """Hit: igual dejamos rastro de auditoría, marcado como caché y sin tokens."""
+        invocacion = InvocacionLLM(
+            analisis_id=analisis.id,
+            modelo_usado=cacheada["modelo"],
+            invocado_at=datetime.utcnow(),
+            tokens_prompt=0,
+            tokens_prompt_estimados=self.tokens_estimados,
+            tokens_respuesta=0,
+            duracion_ms=0,
+            desde_cache=True
+        )
+        self.db.add(invocacion)
+        await self.db.flush()
+        await self._acumular_invocaciones(analisis, [invocacion])
+        self.db.add(PromptGenerado(
+            invocacion_id=invocacion.id, system_prompt=system_p,
+            user_prompt=user_p, cache_key=cacheada["clave"]
+        ))
+        await self._confirmar_auditoria()
+        return invocacion, cacheada["respuesta_raw"], cacheada["respuesta_parseada"] or {}
+
+    async def _reutilizar(self, analisis: Analisis):
+        """SIN_CAMBIOS: el resultado del análisis base se copia tal cual, sin llamar al LLM."""
+        contenido_ia = self._resultado_previo(self.base)
+        invocacion = InvocacionLLM(
+            analisis_id=analisis.id,
+            modelo_usado="sin_cambios",
+            invocado_at=datetime.utcnow(),
+            tokens_prompt=0,
+            tokens_prompt_estimados=0,
+            tokens_respuesta=0,
+            duracion_ms=0,
+            desde_cache=True
+        )
+        self.db.add(invocacion)
+        await self.db.flush()
+        await self._acumular_invocaciones(analisis, [invocacion])
+        await self._confirmar_auditoria()
+        logger.info("♻️ Análisis %s sin cambios materiales: reutiliza el resultado de %s", analisis.id, self.base.id)
+        return invocacion, json.dumps(contenido_ia, ensure_ascii=False), contenido_ia
+
+    async def _resolver_con_reglas(self, analisis: Analisis):
+        """REGLAS: el pre-análisis local no dejó dudas; su resultado se guarda sin llamar al LLM."""
+        contenido_ia = motor_reglas.respuesta_local(self.senales)
+        invocacion = InvocacionLLM(
+            analisis_id=analisis.id,
+            modelo_usado="reglas_locales",
+            invocado_at=datetime.utcnow(),
+            tokens_prompt=0,
+            tokens_prompt_estimados=0,
+            tokens_respuesta=0,
+            duracion_ms=self.senales_ms,
+            desde_cache=False
+        )
+        self.db.add(invocacion)
+        await self.db.flush()
+        await self._acumular_invocaciones(analisis, [invocacion])
+        await self._confirmar_auditoria()
+        logger.info("🧮 Análisis %s resuelto con reglas locales (%s hallazgos)", analisis.id, len(contenido_ia["riesgos"]))
+        return invocacion, json.dumps(contenido_ia, ensure_ascii=False), contenido_ia
+
+    async def _registrar_intentos(self, analisis: Analisis, intentos: list, system_p: str, user_p: str):
+        """Una InvocacionLLM por intento (incluidos fallidos y cancelados por hedging)."""
+        db = self.db
+        invocaciones = []
+        for intento in intentos:
+            invocaciones.append(InvocacionLLM(
+                analisis_id=analisis.id,
+                modelo_usado=intento["modelo"],
+                invocado_at=intento["invocado_at"],
+                duracion_ms=intento["duracion_ms"],
+                exitosa=intento["ganadora"],
+                error_detalle=intento["error"],
+                tokens_prompt=intento["tokens_prompt"],
+                tokens_prompt_estimados=self.tokens_estimados,
+                tokens_respuesta=intento["tokens_respuesta"],
+                espera_cola_ms=intento.get("espera_cola_ms")
+            ))
+        db.add_all(invocaciones)
+
+        # El prompt se guarda una sola vez, colgado de la ganadora (o del último intento)
+        ganadoras = [inv for inv, intento in zip(invocaciones, intentos) if intento["ganadora"]]
+        invocacion = ganadoras[0] if ganadoras else (invocaciones[-1] if invocaciones else None)
+        if invocacion is None:
+            invocacion = InvocacionLLM(analisis_id=analisis.id, modelo_usado="ninguno", exitosa=False)
+            db.add(invocacion)
+        await db.flush()
+        await self._acumular_invocaciones(analisis, invocaciones)
+
+        prompt = PromptGenerado(invocacion_id=invocacion.id, system_prompt=system_p, user_prompt=user_p)
+        db.add(prompt)
+        await self._confirmar_auditoria()
+        return invocacion, prompt
+
+    def _parsear(self, string_contenido: str, via: str = None) -> dict:
+        """Decodifica y valida contra RespuestaIA; lanza RespuestaInvalida (nunca devuelve {} en silencio)."""
+        with etapa("parseo"):
+            contenido_ia, via_parseo = parsear_respuesta(string_contenido)
+        LLM_RESPUESTAS_PARSEO.labels(via or via_parseo).inc()
+        return contenido_ia
+
+    async def _interpretar(self, analisis: Analisis, llm_client: LLMClient, invocacion: InvocacionLLM,
+                           prompt: PromptGenerado, string_contenido: str):
+        """
+        Parsea la respuesta del modelo ganador. Si no valida, hace un único
+        re-pedido de reparación al mismo modelo (solo la respuesta rota, sin el
+        snapshot). Devuelve (invocacion, prompt, texto, contenido) de la respuesta usada.
+        """
+        try:
+            return invocacion, prompt, string_contenido, self._parsear(string_contenido)
+        except RespuestaInvalida as e:
+            motivo = str(e)
+
+        # La respuesta inválida queda auditada en su invocación, se repare o no
+        self.db.add(RespuestaLLM(invocacion_id=invocacion.id, respuesta_raw=string_contenido, respuesta_parseada=None))
+        await self._confirmar_auditoria()
+        if settings.LLM_REPARACION_HABILITADA and llm_client.modelo_exitoso:
+            logger.warning("🩹 Respuesta inválida de %s (%s), se pide reparación", llm_client.modelo_exitoso, motivo)
+            system_r, user_r = PromptBuilder.construir_instrucciones_reparacion(string_contenido, motivo)
+            intentos = []
+            with etapa("reparacion", analisis_id=analisis.id):
+                respuesta_raw = await llm_client.reparar(llm_client.modelo_exitoso, system_r, user_r, intentos=intentos)
+            invocacion_r, prompt_r = await self._registrar_intentos(analisis, intentos, system_r, user_r)
+            if "choices" in respuesta_raw:
+                reparado = respuesta_raw["choices"][0]["message"]["content"]
+                try:
+                    return invocacion_r, prompt_r, reparado, self._parsear(reparado, via="reparado")
+                except RespuestaInvalida as e:
+                    motivo = f"{motivo}; tras la reparación: {e}"
+                    self.db.add(RespuestaLLM(invocacion_id=invocacion_r.id, respuesta_raw=reparado, respuesta_parseada=None))
+            else:
+                motivo = f"{motivo}; falló el re-pedido de reparación"
+
+        LLM_RESPUESTAS_PARSEO.labels("invalido").inc()
+        await self._confirmar_auditoria()
+        raise RespuestaInvalida(motivo)
+
+    def _cachear(self, prompt: PromptGenerado, invocacion: InvocacionLLM, clave: str, string_contenido: str, contenido_ia: dict):
+        # Solo cacheamos respuestas que se pudieron interpretar
+        if not contenido_ia or not clave:
+            return
+        prompt.cache_key = clave
+        llm_cache.guardar({
+            "clave": clave,
+            "modelo": invocacion.modelo_usado,
+            "respuesta_raw": string_contenido,
+            "respuesta_parseada": contenido_ia,
+            "tokens_prompt": invocacion.tokens_prompt or 0,
+            "tokens_respuesta": invocacion.tokens_respuesta or 0,
+            "duracion_ms": invocacion.duracion_ms or 0
+        })
+
+    async def _invocar_llm(self, analisis: Analisis, llm_client: LLMClient, system_p: str, user_p: str, claves: dict):
+        """Llama a la cascada de modelos, audita cada intento y alimenta la caché."""
+        intentos = []
+        with etapa("llm", analisis_id=analisis.id):
+            respuesta_raw = await llm_client.enviar_prompt(system_p, user_p, intentos=intentos)
+        invocacion, prompt = await self._registrar_intentos(analisis, intentos, system_p, user_p)
+
+        if "choices" not in respuesta_raw:
+            invocacion.exitosa = False
+            invocacion.error_detalle = str(respuesta_raw)
+            await self._confirmar_auditoria()
+            raise Exception("Fallo en respuesta de IA")
+
+        string_contenido = respuesta_raw['choices'][0]['message']['content']
+        usada, prompt_usado, string_contenido, contenido_ia = await self._interpretar(
+            analisis, llm_client, invocacion, prompt, string_contenido
+        )
+        # La clave (la del prompt original) va en el prompt de la invocación cuya respuesta validó:
+        # si hubo reparación, el de la reparación, nunca el que quedó con la respuesta inválida
+        self._cachear(prompt_usado, usada, claves.get(llm_client.modelo_exitoso), string_contenido, contenido_ia)
+        return usada, string_contenido, contenido_ia
+
+    def _cerrar(self, analisis_id, **valores):
+        """
+        UPDATE del estado final, vallado con el reclamo: si el análisis superó el
+        timeout, el rescate lo devolvió a PENDIENTE y otro worker lo reclamó
+        (`intentos` ya no es el nuestro), así que no afecta ninguna fila.
+        """
+        return (
+            update(Analisis)
+            .where(
+                Analisis.id == analisis_id,
+                Analisis.estado == EstadoAnalisis.PROCESANDO,
+                Analisis.intentos == self.intento
+            )
+            .values(procesando_desde=None, **valores)
+            .execution_options(synchronize_session=False)
+        )
+
+    async def _guardar_resultado(self, analisis: Analisis, invocacion: InvocacionLLM, string_contenido: str, contenido_ia: dict) -> bool:
+        """Devuelve False (y no guarda nada) si el análisis ya no es nuestro."""
+        db, analisis_id = self.db, analisis.id
+        inicio = time.perf_counter()
+        # Primero el UPDATE: en Postgres deja la fila bloqueada hasta el commit y el rescate la saltea
+        if (await db.execute(self._cerrar(analisis_id, estado=EstadoAnalisis.COMPLETADO))).rowcount == 0:
+            await db.rollback()
+            logger.warning("🔒 Análisis %s retomado por otro worker tras el timeout: se descarta este resultado", analisis_id)
+            return False
+        db.add(RespuestaLLM(invocacion_id=invocacion.id, respuesta_raw=string_contenido, respuesta_parseada=contenido_ia))
+
+        # 3. RESULTADOS DE NEGOCIO
+        resultado = ResultadoAnalisis(
+            analisis_id=analisis.id,
+            resumen_general=contenido_ia.get('resumen'),
+            score_coherencia=contenido_ia.get('score_coherencia'),
+            detecta_riesgos=len(contenido_ia.get('riesgos', [])) > 0
+        )
+        db.add(resultado)
+        await db.flush()
+
+        for riesgo in contenido_ia.get('riesgos', []):
+            db.add(ObservacionGenerada(
+                resultado_id=resultado.id,
+                titulo=riesgo.get('titulo'),
+                descripcion=riesgo.get('descripcion'),
+                nivel=riesgo.get('nivel')
+            ))
+
+        if settings.ESTADISTICAS_HABILITADAS:
+            await estadisticas_diarias.acumular_resultado(db, analisis.proyecto_codigo, invocacion.modelo_usado, contenido_ia)
+
+        set_committed_value(analisis, "estado", EstadoAnalisis.COMPLETADO)
+        set_committed_value(analisis, "procesando_desde", None)
+        ANALISIS_POR_MODO.labels((analisis.modo or ModoAnalisis.COMPLETO).value).inc()
+        # La notificación viaja en el mismo commit; la entrega la hace el despachador
+        WebhookClient.encolar_finalizacion(db, analisis)
+        await db.commit()
+        observar_etapa("guardado", time.perf_counter() - inicio)
+        logger.info("✅ Análisis %s completado", analisis.id, extra={
+            "modelo": invocacion.modelo_usado,
+            "modo": (analisis.modo or ModoAnalisis.COMPLETO).value,
+            "etapas_ms": dict(tiempos_etapas.get() or {})
+        })
+        return True
+
+    async def _marcar_error(self, analisis_id, error: Exception):
+        await self.db.rollback()
+        # Tras el rollback los objetos quedan expirados: actualizamos por id (y solo si sigue siendo nuestro)
+        marcado = (await self.db.execute(self._cerrar(analisis_id, estado=EstadoAnalisis.ERROR))).rowcount
+        await self.db.commit()
+        if not marcado:
+            logger.warning("🔒 Análisis %s retomado por otro worker tras el timeout: se descarta este error (%s)", analisis_id, error)
+            return
+        logger.error("❌ Error procesando análisis %s: %s", analisis_id, error)
+
+    async def procesar(self, analisis: Analisis):
+        """Requiere `analisis.snapshot` ya cargado (no hay lazy loading en asyncio) y el análisis en PROCESANDO."""
+        analisis_id, self.intento = analisis.id, analisis.intentos
+        try:
+            # 1-2. PROCESAMIENTO CON IA Y AUDITORÍA
+            llm_client, system_p, user_p, claves = await self._preparar(analisis)
+            cacheada = None
+            if settings.LLM_CACHE_HABILITADO and claves:
+                with etapa("cache", analisis_id=analisis_id):
+                    cacheada = await llm_cache.buscar(self.db, claves)
+
+            if analisis.modo == ModoAnalisis.SIN_CAMBIOS:
+                invocacion, string_contenido, contenido_ia = await self._reutilizar(analisis)
+            elif analisis.modo == ModoAnalisis.REGLAS:
+                invocacion, string_contenido, contenido_ia = await self._resolver_con_reglas(analisis)
+            elif cacheada:
+                invocacion, string_contenido, contenido_ia = await self._registrar_cache(analisis, cacheada, system_p, user_p)
+            else:
+                invocacion, string_contenido, contenido_ia = await self._invocar_llm(
+                    analisis, llm_client, system_p, user_p, claves
+                )
+
+            await self._guardar_resultado(analisis, invocacion, string_contenido, contenido_ia)
+        except Exception as e:
+            await self._marcar_error(analisis_id, e)
+
+    async def procesar_stream(self, analisis: Analisis):
+        """
+        Igual que `procesar` pero con el LLM en streaming. Genera eventos
+        (nombre, datos): un "riesgo" por cada riesgo completado, luego
+        "resultado" con el objeto completo, o "error".
+        """
+        analisis_id, self.intento = analisis.id, analisis.intentos
+        try:
+            llm_client, system_p, user_p, claves = await self._preparar(analisis)
+            cacheada = None
+            if settings.LLM_CACHE_HABILITADO and claves:
+                with etapa("cache", analisis_id=analisis_id):
+                    cacheada = await llm_cache.buscar(self.db, claves)
+
+            if analisis.modo in (ModoAnalisis.SIN_CAMBIOS, ModoAnalisis.REGLAS) or cacheada:
+                if cacheada:
+                    invocacion, string_contenido, contenido_ia = await self._registrar_cache(analisis, cacheada, system_p, user_p)
+                elif analisis.modo == ModoAnalisis.REGLAS:
+                    invocacion, string_contenido, contenido_ia = await self._resolver_con_reglas(analisis)
+                else:
+                    invocacion, string_contenido, contenido_ia = await self._reutilizar(analisis)
+                for riesgo in contenido_ia.get("riesgos", []):
+                    yield "riesgo", riesgo
+            else:
+                intentos = []
+                parser = ParserRiesgosIncremental()
+                # Sin `etapa` (span) acá: el bloque cruza yields del generador
+                inicio = time.perf_counter()
+                try:
+                    async for fragmento in llm_client.enviar_prompt_stream(system_p, user_p, intentos=intentos):
+                        for riesgo in parser.alimentar(fragmento):
+                            yield "riesgo", riesgo
+                except Exception:
+                    # Dejamos auditados los intentos fallidos antes de marcar el error
+                    await self._registrar_intentos(analisis, intentos, system_p, user_p)
+                    raise
+                observar_etapa("llm_stream", time.perf_counter() - inicio)
+
+                invocacion, prompt = await self._registrar_intentos(analisis, intentos, system_p, user_p)
+                invocacion, prompt, string_contenido, contenido_ia = await self._interpretar(
+                    analisis, llm_client, invocacion, prompt, parser.texto
+                )
+                self._cachear(prompt, invocacion, claves.get(llm_client.modelo_exitoso), string_contenido, contenido_ia)
+
+            if await self._guardar_resultado(analisis, invocacion, string_contenido, contenido_ia):
+                yield "resultado", contenido_ia
+            else:
+                yield "error", {"detalle": "El análisis superó el timeout y lo retomó un worker"}
+        except Exception as e:
+            await self._marcar_error(analisis_id, e)
+            yield "error", {"detalle": str(e)}
@@ -1,10 +1,43 @@
+from app.config.settings import settings
+from app.services.compactador_snapshot import CompactadorSnapshot, json_compacto, resumir_avances, resumir_medidas
+from app.services.motor_reglas import para_prompt
+
 class PromptBuilder:
-    def construir_instrucciones(self, datos_entrada: dict) -> tuple:
-        """
-        Transforma los datos del dominio en instrucciones de lenguaje natural 
-        para el LLM, asegurando una respuesta técnica y estructurada.
-        """
-        
+    def __init__(self, presupuesto_tokens: int = None, formato: str = None):
+        self.presupuesto_tokens = presupuesto_tokens or settings.PROMPT_PRESUPUESTO_TOKENS
+        self.formato = formato or settings.PROMPT_FORMATO
+
+    @staticmethod
+    def presupuesto_para(modelos: list) -> int:
+        """El prompt se arma una vez para toda la cascada: manda el modelo con menos presupuesto."""
+        por_modelo = settings.PROMPT_PRESUPUESTO_POR_MODELO
+        return min(por_modelo.get(m, settings.PROMPT_PRESUPUESTO_TOKENS) for m in modelos)
+
+    def renderizar_datos(self, datos: dict, con_senales: bool = False) -> str:
+        if not settings.PROMPT_COMPACTACION_HABILITADA or not isinstance(datos, dict):
+            return str(datos)
+        # Con las señales calculadas, seguridad y el historial ya van resumidos en ellas
+        return CompactadorSnapshot(
+            self.presupuesto_tokens, self.formato,
+            max_avances_detalle=min(settings.PROMPT_MAX_AVANCES_DETALLE, settings.REGLAS_PROMPT_MAX_AVANCES)
+            if con_senales else settings.PROMPT_MAX_AVANCES_DETALLE,
+            incluir_seguridad=not con_senales
+        ).compactar(datos)
+
+    @staticmethod
+    def seccion_senales(senales: dict) -> tuple:
+        """(bloque de datos, instrucción extra) con las señales del pre-análisis local; vacíos si no hay."""
+        if not senales:
+            return "", ""
+        bloque = f"""--- SEÑALES CALCULADAS (exactas, sobre todos los registros) ---
+        {json_compacto(para_prompt(senales))}"""
+        instruccion = (
+            "4. Toma las SEÑALES CALCULADAS como hechos: confirma, ajusta el nivel o descarta cada hallazgo "
+            "preliminar y agrega lo que los datos muestren además. Parte del score_base."
+        )
+        return bloque, instruccion
+
+    def instrucciones_sistema(self) -> str:
         # El System Prompt: Ahora con instrucciones de formato "agresivas"
         system = """
         Eres un Ingeniero Civil Senior y Auditor de Proyectos con 20 años de experiencia. 
@@ -23,22 +56,111 @@ class PromptBuilder:
           "riesgos": [{"titulo": "...", "descripcion": "...", "nivel": "..."}]
         }
         """
+        return system
+
+    @staticmethod
+    def construir_instrucciones_reparacion(respuesta: str, motivo: str) -> tuple:
+        """
+        Re-pedido barato cuando la respuesta no valida: solo la respuesta rota y
+        el motivo, sin volver a mandar el snapshot.
+        """
+        system = """
+        Corriges respuestas de otro modelo para que sean JSON válido.
+        Devuelve ÚNICAMENTE el objeto JSON corregido, sin markdown ni texto adicional, con esta estructura:
+        {"resumen": "...", "score_coherencia": 0, "riesgos": [{"titulo": "...", "descripcion": "...", "nivel": "CRITICO|ATENCION|INFORMATIVO"}]}
+        Conserva el contenido original; no inventes riesgos nuevos.
+        """
+        user = f"""
+        MOTIVO DEL RECHAZO: {motivo}
+        --- RESPUESTA A CORREGIR ---
+        {respuesta[:settings.LLM_REPARACION_MAX_CARACTERES]}
+        --- FIN ---
+        """
+        return system, user
+
+    def construir_instrucciones(self, datos_entrada: dict, senales: dict = None) -> tuple:
+        """
+        Transforma los datos del dominio en instrucciones de lenguaje natural 
+        para el LLM, asegurando una respuesta técnica y estructurada.
+        `senales` (app.services.motor_reglas) reemplaza parte de los datos crudos.
+        """
         
+        system = self.instrucciones_sistema()
+
         # El User Prompt: Organiza los datos y refuerza el contrato técnico
+        datos_obra = self.renderizar_datos(datos_entrada.get('datos'), con_senales=bool(senales))
+        bloque_senales, instruccion_senales = self.seccion_senales(senales)
+        nota_formato = (
+            '(Tablas como columnas + filas; "resumen_avances" resume todo el historial; '
+            'los códigos ~N se traducen con "leyenda".)'
+            if settings.PROMPT_COMPACTACION_HABILITADA else ""
+        )
         user = f"""
         Realiza una auditoría técnica del siguiente snapshot de obra:
         
         --- INICIO DE DATOS ---
         PROYECTO: {datos_entrada.get('proyecto_codigo')}
-        DATOS DE OBRA: {datos_entrada.get('datos')}
+        DATOS DE OBRA: {datos_obra}
+        {bloque_senales}
         --- FIN DE DATOS ---
+        {nota_formato}
         
         INSTRUCCIONES DE ANÁLISIS:
         1. Evalúa el "resumen": Un párrafo técnico detallado sobre el estado actual.
         2. Calcula el "score_coherencia": Número entero del 0 al 100.
         3. Identifica "riesgos": Lista de objetos con titulo, descripcion y nivel (CRITICO, ATENCION, INFORMATIVO).
+        {instruccion_senales}
         
         RESPONDE SOLO EL JSON:
         """
         
-        return system, user
\ No newline at end of file
+        return system, user
+
+    def construir_instrucciones_delta(self, datos_entrada: dict, delta: dict, previo: dict, senales: dict = None) -> tuple:
+        """
+        Modo incremental: en vez del snapshot entero manda el resultado del
+        análisis anterior y solo lo que cambió desde entonces, más un resumen
+        acumulado corto para no perder el contexto general.
+        """
+        datos = datos_entrada.get('datos') or {}
+        # Como en CompactadorSnapshot: los items que no son objetos se descartan
+        avances = [a for a in datos.get('registros_avance') or [] if isinstance(a, dict)]
+        medidas = [m for m in datos.get('medidas_seguridad') or [] if isinstance(m, dict)]
+        acumulado = {}
+        if avances:
+            acumulado['resumen_avances'] = resumir_avances(avances)
+        if medidas and not senales:
+            acumulado['seguridad'] = resumir_medidas(medidas)
+        nuevos = [r for r in delta.get('registros_avance', {}).get('nuevos') or [] if isinstance(r, dict)]
+        if nuevos:
+            # Mismo formato columnas + filas que el snapshot compacto
+            columnas = CompactadorSnapshot.COLUMNAS_AVANCE
+            delta = {**delta, 'registros_avance': {
+                **delta['registros_avance'],
+                'nuevos': {'columnas': columnas, 'filas': [[r.get(c) for c in columnas] for r in nuevos]}
+            }}
+        bloque_senales, instruccion_senales = self.seccion_senales(senales)
+
+        user = f"""
+        Actualiza la auditoría técnica de una obra ya analizada. Solo se envían los cambios desde el análisis anterior.
+
+        --- ANÁLISIS ANTERIOR ---
+        {json_compacto(previo)}
+        --- CAMBIOS DESDE ENTONCES ---
+        PROYECTO: {datos_entrada.get('proyecto_codigo')}
+        {json_compacto(delta)}
+        --- ESTADO ACUMULADO ---
+        {json_compacto(acumulado)}
+        {bloque_senales}
+        --- FIN DE DATOS ---
+
+        INSTRUCCIONES DE ANÁLISIS:
+        1. Reescribe el "resumen" completo considerando los cambios.
+        2. Recalcula el "score_coherencia": Número entero del 0 al 100.
+        3. Devuelve la lista COMPLETA de "riesgos" vigentes: conserva los anteriores que sigan aplicando, quita los resueltos y agrega los nuevos (nivel CRITICO, ATENCION o INFORMATIVO).
+        {instruccion_senales}
+
+        RESPONDE SOLO EL JSON:
+        """
+
+        return self.instrucciones_sistema(), user
@@ -0,0 +1,79 @@
+import hashlib
+import orjson
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.settings import settings
+from app.models.analisis import PayloadSnapshot, SnapshotRecibido
+
+# zstandard es opcional: solo hace falta con SNAPSHOT_ALMACENAMIENTO="zstd"
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+_compresor = None
+_descompresor = None
+
+def serializar(datos: dict) -> bytes:
+    """JSON canónico (claves ordenadas) con orjson: base del hash y de la compresión."""
+    return orjson.dumps(datos, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+
+def calcular_hash(crudo: bytes) -> str:
+    return hashlib.sha256(crudo).hexdigest()
+
+def _zstd():
+    global _compresor, _descompresor
+    if zstandard is None:
+        raise RuntimeError("SNAPSHOT_ALMACENAMIENTO='zstd' requiere el paquete 'zstandard'")
+    if _compresor is None:
+        _compresor = zstandard.ZstdCompressor(level=settings.SNAPSHOT_ZSTD_NIVEL)
+        _descompresor = zstandard.ZstdDecompressor()
+    return _compresor, _descompresor
+
+def armar_fila(datos: dict, formato: str = None) -> dict:
+    """Fila de payload_snapshot lista para insertar (sin tocar la base)."""
+    formato = formato or settings.SNAPSHOT_ALMACENAMIENTO
+    crudo = serializar(datos)
+    fila = {
+        "hash": calcular_hash(crudo),
+        "formato": formato,
+        "contenido_json": None,
+        "contenido_zstd": None,
+        "tamano_original": len(crudo)
+    }
+    if formato == "zstd":
+        compresor, _ = _zstd()
+        fila["contenido_zstd"] = compresor.compress(crudo)
+    else:
+        fila["contenido_json"] = datos
+    return fila
+
+async def guardar_payload(db: AsyncSession, datos: dict, formato: str = None) -> str:
+    """
+    Guarda el payload si su hash no existe todavía y devuelve el hash.
+    Snapshots idénticos (mismo contenido, cualquier orden de claves) no se duplican.
+    """
+    fila = armar_fila(datos, formato)
+    dialecto = db.bind.dialect.name
+    if dialecto in ("postgresql", "sqlite"):
+        insertar = postgresql.insert if dialecto == "postgresql" else sqlite.insert
+        await db.execute(
+            insertar(PayloadSnapshot).values(**fila).on_conflict_do_nothing(index_elements=["hash"])
+        )
+    elif await db.get(PayloadSnapshot, fila["hash"]) is None:
+        db.add(PayloadSnapshot(**fila))
+        await db.flush()
+    return fila["hash"]
+
+def decodificar(payload: PayloadSnapshot) -> dict:
+    if payload.formato == "zstd":
+        _, descompresor = _zstd()
+        return orjson.loads(descompresor.decompress(payload.contenido_zstd))
+    return payload.contenido_json
+
+async def leer_payload(db: AsyncSession, snapshot: SnapshotRecibido) -> dict:
+    """Devuelve los datos del snapshot, esté en payload_snapshot o en el texto legado."""
+    if snapshot.payload_hash:
+        return decodificar(await db.get(PayloadSnapshot, snapshot.payload_hash))
+    return orjson.loads(snapshot.payload_completo)
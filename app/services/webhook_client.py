@@ -1,22 +1,65 @@
+import hashlib
+import hmac
+import json
+import time
 import httpx
-from app.utils.logger import logger
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.settings import settings
+from app.models.analisis import Analisis, WebhookOutbox
+from app.services.http_clients import obtener_cliente
+import logging
+
+logger = logging.getLogger(__name__)
+
+def firmar(cuerpo: bytes, timestamp: str, secreto: str) -> str:
+    """HMAC-SHA256 de "timestamp.cuerpo": el receptor puede rechazar firmas viejas (replay)."""
+    mensaje = timestamp.encode() + b"." + cuerpo
+    return "sha256=" + hmac.new(secreto.encode(), mensaje, hashlib.sha256).hexdigest()
 
 class WebhookClient:
-    async def notificar_finalizacion(self, analisis_id: str, proyecto_code: str, estado: str):
-        # URL de ejemplo del Backend Principal
-        url_webhook = "https://backend-principal.com/api/webhook/analisis-completado"
-        
-        payload = {
-            "analisis_id": str(analisis_id),
-            "proyecto_codigo": proyecto_code,
-            "estado": estado,
-            "resultado_url": f"https://tu-api-ia.com/api/analisis/{analisis_id}"
-        }
+    def __init__(self, client: httpx.AsyncClient = None):
+        self.client = client or obtener_cliente("webhook")
+
+    @staticmethod
+    def encolar_finalizacion(db: AsyncSession, analisis: Analisis):
+        """
+        Agrega la notificación al outbox dentro de la transacción en curso: se
+        confirma en el mismo commit que el estado del análisis (o no se confirma).
+        """
+        if not settings.WEBHOOK_URL:
+            return None
+        notificacion = WebhookOutbox(
+            analisis_id=analisis.id,
+            url=settings.WEBHOOK_URL,
+            payload={
+                "analisis_id": str(analisis.id),
+                "proyecto_codigo": analisis.proyecto_codigo,
+                "estado": analisis.estado.value,
+                "resultado_url": f"{settings.API_URL_PUBLICA}{settings.API_V1_STR}/analisis/detalle/{analisis.id}"
+            }
+        )
+        db.add(notificacion)
+        return notificacion
+
+    async def entregar(self, notificacion: WebhookOutbox) -> str:
+        """
+        Un intento de entrega. Devuelve None si el receptor respondió 2xx o el
+        motivo del fallo. `X-Webhook-Id` permite al receptor descartar duplicados.
+        """
+        cuerpo = json.dumps(notificacion.payload, separators=(",", ":")).encode()
+        headers = {"Content-Type": "application/json", "X-Webhook-Id": str(notificacion.id)}
+        if settings.WEBHOOK_SECRET:
+            timestamp = str(int(time.time()))
+            headers["X-Webhook-Timestamp"] = timestamp
+            headers["X-Webhook-Firma"] = firmar(cuerpo, timestamp, settings.WEBHOOK_SECRET)
 
         try:
-            async with httpx.AsyncClient() as client:
-                # Intentamos avisar al cliente. Usamos timeout corto para no trabar nuestra API
-                response = await client.post(url_webhook, json=payload, timeout=5.0)
-                logger.info(f"📡 Webhook enviado: Status {response.status_code}")
+            # Timeout corto (WEBHOOK_*_TIMEOUT_SEGUNDOS) configurado en el cliente compartido
+            response = await self.client.post(notificacion.url, content=cuerpo, headers=headers)
         except Exception as e:
-            logger.error(f"⚠️ No se pudo enviar el Webhook: {str(e)}")
\ No newline at end of file
+            return f"Error de red: {str(e)}"
+        if response.is_success:
+            logger.info("📡 Webhook entregado: Status %s", response.status_code)
+            return None
+        return f"Status {response.status_code}: {response.text[:300]}"
@@ -0,0 +1,183 @@
+import asyncio
+import math
+import random
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+from sqlalchemy import func, select, update
+
+from app.config.settings import settings
+from app.core.metrics import WEBHOOK_ENTREGAS, observar_etapa
+from app.db import base as db_base
+from app.models.analisis import EstadoWebhook, WebhookOutbox
+from app.services.webhook_client import WebhookClient
+import logging
+
+logger = logging.getLogger(__name__)
+
+def calcular_backoff(intentos: int) -> float:
+    """Backoff exponencial con jitter: base * 2^(intentos-1), acotado y desparejado entre réplicas."""
+    espera = min(settings.WEBHOOK_BACKOFF_MAX_SEGUNDOS, settings.WEBHOOK_BACKOFF_BASE_SEGUNDOS * 2 ** max(intentos - 1, 0))
+    return espera * random.uniform(0.5, 1.0)
+
+class DespachadorWebhooks:
+    """
+    Entrega en segundo plano las notificaciones del outbox (webhook_outbox).
+
+    Toma lotes de PENDIENTES vencidos con FOR UPDATE SKIP LOCKED y los "alquila"
+    corriendo proximo_intento_at (según lo que tarda el lote), así el HTTP no se
+    hace con la transacción abierta y otra réplica no los toma mientras tanto.
+    Cada entrega se confirma apenas termina. Concurrencia acotada por
+    host destino; los fallos se reprograman con backoff y, agotados
+    WEBHOOK_MAX_INTENTOS, quedan en MUERTO para revisión manual.
+    """
+    def __init__(self):
+        self._tarea: asyncio.Task = None
+        self._hay_trabajo = asyncio.Event()
+        self._detenido = asyncio.Event()
+        self._semaforos: dict[str, asyncio.Semaphore] = {}
+
+    async def iniciar(self):
+        self._detenido.clear()
+        self._tarea = asyncio.create_task(self._bucle(), name="webhook-despachador")
+        logger.info("📮 Despachador de webhooks iniciado")
+
+    async def detener(self):
+        self._detenido.set()
+        self._hay_trabajo.set()
+        if self._tarea:
+            self._tarea.cancel()
+            await asyncio.gather(self._tarea, return_exceptions=True)
+            self._tarea = None
+        logger.info("🛑 Despachador de webhooks detenido")
+
+    def despertar(self):
+        self._hay_trabajo.set()
+
+    def _semaforo(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._semaforos:
+            self._semaforos[host] = asyncio.Semaphore(settings.WEBHOOK_CONCURRENCIA_POR_HOST)
+        return self._semaforos[host]
+
+    async def _bucle(self):
+        while not self._detenido.is_set():
+            try:
+                entregadas = await self.despachar_lote()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("⚠️ Error en el despachador de webhooks: %s", e)
+                entregadas = 0
+            if entregadas:
+                continue # Puede haber más vencidas: seguimos sin dormir
+            self._hay_trabajo.clear()
+            try:
+                await asyncio.wait_for(self._hay_trabajo.wait(), timeout=settings.WEBHOOK_POLL_SEGUNDOS)
+            except asyncio.TimeoutError:
+                pass
+
+    def _alquiler(self, notificaciones: list) -> timedelta:
+        """
+        Lo que puede tardar el lote en el peor caso: por host entran de a
+        WEBHOOK_CONCURRENCIA_POR_HOST, así que el host más cargado hace
+        ceil(n/concurrencia) rondas de connect+read. El doble, como margen.
+        """
+        por_host = {}
+        for notificacion in notificaciones:
+            host = urlsplit(notificacion.url).netloc
+            por_host[host] = por_host.get(host, 0) + 1
+        rondas = max((math.ceil(n / settings.WEBHOOK_CONCURRENCIA_POR_HOST) for n in por_host.values()), default=1)
+        return timedelta(seconds=2 * rondas * (settings.WEBHOOK_CONNECT_TIMEOUT_SEGUNDOS + settings.WEBHOOK_READ_TIMEOUT_SEGUNDOS))
+
+    async def _reclamar(self, db) -> list:
+        ahora = datetime.utcnow()
+        notificaciones = (await db.execute(
+            select(WebhookOutbox)
+            .where(
+                WebhookOutbox.estado == EstadoWebhook.PENDIENTE,
+                WebhookOutbox.proximo_intento_at <= ahora
+            )
+            .order_by(WebhookOutbox.proximo_intento_at)
+            .with_for_update(skip_locked=True)
+            .limit(settings.WEBHOOK_LOTE)
+        )).scalars().all()
+        # Alquiler: si la réplica muere, vuelven a estar vencidas. El vencimiento
+        # queda en cada notificación y sirve de "fencing" al registrar el resultado
+        vence = ahora + self._alquiler(notificaciones)
+        for notificacion in notificaciones:
+            notificacion.proximo_intento_at = vence
+        await db.commit()
+        return notificaciones
+
+    async def _entregar(self, cliente: WebhookClient, notificacion: WebhookOutbox):
+        async with self._semaforo(notificacion.url):
+            inicio = time.perf_counter()
+            error = await cliente.entregar(notificacion)
+            observar_etapa("webhook", time.perf_counter() - inicio)
+        await self._registrar(notificacion, error)
+
+    async def _registrar(self, notificacion: WebhookOutbox, error: str):
+        """
+        Confirma el resultado de una entrega apenas termina, en su propia
+        transacción (no al final del lote). Solo si el alquiler sigue siendo
+        nuestro: si venció y otra réplica la reclamó, su resultado es el que vale.
+        """
+        intentos = (notificacion.intentos or 0) + 1
+        ahora = datetime.utcnow()
+        valores = {"intentos": intentos, "ultimo_error": error}
+        if error is None:
+            valores.update(estado=EstadoWebhook.ENTREGADO, entregado_at=ahora)
+            resultado = "entregado"
+        elif intentos >= settings.WEBHOOK_MAX_INTENTOS:
+            valores.update(estado=EstadoWebhook.MUERTO)
+            resultado = "muerto"
+        else:
+            valores.update(proximo_intento_at=ahora + timedelta(seconds=calcular_backoff(intentos)))
+            resultado = "reintento"
+
+        async with db_base.AsyncSessionLocal() as db:
+            filas = (await db.execute(
+                update(WebhookOutbox)
+                .where(
+                    WebhookOutbox.id == notificacion.id,
+                    WebhookOutbox.estado == EstadoWebhook.PENDIENTE,
+                    WebhookOutbox.proximo_intento_at == notificacion.proximo_intento_at
+                )
+                .values(**valores)
+            )).rowcount
+            await db.commit()
+        if not filas:
+            logger.warning("⚠️ Webhook %s: el alquiler venció antes de registrar el intento; lo registra otra réplica", notificacion.id)
+            return
+
+        WEBHOOK_ENTREGAS.labels(resultado).inc()
+        if resultado == "muerto":
+            logger.error("☠️ Webhook %s descartado tras %s intentos: %s", notificacion.id, intentos, error)
+        elif resultado == "reintento":
+            logger.warning("⚠️ Webhook %s falló (%s), intento %s", notificacion.id, error, intentos)
+
+    async def despachar_lote(self) -> int:
+        """Un ciclo: reclama y entrega en paralelo; cada resultado se confirma al terminar. Devuelve cuántas procesó."""
+        async with db_base.AsyncSessionLocal() as db:
+            notificaciones = await self._reclamar(db)
+        if not notificaciones:
+            return 0
+
+        cliente = WebhookClient()
+        resultados = await asyncio.gather(*(self._entregar(cliente, n) for n in notificaciones), return_exceptions=True)
+        for notificacion, resultado in zip(notificaciones, resultados):
+            if isinstance(resultado, asyncio.CancelledError):
+                raise resultado
+            if isinstance(resultado, Exception):
+                # Queda alquilada: se reintenta cuando venza el alquiler
+                logger.error("⚠️ No se pudo registrar el webhook %s: %s", notificacion.id, resultado)
+        return len(notificaciones)
+
+async def contar_por_estado(db) -> dict:
+    filas = (await db.execute(
+        select(WebhookOutbox.estado, func.count(WebhookOutbox.id)).group_by(WebhookOutbox.estado)
+    )).all()
+    conteo = {estado.value: 0 for estado in EstadoWebhook}
+    conteo.update({estado.value: cantidad for estado, cantidad in filas})
+    return conteo
@@ -1,12 +0,0 @@
-import logging
-import sys
-
-# Configuración básica de logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s | %(levelname)s | %(message)s",
-    datefmt="%H:%M:%S",
-    handlers=[logging.StreamHandler(sys.stdout)]
-)
-
-logger = logging.getLogger("AI-CONSTRUCTOR")
\ No newline at end of file
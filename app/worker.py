@@ -0,0 +1,53 @@
+"""
+Proceso worker independiente para la cola de análisis.
+
+Uso: python -m app.worker
+Pensado para desplegar con ANALISIS_WORKERS_HABILITADOS=False en la API, de modo
+que las réplicas HTTP solo encolen y este proceso (o varios) haga el trabajo de IA.
+"""
+import asyncio
+import signal
+
+from app.config.settings import settings
+from app.core.logging import setup_logging
+from app.db import base as db_base
+from app.db.esquema import asegurar_esquema
+from app.services.analisis_worker import AnalisisWorker
+from app.services.archivo_auditoria import MantenimientoAuditoria
+from app.services.http_clients import iniciar_clientes, cerrar_clientes
+from app.services.webhook_dispatcher import DespachadorWebhooks
+import logging
+
+logger = logging.getLogger(__name__)
+
+async def main():
+    setup_logging()
+    db_base.crear_engines()
+    if settings.DB_CREAR_ESQUEMA_AL_INICIAR:
+        await asegurar_esquema()
+
+    await iniciar_clientes()
+    worker = AnalisisWorker()
+    await worker.iniciar()
+    despachador = DespachadorWebhooks()
+    if settings.WEBHOOK_DESPACHADOR_HABILITADO:
+        await despachador.iniciar()
+    mantenimiento = MantenimientoAuditoria(db_base.engine)
+    if settings.AUDITORIA_MANTENIMIENTO_HABILITADO:
+        await mantenimiento.iniciar()
+
+    # Parada ordenada ante SIGINT/SIGTERM (docker stop, Ctrl+C)
+    parar = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, parar.set)
+
+    await parar.wait()
+    await worker.detener()
+    await despachador.detener()
+    await mantenimiento.detener()
+    await cerrar_clientes()
+    await db_base.cerrar_engines()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+"""
+Benchmark: tiempo de arranque de la API.
+
+Mide, siempre en procesos nuevos (sin caché de módulos del intérprete):
+1. Import de app.main: mediana de --repeticiones imports y los módulos más
+   pesados según `python -X importtime`.
+2. Tiempo hasta el primer request: lanza uvicorn y sondea GET /api/v1/health
+   hasta el primer 200, con la sincronización del esquema en el lifespan y
+   sin ella (DB_CREAR_ESQUEMA_AL_INICIAR=false, como cuando el despliegue
+   corre `python -m app.db.esquema` aparte).
+
+Usa la base configurada en el entorno / .env.
+
+Uso:
+    python -m benchmarks.bench_arranque --repeticiones 10 --puerto 8765
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+MEDIR_IMPORT = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+def medir_import(repeticiones: int) -> dict:
+    tiempos = []
+    for _ in range(repeticiones):
+        salida = subprocess.run([sys.executable, "-c", MEDIR_IMPORT], capture_output=True, text=True, check=True)
+        tiempos.append(float(salida.stdout.strip().splitlines()[-1]))
+    return {"mediana_ms": round(statistics.median(tiempos) * 1000, 1), "min_ms": round(min(tiempos) * 1000, 1)}
+
+def modulos_pesados(cantidad: int) -> list:
+    """Los módulos de primer nivel con más tiempo acumulado de import."""
+    salida = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"], capture_output=True, text=True, check=True)
+    acumulados = {}
+    for linea in salida.stderr.splitlines():
+        if not linea.startswith("import time:") or "|" not in linea:
+            continue
+        _, acumulado, modulo = (parte.strip() for parte in linea.split("|"))
+        if not acumulado.isdigit():
+            continue
+        raiz = modulo.split(".")[0]
+        # La línea del paquete raíz ya incluye a sus submódulos: nos quedamos con el máximo
+        acumulados[raiz] = max(acumulados.get(raiz, 0), int(acumulado))
+    return [
+        {"modulo": modulo, "ms": round(us / 1000, 1)}
+        for modulo, us in sorted(acumulados.items(), key=lambda par: par[1], reverse=True)[:cantidad]
+    ]
+
+def medir_primer_request(puerto: int, crear_esquema: bool, timeout: float) -> float:
+    entorno = {**os.environ, "DB_CREAR_ESQUEMA_AL_INICIAR": str(crear_esquema).lower()}
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(puerto), "--log-level", "warning"],
+        env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        with httpx.Client(timeout=1.0) as client:
+            while time.perf_counter() - inicio < timeout:
+                if proceso.poll() is not None:
+                    raise RuntimeError(f"uvicorn terminó con código {proceso.returncode}")
+                try:
+                    if client.get(f"http://127.0.0.1:{puerto}/api/v1/health").status_code == 200:
+                        return (time.perf_counter() - inicio) * 1000
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.01)
+        raise TimeoutError(f"Sin respuesta de /health en {timeout}s")
+    finally:
+        proceso.terminate()
+        proceso.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=10)
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    reporte = {"import_app_main": medir_import(args.repeticiones), "modulos_pesados": modulos_pesados(8)}
+    for crear_esquema in (True, False):
+        tiempos = [medir_primer_request(args.puerto, crear_esquema, args.timeout) for _ in range(max(args.repeticiones // 2, 1))]
+        clave = "primer_request_con_esquema" if crear_esquema else "primer_request_sin_esquema"
+        reporte[clave] = {"mediana_ms": round(statistics.median(tiempos), 1), "min_ms": round(min(tiempos), 1)}
+    print(json.dumps(reporte, indent=2))
+
+if __name__ == "__main__":
+    main()
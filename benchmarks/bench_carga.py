@@ -0,0 +1,409 @@
+"""
+Benchmark de carga de punta a punta: POST /analisis/iniciar -> worker -> LLM (stub) -> COMPLETADO.
+
+Levanta el stub de OpenRouter como subproceso (o usa --stub-url) y la API en
+este proceso con uvicorn, para poder contar lo que pasa adentro. Genera
+snapshots sintéticos de tamaño controlado, los envía con --concurrencia
+clientes y espera a que todos terminen. Reporta:
+
+- envío: requests/s del POST, p50/p95/p99 y respuestas por estado (los 429 de
+  cola llena se reintentan y se cuentan);
+- procesamiento: análisis/s hasta el último COMPLETADO y latencia de punta a
+  punta (generado_at - fecha_solicitud, exacta, leída de la base);
+- etapas: conteo, media y p50/p95/p99 por etapa del pipeline, a partir del
+  histograma analisis_etapa_segundos (percentiles interpolados por bucket,
+  como histogram_quantile);
+- db: sentencias SQL ejecutadas por análisis, por tipo (incluye workers,
+  limitador y despachador: es el costo real de la API);
+- memoria: RSS y, con --tracemalloc, bytes retenidos por análisis.
+
+Con --guardar el reporte queda como baseline; con --comparar se contrasta
+contra uno guardado y sale con código 1 si alguna métrica clave empeora más
+que --tolerancia-pct. Usar una base descartable (DATABASE_URL) en Postgres:
+SQLite admite un solo escritor e ignora SKIP LOCKED, así que con más de un
+worker o cliente mide bloqueos y reclamos duplicados, no la API (ahí usar
+--workers 1 --concurrencia 1).
+
+Uso:
+    python -m benchmarks.bench_carga --analisis 200 --concurrencia 20 --guardar benchmarks/baseline.json
+    python -m benchmarks.bench_carga --analisis 200 --concurrencia 20 --comparar benchmarks/baseline.json
+    python -m benchmarks.bench_carga --stub-latencia-ms 2000 --stub-distribucion lognormal --stub-desvio-ms 1500 \\
+        --stub-limite-pct 5 --stub-error-pct 2
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+
+from benchmarks.stub_openrouter import agregar_argumentos
+
+def parsear_argumentos():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--analisis", type=int, default=200)
+    parser.add_argument("--concurrencia", type=int, default=20, help="Clientes enviando a la vez")
+    parser.add_argument("--calentamiento", type=int, default=5, help="Análisis previos que no se miden")
+    parser.add_argument("--proyectos", type=int, default=0,
+                        help="Proyectos distintos (0 = uno por análisis; menos activa DELTA/SIN_CAMBIOS)")
+    parser.add_argument("--avances", type=int, default=50)
+    parser.add_argument("--etapas", type=int, default=8)
+    parser.add_argument("--medidas", type=int, default=7)
+    parser.add_argument("--workers", type=int, default=None, help="ANALISIS_WORKERS_CONCURRENCIA")
+    parser.add_argument("--sin-limitador", action="store_true", help="Desactiva el limitador de OpenRouter (mide solo la API)")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--stub-url", default=None, help="Stub ya levantado; si se omite se lanza uno")
+    parser.add_argument("--stub-port", type=int, default=9100)
+    agregar_argumentos(parser, prefijo="stub-")
+    parser.add_argument("--tracemalloc", action="store_true", help="Mide memoria retenida (más lento)")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Espera máxima hasta que terminen todos")
+    parser.add_argument("--etiqueta", default="actual")
+    parser.add_argument("--guardar", default=None, help="Ruta donde guardar el reporte como baseline")
+    parser.add_argument("--comparar", default=None, help="Baseline guardado contra el que comparar")
+    parser.add_argument("--tolerancia-pct", type=float, default=10.0)
+    return parser.parse_args()
+
+ARGS = parsear_argumentos()
+STUB_URL = ARGS.stub_url or f"http://127.0.0.1:{ARGS.stub_port}"
+# La configuración se lee al importar app.*: va antes de importarla
+os.environ["OPENROUTER_BASE_URL"] = STUB_URL
+os.environ.setdefault("OPENROUTER_API_KEY", "bench")
+os.environ["WEBHOOK_URL"] = ""
+# Sin el camino rápido de reglas: el benchmark mide el recorrido con LLM
+os.environ.setdefault("REGLAS_MODO", "senales")
+if ARGS.workers:
+    os.environ["ANALISIS_WORKERS_CONCURRENCIA"] = str(ARGS.workers)
+if ARGS.sin_limitador:
+    os.environ["LLM_LIMITADOR_HABILITADO"] = "false"
+
+import httpx
+import uvicorn
+from sqlalchemy import event, select
+
+from app.core.metrics import ETAPA_SEGUNDOS
+from app.db.base import async_engine, async_read_engine, engine
+from app.main import app
+from app.models.analisis import Analisis, EstadoAnalisis, ResultadoAnalisis
+from benchmarks.bench_health_bajo_carga import percentil
+from benchmarks.sinteticos import generar_snapshot
+
+# Métricas que se comparan contra el baseline: (ruta en el reporte, True si más es mejor)
+METRICAS_CLAVE = [
+    ("envio.req_s", True),
+    ("envio.p95_ms", False),
+    ("procesamiento.analisis_s", True),
+    ("procesamiento.e2e_p50_ms", False),
+    ("procesamiento.e2e_p95_ms", False),
+    ("procesamiento.e2e_p99_ms", False),
+    ("db.sentencias_por_analisis", False),
+    ("memoria.rss_delta_kb_por_analisis", False),
+]
+
+# --- Contadores ---
+
+class ContadorSQL:
+    """Sentencias ejecutadas por los engines asyncio de la API (el polling del bench usa el engine síncrono)."""
+    def __init__(self):
+        self.por_tipo = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        tipo = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTRO"
+        with self._lock:
+            self.por_tipo[tipo] = self.por_tipo.get(tipo, 0) + 1
+
+    def foto(self) -> dict:
+        with self._lock:
+            return dict(self.por_tipo)
+
+def foto_etapas() -> dict:
+    """{etapa: {"buckets": {le: acumulado}, "suma": s, "conteo": n}} del histograma de etapas."""
+    etapas = {}
+    for metrica in ETAPA_SEGUNDOS.collect():
+        for muestra in metrica.samples:
+            datos = etapas.setdefault(muestra.labels["etapa"], {"buckets": {}, "suma": 0.0, "conteo": 0})
+            if muestra.name.endswith("_bucket"):
+                datos["buckets"][float(muestra.labels["le"])] = muestra.value
+            elif muestra.name.endswith("_sum"):
+                datos["suma"] = muestra.value
+            elif muestra.name.endswith("_count"):
+                datos["conteo"] = muestra.value
+    return etapas
+
+def percentil_histograma(buckets: dict, p: float) -> float:
+    """Interpolación lineal dentro del bucket, igual que histogram_quantile de Prometheus."""
+    limites = sorted(buckets)
+    total = buckets[limites[-1]]
+    if not total:
+        return 0.0
+    objetivo = p / 100 * total
+    anterior_limite, anterior_acumulado = 0.0, 0.0
+    for limite in limites:
+        acumulado = buckets[limite]
+        if acumulado >= objetivo:
+            if limite == float("inf"):
+                return anterior_limite
+            en_bucket = acumulado - anterior_acumulado
+            fraccion = (objetivo - anterior_acumulado) / en_bucket if en_bucket else 0
+            return anterior_limite + (limite - anterior_limite) * fraccion
+        anterior_limite, anterior_acumulado = limite, acumulado
+    return anterior_limite
+
+def resumen_etapas(antes: dict, despues: dict) -> dict:
+    resumen = {}
+    for nombre, datos in sorted(despues.items()):
+        previo = antes.get(nombre, {"buckets": {}, "suma": 0.0, "conteo": 0})
+        conteo = datos["conteo"] - previo["conteo"]
+        if not conteo:
+            continue
+        buckets = {le: v - previo["buckets"].get(le, 0) for le, v in datos["buckets"].items()}
+        resumen[nombre] = {
+            "conteo": int(conteo),
+            "media_ms": round((datos["suma"] - previo["suma"]) / conteo * 1000, 2),
+            **{f"p{p}_ms": round(percentil_histograma(buckets, p) * 1000, 2) for p in (50, 95, 99)},
+        }
+    return resumen
+
+def rss_kb() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError):
+        # Fuera de Linux: el pico es lo único disponible
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+# --- Procesos auxiliares ---
+
+def lanzar_stub() -> subprocess.Popen:
+    comando = [sys.executable, "-m", "benchmarks.stub_openrouter", "--port", str(ARGS.stub_port)]
+    for nombre, valor in vars(ARGS).items():
+        if not nombre.startswith("stub_") or nombre in ("stub_url", "stub_port") or valor in (None, False):
+            continue
+        opcion = "--" + nombre[len("stub_"):].replace("_", "-")
+        comando += [opcion] if valor is True else [opcion, str(valor)]
+    proceso = subprocess.Popen(comando)
+    fin = time.perf_counter() + 30
+    while time.perf_counter() < fin:
+        try:
+            httpx.get(f"{STUB_URL}/estadisticas", timeout=1.0)
+            return proceso
+        except httpx.TransportError:
+            time.sleep(0.1)
+    proceso.terminate()
+    raise RuntimeError("El stub no arrancó")
+
+def levantar_api() -> tuple:
+    # Hilo propio con su event loop: los clientes del bench no le roban turnos al de la API
+    servidor = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=ARGS.port, log_level="warning"))
+    hilo = threading.Thread(target=servidor.run, daemon=True)
+    hilo.start()
+    while not servidor.started:
+        time.sleep(0.05)
+    return servidor, hilo
+
+# --- Carga ---
+
+# Prefijo por corrida: con la misma base, la caché LLM y el modo incremental no reutilizan corridas anteriores
+CORRIDA = uuid.uuid4().hex[:6]
+
+def generar_snapshots(cantidad: int, desplazamiento: int) -> list:
+    snapshots = []
+    for i in range(desplazamiento, desplazamiento + cantidad):
+        proyecto = f"CARGA-{CORRIDA}-{i % ARGS.proyectos if ARGS.proyectos else i}"
+        snapshots.append(generar_snapshot(ARGS.avances, ARGS.etapas, ARGS.medidas, proyecto_codigo=proyecto, semilla=i))
+    return snapshots
+
+async def enviar(client: httpx.AsyncClient, base: str, snapshots: list) -> dict:
+    resultado = {"ids": [], "latencias": [], "por_estado": {}, "errores": 0}
+    pendientes = list(reversed(snapshots))
+
+    async def cliente():
+        while pendientes:
+            snapshot = pendientes.pop()
+            while True:
+                inicio = time.perf_counter()
+                try:
+                    respuesta = await client.post(f"{base}/api/v1/analisis/iniciar", json=snapshot)
+                except httpx.HTTPError:
+                    resultado["errores"] += 1
+                    break
+                resultado["latencias"].append(time.perf_counter() - inicio)
+                resultado["por_estado"][respuesta.status_code] = resultado["por_estado"].get(respuesta.status_code, 0) + 1
+                if respuesta.status_code == 429:
+                    # Cola llena: contrapresión de la API, se reintenta como lo haría un cliente real
+                    await asyncio.sleep(0.2)
+                    continue
+                if respuesta.status_code == 202:
+                    resultado["ids"].append(respuesta.json()["analisis_id"])
+                break
+
+    await asyncio.gather(*(cliente() for _ in range(ARGS.concurrencia)))
+    return resultado
+
+def estados(ids: list) -> dict:
+    with engine.connect() as conexion:
+        filas = conexion.execute(
+            select(Analisis.estado, Analisis.fecha_solicitud, ResultadoAnalisis.generado_at)
+            .outerjoin(ResultadoAnalisis, ResultadoAnalisis.analisis_id == Analisis.id)
+            .where(Analisis.id.in_(ids))
+        ).all()
+    return {"filas": filas, "terminados": sum(1 for f in filas if f[0] in (EstadoAnalisis.COMPLETADO, EstadoAnalisis.ERROR))}
+
+async def esperar_fin(ids: list, limite: float) -> tuple:
+    uuids = [uuid.UUID(i) for i in ids]
+    while True:
+        actual = await asyncio.to_thread(estados, uuids)
+        if actual["terminados"] >= len(uuids) or time.perf_counter() > limite:
+            return actual, time.perf_counter()
+        await asyncio.sleep(0.1)
+
+async def correr(base: str) -> dict:
+    snapshots = generar_snapshots(ARGS.analisis, ARGS.calentamiento)
+    async with httpx.AsyncClient(timeout=120.0, limits=httpx.Limits(max_connections=ARGS.concurrencia)) as client:
+        if ARGS.calentamiento:
+            previo = await enviar(client, base, generar_snapshots(ARGS.calentamiento, 0))
+            await esperar_fin(previo["ids"], time.perf_counter() + ARGS.timeout)
+
+        gc.collect()
+        if ARGS.tracemalloc:
+            tracemalloc.start()
+            memoria_antes = tracemalloc.get_traced_memory()[0]
+        sql_antes, etapas_antes, rss_antes = CONTADOR.foto(), foto_etapas(), rss_kb()
+        stub_antes = (await client.get(f"{STUB_URL}/estadisticas")).json()
+
+        inicio = time.perf_counter()
+        envio = await enviar(client, base, snapshots)
+        fin_envio = time.perf_counter()
+        final, fin = await esperar_fin(envio["ids"], fin_envio + ARGS.timeout)
+
+        rss_despues = rss_kb()
+        sql = {tipo: n - sql_antes.get(tipo, 0) for tipo, n in CONTADOR.foto().items() if n - sql_antes.get(tipo, 0)}
+        etapas = resumen_etapas(etapas_antes, foto_etapas())
+        if ARGS.tracemalloc:
+            gc.collect()
+            retenido, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        stub_despues = (await client.get(f"{STUB_URL}/estadisticas")).json()
+
+    n = max(len(envio["ids"]), 1)
+    completados = [f for f in final["filas"] if f[0] == EstadoAnalisis.COMPLETADO]
+    e2e = [(generado - solicitud).total_seconds() for _, solicitud, generado in completados if generado] or [0]
+    latencias = envio["latencias"] or [0]
+    memoria = {
+        "rss_inicio_mb": round(rss_antes / 1024, 1),
+        "rss_fin_mb": round(rss_despues / 1024, 1),
+        "rss_pico_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "rss_delta_kb_por_analisis": round((rss_despues - rss_antes) / n, 1),
+    }
+    if ARGS.tracemalloc:
+        memoria["retenido_kb_por_analisis"] = round((retenido - memoria_antes) / 1024 / n, 2)
+        memoria["pico_traced_mb"] = round(pico / 1024 / 1024, 1)
+
+    return {
+        "envio": {
+            "aceptados": len(envio["ids"]),
+            "errores_conexion": envio["errores"],
+            "por_estado": {str(k): v for k, v in sorted(envio["por_estado"].items())},
+            "req_s": round(len(latencias) / (fin_envio - inicio), 1),
+            "p50_ms": round(percentil(latencias, 50) * 1000, 2),
+            "p95_ms": round(percentil(latencias, 95) * 1000, 2),
+            "p99_ms": round(percentil(latencias, 99) * 1000, 2),
+        },
+        "procesamiento": {
+            "completados": len(completados),
+            "errores": sum(1 for f in final["filas"] if f[0] == EstadoAnalisis.ERROR),
+            "sin_terminar": len(envio["ids"]) - final["terminados"],
+            "duracion_s": round(fin - inicio, 2),
+            "analisis_s": round(final["terminados"] / (fin - inicio), 2),
+            "e2e_p50_ms": round(percentil(e2e, 50) * 1000, 1),
+            "e2e_p95_ms": round(percentil(e2e, 95) * 1000, 1),
+            "e2e_p99_ms": round(percentil(e2e, 99) * 1000, 1),
+        },
+        "etapas": etapas,
+        "db": {
+            "sentencias": sum(sql.values()),
+            "sentencias_por_analisis": round(sum(sql.values()) / n, 1),
+            "por_tipo": dict(sorted(sql.items(), key=lambda item: -item[1])),
+        },
+        "memoria": memoria,
+        "stub": {
+            clave: {k: v - stub_antes[clave].get(k, 0) for k, v in stub_despues[clave].items() if v - stub_antes[clave].get(k, 0)}
+            for clave in ("chat_por_estado", "chat_por_modelo")
+        },
+    }
+
+# --- Baselines ---
+
+def _valor(reporte: dict, ruta: str):
+    for parte in ruta.split("."):
+        reporte = (reporte or {}).get(parte)
+    return reporte
+
+def comparar(actual: dict, base: dict) -> dict:
+    comparacion = {}
+    for ruta, mas_es_mejor in METRICAS_CLAVE:
+        antes, ahora = _valor(base, ruta), _valor(actual, ruta)
+        if antes is None or ahora is None:
+            continue
+        cambio = (ahora - antes) / abs(antes) * 100 if antes else 0.0
+        # Los deltas de RSS rondan 0 y oscilan en signo: solo cuentan como regresión si además crecen en absoluto
+        empeora = -cambio if mas_es_mejor else cambio
+        comparacion[ruta] = {
+            "baseline": antes, "actual": ahora, "cambio_pct": round(cambio, 1),
+            "regresion": empeora > ARGS.tolerancia_pct and (mas_es_mejor or ahora > antes),
+        }
+    distintas = {
+        k: {"baseline": base["config"].get(k), "actual": v}
+        for k, v in actual["config"].items() if k not in ("etiqueta", "commit") and base.get("config", {}).get(k) != v
+    }
+    return {"baseline": base.get("config", {}).get("etiqueta"), "config_distinta": distintas, "metricas": comparacion}
+
+def version_actual() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+CONTADOR = ContadorSQL()
+
+def main():
+    for motor in {async_engine, async_read_engine}:
+        event.listen(motor.sync_engine, "before_cursor_execute", CONTADOR)
+
+    stub = None if ARGS.stub_url else lanzar_stub()
+    servidor, hilo = levantar_api()
+    try:
+        resultado = asyncio.run(correr(f"http://127.0.0.1:{ARGS.port}"))
+    finally:
+        servidor.should_exit = True
+        hilo.join(timeout=15) # Lifespan: workers y pools se cierran antes de salir
+        if stub:
+            stub.terminate()
+
+    configuracion = {
+        k: v for k, v in vars(ARGS).items()
+        if k not in ("guardar", "comparar", "tolerancia_pct", "timeout", "port", "stub_port", "stub_url")
+    }
+    reporte = {"config": {**configuracion, "dialecto": engine.dialect.name, "commit": version_actual()}, **resultado}
+
+    regresiones = []
+    if ARGS.comparar:
+        with open(ARGS.comparar, encoding="utf-8") as archivo:
+            reporte["comparacion"] = comparar(reporte, json.load(archivo))
+        regresiones = [ruta for ruta, datos in reporte["comparacion"]["metricas"].items() if datos["regresion"]]
+    if ARGS.guardar:
+        with open(ARGS.guardar, "w", encoding="utf-8") as archivo:
+            json.dump(reporte, archivo, indent=2, ensure_ascii=False)
+    print(json.dumps(reporte, indent=2, ensure_ascii=False, default=str))
+
+    if regresiones or resultado["procesamiento"]["sin_terminar"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
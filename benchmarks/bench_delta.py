@@ -0,0 +1,68 @@
+"""
+Benchmark: prompt completo vs incremental para sincronizaciones periódicas.
+
+Simula un proyecto que reenvía su historial con unos pocos registros de avance
+nuevos por sincronización y compara tokens estimados y tiempo de armado del
+prompt completo (compactado) contra el delta + resultado previo. Cuando nada
+cambió no hay prompt: se reutiliza el resultado anterior sin llamar al LLM.
+
+Uso:
+    python -m benchmarks.bench_delta --avances 1000 --nuevos 1,5,20,100
+"""
+import argparse
+import copy
+import json
+import time
+
+from app.services.compactador_snapshot import estimar_tokens
+from app.services.delta_snapshot import calcular_delta
+from app.services.llm_cache import canonicalizar
+from app.services.prompt_builder import PromptBuilder
+from benchmarks.sinteticos import generar_snapshot
+
+PREVIO = {
+    "resumen": "Obra con avance sostenido y desvíos puntuales en mampostería.",
+    "score_coherencia": 78,
+    "riesgos": [
+        {"titulo": "Baranda perimetral", "descripcion": "No se verifica en los últimos controles.", "nivel": "CRITICO"},
+        {"titulo": "Avance estancado", "descripcion": "Sin progreso en la última semana.", "nivel": "ATENCION"},
+    ],
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--avances", type=int, default=1000)
+    parser.add_argument("--nuevos", default="1,5,20,100")
+    args = parser.parse_args()
+
+    builder = PromptBuilder()
+    reporte = []
+    for nuevos in (int(n) for n in args.nuevos.split(",")):
+        actual = canonicalizar(generar_snapshot(avances=args.avances + nuevos, semilla=1))
+        anterior = copy.deepcopy(actual)
+        anterior["datos"]["registros_avance"] = anterior["datos"]["registros_avance"][:args.avances]
+
+        inicio = time.perf_counter()
+        _, completo = builder.construir_instrucciones(actual)
+        completo_ms = (time.perf_counter() - inicio) * 1000
+
+        inicio = time.perf_counter()
+        delta = calcular_delta(anterior["datos"], actual["datos"])
+        _, incremental = builder.construir_instrucciones_delta(actual, delta, PREVIO)
+        delta_ms = (time.perf_counter() - inicio) * 1000
+        enviado = min(estimar_tokens(completo), estimar_tokens(incremental)) # El procesador manda el menor
+
+        reporte.append({
+            "avances_previos": args.avances,
+            "nuevos": nuevos,
+            "completo_tokens": estimar_tokens(completo),
+            "delta_tokens": estimar_tokens(incremental),
+            "modo": "DELTA" if enviado < estimar_tokens(completo) else "COMPLETO",
+            "reduccion_pct": round(100 * (1 - enviado / estimar_tokens(completo)), 1),
+            "completo_armado_ms": round(completo_ms, 2),
+            "delta_armado_ms": round(delta_ms, 2),
+        })
+    print(json.dumps(reporte, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmark: consultas y bytes traídos por GET /analisis/detalle/{id}.
+
+Siembra un análisis con 200 etapas, 20 observaciones y 3 invocaciones con
+respuesta cruda grande, y compara la carga anterior (cuatro joinedload
+encadenados) con la actual (selectinload + load_only). Para cada variante
+captura las sentencias SQL emitidas y las re-ejecuta para medir filas y
+bytes devueltos por la base.
+
+Uso:
+    python -m benchmarks.bench_detalle --etapas 200 --observaciones 20
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from sqlalchemy import event, insert, select
+from sqlalchemy.orm import joinedload
+
+from app.api.v1.endpoints.analisis import obtener_analisis_completo
+from app.db.base import AsyncSessionLocal, Base, async_engine, engine
+from app.models.analisis import (
+    Analisis, SnapshotRecibido, EstadoAnalisis, ResultadoAnalisis, ObservacionGenerada,
+    InvocacionLLM, RespuestaLLM, PromptGenerado, DatoProyecto, DatoEtapa
+)
+
+async def sembrar(etapas: int, observaciones: int, invocaciones: int) -> uuid.UUID:
+    analisis_id, snapshot_id, resultado_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    respuesta_grande = json.dumps({"resumen": "x" * 20_000, "riesgos": []})
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(Analisis), [{
+            "id": analisis_id, "proyecto_codigo": "BENCH-DET", "estado": EstadoAnalisis.COMPLETADO
+        }])
+        await db.execute(insert(SnapshotRecibido), [{
+            "id": snapshot_id, "analisis_id": analisis_id, "payload_completo": "p" * 200_000
+        }])
+        await db.execute(insert(DatoProyecto), [{"snapshot_id": snapshot_id, "codigo": "BENCH-DET", "nombre": "Obra"}])
+        await db.execute(insert(DatoEtapa), [
+            {"snapshot_id": snapshot_id, "nombre": f"Etapa {i}", "estado": "EN_CURSO", "avance_estimado": i % 100}
+            for i in range(etapas)
+        ])
+        await db.execute(insert(ResultadoAnalisis), [{
+            "id": resultado_id, "analisis_id": analisis_id, "resumen_general": "Resumen",
+            "score_coherencia": 80, "detecta_riesgos": True
+        }])
+        await db.execute(insert(ObservacionGenerada), [
+            {"resultado_id": resultado_id, "titulo": f"Riesgo {i}", "descripcion": "d" * 300, "nivel": "ATENCION"}
+            for i in range(observaciones)
+        ])
+        for _ in range(invocaciones):
+            invocacion_id = uuid.uuid4()
+            await db.execute(insert(InvocacionLLM), [{
+                "id": invocacion_id, "analisis_id": analisis_id, "modelo_usado": "stub/model",
+                "tokens_prompt": 800, "tokens_respuesta": 200
+            }])
+            await db.execute(insert(RespuestaLLM), [{
+                "invocacion_id": invocacion_id, "respuesta_raw": respuesta_grande, "respuesta_parseada": {}
+            }])
+            await db.execute(insert(PromptGenerado), [{
+                "invocacion_id": invocacion_id, "system_prompt": "s" * 5_000, "user_prompt": "u" * 50_000
+            }])
+        await db.commit()
+    return analisis_id
+
+async def carga_anterior(db, analisis_id):
+    """La versión previa del endpoint: un único SELECT con cuatro joinedload."""
+    resultado = await db.execute(
+        select(Analisis).options(
+            joinedload(Analisis.snapshot).joinedload(SnapshotRecibido.proyecto),
+            joinedload(Analisis.snapshot).joinedload(SnapshotRecibido.etapas),
+            joinedload(Analisis.resultado).joinedload(ResultadoAnalisis.observaciones),
+            joinedload(Analisis.invocaciones).joinedload(InvocacionLLM.respuesta)
+        ).where(Analisis.id == analisis_id)
+    )
+    return resultado.unique().scalars().first()
+
+async def medir(nombre: str, corrutina) -> dict:
+    sentencias = []
+
+    def capturar(conn, cursor, statement, parameters, context, executemany):
+        sentencias.append((statement, parameters))
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", capturar)
+    try:
+        inicio = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            await corrutina(db)
+        latencia_ms = (time.perf_counter() - inicio) * 1000
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", capturar)
+
+    # Re-ejecutamos lo capturado para medir lo que viaja desde la base
+    filas = bytes_traidos = 0
+    async with async_engine.connect() as conexion:
+        for statement, parameters in sentencias:
+            resultado = await conexion.exec_driver_sql(statement, parameters)
+            for fila in resultado.all():
+                filas += 1
+                bytes_traidos += sum(len(str(valor)) for valor in fila if valor is not None)
+    return {
+        "variante": nombre, "consultas": len(sentencias), "filas": filas,
+        "bytes": bytes_traidos, "latencia_ms": round(latencia_ms, 2)
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--etapas", type=int, default=200)
+    parser.add_argument("--observaciones", type=int, default=20)
+    parser.add_argument("--invocaciones", type=int, default=3)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    analisis_id = await sembrar(args.etapas, args.observaciones, args.invocaciones)
+
+    reporte = [
+        await medir("joinedload_anterior", lambda db: carga_anterior(db, analisis_id)),
+        await medir("selectinload", lambda db: obtener_analisis_completo(analisis_id, include=None, db=db)),
+        await medir("selectinload_con_prompts", lambda db: obtener_analisis_completo(analisis_id, include="prompts", db=db)),
+    ]
+    print(json.dumps(reporte, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
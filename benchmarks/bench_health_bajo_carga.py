@@ -0,0 +1,79 @@
+"""
+Benchmark: latencia de /health mientras hay análisis en curso.
+
+Encola N análisis en paralelo y, mientras los workers los procesan, mide la
+latencia de GET /health. Sirve para comparar el event loop bloqueado (sesión
+síncrona) contra la capa AsyncSession: correr una vez en cada versión con
+distinta --etiqueta y comparar el p99.
+
+Uso:
+    python -m benchmarks.bench_health_bajo_carga --url http://localhost:8000 --analisis 50
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+SNAPSHOT_EJEMPLO = {
+    "proyecto_codigo": "BENCH-001",
+    "datos": {
+        "proyecto": {"codigo": "BENCH-001", "nombre": "Obra de prueba", "responsable_tecnico": "Ing. Bench"},
+        "etapas": [{"nombre": f"Etapa {i}", "estado": "EN_CURSO", "avance_estimado": i * 5} for i in range(10)],
+        "registros_avance": [
+            {"fecha": "2025-01-%02d" % (i % 28 + 1), "supervisor": "Sup", "porcentaje_avance": i,
+             "presenta_desvios": i % 7 == 0, "tareas_ejecutadas": ["hormigonado"], "oficios_activos": ["albañil"]}
+            for i in range(50)
+        ],
+        "medidas_seguridad": [{"item": "Casco", "cumple": True}, {"item": "Arnés", "cumple": False}],
+    },
+}
+
+def percentil(valores: list, p: float) -> float:
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+async def medir_health(client: httpx.AsyncClient, base: str, segundos: float) -> list:
+    latencias = []
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        inicio = time.perf_counter()
+        await client.get(f"{base}/api/v1/health")
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        await asyncio.sleep(0.05)
+    return latencias
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--analisis", type=int, default=50)
+    parser.add_argument("--segundos", type=float, default=30.0)
+    parser.add_argument("--etiqueta", default="actual")
+    args = parser.parse_args()
+
+    async with httpx.AsyncClient(timeout=300.0) as client:
+        # Los POST no se esperan: con la cola responden 202 y el trabajo sigue en los workers
+        envios = [
+            asyncio.create_task(client.post(f"{args.url}/api/v1/analisis/iniciar", json=SNAPSHOT_EJEMPLO))
+            for _ in range(args.analisis)
+        ]
+        await asyncio.sleep(0.5)
+        latencias = await medir_health(client, args.url, args.segundos)
+        await asyncio.gather(*envios, return_exceptions=True)
+
+    reporte = {
+        "etiqueta": args.etiqueta,
+        "analisis_en_curso": args.analisis,
+        "muestras": len(latencias),
+        "p50_ms": round(statistics.median(latencias), 2),
+        "p95_ms": round(percentil(latencias, 95), 2),
+        "p99_ms": round(percentil(latencias, 99), 2),
+        "max_ms": round(max(latencias), 2),
+    }
+    print(json.dumps(reporte, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
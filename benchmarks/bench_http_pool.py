@@ -0,0 +1,82 @@
+"""
+Benchmark: ahorro de establecimiento de conexión con clientes HTTP compartidos.
+
+Simula N análisis (una llamada al LLM + un webhook cada uno) contra el stub
+local y compara:
+  - "cliente_por_llamada": un httpx.AsyncClient nuevo por request (comportamiento anterior)
+  - "cliente_compartido": un único cliente con keep-alive (comportamiento actual)
+
+Uso:
+    python -m benchmarks.bench_http_pool --analisis 200
+    python -m benchmarks.bench_http_pool --url https://mi-stub-con-tls:9443   # para incluir TLS
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+
+import httpx
+import uvicorn
+
+from benchmarks.stub_openrouter import crear_app
+
+PAYLOAD = {"model": "stub/model", "messages": [{"role": "user", "content": "ping"}]}
+
+async def un_analisis(url: str, client: httpx.AsyncClient = None) -> float:
+    inicio = time.perf_counter()
+    if client is None:
+        async with httpx.AsyncClient() as c:
+            await c.post(f"{url}/chat/completions", json=PAYLOAD)
+        async with httpx.AsyncClient() as c:
+            await c.post(f"{url}/webhook", json={})
+    else:
+        await client.post(f"{url}/chat/completions", json=PAYLOAD)
+        await client.post(f"{url}/webhook", json={})
+    return (time.perf_counter() - inicio) * 1000
+
+async def medir(url: str, analisis: int, compartido: bool) -> list:
+    tiempos = []
+    if compartido:
+        async with httpx.AsyncClient() as client:
+            for _ in range(analisis):
+                tiempos.append(await un_analisis(url, client))
+    else:
+        for _ in range(analisis):
+            tiempos.append(await un_analisis(url))
+    return tiempos
+
+def levantar_stub(port: int) -> str:
+    config = uvicorn.Config(crear_app(), host="127.0.0.1", port=port, log_level="warning")
+    servidor = uvicorn.Server(config)
+    threading.Thread(target=servidor.run, daemon=True).start()
+    while not servidor.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="Upstream a medir; si se omite se levanta el stub local")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--analisis", type=int, default=200)
+    args = parser.parse_args()
+
+    url = args.url or levantar_stub(args.port)
+    await medir(url, 5, True)  # calentamiento
+
+    por_llamada = await medir(url, args.analisis, False)
+    compartido = await medir(url, args.analisis, True)
+
+    media_llamada = statistics.mean(por_llamada)
+    media_compartido = statistics.mean(compartido)
+    print(json.dumps({
+        "analisis": args.analisis,
+        "cliente_por_llamada_ms": round(media_llamada, 3),
+        "cliente_compartido_ms": round(media_compartido, 3),
+        "ahorro_por_analisis_ms": round(media_llamada - media_compartido, 3),
+        "ahorro_pct": round(100 * (1 - media_compartido / media_llamada), 1),
+    }, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+"""
+Benchmark: ingesta de snapshots (filas/s) con AnalisisService.
+
+Compara la persistencia en bloque (executemany / COPY) con el método anterior
+de un db.add por fila, para snapshots de 10, 1.000 y 10.000 avances. Usa la
+base configurada en DATABASE_URL (idealmente una base descartable).
+
+Uso:
+    python -m benchmarks.bench_ingesta --repeticiones 5
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+
+from app.db.base import AsyncSessionLocal, Base, engine
+from app.models.analisis import Analisis, SnapshotRecibido, DatoAvance, DatoEtapa
+from app.schemas.snapshot import SnapshotCreate
+from app.services.analisis_service import AnalisisService
+from benchmarks.sinteticos import generar_snapshot
+
+async def ingesta_por_fila(db, snapshot_in: SnapshotCreate):
+    """Reproduce el camino anterior: un db.add por fila y varios flush."""
+    analisis = Analisis(proyecto_codigo=snapshot_in.proyecto_codigo)
+    db.add(analisis)
+    await db.flush()
+    snapshot = SnapshotRecibido(analisis_id=analisis.id, payload_completo=json.dumps(snapshot_in.datos))
+    db.add(snapshot)
+    await db.flush()
+    for etapa in snapshot_in.datos["etapas"]:
+        db.add(DatoEtapa(snapshot_id=snapshot.id, nombre=etapa["nombre"], estado=etapa["estado"],
+                         avance_estimado=etapa["avance_estimado"]))
+    for avance in snapshot_in.datos["registros_avance"]:
+        db.add(DatoAvance(
+            snapshot_id=snapshot.id,
+            fecha_registro=datetime.strptime(avance["fecha"], "%Y-%m-%d").date(),
+            supervisor=avance["supervisor"], porcentaje_avance=avance["porcentaje_avance"],
+            presenta_desvios=avance["presenta_desvios"], tareas_ejecutadas=avance["tareas_ejecutadas"],
+            oficios_activos=avance["oficios_activos"]
+        ))
+
+async def medir(modo: str, snapshot_in: SnapshotCreate, repeticiones: int) -> float:
+    filas = len(snapshot_in.datos["registros_avance"]) + len(snapshot_in.datos["etapas"]) + 3
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        async with AsyncSessionLocal() as db:
+            if modo == "bloque":
+                await AnalisisService(db).crear_analisis(snapshot_in)
+            else:
+                await ingesta_por_fila(db, snapshot_in)
+            await db.commit()
+    return filas * repeticiones / (time.perf_counter() - inicio)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--tamanos", default="10,1000,10000")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    reporte = []
+    for tamano in (int(t) for t in args.tamanos.split(",")):
+        snapshot_in = SnapshotCreate(**generar_snapshot(avances=tamano))
+        por_fila = await medir("por_fila", snapshot_in, args.repeticiones)
+        bloque = await medir("bloque", snapshot_in, args.repeticiones)
+        reporte.append({
+            "avances": tamano,
+            "por_fila_filas_s": round(por_fila),
+            "bloque_filas_s": round(bloque),
+            "aceleracion": round(bloque / por_fila, 2),
+        })
+    print(json.dumps(reporte, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
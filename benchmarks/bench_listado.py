@@ -0,0 +1,152 @@
+"""
+Benchmark: planes de consulta y latencia de GET /analisis (listado con keyset).
+
+Siembra N análisis sintéticos (con resultados y observaciones), ejecuta
+EXPLAIN sobre las consultas típicas del listado y falla (exit 1) si alguna
+hace un scan secuencial sobre analisis u observacion_generada. También mide
+la latencia de la primera página y de una página profunda.
+
+Pensado para PostgreSQL (DATABASE_URL apuntando a una base descartable):
+
+    python -m benchmarks.bench_listado --sembrar --total 1000000
+    python -m benchmarks.bench_listado            # reusar datos ya sembrados
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from app.db.base import AsyncSessionLocal, Base, async_engine, engine
+from app.models.analisis import Analisis, EstadoAnalisis, ResultadoAnalisis, ObservacionGenerada
+from app.services.analisis_service import consulta_listado
+
+NIVELES = ["INFORMATIVO", "ATENCION", "CRITICO"]
+TABLAS_VIGILADAS = ("analisis", "observacion_generada")
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, consulta):
+        self.consulta = consulta
+
+@compiles(Explain)
+def _compilar_explain(elemento, compilador, **kw):
+    prefijo = "EXPLAIN QUERY PLAN " if compilador.dialect.name == "sqlite" else "EXPLAIN "
+    sql = compilador.process(elemento.consulta, **kw)
+    # Las filas son texto del plan, no las columnas del SELECT: sin procesadores de tipo
+    compilador._result_columns = []
+    return prefijo + sql
+
+async def sembrar(total: int, lote: int, proyectos: int, semilla: int):
+    azar = random.Random(semilla)
+    ahora = datetime.utcnow()
+    for inicio in range(0, total, lote):
+        analisis, resultados, observaciones = [], [], []
+        for _ in range(min(lote, total - inicio)):
+            analisis_id = uuid.uuid4()
+            completado = azar.random() < 0.9
+            analisis.append({
+                "id": analisis_id,
+                "proyecto_codigo": f"PRJ-{azar.randrange(proyectos):05d}",
+                "fecha_solicitud": ahora - timedelta(seconds=azar.randrange(365 * 86400)),
+                "estado": EstadoAnalisis.COMPLETADO if completado else azar.choice(list(EstadoAnalisis)),
+                "intentos": 1
+            })
+            if not completado:
+                continue
+            resultado_id = uuid.uuid4()
+            cantidad = azar.choice([0, 0, 1, 2, 3])
+            resultados.append({
+                "id": resultado_id, "analisis_id": analisis_id, "resumen_general": "Sintético",
+                "score_coherencia": azar.uniform(40, 100), "detecta_riesgos": cantidad > 0
+            })
+            observaciones.extend(
+                {"id": uuid.uuid4(), "resultado_id": resultado_id, "titulo": "Riesgo",
+                 "descripcion": "Sintético", "nivel": azar.choice(NIVELES)}
+                for _ in range(cantidad)
+            )
+        async with AsyncSessionLocal() as db:
+            await db.execute(insert(Analisis), analisis)
+            if resultados:
+                await db.execute(insert(ResultadoAnalisis), resultados)
+            if observaciones:
+                await db.execute(insert(ObservacionGenerada), observaciones)
+            await db.commit()
+        print(f"sembrados {inicio + len(analisis)}/{total}", file=sys.stderr)
+
+    # Estadísticas frescas para que el planificador elija los índices
+    async with async_engine.begin() as conexion:
+        await conexion.execute(text("ANALYZE"))
+
+def escenarios(proyecto: str, cursor_profundo: tuple) -> dict:
+    hace_30_dias = datetime.utcnow() - timedelta(days=30)
+    return {
+        "primera_pagina": consulta_listado(),
+        "por_proyecto": consulta_listado(proyecto_codigo=proyecto),
+        "proyecto_30_dias_critico": consulta_listado(proyecto_codigo=proyecto, desde=hace_30_dias, nivel="CRITICO"),
+        "por_estado": consulta_listado(estado=EstadoAnalisis.ERROR),
+        "con_riesgos": consulta_listado(detecta_riesgos=True),
+        "pagina_profunda": consulta_listado(despues_de=cursor_profundo),
+    }
+
+def scans_secuenciales(plan: list) -> list:
+    encontrados = []
+    for linea in plan:
+        for tabla in TABLAS_VIGILADAS:
+            # PostgreSQL: "Seq Scan on analisis" / SQLite: "SCAN analisis" (sin índice)
+            if f"Seq Scan on {tabla} " in linea + " " or (linea.strip().startswith(f"SCAN {tabla}") and "INDEX" not in linea):
+                encontrados.append(linea.strip())
+    return encontrados
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sembrar", action="store_true")
+    parser.add_argument("--total", type=int, default=1_000_000)
+    parser.add_argument("--lote", type=int, default=10_000)
+    parser.add_argument("--proyectos", type=int, default=2_000)
+    parser.add_argument("--limite", type=int, default=50)
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    if args.sembrar:
+        await sembrar(args.total, args.lote, args.proyectos, args.semilla)
+
+    async with AsyncSessionLocal() as db:
+        proyecto = (await db.execute(text("SELECT proyecto_codigo FROM analisis LIMIT 1"))).scalar()
+        # Cursor a ~90% de profundidad: con OFFSET esta página sería la más cara
+        fila = (await db.execute(
+            consulta_listado().offset(int(args.total * 0.9)).limit(1)
+        )).first()
+        cursor_profundo = (fila.fecha_solicitud, fila.id) if fila else (datetime.utcnow(), uuid.uuid4())
+
+        reporte, fallas = [], []
+        for nombre, consulta in escenarios(proyecto, cursor_profundo).items():
+            consulta = consulta.limit(args.limite + 1)
+            plan = [str(f[-1]) for f in (await db.execute(Explain(consulta))).all()]
+            inicio = time.perf_counter()
+            filas = (await db.execute(consulta)).all()
+            latencia_ms = (time.perf_counter() - inicio) * 1000
+            secuenciales = scans_secuenciales(plan)
+            if secuenciales:
+                fallas.append({"escenario": nombre, "plan": plan})
+            reporte.append({
+                "escenario": nombre, "filas": len(filas),
+                "latencia_ms": round(latencia_ms, 2), "scans_secuenciales": secuenciales
+            })
+
+    print(json.dumps(reporte, indent=2, ensure_ascii=False))
+    if fallas:
+        print(json.dumps(fallas, indent=2, ensure_ascii=False), file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,159 @@
+"""
+Micro-benchmark del costo de loguear por solicitud.
+
+Simula los logs de un análisis completo (recepción y encolado en
+iniciar_analisis, toma del worker, intento y éxito de LLMClient, cierre del
+procesador y la línea de acceso de uvicorn, más algunos DEBUG) y mide cuánto
+tarda el código que loguea, es decir cuánto se frena el event loop, con:
+
+  - legado: StreamHandler síncrono en el root y mensajes con f-strings
+    (formateados aunque el nivel esté apagado).
+  - cola_texto / cola_json: app.core.logging (QueueHandler + QueueListener,
+    estilo % y campos extra).
+
+Cada configuración corre contra un destino rápido (descarta lo escrito) y uno
+lento (cada write duerme --latencia-escritura-ms, como un stdout con
+back-pressure del runtime de contenedores). Con --muestreo-debug se mide además
+el efecto de muestrear los DEBUG.
+
+Uso:
+    python -m benchmarks.bench_logging --solicitudes 2000 --latencia-escritura-ms 2
+    python -m benchmarks.bench_logging --nivel DEBUG --muestreo-debug 0.05
+"""
+import argparse
+import io
+import json
+import logging
+import statistics
+import time
+import uuid
+
+from app.config.settings import settings
+from app.core import logging as app_logging
+from app.core.logging import contexto_analisis, detener_logging, setup_logging
+
+MODELO = "google/gemma-3-27b-it:free"
+
+class DestinoLento(io.TextIOBase):
+    """Stream que tarda `latencia` segundos por write (0 = descarta al instante)."""
+    def __init__(self, latencia: float):
+        self.latencia = latencia
+        self.escrituras = 0
+
+    def write(self, texto):
+        self.escrituras += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+        return len(texto)
+
+    def flush(self):
+        pass
+
+def solicitud_legado(logger, acceso, debug_por_solicitud: int):
+    analisis_id = uuid.uuid4()
+    logger.info(f"📥 Recibida solicitud para proyecto: {'BENCH-001'}")
+    logger.info(f"💾 Datos guardados. Análisis {analisis_id} encolado")
+    logger.info(f"⚙️ Worker {1} procesando análisis {analisis_id}")
+    for i in range(debug_por_solicitud):
+        logger.debug(f"Intentando con modelo: {MODELO}... ({i})")
+    logger.info(f"✅ ÉXITO con modelo: {MODELO}")
+    logger.info(f"✅ Análisis {analisis_id} completado")
+    acceso.info('%s - "%s %s HTTP/%s" %d', "127.0.0.1:5000", "POST", "/api/v1/analisis/iniciar", "1.1", 202)
+
+def solicitud_nueva(logger, acceso, debug_por_solicitud: int):
+    analisis_id = uuid.uuid4()
+    logger.info("📥 Recibida solicitud para proyecto: %s", "BENCH-001", extra={"proyecto_codigo": "BENCH-001"})
+    logger.info("💾 Datos guardados. Análisis %s encolado", analisis_id,
+                extra={"analisis_id": str(analisis_id), "proyecto_codigo": "BENCH-001"})
+    with contexto_analisis(analisis_id) as tiempos:
+        tiempos.update({"espera_cola": 12.5, "prompt": 3.1, "llm": 2100.0, "guardado": 8.4})
+        logger.info("⚙️ Worker %s procesando análisis %s", 1, analisis_id)
+        for i in range(debug_por_solicitud):
+            logger.debug("Intentando con modelo: %s... (%s)", MODELO, i, extra={"modelo": MODELO})
+        logger.info("✅ ÉXITO con modelo: %s", MODELO, extra={
+            "modelo": MODELO, "duracion_ms": 2100, "espera_cola_ms": 0, "tokens_prompt": 950, "tokens_respuesta": 320
+        })
+        logger.info("✅ Análisis %s completado", analisis_id, extra={
+            "modelo": MODELO, "modo": "COMPLETO", "etapas_ms": dict(tiempos)
+        })
+    acceso.info('%s - "%s %s HTTP/%s" %d', "127.0.0.1:5000", "POST", "/api/v1/analisis/iniciar", "1.1", 202)
+
+def configurar_legado(destino, nivel):
+    detener_logging()
+    manejador = logging.StreamHandler(destino)
+    manejador.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+    raiz = logging.getLogger()
+    raiz.handlers = [manejador]
+    raiz.setLevel(nivel)
+
+def configurar_cola(destino, nivel, formato, muestreo):
+    settings.LOG_FORMATO = formato
+    settings.LOG_LEVEL = logging.getLevelName(nivel)
+    settings.LOG_MUESTREO_DEBUG = muestreo
+    setup_logging(stream=destino)
+
+def correr(nombre: str, solicitud, configurar, destino: DestinoLento, solicitudes: int, debug: int) -> dict:
+    configurar(destino)
+    logger = logging.getLogger("app.bench")
+    acceso = logging.getLogger("uvicorn.access")
+    descartados_antes = app_logging.descartados
+    tiempos = []
+    inicio_total = time.perf_counter()
+    for _ in range(solicitudes):
+        inicio = time.perf_counter()
+        solicitud(logger, acceso, debug)
+        tiempos.append((time.perf_counter() - inicio) * 1e6)
+    emision = time.perf_counter() - inicio_total
+    # Lo que quedó en la cola se escribe al detener el listener (no frena a quien loguea)
+    inicio_vaciado = time.perf_counter()
+    detener_logging()
+    vaciado = time.perf_counter() - inicio_vaciado
+    tiempos.sort()
+    return {
+        "config": nombre,
+        "destino": "lento" if destino.latencia else "rapido",
+        "us_por_solicitud_p50": round(statistics.median(tiempos), 1),
+        "us_por_solicitud_p99": round(tiempos[int(len(tiempos) * 0.99) - 1], 1),
+        "us_por_solicitud_media": round(sum(tiempos) / len(tiempos), 1),
+        "emision_s": round(emision, 3),
+        "vaciado_s": round(vaciado, 3),
+        "lineas_escritas": destino.escrituras,
+        "descartados": app_logging.descartados - descartados_antes,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--solicitudes", type=int, default=2000)
+    parser.add_argument("--debug-por-solicitud", type=int, default=4, help="Líneas DEBUG por solicitud (intentos, COPY...)")
+    parser.add_argument("--latencia-escritura-ms", type=float, default=2.0, help="Demora de cada write en el destino lento")
+    parser.add_argument("--solicitudes-lento", type=int, default=300, help="Solicitudes contra el destino lento (cada línea cuesta la latencia)")
+    parser.add_argument("--nivel", default="INFO", help="Nivel del root logger (DEBUG para medir el muestreo)")
+    parser.add_argument("--muestreo-debug", type=float, default=0.1, help="LOG_MUESTREO_DEBUG de la corrida con muestreo")
+    args = parser.parse_args()
+
+    nivel = logging.getLevelName(args.nivel.upper())
+    configs = [
+        ("legado", solicitud_legado, lambda d: configurar_legado(d, nivel)),
+        ("cola_texto", solicitud_nueva, lambda d: configurar_cola(d, nivel, "texto", 1.0)),
+        ("cola_json", solicitud_nueva, lambda d: configurar_cola(d, nivel, "json", 1.0)),
+    ]
+    if nivel <= logging.DEBUG:
+        configs.append((f"cola_json_muestreo_{args.muestreo_debug}", solicitud_nueva,
+                        lambda d: configurar_cola(d, nivel, "json", args.muestreo_debug)))
+
+    reporte = {
+        "solicitudes": args.solicitudes,
+        "nivel": args.nivel.upper(),
+        "log_cola_maxima": settings.LOG_COLA_MAXIMA,
+        "resultados": []
+    }
+    for latencia in (0.0, args.latencia_escritura_ms / 1000):
+        for nombre, solicitud, configurar in configs:
+            solicitudes = args.solicitudes_lento if latencia else args.solicitudes
+            reporte["resultados"].append(
+                correr(nombre, solicitud, configurar, DestinoLento(latencia), solicitudes, args.debug_por_solicitud)
+            )
+    print(json.dumps(reporte, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Micro-benchmark y fuzz del parser de respuestas del LLM.
+
+1. Micro-benchmark: tiempo por respuesta del parseo anterior (json.loads y, si
+   falla, regex codiciosa r"(\\{.*\\})" + json.loads) contra
+   app.services.parser_respuesta en casos típicos (JSON limpio, con fences,
+   con prosa alrededor, respuesta larga) y patológicos (llaves sin cerrar,
+   donde la regex retrocede en tiempo cuadrático).
+2. Fuzz: muta respuestas válidas al azar (truncado, prosa con llaves y
+   comillas, fences, comas faltantes, ruido) y verifica que el parser solo
+   falle con RespuestaInvalida, nunca con otra excepción. Cuenta cuántas
+   recupera cada implementación. Sale con código 1 si el parser nuevo lanza
+   algo inesperado.
+
+Uso:
+    python -m benchmarks.bench_parser --repeticiones 200 --fuzz 5000
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+
+from app.services.parser_respuesta import RespuestaInvalida, parsear_respuesta
+
+def respuesta_valida(riesgos: int, semilla: int = 0) -> str:
+    aleatorio = random.Random(semilla)
+    return json.dumps({
+        "resumen": "Obra con avance sostenido; desvíos puntuales en {mampostería} y \"estructura\".",
+        "score_coherencia": aleatorio.randint(0, 100),
+        "riesgos": [
+            {
+                "titulo": f"Riesgo {i}",
+                "descripcion": f"Detalle del riesgo {i} con llaves {{}} y comillas \\\" escapadas.",
+                "nivel": aleatorio.choice(["CRITICO", "ATENCION", "INFORMATIVO"])
+            }
+            for i in range(riesgos)
+        ]
+    }, ensure_ascii=False)
+
+def parsear_legado(texto: str) -> dict:
+    """El parseo que tenía ProcesadorAnalisis antes de parser_respuesta."""
+    contenido = {}
+    try:
+        contenido = json.loads(texto)
+    except Exception:
+        match = re.search(r"(\{.*\})", texto, re.DOTALL)
+        if match:
+            contenido = json.loads(match.group(1))
+    return contenido
+
+def parsear_nuevo(texto: str) -> dict:
+    return parsear_respuesta(texto)[0]
+
+def casos() -> dict:
+    base = respuesta_valida(5)
+    return {
+        "limpio": base,
+        "fences": f"```json\n{base}\n```",
+        "prosa": f"Claro, aquí va el análisis {{resumido}}:\n{base}\nCualquier duda {{consultar}}.",
+        "largo_300_riesgos": respuesta_valida(300),
+        "patologico_llaves": "Plantilla: " + "{" * 20000 + " sin cerrar",
+        "truncado_largo": respuesta_valida(300)[:-20],
+    }
+
+def medir(funcion, texto: str, repeticiones: int) -> float:
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        try:
+            funcion(texto)
+        except Exception:
+            pass
+    return (time.perf_counter() - inicio) / repeticiones * 1e6
+
+def mutar(texto: str, aleatorio: random.Random) -> str:
+    mutaciones = [
+        lambda t: t[:aleatorio.randint(0, len(t))], # Truncado (max_tokens)
+        lambda t: f"Respuesta {{borrador}}: \"{t}\" fin", # Prosa con llaves y comillas
+        lambda t: f"```json\n{t}\n```\nNota: revisar {{x}}.",
+        lambda t: f"```\n{t}", # Fence sin cerrar
+        lambda t: t.replace(",", "", 1),
+        lambda t: t.replace('"', "'", aleatorio.randint(1, 3)),
+        lambda t: t + "}" * aleatorio.randint(1, 3),
+        lambda t: "{" * aleatorio.randint(1, 3) + t,
+        lambda t: t.replace('"CRITICO"', '"Crítico"').replace('"ATENCION"', '"media"'),
+        lambda t: t.replace('"score_coherencia": ', '"score_coherencia": "', 1).replace(', "riesgos"', '", "riesgos"', 1),
+        lambda t: "".join(c if aleatorio.random() > 0.002 else aleatorio.choice("{}[]\",:\\") for c in t),
+    ]
+    for _ in range(aleatorio.randint(1, 3)):
+        texto = aleatorio.choice(mutaciones)(texto)
+    return texto
+
+def fuzz(cantidad: int, semilla: int) -> dict:
+    aleatorio = random.Random(semilla)
+    resultado = {
+        "casos": cantidad,
+        "nuevo_recuperadas": 0, "nuevo_invalidas": 0, "nuevo_inesperadas": [],
+        "legado_recuperadas": 0, "legado_excepciones": 0,
+    }
+    for i in range(cantidad):
+        texto = mutar(respuesta_valida(aleatorio.randint(0, 8), semilla=i), aleatorio)
+        try:
+            parsear_nuevo(texto)
+            resultado["nuevo_recuperadas"] += 1
+        except RespuestaInvalida:
+            resultado["nuevo_invalidas"] += 1
+        except Exception as e:
+            if len(resultado["nuevo_inesperadas"]) < 5:
+                resultado["nuevo_inesperadas"].append({"error": repr(e), "entrada": texto[:200]})
+        try:
+            # El legado "recuperaba" cualquier dict, cumpliera o no el contrato
+            if parsear_legado(texto):
+                resultado["legado_recuperadas"] += 1
+        except Exception:
+            resultado["legado_excepciones"] += 1
+    return resultado
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=200)
+    parser.add_argument("--fuzz", type=int, default=5000)
+    parser.add_argument("--semilla", type=int, default=7)
+    args = parser.parse_args()
+
+    reporte = {"micro_us_por_respuesta": []}
+    for nombre, texto in casos().items():
+        repeticiones = max(1, args.repeticiones // 20) if nombre.startswith("patologico") else args.repeticiones
+        reporte["micro_us_por_respuesta"].append({
+            "caso": nombre,
+            "bytes": len(texto),
+            "legado_us": round(medir(parsear_legado, texto, repeticiones), 1),
+            "nuevo_us": round(medir(parsear_nuevo, texto, repeticiones), 1),
+        })
+    reporte["fuzz"] = fuzz(args.fuzz, args.semilla)
+    print(json.dumps(reporte, indent=2, ensure_ascii=False))
+    if reporte["fuzz"]["nuevo_inesperadas"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Soak test: comportamiento del pool de conexiones al agotarse.
+
+Corre fases de carga sostenida contra la dependencia get_async_db (la misma
+que usan los endpoints): cada "request" toma una conexión, ejecuta SELECT 1 y
+la retiene --retencion-ms simulando trabajo. La primera fase queda dentro de
+la capacidad del pool; la segunda la supera. Reporta por fase requests OK,
+503 por timeout del pool, espera p50/p99 por conexión y el estado del pool al
+final, que tiene que volver a 0 en uso (sin fugas) y seguir respondiendo.
+
+Uso:
+    python -m benchmarks.bench_pool --pool-size 5 --max-overflow 5 --pool-timeout 1 --segundos 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+def parsear_argumentos():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pool-size", type=int, default=5)
+    parser.add_argument("--max-overflow", type=int, default=5)
+    parser.add_argument("--pool-timeout", type=float, default=1.0)
+    parser.add_argument("--retencion-ms", type=float, default=50.0)
+    parser.add_argument("--segundos", type=float, default=20.0, help="Duración de cada fase")
+    parser.add_argument("--sobrecarga", type=float, default=4.0, help="Concurrencia de la fase 2 = capacidad x este factor")
+    return parser.parse_args()
+
+ARGS = parsear_argumentos()
+# El pool se arma al importar app.db.base: la configuración va antes de importarlo
+os.environ["DB_POOL_SIZE"] = str(ARGS.pool_size)
+os.environ["DB_MAX_OVERFLOW"] = str(ARGS.max_overflow)
+os.environ["DB_POOL_TIMEOUT_SEGUNDOS"] = str(ARGS.pool_timeout)
+
+from fastapi import HTTPException
+from sqlalchemy import text
+
+from app.api.dependencies import get_async_db
+from app.db.base import async_engine, estadisticas_pool
+from benchmarks.bench_health_bajo_carga import percentil
+
+async def cliente(fin: float, resultados: dict):
+    while time.perf_counter() < fin:
+        inicio = time.perf_counter()
+        try:
+            async for db in get_async_db():
+                resultados["espera"].append(time.perf_counter() - inicio)
+                await db.execute(text("SELECT 1"))
+                await asyncio.sleep(ARGS.retencion_ms / 1000)
+            resultados["ok"] += 1
+        except HTTPException as e:
+            resultados["rechazadas_503" if e.status_code == 503 else "errores"] += 1
+        except Exception:
+            resultados["errores"] += 1
+
+async def fase(nombre: str, concurrencia: int) -> dict:
+    resultados = {"ok": 0, "rechazadas_503": 0, "errores": 0, "espera": []}
+    fin = time.perf_counter() + ARGS.segundos
+    pico = {"en_uso": 0}
+
+    async def observar():
+        while time.perf_counter() < fin:
+            pico["en_uso"] = max(pico["en_uso"], estadisticas_pool(async_engine).get("en_uso", 0))
+            await asyncio.sleep(0.05)
+
+    await asyncio.gather(observar(), *(cliente(fin, resultados) for _ in range(concurrencia)))
+    esperas = resultados.pop("espera") or [0]
+    return {
+        "fase": nombre,
+        "concurrencia": concurrencia,
+        **resultados,
+        "req_s": round(resultados["ok"] / ARGS.segundos, 1),
+        "espera_p50_ms": round(percentil(esperas, 50) * 1000, 2),
+        "espera_p99_ms": round(percentil(esperas, 99) * 1000, 2),
+        "en_uso_pico": pico["en_uso"],
+    }
+
+async def main():
+    capacidad = ARGS.pool_size + ARGS.max_overflow
+    reporte = {
+        "pool": {"size": ARGS.pool_size, "max_overflow": ARGS.max_overflow, "timeout_s": ARGS.pool_timeout},
+        "fases": [
+            await fase("bajo_capacidad", max(capacidad - 1, 1)),
+            await fase("sobrecarga", int(capacidad * ARGS.sobrecarga)),
+        ],
+    }
+    # Recuperación: sin carga, el pool vuelve a 0 en uso y atiende enseguida
+    await asyncio.sleep(0.2)
+    reporte["pool_tras_carga"] = estadisticas_pool(async_engine)
+    recuperacion = await fase("recuperacion", 1) if ARGS.segundos else None
+    reporte["fases"].append(recuperacion)
+    await async_engine.dispose()
+    print(json.dumps(reporte, indent=2))
+
+    fugas = reporte["pool_tras_carga"].get("en_uso", 0)
+    if fugas or reporte["fases"][0]["rechazadas_503"] or recuperacion["rechazadas_503"] or any(f["errores"] for f in reporte["fases"]):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,52 @@
+"""
+Benchmark: tokens del prompt con volcado crudo (repr) vs compactación.
+
+Arma el user prompt de snapshots sintéticos de distinto tamaño con la
+compactación apagada (comportamiento anterior) y encendida en formato json y
+tabla, y reporta tokens estimados, reducción y tiempo de armado. No llama al
+LLM: el conteo real por modelo queda en InvocacionLLM.tokens_prompt.
+
+Uso:
+    python -m benchmarks.bench_prompt --avances 10,100,1000,5000 --presupuesto 6000
+"""
+import argparse
+import json
+import time
+
+from app.config.settings import settings
+from app.services.compactador_snapshot import estimar_tokens
+from app.services.prompt_builder import PromptBuilder
+from benchmarks.sinteticos import generar_snapshot
+
+def medir(datos_entrada: dict, compactar: bool, formato: str, presupuesto: int, repeticiones: int) -> dict:
+    settings.PROMPT_COMPACTACION_HABILITADA = compactar
+    builder = PromptBuilder(presupuesto, formato)
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        system, user = builder.construir_instrucciones(datos_entrada)
+    duracion = (time.perf_counter() - inicio) / repeticiones
+    return {"tokens": estimar_tokens(system) + estimar_tokens(user), "armado_ms": round(duracion * 1000, 2)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--avances", default="10,100,1000,5000")
+    parser.add_argument("--etapas", type=int, default=20)
+    parser.add_argument("--presupuesto", type=int, default=settings.PROMPT_PRESUPUESTO_TOKENS)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    reporte = []
+    for avances in (int(n) for n in args.avances.split(",")):
+        datos_entrada = generar_snapshot(avances=avances, etapas=args.etapas, semilla=avances)
+        crudo = medir(datos_entrada, False, "json", args.presupuesto, args.repeticiones)
+        fila = {"avances": avances, "crudo_tokens": crudo["tokens"], "crudo_armado_ms": crudo["armado_ms"]}
+        for formato in ("json", "tabla"):
+            compacto = medir(datos_entrada, True, formato, args.presupuesto, args.repeticiones)
+            fila[f"{formato}_tokens"] = compacto["tokens"]
+            fila[f"{formato}_reduccion_pct"] = round(100 * (1 - compacto["tokens"] / crudo["tokens"]), 1)
+            fila[f"{formato}_armado_ms"] = compacto["armado_ms"]
+        reporte.append(fila)
+    print(json.dumps(reporte, indent=2))
+
+if __name__ == "__main__":
+    main()
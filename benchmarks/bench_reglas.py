@@ -0,0 +1,88 @@
+"""
+Benchmark del pre-análisis local (app.services.motor_reglas).
+
+Genera lotes de snapshots sintéticos (con calendario en las etapas) y mide:
+
+  - por_snapshot: evaluar() uno por uno (lo que hace el procesador).
+  - lote: evaluar_lote() sobre todo el lote (arreglos aplanados, un solo
+    bincount por señal).
+
+Reporta snapshots/s, reglas/s (snapshots × reglas evaluadas) y registros/s,
+la fracción que se resolvería sin LLM (no ambigua) y los tokens del prompt
+con y sin las señales calculadas.
+
+Uso:
+    python -m benchmarks.bench_reglas --lotes 100,1000,5000 --avances 200
+"""
+import argparse
+import json
+import time
+from datetime import date, timedelta
+
+from app.services.compactador_snapshot import estimar_tokens
+from app.services.motor_reglas import REGLAS, evaluar, evaluar_lote
+from app.services.prompt_builder import PromptBuilder
+from benchmarks.sinteticos import generar_snapshot
+
+def snapshot_con_calendario(avances: int, etapas: int, semilla: int) -> dict:
+    datos = generar_snapshot(avances=avances, etapas=etapas, semilla=semilla)["datos"]
+    inicio = date(2025, 1, 1)
+    for i, etapa in enumerate(datos["etapas"]):
+        etapa["fecha_inicio"] = (inicio + timedelta(days=30 * i)).isoformat()
+        etapa["fecha_fin"] = (inicio + timedelta(days=30 * i + 60)).isoformat()
+    return datos
+
+def medir(funcion, repeticiones: int) -> float:
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lotes", default="100,1000,5000", help="Tamaños de lote (snapshots)")
+    parser.add_argument("--avances", type=int, default=200, help="Registros de avance por snapshot")
+    parser.add_argument("--etapas", type=int, default=8)
+    parser.add_argument("--repeticiones", type=int, default=3, help="Se reporta la mejor")
+    args = parser.parse_args()
+
+    tamanos = [int(n) for n in args.lotes.split(",")]
+    snapshots = [snapshot_con_calendario(args.avances, args.etapas, semilla) for semilla in range(max(tamanos))]
+
+    resultados = []
+    for tamano in tamanos:
+        lote = snapshots[:tamano]
+        registros = sum(len(d["registros_avance"]) + len(d["etapas"]) + len(d["medidas_seguridad"]) for d in lote)
+        senales = evaluar_lote(lote)
+        for nombre, funcion in (
+            ("por_snapshot", lambda: [evaluar(d) for d in lote]),
+            ("lote", lambda: evaluar_lote(lote)),
+        ):
+            segundos = medir(funcion, args.repeticiones)
+            resultados.append({
+                "modo": nombre,
+                "snapshots": tamano,
+                "ms_total": round(segundos * 1000, 2),
+                "ms_por_snapshot": round(segundos * 1000 / tamano, 4),
+                "snapshots_por_s": round(tamano / segundos),
+                "reglas_por_s": round(tamano * len(REGLAS) / segundos),
+                "registros_por_s": round(registros / segundos),
+                "resueltos_sin_llm_pct": round(100 * sum(not s["ambigua"] for s in senales) / tamano, 1),
+            })
+
+    builder = PromptBuilder()
+    entrada = {"proyecto_codigo": "SINT-001", "datos": snapshots[0]}
+    _, sin_senales = builder.construir_instrucciones(entrada)
+    _, con_senales = builder.construir_instrucciones(entrada, evaluar(snapshots[0]))
+
+    print(json.dumps({
+        "avances_por_snapshot": args.avances,
+        "reglas": list(REGLAS),
+        "resultados": resultados,
+        "prompt_tokens": {"sin_senales": estimar_tokens(sin_senales), "con_senales": estimar_tokens(con_senales)},
+    }, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
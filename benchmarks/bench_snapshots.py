@@ -0,0 +1,111 @@
+"""
+Benchmark: almacenamiento de snapshots (texto legado vs JSONB vs zstd).
+
+Inserta N snapshots con una fracción de payloads repetidos (el caso de un
+proyecto que reenvía casi lo mismo) y reporta, por formato, bytes por
+snapshot en la base, cuántos payloads quedaron tras deduplicar y el
+throughput de escritura y de lectura (leer_payload).
+
+Uso:
+    python -m benchmarks.bench_snapshots --total 2000 --avances 500 --repetidos-pct 60
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from app.db.base import AsyncSessionLocal, Base, engine
+from app.models.analisis import Analisis, PayloadSnapshot, SnapshotRecibido
+from app.services.snapshot_store import guardar_payload, leer_payload, serializar
+from benchmarks.sinteticos import generar_snapshot
+
+def tamano_columna(columna, dialecto: str):
+    # pg_column_size mide lo que ocupa realmente (TOAST comprimido incluido)
+    return func.pg_column_size(columna) if dialecto == "postgresql" else func.length(columna)
+
+async def medir(formato: str, payloads: list) -> dict:
+    ids_snapshot = []
+    marca = datetime.utcnow()
+
+    inicio = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        dialecto = db.bind.dialect.name
+        for datos in payloads:
+            analisis = Analisis(id=uuid.uuid4(), proyecto_codigo="BENCH-SNAP")
+            snapshot = SnapshotRecibido(id=uuid.uuid4(), analisis_id=analisis.id)
+            if formato == "texto":
+                snapshot.payload_completo = json.dumps(datos)
+            else:
+                snapshot.payload_hash = await guardar_payload(db, datos, formato)
+            db.add_all([analisis, snapshot])
+            ids_snapshot.append(snapshot.id)
+        await db.commit()
+    escritura = time.perf_counter() - inicio
+
+    async with AsyncSessionLocal() as db:
+        if formato == "texto":
+            bytes_totales = await db.scalar(
+                select(func.sum(tamano_columna(SnapshotRecibido.payload_completo, dialecto)))
+                .where(SnapshotRecibido.recibido_at >= marca, SnapshotRecibido.payload_completo.is_not(None))
+            )
+            filas_payload = len(payloads)
+        else:
+            columna = PayloadSnapshot.contenido_zstd if formato == "zstd" else PayloadSnapshot.contenido_json
+            bytes_totales, filas_payload = (await db.execute(
+                select(func.sum(tamano_columna(columna, dialecto)), func.count(PayloadSnapshot.hash))
+                .where(PayloadSnapshot.creado_at >= marca, PayloadSnapshot.formato == formato)
+            )).one()
+
+    inicio = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        for snapshot in (await db.execute(
+            select(SnapshotRecibido).where(SnapshotRecibido.id.in_(ids_snapshot))
+        )).scalars():
+            await leer_payload(db, snapshot)
+    lectura = time.perf_counter() - inicio
+
+    return {
+        "formato": formato,
+        "snapshots": len(payloads),
+        "filas_payload": filas_payload,
+        "bytes_por_snapshot": round((bytes_totales or 0) / len(payloads)),
+        "escritura_snapshots_s": round(len(payloads) / escritura),
+        "lectura_snapshots_s": round(len(payloads) / lectura),
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--total", type=int, default=2000)
+    parser.add_argument("--avances", type=int, default=500)
+    parser.add_argument("--repetidos-pct", type=float, default=60.0)
+    parser.add_argument("--formatos", default="texto,jsonb,zstd")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    reporte = []
+    for formato in args.formatos.split(","):
+        # Marca por corrida y formato: cada formato arranca sin payloads previos que deduplicar
+        sal = uuid.uuid4().hex
+        azar = random.Random(7)
+        distintos = []
+        payloads = []
+        for i in range(args.total):
+            if distintos and azar.random() * 100 < args.repetidos_pct:
+                payloads.append(azar.choice(distintos))
+                continue
+            datos = generar_snapshot(avances=args.avances, proyecto_codigo=f"P{i}", semilla=i)["datos"]
+            datos["_corrida"] = sal
+            distintos.append(datos)
+            payloads.append(datos)
+        fila = await medir(formato, payloads)
+        fila["json_bytes_promedio"] = round(sum(len(serializar(p)) for p in payloads) / len(payloads))
+        reporte.append(fila)
+    print(json.dumps(reporte, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+"""
+Benchmark: entrega de webhooks vía outbox contra un receptor stub inestable.
+
+Levanta el stub (benchmarks.stub_openrouter) en proceso con latencia y una
+tasa de fallos 503, encola N notificaciones como lo hace el procesador (mismo
+commit que el COMPLETADO) y corre el despachador hasta vaciar el outbox.
+Verifica que no se pierda ninguna (todas ENTREGADO y recibidas por el stub) y
+compara el costo de encolar contra el de entregar en línea.
+
+Uso:
+    python -m benchmarks.bench_webhooks --total 500 --fallo-pct 30 --latencia-ms 200
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+import uuid
+
+import httpx
+import uvicorn
+from sqlalchemy import select
+
+from app.config.settings import settings
+from app.db.base import AsyncSessionLocal, Base, engine
+from app.models.analisis import Analisis, EstadoAnalisis, EstadoWebhook, WebhookOutbox
+from app.services.webhook_client import WebhookClient
+from app.services.webhook_dispatcher import DespachadorWebhooks, contar_por_estado
+from benchmarks.stub_openrouter import crear_app
+
+async def encolar(total: int) -> list:
+    """Un commit por análisis, como _guardar_resultado. Devuelve la latencia de cada commit (s)."""
+    latencias = []
+    for _ in range(total):
+        inicio = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            analisis = Analisis(id=uuid.uuid4(), proyecto_codigo="BENCH-WH", estado=EstadoAnalisis.COMPLETADO)
+            db.add(analisis)
+            WebhookClient.encolar_finalizacion(db, analisis)
+            await db.commit()
+        latencias.append(time.perf_counter() - inicio)
+    return latencias
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--total", type=int, default=500)
+    parser.add_argument("--fallo-pct", type=float, default=30.0)
+    parser.add_argument("--latencia-ms", type=float, default=200.0)
+    parser.add_argument("--port", type=int, default=9011)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    args = parser.parse_args()
+
+    base = f"http://127.0.0.1:{args.port}"
+    settings.WEBHOOK_URL = f"{base}/webhook"
+    settings.WEBHOOK_BACKOFF_BASE_SEGUNDOS = 0.05
+    settings.WEBHOOK_BACKOFF_MAX_SEGUNDOS = 1.0
+    settings.WEBHOOK_MAX_INTENTOS = 50 # Con 30% de fallos no debería llegar a MUERTO
+
+    stub = uvicorn.Server(uvicorn.Config(
+        crear_app(latencia_webhook_ms=args.latencia_ms, fallo_webhook_pct=args.fallo_pct),
+        host="127.0.0.1", port=args.port, log_level="warning"
+    ))
+    tarea_stub = asyncio.create_task(stub.serve())
+    while not stub.started:
+        await asyncio.sleep(0.05)
+
+    Base.metadata.create_all(bind=engine)
+    async with AsyncSessionLocal() as db:
+        previas = await contar_por_estado(db)
+
+    latencias_encolado = await encolar(args.total)
+
+    despachador = DespachadorWebhooks()
+    inicio = time.perf_counter()
+    await despachador.iniciar()
+    while time.perf_counter() - inicio < args.timeout:
+        async with AsyncSessionLocal() as db:
+            conteo = await contar_por_estado(db)
+        if conteo["PENDIENTE"] == 0:
+            break
+        await asyncio.sleep(0.2)
+    duracion_entrega = time.perf_counter() - inicio
+    await despachador.detener()
+
+    async with httpx.AsyncClient() as cliente:
+        recibidos = (await cliente.get(f"{base}/webhook/recibidos")).json()
+    async with AsyncSessionLocal() as db:
+        entregados = set(str(i) for i in (await db.execute(
+            select(WebhookOutbox.id).where(WebhookOutbox.estado == EstadoWebhook.ENTREGADO)
+        )).scalars())
+    perdidos = entregados.symmetric_difference(recibidos["ids"])
+
+    stub.should_exit = True
+    await tarea_stub
+
+    reporte = {
+        "total": args.total,
+        "estado_outbox": {k: conteo[k] - previas.get(k, 0) for k in conteo},
+        "recibidos_unicos": recibidos["unicos"],
+        "recibidos_total": recibidos["total"], # > unicos si hubo reentregas (el receptor deduplica por X-Webhook-Id)
+        "perdidos": len(perdidos),
+        "encolado_p50_ms": round(statistics.median(latencias_encolado) * 1000, 2),
+        "encolado_max_ms": round(max(latencias_encolado) * 1000, 2),
+        "entrega_en_linea_ms_por_analisis": args.latencia_ms, # lo que antes sumaba cada análisis
+        "duracion_entrega_s": round(duracion_entrega, 2),
+    }
+    print(json.dumps(reporte, indent=2))
+    if perdidos or conteo["PENDIENTE"] or conteo["MUERTO"] - previas.get("MUERTO", 0):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,41 @@
+"""Generador de snapshots sintéticos con tamaño controlado para los benchmarks."""
+import random
+from datetime import date, timedelta
+
+OFICIOS = ["albañil", "electricista", "plomero", "herrero", "carpintero", "pintor"]
+TAREAS = ["excavación", "hormigonado", "encofrado", "mampostería", "instalación eléctrica", "revoque"]
+MEDIDAS = ["Casco", "Arnés", "Guantes", "Botines", "Señalización", "Baranda perimetral", "Extintor"]
+
+def generar_snapshot(avances: int = 50, etapas: int = 8, medidas: int = 7,
+                     proyecto_codigo: str = "SINT-001", semilla: int = 42) -> dict:
+    """Devuelve un dict listo para POST /analisis/iniciar (SnapshotCreate)."""
+    azar = random.Random(semilla)
+    inicio = date(2025, 1, 1)
+    porcentaje = 0
+    registros = []
+    for i in range(avances):
+        porcentaje = min(100, porcentaje + azar.choice([0, 0, 1, 1, 2]))
+        registros.append({
+            "fecha": (inicio + timedelta(days=i % 365)).isoformat(),
+            "supervisor": f"Supervisor {azar.randint(1, 5)}",
+            "porcentaje_avance": porcentaje,
+            "presenta_desvios": azar.random() < 0.1,
+            "tareas_ejecutadas": azar.sample(TAREAS, k=2),
+            "oficios_activos": azar.sample(OFICIOS, k=3),
+        })
+    return {
+        "proyecto_codigo": proyecto_codigo,
+        "datos": {
+            "proyecto": {"codigo": proyecto_codigo, "nombre": f"Obra {proyecto_codigo}", "responsable_tecnico": "Ing. Sintético"},
+            "etapas": [
+                {"nombre": f"Etapa {i + 1}", "estado": azar.choice(["PENDIENTE", "EN_CURSO", "FINALIZADA"]),
+                 "avance_estimado": azar.randint(0, 100)}
+                for i in range(etapas)
+            ],
+            "registros_avance": registros,
+            "medidas_seguridad": [
+                {"item": MEDIDAS[i % len(MEDIDAS)] + ("" if i < len(MEDIDAS) else f" #{i}"), "cumple": azar.random() > 0.15}
+                for i in range(medidas)
+            ],
+        },
+    }
@@ -0,0 +1,248 @@
+"""
+Servidor stub local que imita POST /chat/completions de OpenRouter.
+
+Permite medir la API sin pagar ni depender del servicio real. Apuntar la API
+con OPENROUTER_BASE_URL=http://127.0.0.1:9000 y levantar el stub con:
+
+    python -m benchmarks.stub_openrouter --port 9000 --latencia-ms 200
+    python -m benchmarks.stub_openrouter --latencia-ms 3000 --distribucion lognormal --desvio-ms 2000 \\
+        --error-pct 2 --limite-pct 5
+    python -m benchmarks.stub_openrouter --replay-db postgresql://...  # respuestas grabadas en respuesta_llm
+
+- Latencia: fija, uniforme (media ± desvío), normal o lognormal (misma media,
+  cola larga como la de los modelos reales). En streaming se reparte entre chunks.
+- Fallos: --error-pct responde 500 tras la latencia; --limite-pct responde 429
+  enseguida, con Retry-After y X-RateLimit-* como OpenRouter.
+- Replay: sirve en rueda las respuestas grabadas en respuesta_llm (o en un
+  NDJSON), por modelo si el pedido coincide, con sus tokens y, con
+  --replay-latencia, su duracion_ms original.
+
+También expone POST /webhook como receptor de notificaciones, con latencia y
+tasa de fallos configurables, GET /webhook/recibidos para verificar entregas y
+GET /estadisticas con los pedidos de chat por estado y modelo.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CONTENIDO_POR_DEFECTO = json.dumps({
+    "resumen": "Obra en curso sin desvíos relevantes (respuesta stub).",
+    "score_coherencia": 82,
+    "riesgos": [
+        {"titulo": "Medidas de seguridad incompletas", "descripcion": "Falta arnés en altura.", "nivel": "CRITICO"},
+        {"titulo": "Desvío leve de cronograma", "descripcion": "Etapa de estructura 5% atrasada.", "nivel": "ATENCION"},
+    ],
+}, ensure_ascii=False)
+
+DISTRIBUCIONES = ("fija", "uniforme", "normal", "lognormal")
+
+def muestrear_latencia_ms(azar: random.Random, distribucion: str, media_ms: float, desvio_ms: float) -> float:
+    if media_ms <= 0 or distribucion == "fija" or desvio_ms <= 0:
+        return max(media_ms, 0.0)
+    if distribucion == "uniforme":
+        return max(0.0, azar.uniform(media_ms - desvio_ms, media_ms + desvio_ms))
+    if distribucion == "normal":
+        return max(0.0, azar.gauss(media_ms, desvio_ms))
+    # Lognormal con la media y el desvío pedidos (no los del logaritmo)
+    sigma = math.sqrt(math.log(1 + (desvio_ms / media_ms) ** 2))
+    return azar.lognormvariate(math.log(media_ms) - sigma ** 2 / 2, sigma)
+
+def cargar_replay_db(url: str, limite: int = 5000, solo_validas: bool = True) -> list:
+    """Respuestas reales de respuesta_llm con el modelo, tokens y duración de su invocación."""
+    from sqlalchemy import create_engine, text
+    motor = create_engine(url)
+    consulta = text("""
+        SELECT r.respuesta_raw, r.respuesta_parseada, i.modelo_usado, i.tokens_prompt, i.tokens_respuesta, i.duracion_ms
+        FROM respuesta_llm r JOIN invocacion_llm i ON i.id = r.invocacion_id
+        WHERE i.desde_cache IS NOT TRUE AND r.respuesta_raw IS NOT NULL
+        ORDER BY r.recibida_at DESC
+        LIMIT :limite
+    """)
+    with motor.connect() as conexion:
+        filas = conexion.execute(consulta, {"limite": limite}).all()
+    motor.dispose()
+    return [
+        {"contenido": raw, "modelo": modelo, "tokens_prompt": tp, "tokens_respuesta": tr, "duracion_ms": dur}
+        for raw, parseada, modelo, tp, tr, dur in filas
+        # JSON null llega como None (psycopg) o como texto "null" (SQLite): es una respuesta que no validó
+        if not solo_validas or parseada not in (None, "null")
+    ]
+
+def cargar_replay_archivo(ruta: str) -> list:
+    """NDJSON con {contenido, modelo?, tokens_prompt?, tokens_respuesta?, duracion_ms?} por línea."""
+    with open(ruta, encoding="utf-8") as archivo:
+        return [json.loads(linea) for linea in archivo if linea.strip()]
+
+class _Replay:
+    """Rueda de respuestas grabadas: por modelo si hay del modelo pedido, si no la rueda general."""
+    def __init__(self, respuestas: list):
+        self.general = itertools.cycle(respuestas)
+        por_modelo = {}
+        for respuesta in respuestas:
+            por_modelo.setdefault(respuesta.get("modelo"), []).append(respuesta)
+        self.por_modelo = {modelo: itertools.cycle(lista) for modelo, lista in por_modelo.items()}
+
+    def siguiente(self, modelo: str) -> dict:
+        return next(self.por_modelo.get(modelo) or self.general)
+
+def crear_app(latencia_ms: float = 0.0, latencia_webhook_ms: float = 0.0, fallo_webhook_pct: float = 0.0,
+              distribucion: str = "fija", desvio_ms: float = 0.0, error_pct: float = 0.0, limite_pct: float = 0.0,
+              retry_after_segundos: float = 1.0, respuestas_replay: list = None, replay_latencia: bool = False,
+              semilla: int = None) -> FastAPI:
+    stub = FastAPI(title="OpenRouter Stub")
+    stub.state.latencia_ms = latencia_ms
+    stub.state.latencia_webhook_ms = latencia_webhook_ms
+    stub.state.fallo_webhook_pct = fallo_webhook_pct
+    stub.state.solicitudes = 0
+    stub.state.webhooks_recibidos = {} # X-Webhook-Id -> veces recibido
+    stub.state.chat_por_estado = {}
+    stub.state.chat_por_modelo = {}
+    azar = random.Random(semilla)
+    replay = _Replay(respuestas_replay) if respuestas_replay else None
+
+    def _contar(modelo: str, estado: int):
+        stub.state.chat_por_estado[estado] = stub.state.chat_por_estado.get(estado, 0) + 1
+        stub.state.chat_por_modelo[modelo] = stub.state.chat_por_modelo.get(modelo, 0) + 1
+
+    def _respuesta(modelo: str, cuerpo: dict) -> tuple:
+        """(contenido, usage, latencia_ms) del próximo pedido."""
+        latencia = muestrear_latencia_ms(azar, distribucion, stub.state.latencia_ms, desvio_ms)
+        if replay:
+            grabada = replay.siguiente(modelo)
+            contenido = grabada["contenido"]
+            if replay_latencia and grabada.get("duracion_ms"):
+                latencia = grabada["duracion_ms"]
+            tokens_prompt, tokens_respuesta = grabada.get("tokens_prompt"), grabada.get("tokens_respuesta")
+        else:
+            contenido, tokens_prompt, tokens_respuesta = CONTENIDO_POR_DEFECTO, None, 120
+        # Sin dato grabado se estima como el compactador (~4 caracteres por token)
+        tokens_prompt = tokens_prompt or max(1, sum(len(m.get("content") or "") for m in cuerpo.get("messages", [])) // 4)
+        tokens_respuesta = tokens_respuesta or max(1, len(contenido) // 4)
+        usage = {"prompt_tokens": tokens_prompt, "completion_tokens": tokens_respuesta,
+                 "total_tokens": tokens_prompt + tokens_respuesta}
+        return contenido, usage, latencia
+
+    @stub.post("/chat/completions")
+    async def chat_completions(request: Request):
+        cuerpo = await request.json()
+        modelo = cuerpo.get("model", "stub/model")
+        stub.state.solicitudes += 1
+        sorteo = azar.random() * 100
+        if sorteo < limite_pct:
+            _contar(modelo, 429)
+            return JSONResponse(
+                {"error": {"message": "Rate limit exceeded (stub)", "code": 429}}, status_code=429,
+                headers={
+                    "Retry-After": str(retry_after_segundos),
+                    "X-RateLimit-Remaining": "0",
+                    "X-RateLimit-Reset": str(int((time.time() + retry_after_segundos) * 1000)),
+                }
+            )
+
+        contenido, usage, latencia = _respuesta(modelo, cuerpo)
+        if sorteo < limite_pct + error_pct:
+            await asyncio.sleep(latencia / 1000)
+            _contar(modelo, 500)
+            return JSONResponse({"error": {"message": "Upstream error (stub)", "code": 500}}, status_code=500)
+
+        _contar(modelo, 200)
+        if cuerpo.get("stream"):
+            return StreamingResponse(_stream(modelo, contenido, usage, latencia), media_type="text/event-stream")
+        await asyncio.sleep(latencia / 1000)
+        return {
+            "id": f"stub-{stub.state.solicitudes}",
+            "created": int(time.time()),
+            "model": modelo,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": contenido}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    async def _stream(modelo: str, contenido: str, usage: dict, latencia: float):
+        # Reparte la latencia entre los chunks para simular tokens llegando de a poco
+        trozos = [contenido[i:i + 16] for i in range(0, len(contenido), 16)] or [""]
+        pausa = latencia / 1000 / len(trozos)
+        for trozo in trozos:
+            if pausa:
+                await asyncio.sleep(pausa)
+            chunk = {"model": modelo, "choices": [{"index": 0, "delta": {"content": trozo}}]}
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        final = {"model": modelo, "choices": [], "usage": usage}
+        yield f"data: {json.dumps(final)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    @stub.get("/estadisticas")
+    async def estadisticas():
+        return {
+            "chat_por_estado": stub.state.chat_por_estado,
+            "chat_por_modelo": stub.state.chat_por_modelo,
+            "replay": len(respuestas_replay or []),
+        }
+
+    @stub.post("/webhook")
+    async def webhook(request: Request):
+        stub.state.solicitudes += 1
+        if stub.state.latencia_webhook_ms:
+            await asyncio.sleep(stub.state.latencia_webhook_ms / 1000)
+        if random.random() * 100 < stub.state.fallo_webhook_pct:
+            return JSONResponse({"ok": False}, status_code=503)
+        id_webhook = request.headers.get("X-Webhook-Id", "sin-id")
+        stub.state.webhooks_recibidos[id_webhook] = stub.state.webhooks_recibidos.get(id_webhook, 0) + 1
+        return {"ok": True}
+
+    @stub.get("/webhook/recibidos")
+    async def webhooks_recibidos():
+        recibidos = stub.state.webhooks_recibidos
+        return {"unicos": len(recibidos), "total": sum(recibidos.values()), "ids": list(recibidos)}
+
+    return stub
+
+def agregar_argumentos(parser: argparse.ArgumentParser, prefijo: str = ""):
+    """Opciones del stub; bench_carga las reusa con prefijo "stub-" para levantarlo como subproceso."""
+    parser.add_argument(f"--{prefijo}latencia-ms", type=float, default=0.0, help="Latencia media del LLM simulado")
+    parser.add_argument(f"--{prefijo}distribucion", choices=DISTRIBUCIONES, default="fija")
+    parser.add_argument(f"--{prefijo}desvio-ms", type=float, default=0.0)
+    parser.add_argument(f"--{prefijo}error-pct", type=float, default=0.0, help="Respuestas 500 (tras la latencia)")
+    parser.add_argument(f"--{prefijo}limite-pct", type=float, default=0.0, help="Respuestas 429 inmediatas")
+    parser.add_argument(f"--{prefijo}retry-after", type=float, default=1.0, help="Segundos del Retry-After de los 429")
+    parser.add_argument(f"--{prefijo}replay-db", default=None, help="URL de base con respuesta_llm a reproducir")
+    parser.add_argument(f"--{prefijo}replay-archivo", default=None, help="NDJSON de respuestas a reproducir")
+    parser.add_argument(f"--{prefijo}replay-latencia", action="store_true", help="Usar la duracion_ms grabada")
+    parser.add_argument(f"--{prefijo}replay-incluir-invalidas", action="store_true",
+                        help="Reproducir también las que no validaron (ejercita la reparación)")
+    parser.add_argument(f"--{prefijo}semilla", type=int, default=None)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latencia-webhook-ms", type=float, default=0.0)
+    parser.add_argument("--fallo-webhook-pct", type=float, default=0.0)
+    agregar_argumentos(parser)
+    args = parser.parse_args()
+
+    respuestas = None
+    if args.replay_db:
+        respuestas = cargar_replay_db(args.replay_db, solo_validas=not args.replay_incluir_invalidas)
+    elif args.replay_archivo:
+        respuestas = cargar_replay_archivo(args.replay_archivo)
+    if respuestas is not None and not respuestas:
+        parser.error("El origen de replay no tiene respuestas")
+
+    stub = crear_app(
+        args.latencia_ms, args.latencia_webhook_ms, args.fallo_webhook_pct,
+        distribucion=args.distribucion, desvio_ms=args.desvio_ms, error_pct=args.error_pct,
+        limite_pct=args.limite_pct, retry_after_segundos=args.retry_after, respuestas_replay=respuestas,
+        replay_latencia=args.replay_latencia, semilla=args.semilla
+    )
+    uvicorn.run(stub, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
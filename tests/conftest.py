@@ -0,0 +1,57 @@
+"""
+La configuración se lee al importar app.*: las variables mínimas van antes de
+cualquier import de la aplicación. Por defecto todo corre contra un SQLite
+temporal; las pruebas que necesitan Postgres (planes, particiones) usan
+TEST_POSTGRES_URL y se saltean si no está definida.
+"""
+import os
+import tempfile
+import uuid
+
+_BASE_PRUEBAS = os.path.join(tempfile.mkdtemp(prefix="analisis-tests-"), "pruebas.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_BASE_PRUEBAS}")
+os.environ.setdefault("OPENROUTER_API_KEY", "pruebas")
+os.environ.setdefault("WEBHOOK_URL", "")
+
+import pytest
+
+@pytest.fixture
+async def db():
+    """Sesión asyncio sobre el esquema sincronizado; engines nuevos por prueba (cada una corre en su loop)."""
+    from app.db import base as db_base
+    from app.db.esquema import asegurar_esquema
+
+    db_base.crear_engines()
+    await asegurar_esquema()
+    async with db_base.AsyncSessionLocal() as sesion:
+        yield sesion
+    await db_base.cerrar_engines()
+
+@pytest.fixture
+def postgres():
+    """
+    Engine síncrono sobre un esquema descartable en TEST_POSTGRES_URL (se borra
+    al terminar); la prueba se saltea si la variable no está definida.
+    """
+    url = os.environ.get("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL no definida")
+    from sqlalchemy import create_engine, event, text
+
+    esquema = f"pruebas_{uuid.uuid4().hex[:12]}"
+    motor = create_engine(url)
+    with motor.begin() as conexion:
+        conexion.execute(text(f"CREATE SCHEMA {esquema}"))
+    motor.dispose()
+
+    @event.listens_for(motor, "connect")
+    def _search_path(conexion_dbapi, _registro):
+        cursor = conexion_dbapi.cursor()
+        cursor.execute(f"SET search_path TO {esquema}")
+        cursor.close()
+        conexion_dbapi.commit()
+
+    yield motor
+    with motor.begin() as conexion:
+        conexion.execute(text(f"DROP SCHEMA {esquema} CASCADE"))
+    motor.dispose()
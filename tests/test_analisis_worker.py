@@ -0,0 +1,91 @@
+import json
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, update
+
+from app.config.settings import settings
+from app.db import base as db_base
+from app.models.analisis import Analisis, EstadoAnalisis, ResultadoAnalisis, WebhookOutbox
+from app.schemas.snapshot import SnapshotCreate
+from app.services import procesador_analisis
+from app.services.analisis_service import AnalisisService
+from app.services.analisis_worker import AnalisisWorker
+from app.services.procesador_analisis import ProcesadorAnalisis
+
+class ClienteFijo:
+    def __init__(self, *args, **kwargs):
+        self.modelos_fallback = ["modelo/prueba"]
+        self.modelo_exitoso = None
+
+    async def enviar_prompt(self, system_prompt, user_prompt, intentos=None):
+        intentos.append({
+            "modelo": "modelo/prueba", "invocado_at": datetime.utcnow(), "exitosa": True, "ganadora": True,
+            "error": None, "tokens_prompt": 10, "tokens_respuesta": 10, "duracion_ms": 1, "espera_cola_ms": 0
+        })
+        self.modelo_exitoso = "modelo/prueba"
+        return {"choices": [{"message": {"content": json.dumps({"resumen": "ok", "score_coherencia": 90, "riesgos": []})}}]}
+
+class ClienteCaido(ClienteFijo):
+    async def enviar_prompt(self, system_prompt, user_prompt, intentos=None):
+        raise RuntimeError("OpenRouter no responde")
+
+async def _reclamado_dos_veces(db, monkeypatch):
+    """
+    El worker A reclama el análisis y se pasa del timeout; el rescate lo devuelve
+    a PENDIENTE y el worker B lo reclama. Devuelve (id, analisis de A, analisis de B, sesiones).
+    """
+    monkeypatch.setattr(settings, "REGLAS_MODO", "senales")
+    monkeypatch.setattr(settings, "ANALISIS_INCREMENTAL_HABILITADO", False)
+    monkeypatch.setattr(settings, "LLM_CACHE_HABILITADO", False)
+    monkeypatch.setattr(settings, "ANALISIS_MAX_INTENTOS", 3)
+    monkeypatch.setattr(settings, "WEBHOOK_URL", "http://receptor.test/webhook")
+    # La base es compartida: que el reclamo encuentre solo el nuestro
+    await db.execute(update(Analisis).where(Analisis.estado == EstadoAnalisis.PENDIENTE).values(estado=EstadoAnalisis.ERROR))
+    analisis = await AnalisisService(db).crear_analisis(SnapshotCreate(
+        proyecto_codigo=f"RESCATE-{uuid.uuid4().hex[:8]}",
+        datos={"registros_avance": [{"fecha": "2025-01-01", "porcentaje_avance": 10}]}
+    ))
+    await db.commit()
+
+    worker = AnalisisWorker(concurrencia=1)
+    sesion_a, sesion_b = db_base.AsyncSessionLocal(), db_base.AsyncSessionLocal()
+    de_a = await worker._reclamar(sesion_a)
+    assert de_a.id == analisis.id and de_a.intentos == 1
+
+    await db.execute(update(Analisis).where(Analisis.id == analisis.id).values(
+        procesando_desde=datetime.utcnow() - timedelta(seconds=settings.ANALISIS_TIMEOUT_PROCESANDO_SEGUNDOS + 1)
+    ))
+    await db.commit()
+    assert await worker.rescatar_huerfanos() >= 1
+    de_b = await worker._reclamar(sesion_b)
+    assert de_b.id == analisis.id and de_b.intentos == 2
+    return analisis.id, de_a, de_b, sesion_a, sesion_b
+
+async def _estado_final(db, analisis_id) -> tuple:
+    analisis = (await db.execute(
+        select(Analisis).where(Analisis.id == analisis_id).execution_options(populate_existing=True)
+    )).scalar_one()
+    resultados = await db.scalar(select(func.count(ResultadoAnalisis.id)).where(ResultadoAnalisis.analisis_id == analisis_id))
+    notificaciones = await db.scalar(select(func.count(WebhookOutbox.id)).where(WebhookOutbox.analisis_id == analisis_id))
+    return analisis.estado, analisis.intentos, resultados, notificaciones
+
+async def test_resultado_del_reclamo_vencido_se_descarta(db, monkeypatch):
+    monkeypatch.setattr(procesador_analisis, "LLMClient", ClienteFijo)
+    analisis_id, de_a, de_b, sesion_a, sesion_b = await _reclamado_dos_veces(db, monkeypatch)
+    async with sesion_a, sesion_b:
+        # A termina tarde: el análisis ya es de B
+        await ProcesadorAnalisis(sesion_a).procesar(de_a)
+        assert await _estado_final(db, analisis_id) == (EstadoAnalisis.PROCESANDO, 2, 0, 0)
+
+        await ProcesadorAnalisis(sesion_b).procesar(de_b)
+    assert await _estado_final(db, analisis_id) == (EstadoAnalisis.COMPLETADO, 2, 1, 1)
+
+async def test_error_del_reclamo_vencido_no_pisa_el_completado(db, monkeypatch):
+    monkeypatch.setattr(procesador_analisis, "LLMClient", ClienteFijo)
+    analisis_id, de_a, de_b, sesion_a, sesion_b = await _reclamado_dos_veces(db, monkeypatch)
+    async with sesion_a, sesion_b:
+        await ProcesadorAnalisis(sesion_b).procesar(de_b)
+        monkeypatch.setattr(procesador_analisis, "LLMClient", ClienteCaido)
+        await ProcesadorAnalisis(sesion_a).procesar(de_a)
+    assert await _estado_final(db, analisis_id) == (EstadoAnalisis.COMPLETADO, 2, 1, 1)
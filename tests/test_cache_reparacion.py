@@ -0,0 +1,134 @@
+"""La caché compartida (tablas de auditoría) nunca sirve una respuesta que no validó."""
+import json
+import uuid
+from datetime import datetime
+
+from sqlalchemy import JSON, select
+from sqlalchemy.orm import selectinload
+
+from app.config.settings import settings
+from app.models.analisis import Analisis, EstadisticaDiaria, EstadoAnalisis, InvocacionLLM, PromptGenerado, RespuestaLLM
+from app.schemas.snapshot import SnapshotCreate
+from app.services import procesador_analisis
+from app.services.analisis_service import AnalisisService
+from app.services.llm_cache import LLMCache
+from app.services.procesador_analisis import ProcesadorAnalisis
+
+VALIDA = {
+    "resumen": "Obra en plazo.",
+    "score_coherencia": 80,
+    "riesgos": [{"titulo": "Baranda", "descripcion": "Falta en piso 3.", "nivel": "CRITICO"}],
+}
+MODELO = "modelo/prueba"
+
+def _intento(modelo: str) -> dict:
+    return {
+        "modelo": modelo, "invocado_at": datetime.utcnow(), "exitosa": True, "ganadora": True, "error": None,
+        "tokens_prompt": 100, "tokens_respuesta": 50, "duracion_ms": 10, "espera_cola_ms": 0
+    }
+
+class ClienteReparado:
+    """Primera respuesta rota (llave suelta y JSON truncado); la reparación devuelve JSON válido."""
+    def __init__(self, *args, **kwargs):
+        self.modelos_fallback = [MODELO]
+        self.modelo_exitoso = None
+
+    async def enviar_prompt(self, system_prompt, user_prompt, intentos=None):
+        intentos.append(_intento(MODELO))
+        self.modelo_exitoso = MODELO
+        return {"choices": [{"message": {"content": '{"resumen": "Obra en plazo", "riesgos": [{"titulo"'}}]}
+
+    async def reparar(self, modelo, system_prompt, user_prompt, intentos=None):
+        intentos.append(_intento(modelo))
+        return {"choices": [{"message": {"content": json.dumps(VALIDA)}}]}
+
+async def test_clave_de_cache_va_en_la_invocacion_reparada(db, monkeypatch):
+    monkeypatch.setattr(procesador_analisis, "LLMClient", ClienteReparado)
+    monkeypatch.setattr(settings, "REGLAS_MODO", "senales")
+    monkeypatch.setattr(settings, "ANALISIS_INCREMENTAL_HABILITADO", False)
+
+    analisis = await AnalisisService(db).crear_analisis(SnapshotCreate(
+        proyecto_codigo=f"CACHE-{uuid.uuid4().hex[:8]}",
+        datos={"registros_avance": [{"fecha": "2025-01-01", "porcentaje_avance": 10}]}
+    ), estado=EstadoAnalisis.PROCESANDO)
+    await db.commit()
+    analisis = (await db.execute(
+        select(Analisis).options(selectinload(Analisis.snapshot)).where(Analisis.id == analisis.id)
+    )).scalar_one()
+    await ProcesadorAnalisis(db).procesar(analisis)
+    assert analisis.estado == EstadoAnalisis.COMPLETADO
+
+    invocaciones = (await db.execute(
+        select(InvocacionLLM).where(InvocacionLLM.analisis_id == analisis.id).order_by(InvocacionLLM.invocado_at)
+    )).scalars().all()
+    assert len(invocaciones) == 2
+    original, reparada = invocaciones
+    prompts = {
+        p.invocacion_id: p for p in (await db.execute(
+            select(PromptGenerado).where(PromptGenerado.invocacion_id.in_([original.id, reparada.id]))
+        )).scalars()
+    }
+    assert prompts[original.id].cache_key is None
+    clave = prompts[reparada.id].cache_key
+    assert clave
+
+    # Otra réplica / tras reiniciar: caché en memoria vacía, se resuelve contra la base
+    entrada = await LLMCache().buscar(db, {MODELO: clave})
+    assert entrada is not None
+    assert entrada["respuesta_parseada"] == VALIDA
+    assert json.loads(entrada["respuesta_raw"]) == VALIDA
+
+async def test_respuesta_sin_parsear_no_se_sirve(db):
+    """Incluye las filas viejas que guardaron el JSON 'null' en vez de NULL."""
+    for parseada in (None, JSON.NULL):
+        clave = f"clave-{uuid.uuid4()}"
+        invocacion = InvocacionLLM(analisis_id=uuid.uuid4(), modelo_usado=MODELO, exitosa=True, desde_cache=False)
+        db.add(invocacion)
+        await db.flush()
+        db.add_all([
+            PromptGenerado(invocacion_id=invocacion.id, system_prompt="s", user_prompt="u", cache_key=clave),
+            RespuestaLLM(invocacion_id=invocacion.id, respuesta_raw="{roto", respuesta_parseada=parseada),
+        ])
+        await db.commit()
+        assert await LLMCache().buscar(db, {MODELO: clave}) is None
+
+class ClienteReparacionCaida(ClienteReparado):
+    """La respuesta no valida y el re-pedido de reparación se corta con una excepción."""
+    async def reparar(self, modelo, system_prompt, user_prompt, intentos=None):
+        raise RuntimeError("conexión cortada")
+
+async def test_error_no_borra_la_auditoria_ni_el_rollup(db, monkeypatch):
+    monkeypatch.setattr(procesador_analisis, "LLMClient", ClienteReparacionCaida)
+    monkeypatch.setattr(settings, "REGLAS_MODO", "senales")
+    monkeypatch.setattr(settings, "ANALISIS_INCREMENTAL_HABILITADO", False)
+    monkeypatch.setattr(settings, "ESTADISTICAS_HABILITADAS", True)
+
+    proyecto = f"AUDIT-{uuid.uuid4().hex[:8]}"
+    analisis = await AnalisisService(db).crear_analisis(SnapshotCreate(
+        proyecto_codigo=proyecto,
+        datos={"registros_avance": [{"fecha": "2025-01-01", "porcentaje_avance": 10}]}
+    ), estado=EstadoAnalisis.PROCESANDO)
+    await db.commit()
+    analisis = (await db.execute(
+        select(Analisis).options(selectinload(Analisis.snapshot)).where(Analisis.id == analisis.id)
+    )).scalar_one()
+    await ProcesadorAnalisis(db).procesar(analisis)
+
+    estado = (await db.execute(select(Analisis.estado).where(Analisis.id == analisis.id))).scalar_one()
+    assert estado == EstadoAnalisis.ERROR
+    [invocacion] = (await db.execute(
+        select(InvocacionLLM).where(InvocacionLLM.analisis_id == analisis.id)
+    )).scalars().all()
+    assert invocacion.modelo_usado == MODELO
+    assert (await db.execute(
+        select(PromptGenerado.id).where(PromptGenerado.invocacion_id == invocacion.id)
+    )).scalar_one()
+    # La respuesta que no validó es justo la que hay que poder revisar
+    respuesta = (await db.execute(
+        select(RespuestaLLM).where(RespuestaLLM.invocacion_id == invocacion.id)
+    )).scalar_one()
+    assert respuesta.respuesta_parseada is None
+    rollup = (await db.execute(
+        select(EstadisticaDiaria).where(EstadisticaDiaria.proyecto_codigo == proyecto)
+    )).scalar_one()
+    assert (rollup.invocaciones, rollup.analisis_completados) == (1, 0)
@@ -0,0 +1,89 @@
+import json
+import os
+import subprocess
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+from app.services.compactador_snapshot import CompactadorSnapshot, estimar_tokens
+
+SUPERVISORES = ["Ana Gómez", "Bruno Díaz", "Carla Ruiz"]
+OFICIOS = ["Albañilería", "Electricidad", "Plomería", "Herrería"]
+
+def _snapshot(registros: int = 400, etapas: int = 150) -> dict:
+    """Obra grande y repetitiva, armada sin azar."""
+    inicio = date(2024, 1, 1)
+    return {
+        "proyecto": {"codigo": "OBRA-1", "nombre": "Torre", "descripcion": "Memoria descriptiva. " * 40, "vacio": None},
+        "etapas": [
+            {"nombre": f"Etapa {i}", "estado": ("FINALIZADA", "EN_CURSO", "PENDIENTE")[i % 3], "avance_estimado": i % 101}
+            for i in range(etapas)
+        ],
+        "registros_avance": [
+            {
+                "fecha": (inicio + timedelta(days=i)).isoformat(),
+                "supervisor": SUPERVISORES[i % 3] if i % 7 else SUPERVISORES[0],
+                "porcentaje_avance": min(i // 4, 100),
+                "presenta_desvios": i % 11 == 0,
+                "tareas_ejecutadas": [f"Tarea {i % 5}", "Limpieza de obra"],
+                "oficios_activos": OFICIOS[: 1 + i % 4],
+                "observaciones": "Sin novedades relevantes en el frente de trabajo. " * (1 + i % 3),
+            }
+            for i in range(registros)
+        ],
+        "medidas_seguridad": [{"item": f"Medida {i}", "cumple": i % 4 != 0} for i in range(30)],
+        "anexo": ["Plano " + "x" * 300, ""],
+    }
+
+@pytest.mark.parametrize("formato", ["json", "tabla"])
+@pytest.mark.parametrize("presupuesto", [100_000, 6_000, 1_500, 300, 40, 1])
+def test_salida_dentro_del_presupuesto(formato, presupuesto):
+    texto = CompactadorSnapshot(presupuesto, formato).compactar(_snapshot())
+    assert 0 < estimar_tokens(texto) <= presupuesto
+
+def test_reduce_antes_de_cortar():
+    datos = _snapshot()
+    completo = CompactadorSnapshot(100_000).compactar(datos)
+    assert not completo.endswith("…[truncado]")
+    # Justo por debajo de lo completo: alcanza con detallar menos avances, sin cortar el texto
+    reducido = CompactadorSnapshot(estimar_tokens(completo) - 1).compactar(datos)
+    assert not reducido.endswith("…[truncado]")
+    assert len(json.loads(reducido)["avances_recientes"]["filas"]) < len(json.loads(completo)["avances_recientes"]["filas"])
+    # Sin lugar ni para lo mínimo: último recurso, el corte
+    assert CompactadorSnapshot(40).compactar(datos).endswith("…[truncado]")
+
+@pytest.mark.parametrize("formato", ["json", "tabla"])
+def test_mismo_snapshot_mismo_texto(formato):
+    compactador = CompactadorSnapshot(2_000, formato)
+    primero = compactador.compactar(_snapshot())
+    assert CompactadorSnapshot(2_000, formato).compactar(_snapshot()) == primero
+    assert compactador.compactar(json.loads(json.dumps(_snapshot()))) == primero
+
+def test_codigos_de_leyenda_por_frecuencia_y_alfabeticos():
+    datos = _snapshot(registros=21, etapas=0)
+    leyenda = json.loads(CompactadorSnapshot(100_000).compactar(datos))["leyenda"]
+    # 21, 21, 15, 10, 9, 6, 6, 5, 5 y 4 apariciones: los empates van en orden alfabético
+    assert leyenda == {f"~{i + 1}": valor for i, valor in enumerate([
+        "Albañilería", "Limpieza de obra", "Electricidad", "Plomería", "Ana Gómez", "Bruno Díaz", "Carla Ruiz",
+        "Herrería", "Tarea 0", "Tarea 1", "Tarea 2", "Tarea 3", "Tarea 4",
+    ])}
+
+def test_mismo_texto_con_otra_semilla_de_hash(tmp_path):
+    # Sets y Counters no deben filtrar el orden de hash al prompt (la clave de caché depende del texto)
+    entrada = tmp_path / "snapshot.json"
+    entrada.write_text(json.dumps(_snapshot()), encoding="utf-8")
+    programa = (
+        "import json, sys\n"
+        "from app.services.compactador_snapshot import CompactadorSnapshot\n"
+        "datos = json.load(open(sys.argv[1], encoding='utf-8'))\n"
+        "sys.stdout.write(CompactadorSnapshot(2_000, 'tabla').compactar(datos) + CompactadorSnapshot(2_000).compactar(datos))\n"
+    )
+    salidas = {
+        subprocess.run(
+            [sys.executable, "-c", programa, str(entrada)], capture_output=True, check=True,
+            env={**os.environ, "PYTHONHASHSEED": semilla}, cwd=os.path.dirname(os.path.dirname(__file__))
+        ).stdout
+        for semilla in ("1", "2", "3")
+    }
+    assert len(salidas) == 1
@@ -0,0 +1,119 @@
+"""Delta entre snapshots: nombres repetidos en etapas y medidas de seguridad."""
+import copy
+import json
+import uuid
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from app.config.settings import settings
+from app.models.analisis import Analisis, EstadoAnalisis, ModoAnalisis
+from app.schemas.snapshot import SnapshotCreate
+from app.services import procesador_analisis
+from app.services.analisis_service import AnalisisService
+from app.services.delta_snapshot import calcular_delta
+from app.services.procesador_analisis import ProcesadorAnalisis
+from app.services.prompt_builder import PromptBuilder
+
+BASE = {
+    "proyecto": {"codigo": "DUP-1"},
+    "etapas": [{"nombre": "Losa", "estado": "EN_CURSO", "avance_estimado": 40}],
+    "registros_avance": [{"fecha": "2025-01-01", "porcentaje_avance": 10}],
+    "medidas_seguridad": [{"item": "Casco", "cumple": True}, {"item": "Casco", "cumple": True}],
+}
+
+def test_sin_cambios_con_repetidos_es_vacio():
+    assert calcular_delta(BASE, copy.deepcopy(BASE)) == {}
+
+def test_cambio_en_item_repetido_se_detecta():
+    actual = copy.deepcopy(BASE)
+    actual["medidas_seguridad"][1]["cumple"] = False
+    delta = calcular_delta(BASE, actual)
+    assert delta["medidas_seguridad"] == {"modificadas": {"Casco (#2)": {"cumple": [True, False]}}}
+    assert delta["claves_duplicadas"] == ["medidas_seguridad"]
+
+def test_repetido_eliminado_se_detecta():
+    actual = copy.deepcopy(BASE)
+    actual["medidas_seguridad"].pop()
+    delta = calcular_delta(BASE, actual)
+    assert delta["medidas_seguridad"] == {"eliminadas": ["Casco (#2)"]}
+
+def test_etapa_repetida_agregada():
+    actual = copy.deepcopy(BASE)
+    actual["etapas"].append({"nombre": "Losa", "estado": "PENDIENTE", "avance_estimado": 0})
+    delta = calcular_delta(BASE, actual)
+    assert delta["etapas"]["nuevas"] == [actual["etapas"][1]]
+    assert delta["claves_duplicadas"] == ["etapas"]
+
+def test_claves_unicas_no_marcan_duplicados():
+    actual = copy.deepcopy(BASE)
+    actual["etapas"][0]["avance_estimado"] = 60
+    delta = calcular_delta(BASE, actual)
+    assert delta["etapas"] == {"modificadas": {"Losa": {"avance_estimado": [40, 60]}}}
+    assert "claves_duplicadas" not in delta
+
+class ClienteFijo:
+    def __init__(self, *args, **kwargs):
+        self.modelos_fallback = ["modelo/prueba"]
+        self.modelo_exitoso = None
+
+    async def enviar_prompt(self, system_prompt, user_prompt, intentos=None):
+        intentos.append({
+            "modelo": "modelo/prueba", "invocado_at": datetime.utcnow(), "exitosa": True, "ganadora": True,
+            "error": None, "tokens_prompt": 10, "tokens_respuesta": 10, "duracion_ms": 1, "espera_cola_ms": 0
+        })
+        self.modelo_exitoso = "modelo/prueba"
+        contenido = {"resumen": "ok", "score_coherencia": 90, "riesgos": []}
+        return {"choices": [{"message": {"content": json.dumps(contenido)}}]}
+
+async def _procesar(db, proyecto: str, datos: dict) -> Analisis:
+    analisis = await AnalisisService(db).crear_analisis(
+        SnapshotCreate(proyecto_codigo=proyecto, datos=datos), estado=EstadoAnalisis.PROCESANDO
+    )
+    await db.commit()
+    analisis = (await db.execute(
+        select(Analisis).options(selectinload(Analisis.snapshot)).where(Analisis.id == analisis.id)
+    )).scalar_one()
+    await ProcesadorAnalisis(db).procesar(analisis)
+    return analisis
+
+async def test_cambio_en_repetido_no_reutiliza_el_resultado(db, monkeypatch):
+    monkeypatch.setattr(procesador_analisis, "LLMClient", ClienteFijo)
+    monkeypatch.setattr(settings, "REGLAS_MODO", "senales")
+    monkeypatch.setattr(settings, "LLM_CACHE_HABILITADO", False)
+    proyecto = f"DUP-{uuid.uuid4().hex[:8]}"
+
+    primero = await _procesar(db, proyecto, BASE)
+    assert primero.estado == EstadoAnalisis.COMPLETADO
+
+    actual = copy.deepcopy(BASE)
+    actual["medidas_seguridad"][1]["cumple"] = False
+    segundo = await _procesar(db, proyecto, actual)
+    assert segundo.estado == EstadoAnalisis.COMPLETADO
+    assert segundo.modo == ModoAnalisis.COMPLETO
+
+def test_instrucciones_delta_ignoran_items_que_no_son_objetos():
+    datos = copy.deepcopy(BASE)
+    datos["registros_avance"] += ["registro suelto", None, {"fecha": "2025-01-08", "porcentaje_avance": 15}]
+    datos["medidas_seguridad"].append("Arnés")
+    delta = calcular_delta(BASE, datos)
+    assert delta["registros_avance"]["nuevos"][0] == "registro suelto"
+
+    previo = {"resumen": "ok", "score_coherencia": 90, "riesgos": []}
+    _, user = PromptBuilder().construir_instrucciones_delta({"proyecto_codigo": "DUP-1", "datos": datos}, delta, previo)
+    assert "2025-01-08" in user
+    assert "registro suelto" not in user
+
+async def test_item_malformado_en_modo_incremental(db, monkeypatch):
+    monkeypatch.setattr(procesador_analisis, "LLMClient", ClienteFijo)
+    monkeypatch.setattr(settings, "REGLAS_MODO", "senales")
+    monkeypatch.setattr(settings, "LLM_CACHE_HABILITADO", False)
+    monkeypatch.setattr(settings, "ANALISIS_INCREMENTAL_HABILITADO", True)
+    proyecto = f"MAL-{uuid.uuid4().hex[:8]}"
+
+    assert (await _procesar(db, proyecto, BASE)).estado == EstadoAnalisis.COMPLETADO
+    actual = copy.deepcopy(BASE)
+    actual["registros_avance"] += ["registro suelto", {"fecha": "2025-01-08", "porcentaje_avance": 15}]
+    segundo = await _procesar(db, proyecto, actual)
+    assert segundo.estado == EstadoAnalisis.COMPLETADO
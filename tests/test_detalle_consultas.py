@@ -0,0 +1,102 @@
+import json
+import uuid
+
+from sqlalchemy import event, insert
+
+from app.api.v1.endpoints.analisis import obtener_analisis_completo
+from app.db import base as db_base
+from app.models.analisis import (
+    Analisis, SnapshotRecibido, EstadoAnalisis, ResultadoAnalisis, ObservacionGenerada,
+    InvocacionLLM, RespuestaLLM, PromptGenerado, DatoProyecto, DatoEtapa
+)
+
+# Lo que sembramos y /detalle no debe traer sin pedirlo
+PAYLOAD = 200_000
+RESPUESTA_RAW = 20_000
+PROMPTS = 55_000
+
+async def _sembrar(db, etapas: int, observaciones: int, invocaciones: int) -> uuid.UUID:
+    analisis_id, snapshot_id, resultado_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    await db.execute(insert(Analisis), [{"id": analisis_id, "proyecto_codigo": "TEST-DET", "estado": EstadoAnalisis.COMPLETADO}])
+    await db.execute(insert(SnapshotRecibido), [{"id": snapshot_id, "analisis_id": analisis_id, "payload_completo": "p" * PAYLOAD}])
+    await db.execute(insert(DatoProyecto), [{"snapshot_id": snapshot_id, "codigo": "TEST-DET", "nombre": "Obra"}])
+    await db.execute(insert(DatoEtapa), [
+        {"snapshot_id": snapshot_id, "nombre": f"Etapa {i}", "estado": "EN_CURSO", "avance_estimado": i % 100}
+        for i in range(etapas)
+    ])
+    await db.execute(insert(ResultadoAnalisis), [{
+        "id": resultado_id, "analisis_id": analisis_id, "resumen_general": "Resumen",
+        "score_coherencia": 80, "detecta_riesgos": True
+    }])
+    await db.execute(insert(ObservacionGenerada), [
+        {"resultado_id": resultado_id, "titulo": f"Riesgo {i}", "descripcion": "d" * 300, "nivel": "ATENCION"}
+        for i in range(observaciones)
+    ])
+    for _ in range(invocaciones):
+        invocacion_id = uuid.uuid4()
+        await db.execute(insert(InvocacionLLM), [{
+            "id": invocacion_id, "analisis_id": analisis_id, "modelo_usado": "stub/model",
+            "tokens_prompt": 800, "tokens_respuesta": 200
+        }])
+        await db.execute(insert(RespuestaLLM), [{
+            "invocacion_id": invocacion_id, "respuesta_raw": json.dumps({"resumen": "x" * RESPUESTA_RAW}), "respuesta_parseada": {}
+        }])
+        await db.execute(insert(PromptGenerado), [{
+            "invocacion_id": invocacion_id, "system_prompt": "s" * 5_000, "user_prompt": "u" * (PROMPTS - 5_000)
+        }])
+    await db.commit()
+    return analisis_id
+
+async def _medir(analisis_id: uuid.UUID, include: str = None) -> tuple:
+    """(consultas emitidas, bytes que devuelven) por una llamada a /detalle."""
+    sentencias = []
+
+    def capturar(conn, cursor, statement, parameters, context, executemany):
+        sentencias.append((statement, parameters))
+
+    motor = db_base.async_engine.sync_engine
+    event.listen(motor, "before_cursor_execute", capturar)
+    try:
+        async with db_base.AsyncReadSessionLocal() as db:
+            detalle = await obtener_analisis_completo(analisis_id, include=include, db=db)
+    finally:
+        event.remove(motor, "before_cursor_execute", capturar)
+
+    # Re-ejecutamos lo capturado para medir lo que viaja desde la base
+    bytes_traidos = 0
+    async with db_base.async_engine.connect() as conexion:
+        for statement, parameters in sentencias:
+            for fila in (await conexion.exec_driver_sql(statement, parameters)).all():
+                bytes_traidos += sum(len(str(valor)) for valor in fila if valor is not None)
+    return detalle, len(sentencias), bytes_traidos
+
+async def test_detalle_consultas_acotadas_y_sin_textos_grandes(db):
+    analisis_id = await _sembrar(db, etapas=200, observaciones=20, invocaciones=3)
+
+    detalle, consultas, bytes_traidos = await _medir(analisis_id)
+
+    assert detalle.datos_obra.etapas == 200
+    # Una por colección, no una por fila ni un JOIN que las multiplique
+    assert consultas <= 6
+    # Ni el payload del snapshot, ni la respuesta cruda, ni los prompts
+    assert bytes_traidos < 20_000
+
+async def test_detalle_consultas_no_crecen_con_el_tamano(db):
+    chico = await _sembrar(db, etapas=5, observaciones=2, invocaciones=1)
+    grande = await _sembrar(db, etapas=300, observaciones=40, invocaciones=4)
+
+    _, consultas_chico, bytes_chico = await _medir(chico)
+    _, consultas_grande, bytes_grande = await _medir(grande)
+
+    assert consultas_grande == consultas_chico
+    # Crecen las observaciones (~300 B c/u) y las invocaciones; las etapas solo se cuentan
+    assert bytes_grande - bytes_chico < 38 * 400 + 3 * 500
+
+async def test_detalle_prompts_solo_si_se_piden(db):
+    analisis_id = await _sembrar(db, etapas=10, observaciones=2, invocaciones=2)
+
+    _, consultas, bytes_traidos = await _medir(analisis_id)
+    _, consultas_prompts, bytes_prompts = await _medir(analisis_id, include="prompts")
+
+    assert consultas_prompts == consultas + 1
+    assert 2 * PROMPTS <= bytes_prompts - bytes_traidos < 2 * PROMPTS + 2_000
@@ -0,0 +1,122 @@
+import json
+import uuid
+from datetime import datetime
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import selectinload
+
+from app.config.settings import settings
+from app.db import base as db_base
+from app.models.analisis import Analisis, EstadisticaDiaria, EstadoAnalisis
+from app.schemas.snapshot import SnapshotCreate
+from app.services import estadisticas_diarias, procesador_analisis
+from app.services.analisis_service import AnalisisService
+from app.services.procesador_analisis import ProcesadorAnalisis
+
+VALIDA = {
+    "resumen": "Obra en plazo.",
+    "score_coherencia": 70,
+    "riesgos": [
+        {"titulo": "Baranda", "descripcion": "Falta en piso 3.", "nivel": "CRITICO"},
+        {"titulo": "Acopio", "descripcion": "Material a la intemperie.", "nivel": "atencion"},
+    ],
+}
+
+def _intento(modelo: str, ganadora: bool = True) -> dict:
+    return {
+        "modelo": modelo, "invocado_at": datetime.utcnow(), "exitosa": ganadora, "ganadora": ganadora,
+        "error": None if ganadora else "Status 429", "tokens_prompt": 100, "tokens_respuesta": 50,
+        "duracion_ms": 10, "espera_cola_ms": 0
+    }
+
+def cliente(respuestas: list, modelos=("modelo/a",)):
+    """LLMClient falso: cada llamada (envío o reparación) consume la siguiente respuesta de la lista."""
+    class Cliente:
+        def __init__(self, *args, **kwargs):
+            self.modelos_fallback = list(modelos)
+            self.modelo_exitoso = None
+
+        async def enviar_prompt(self, system_prompt, user_prompt, intentos=None):
+            if respuestas[0] is None:
+                respuestas.pop(0)
+                return {"error": {"message": "Cascada sin modelos"}} # ningún intento: marcador "ninguno"
+            for modelo in modelos[:-1]:
+                intentos.append(_intento(modelo, ganadora=False))
+            return await self.reparar(modelos[-1], system_prompt, user_prompt, intentos)
+
+        async def reparar(self, modelo, system_prompt, user_prompt, intentos=None):
+            intentos.append(_intento(modelo))
+            self.modelo_exitoso = modelo
+            return {"choices": [{"message": {"content": respuestas.pop(0)}}]}
+    return Cliente
+
+async def _procesar(db, proyecto: str, datos: dict, analisis_id=None) -> Analisis:
+    if analisis_id is None:
+        analisis = await AnalisisService(db).crear_analisis(
+            SnapshotCreate(proyecto_codigo=proyecto, datos=datos), estado=EstadoAnalisis.PROCESANDO
+        )
+        await db.commit()
+        analisis_id = analisis.id
+    analisis = (await db.execute(
+        select(Analisis).options(selectinload(Analisis.snapshot)).where(Analisis.id == analisis_id)
+        .execution_options(populate_existing=True)
+    )).scalar_one()
+    await ProcesadorAnalisis(db).procesar(analisis)
+    return (await db.execute(
+        select(Analisis).where(Analisis.id == analisis_id).execution_options(populate_existing=True)
+    )).scalar_one()
+
+async def _rollups(db, proyectos: list) -> dict:
+    filas = (await db.execute(
+        select(EstadisticaDiaria).where(EstadisticaDiaria.proyecto_codigo.in_(proyectos))
+        .execution_options(populate_existing=True)
+    )).scalars().all()
+    return {
+        (f.proyecto_codigo, f.dia, f.modelo): {m: getattr(f, m) for m in estadisticas_diarias.METRICAS}
+        for f in filas
+    }
+
+async def test_reconstruir_coincide_con_lo_acumulado_en_vivo(db, monkeypatch):
+    monkeypatch.setattr(settings, "ESTADISTICAS_HABILITADAS", True)
+    monkeypatch.setattr(settings, "REGLAS_MODO", "senales")
+    monkeypatch.setattr(settings, "ANALISIS_INCREMENTAL_HABILITADO", False)
+    monkeypatch.setattr(settings, "LLM_CACHE_HABILITADO", True)
+    monkeypatch.setattr(settings, "LLM_REPARACION_HABILITADA", True)
+    sufijo = uuid.uuid4().hex[:8]
+    fijo, reparado, vacio, retomado = (f"{nombre}-{sufijo}" for nombre in ("FIJO", "REPARA", "NINGUNO", "RETOMA"))
+    datos = {"registros_avance": [{"fecha": "2025-01-01", "porcentaje_avance": 10, "nota": sufijo}]}
+
+    # Cascada con un 429 y la respuesta del segundo modelo; el mismo snapshot otra vez sale de la caché
+    monkeypatch.setattr(procesador_analisis, "LLMClient", cliente([json.dumps(VALIDA)], ("modelo/a", "modelo/b")))
+    assert (await _procesar(db, fijo, datos)).estado == EstadoAnalisis.COMPLETADO
+    assert (await _procesar(db, fijo, datos)).estado == EstadoAnalisis.COMPLETADO
+
+    # Respuesta rota y reparación al mismo modelo
+    otros = {**datos, "medidas_seguridad": [{"item": "Casco", "cumple": True}]}
+    monkeypatch.setattr(procesador_analisis, "LLMClient", cliente(['{"resumen": "roto', json.dumps(VALIDA)]))
+    assert (await _procesar(db, reparado, otros)).estado == EstadoAnalisis.COMPLETADO
+
+    # La cascada no llegó a intentar nada: queda el marcador "ninguno", que no suma
+    monkeypatch.setattr(procesador_analisis, "LLMClient", cliente([None]))
+    assert (await _procesar(db, vacio, {**datos, "etapas": []})).estado == EstadoAnalisis.ERROR
+
+    # Un modelo devolvió algo que no validó y, retomado el análisis, lo completó otro:
+    # el resultado se atribuye al de la respuesta usada, no al primero en orden alfabético
+    monkeypatch.setattr(settings, "LLM_REPARACION_HABILITADA", False)
+    monkeypatch.setattr(procesador_analisis, "LLMClient", cliente(["no es json"], ("modelo/a",)))
+    analisis = await _procesar(db, retomado, {**datos, "proyecto": {"nombre": "Retomado"}})
+    await db.execute(update(Analisis).where(Analisis.id == analisis.id).values(estado=EstadoAnalisis.PROCESANDO, intentos=1))
+    await db.commit()
+    monkeypatch.setattr(procesador_analisis, "LLMClient", cliente([json.dumps(VALIDA)], ("modelo/z",)))
+    assert (await _procesar(db, retomado, None, analisis.id)).estado == EstadoAnalisis.COMPLETADO
+
+    proyectos = [fijo, reparado, vacio, retomado]
+    en_vivo = await _rollups(db, proyectos)
+    assert not any(modelo == "ninguno" for _, _, modelo in en_vivo)
+    assert {(p, m) for p, _, m in en_vivo} == {
+        (fijo, "modelo/a"), (fijo, "modelo/b"), (reparado, "modelo/a"), (retomado, "modelo/a"), (retomado, "modelo/z")
+    }
+
+    async with db_base.async_engine.begin() as conexion:
+        await conexion.run_sync(estadisticas_diarias.reconstruir)
+    assert await _rollups(db, proyectos) == en_vivo
@@ -0,0 +1,33 @@
+import asyncio
+
+from app.config.settings import settings
+from app.services.limitador_llm import LimitadorLLM
+
+def _limitador(monkeypatch, en_vuelo: int) -> LimitadorLLM:
+    monkeypatch.setattr(settings, "LLM_LIMITADOR_HABILITADO", True)
+    monkeypatch.setattr(settings, "LLM_LIMITADOR_COORDINACION", "memoria")
+    monkeypatch.setattr(settings, "LLM_SOLICITUDES_POR_MINUTO", 10_000)
+    monkeypatch.setattr(settings, "LLM_TOKENS_POR_MINUTO", 0)
+    monkeypatch.setattr(settings, "LLM_MAX_EN_VUELO_POR_PROCESO", en_vuelo)
+    return LimitadorLLM()
+
+async def _rafaga(limitador: LimitadorLLM, total: int) -> int:
+    """Máximo de bloques `cupo` abiertos a la vez durante una ráfaga de `total` llamadas."""
+    abiertos, maximo = 0, 0
+
+    async def llamada():
+        nonlocal abiertos, maximo
+        async with limitador.cupo("modelo/prueba", 100):
+            abiertos += 1
+            maximo = max(maximo, abiertos)
+            await asyncio.sleep(0.01)
+            abiertos -= 1
+
+    await asyncio.gather(*(llamada() for _ in range(total)))
+    return maximo
+
+def test_tope_en_vuelo_en_cada_event_loop(monkeypatch):
+    # La instancia es global del proceso: un segundo loop no puede heredar el semáforo del primero
+    limitador = _limitador(monkeypatch, en_vuelo=2)
+    assert asyncio.run(_rafaga(limitador, 8)) == 2
+    assert asyncio.run(_rafaga(limitador, 8)) == 2
@@ -0,0 +1,62 @@
+import logging
+import queue
+import sys
+import threading
+import time
+
+from app.core.logging import EscritorCola, ManejadorCola
+
+class Bloqueado(logging.Handler):
+    """Handler que simula un stdout trabado hasta que se libera."""
+    def __init__(self):
+        super().__init__()
+        self.libre = threading.Event()
+        self.escritos = []
+
+    def emit(self, record):
+        self.libre.wait()
+        self.escritos.append(record.getMessage())
+
+def test_prepare_no_modifica_el_record_original():
+    try:
+        raise ValueError("falla")
+    except ValueError:
+        exc_info = sys.exc_info()
+    args = {"proyecto": "OBRA-1"}
+    record = logging.LogRecord("app", logging.ERROR, __file__, 1, "Análisis de %(proyecto)s", (args,), exc_info)
+
+    preparado = ManejadorCola(queue.Queue()).prepare(record)
+
+    assert preparado is not record
+    assert (preparado.msg, preparado.args, preparado.exc_info) == ("Análisis de OBRA-1", None, None)
+    assert "ValueError: falla" in preparado.exc_text
+    # Otro handler del root (pytest, Sentry) recibe el record tal como lo creó el logger
+    assert (record.msg, record.args, record.exc_info, record.exc_text) == ("Análisis de %(proyecto)s", args, exc_info, None)
+
+def test_detener_con_la_cola_llena_espera_a_que_se_vacie():
+    cola, salida = queue.Queue(maxsize=1), Bloqueado()
+    escritor = EscritorCola(cola, salida)
+    escritor.start()
+    cola.put_nowait(logging.makeLogRecord({"msg": "primero"}))
+    while not cola.empty(): # el hilo tomó el primero y quedó trabado escribiéndolo
+        time.sleep(0.001)
+    cola.put_nowait(logging.makeLogRecord({"msg": "segundo"}))
+
+    threading.Timer(0.1, salida.libre.set).start()
+    escritor.stop()
+
+    assert salida.escritos == ["primero", "segundo"]
+
+def test_detener_con_stdout_trabado_no_cuelga(monkeypatch, capsys):
+    monkeypatch.setattr(EscritorCola, "ESPERA_CIERRE_SEGUNDOS", 0.1)
+    cola, salida = queue.Queue(maxsize=1), Bloqueado()
+    escritor = EscritorCola(cola, salida)
+    escritor.start()
+    cola.put_nowait(logging.makeLogRecord({"msg": "primero"}))
+    while not cola.empty():
+        time.sleep(0.001)
+    cola.put_nowait(logging.makeLogRecord({"msg": "segundo"}))
+
+    escritor.stop()
+    assert "1 records pendientes" in capsys.readouterr().err
+    salida.libre.set()
@@ -0,0 +1,21 @@
+import httpx
+
+from app.core.metrics import etapa
+
+async def test_metrics_expone_formato_prometheus():
+    from app.main import app
+
+    with etapa("prueba_metricas"):
+        pass
+    # Sin lifespan: /metrics no depende de la base ni de los workers
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://api.test") as cliente:
+        assert (await cliente.get("/")).status_code == 200
+        respuesta = await cliente.get("/metrics")
+
+    assert respuesta.status_code == 200
+    assert respuesta.headers["content-type"].startswith("text/plain")
+    cuerpo = respuesta.text
+    assert 'analisis_etapa_segundos_count{etapa="prueba_metricas"} 1.0' in cuerpo
+    # El middleware etiqueta por plantilla de ruta y la solicitud anterior ya quedó contada
+    assert 'http_solicitud_segundos_count{estado="200",metodo="GET",ruta="/"}' in cuerpo
+    assert "http_solicitudes_en_curso" in cuerpo
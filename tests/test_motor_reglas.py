@@ -0,0 +1,185 @@
+import copy
+import json
+import uuid
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from app.config.settings import settings
+from app.models.analisis import Analisis, EstadoAnalisis, InvocacionLLM, ModoAnalisis
+from app.schemas.snapshot import SnapshotCreate
+from app.services import motor_reglas, procesador_analisis
+from app.services.analisis_service import AnalisisService
+from app.services.procesador_analisis import ProcesadorAnalisis
+
+INICIO = date(2025, 1, 1)
+
+@pytest.fixture(autouse=True)
+def umbrales(monkeypatch):
+    """Los valores por defecto, fijos: los casos están armados a distancia conocida de cada umbral."""
+    for nombre, valor in {
+        "REGLAS_MIN_AVANCES": 5, "REGLAS_VENTANA_DESVIOS": 30, "REGLAS_DESVIOS_RATIO_CRITICO": 0.3,
+        "REGLAS_ESTANCAMIENTO_REGISTROS": 10, "REGLAS_SEGURIDAD_RATIO_CRITICO": 0.8,
+        "REGLAS_ETAPA_ATRASO_PP": 25.0, "REGLAS_MARGEN_AMBIGUEDAD": 0.15,
+    }.items():
+        monkeypatch.setattr(settings, nombre, valor)
+
+def _avances(porcentajes: list, desvios=()) -> list:
+    return [
+        {"fecha": (INICIO + timedelta(days=i)).isoformat(), "supervisor": "Ana", "porcentaje_avance": p,
+         "presenta_desvios": i in desvios}
+        for i, p in enumerate(porcentajes)
+    ]
+
+def _medidas(total: int, cumplen: int) -> list:
+    return [{"item": f"Medida {i}", "cumple": i < cumplen} for i in range(total)]
+
+def _snapshot(**cambios) -> dict:
+    """12 registros con avance parejo, etapa en calendario y seguridad al día: ninguna señal."""
+    datos = {
+        "proyecto": {"codigo": "REGLAS-1", "nombre": "Edificio"},
+        "registros_avance": _avances(list(range(5, 65, 5))),
+        "etapas": [{"nombre": "Estructura", "estado": "EN_CURSO", "avance_estimado": 60,
+                    "fecha_inicio": "2025-01-01", "fecha_fin": "2025-01-21"}],
+        "medidas_seguridad": _medidas(5, 5),
+    }
+    datos.update(cambios)
+    return datos
+
+def _niveles(senales: dict) -> dict:
+    return {h["titulo"]: h["nivel"] for h in senales["hallazgos"]}
+
+def test_snapshot_sin_senales_va_por_el_camino_rapido():
+    senales = motor_reglas.evaluar(_snapshot())
+    assert senales["hallazgos"] == []
+    assert senales["score_base"] == 100
+    assert not senales["ambigua"], senales["motivos_ambiguedad"]
+    assert senales["indicadores"]["porcentaje_final"] == 60
+    assert senales["indicadores"]["max_atraso_etapa_pp"] == -5
+
+@pytest.mark.parametrize("cumplen, nivel", [(10, "CRITICO"), (19, "ATENCION")])
+def test_umbral_de_seguridad(cumplen, nivel):
+    senales = motor_reglas.evaluar(_snapshot(medidas_seguridad=_medidas(20, cumplen)))
+    assert _niveles(senales) == {"Medidas de seguridad incumplidas": nivel}
+    assert senales["indicadores"]["ratio_cumplimiento_seguridad"] == round(cumplen / 20, 2)
+    assert not senales["ambigua"]
+
+@pytest.mark.parametrize("desvios, nivel", [({6, 7, 8, 9, 10, 11}, "CRITICO"), ({11}, "ATENCION")])
+def test_umbral_de_desvios_recientes(desvios, nivel):
+    senales = motor_reglas.evaluar(_snapshot(registros_avance=_avances(list(range(5, 65, 5)), desvios)))
+    assert _niveles(senales) == {"Desvíos recientes en el avance": nivel}
+    assert senales["indicadores"]["desvios_ultimos_registros"] == len(desvios)
+
+def test_desvios_fuera_de_la_ventana_son_informativos():
+    senales = motor_reglas.evaluar(_snapshot(registros_avance=_avances(list(range(1, 41)), {0}), etapas=[]))
+    assert _niveles(senales) == {"Desvíos en el historial": "INFORMATIVO"}
+
+@pytest.mark.parametrize("iguales, nivel", [(15, "ATENCION"), (25, "CRITICO")])
+def test_estancamiento(iguales, nivel):
+    senales = motor_reglas.evaluar(_snapshot(registros_avance=_avances([10, 20, 30] + [40] * iguales)))
+    assert senales["indicadores"]["registros_finales_sin_avance"] == iguales - 1
+    assert _niveles(senales)["Obra estancada"] == nivel
+
+def test_retrocesos():
+    senales = motor_reglas.evaluar(_snapshot(registros_avance=_avances([5, 10, 15, 20, 15, 25, 30, 35, 30, 40, 45, 50])))
+    assert senales["indicadores"]["retrocesos"] == 2
+    assert _niveles(senales) == {"Retrocesos en el porcentaje de avance": "ATENCION"}
+
+@pytest.mark.parametrize("avance, nivel", [(40, "ATENCION"), (0, "CRITICO")])
+def test_etapa_atrasada_contra_calendario(avance, nivel):
+    # La referencia es el último registro de avance (12/01), no la fecha de hoy
+    etapa = {"nombre": "Losa", "estado": "EN_CURSO", "avance_estimado": avance,
+             "fecha_inicio": "2024-12-13", "fecha_fin": "2025-01-22"}
+    senales = motor_reglas.evaluar(_snapshot(etapas=[etapa]))
+    # 30 de 40 días transcurridos: 75% esperado
+    assert senales["indicadores"]["max_atraso_etapa_pp"] == 75 - avance
+    assert _niveles(senales) == {"Etapas atrasadas respecto del calendario": nivel}
+
+def test_etapa_finalizada_incompleta():
+    etapa = {"nombre": "Excavación", "estado": "finalizada", "avance_estimado": 80}
+    senales = motor_reglas.evaluar(_snapshot(etapas=[etapa]))
+    assert _niveles(senales) == {"Etapas finalizadas con avance incompleto": "INFORMATIVO"}
+
+def test_score_base_descuenta_por_nivel():
+    senales = motor_reglas.evaluar(_snapshot(
+        medidas_seguridad=_medidas(20, 10),
+        registros_avance=_avances([5, 10, 15, 20, 15, 25, 30, 35, 40, 45, 50, 55], {11}),
+    ))
+    assert sorted(h["nivel"] for h in senales["hallazgos"]) == ["ATENCION", "ATENCION", "CRITICO"]
+    assert senales["score_base"] == 100 - 25 - 10 - 10
+
+@pytest.mark.parametrize("cambios, motivo", [
+    ({"registros_avance": _avances([10, 20, 30])}, "solo 3 registros de avance"),
+    ({"observaciones_director": "Revisar la losa"}, "campos sin reglas: observaciones_director"),
+    ({"medidas_seguridad": [{"item": "Casco", "cumple": True, "comentario": "Dos sin casco"}]}, "campos sin reglas: comentario"),
+    ({"registros_avance": _avances(list(range(5, 55, 5)), {7, 8, 9})}, "desvíos cerca del umbral"),
+    ({"medidas_seguridad": _medidas(10, 9)}, "seguridad cerca del umbral"),
+    ({"registros_avance": _avances([10, 20] + [30] * 11)}, "estancamiento cerca del umbral"),
+])
+def test_ambiguedad_escala_al_llm(cambios, motivo):
+    senales = motor_reglas.evaluar(_snapshot(**cambios))
+    assert senales["ambigua"]
+    assert motivo in senales["motivos_ambiguedad"]
+
+def test_lote_igual_a_evaluar_de_a_uno():
+    lote = [
+        _snapshot(),
+        _snapshot(medidas_seguridad=_medidas(20, 10)),
+        {},
+        _snapshot(registros_avance=_avances([10, 20, 30] + [40] * 25, {26})),
+        "no es un dict",
+        _snapshot(registros_avance=[]),
+    ]
+    hoy = date(2025, 2, 1)
+    assert motor_reglas.evaluar_lote(lote, hoy) == [motor_reglas.evaluar(datos, hoy) for datos in lote]
+
+# --- Decisión en ProcesadorAnalisis: camino rápido o LLM ---
+
+class ClienteContado:
+    llamadas = 0
+
+    def __init__(self, *args, **kwargs):
+        self.modelos_fallback = ["modelo/prueba"]
+        self.modelo_exitoso = None
+
+    async def enviar_prompt(self, system_prompt, user_prompt, intentos=None):
+        ClienteContado.llamadas += 1
+        intentos.append({
+            "modelo": "modelo/prueba", "invocado_at": datetime.utcnow(), "exitosa": True, "ganadora": True,
+            "error": None, "tokens_prompt": 10, "tokens_respuesta": 10, "duracion_ms": 1, "espera_cola_ms": 0
+        })
+        self.modelo_exitoso = "modelo/prueba"
+        return {"choices": [{"message": {"content": json.dumps({"resumen": "ok", "score_coherencia": 90, "riesgos": []})}}]}
+
+async def _procesar(db, datos: dict) -> tuple:
+    analisis = await AnalisisService(db).crear_analisis(
+        SnapshotCreate(proyecto_codigo=f"REGLAS-{uuid.uuid4().hex[:8]}", datos=datos), estado=EstadoAnalisis.PROCESANDO
+    )
+    await db.commit()
+    analisis = (await db.execute(
+        select(Analisis).options(selectinload(Analisis.snapshot)).where(Analisis.id == analisis.id)
+    )).scalar_one()
+    await ProcesadorAnalisis(db).procesar(analisis)
+    modelos = (await db.execute(
+        select(InvocacionLLM.modelo_usado).where(InvocacionLLM.analisis_id == analisis.id)
+    )).scalars().all()
+    return analisis, modelos
+
+@pytest.mark.parametrize("datos, modo, modelo, llamadas", [
+    (_snapshot(medidas_seguridad=_medidas(20, 10)), ModoAnalisis.REGLAS, "reglas_locales", 0),
+    (_snapshot(registros_avance=_avances([10, 20, 30])), ModoAnalisis.COMPLETO, "modelo/prueba", 1),
+], ids=["clara-sin-llm", "ambigua-al-llm"])
+async def test_modo_rapido_decide_si_llama_al_llm(db, monkeypatch, datos, modo, modelo, llamadas):
+    monkeypatch.setattr(procesador_analisis, "LLMClient", ClienteContado)
+    monkeypatch.setattr(ClienteContado, "llamadas", 0)
+    monkeypatch.setattr(settings, "REGLAS_MODO", "rapido")
+    monkeypatch.setattr(settings, "LLM_CACHE_HABILITADO", False)
+    monkeypatch.setattr(settings, "ANALISIS_INCREMENTAL_HABILITADO", False)
+
+    analisis, modelos = await _procesar(db, copy.deepcopy(datos))
+    assert analisis.estado == EstadoAnalisis.COMPLETADO
+    assert analisis.modo == modo
+    assert modelos == [modelo]
+    assert ClienteContado.llamadas == llamadas
@@ -0,0 +1,57 @@
+import json
+import random
+import time
+
+from app.services.parser_incremental import ParserRiesgosIncremental
+
+def _respuesta(riesgos: int, largo_resumen: int = 200) -> dict:
+    return {
+        "resumen": "Obra con \"comillas\", {llaves} y [corchetes] y la palabra riesgos. " + "x" * largo_resumen,
+        "score_coherencia": 72,
+        "riesgos": [
+            {"titulo": f"Riesgo {n}", "descripcion": "Texto con \\ barra y } llave", "nivel": "ATENCION",
+             "detalle": {"etapas": ["Casco", "Techo"]}}
+            for n in range(riesgos)
+        ],
+    }
+
+def _alimentar(texto: str, tamanos) -> tuple:
+    parser, riesgos, pos = ParserRiesgosIncremental(), [], 0
+    while pos < len(texto):
+        paso = next(tamanos)
+        riesgos.extend(parser.alimentar(texto[pos:pos + paso]))
+        pos += paso
+    return parser, riesgos
+
+def test_mismos_riesgos_con_cualquier_particion():
+    esperado = _respuesta(12)
+    texto = "Aquí va el análisis:\n```json\n" + json.dumps(esperado, ensure_ascii=False, indent=2) + "\n```"
+    azar = random.Random(3)
+    for tamanos in ([1], [7], [len(texto)], None):
+        generador = iter(lambda: azar.randint(1, 40), None) if tamanos is None else iter(lambda: tamanos[0], None)
+        parser, riesgos = _alimentar(texto, generador)
+        assert riesgos == esperado["riesgos"]
+        assert parser.texto == texto
+
+def test_riesgos_se_emiten_apenas_cierran():
+    texto = json.dumps(_respuesta(2))
+    corte = texto.index("Riesgo 1")
+    parser = ParserRiesgosIncremental()
+    assert [r["titulo"] for r in parser.alimentar(texto[:corte])] == ["Riesgo 0"]
+    assert [r["titulo"] for r in parser.alimentar(texto[corte:])] == ["Riesgo 1"]
+
+def test_costo_lineal_en_fragmentos_chicos():
+    # Token a token: re-unir el buffer en cada fragmento lo volvía cuadrático
+    def duracion(riesgos: int) -> float:
+        texto = json.dumps(_respuesta(riesgos, largo_resumen=riesgos * 20))
+        mejor = float("inf")
+        for _ in range(3):
+            inicio = time.perf_counter()
+            _, obtenidos = _alimentar(texto, iter(lambda: 4, None))
+            mejor = min(mejor, time.perf_counter() - inicio)
+        assert len(obtenidos) == riesgos
+        return mejor
+
+    # 4 veces el texto: lineal ~4x, el buffer re-unido daba >12x
+    chico, grande = duracion(1000), duracion(4000)
+    assert grande < chico * 7
@@ -0,0 +1,110 @@
+"""Parser de respuestas del LLM: fences, prosa, truncado, llaves sueltas y fuzz."""
+import json
+import random
+
+import pytest
+
+from app.services.parser_respuesta import RespuestaInvalida, decodificar, extraer_objeto_json, parsear_respuesta
+
+VALIDA = {
+    "resumen": "Avance sostenido; desvíos en {mampostería} y \"estructura\".",
+    "score_coherencia": 72,
+    "riesgos": [
+        {"titulo": "Baranda", "descripcion": "Llaves {} y comillas \" escapadas.", "nivel": "CRITICO"},
+        {"titulo": "Estancamiento", "descripcion": "Sin progreso.", "nivel": "ATENCION"},
+    ],
+}
+TEXTO = json.dumps(VALIDA, ensure_ascii=False)
+
+def test_json_limpio():
+    assert parsear_respuesta(TEXTO) == (VALIDA, "directo")
+
+@pytest.mark.parametrize("texto", [
+    f"```json\n{TEXTO}\n```",
+    f"```\n{TEXTO}\n```",
+    f"Aquí va:\n```json\n{TEXTO}\n```\nSaludos.",
+    f"```json\n{TEXTO}", # Fence sin cerrar
+])
+def test_fences(texto):
+    assert parsear_respuesta(texto) == (VALIDA, "extraido")
+
+@pytest.mark.parametrize("texto", [
+    f"Claro, aquí va el análisis:\n{TEXTO}\nCualquier duda, consultar.",
+    f"Resumen {{borrador}} y \"comillas\" en la prosa: {TEXTO} fin {{x}}",
+    f"}} llave de cierre suelta antes {TEXTO}",
+])
+def test_prosa_alrededor(texto):
+    assert parsear_respuesta(texto)[0] == VALIDA
+
+@pytest.mark.parametrize("texto", [
+    f"Nota: use {{placeholder. Resultado: {TEXTO}",
+    f"Plantilla {{{{ sin cerrar \"y comilla: {TEXTO}",
+    f"{{ a {{ b {{ c\n```json\n{TEXTO}\n```",
+])
+def test_llaves_sueltas_sin_cerrar(texto):
+    assert parsear_respuesta(texto)[0] == VALIDA
+
+def test_llave_suelta_caso_minimo():
+    assert extraer_objeto_json('Nota: use {placeholder. Resultado: {"a": 1}') == {"a": 1}
+
+@pytest.mark.parametrize("corte", [1, 10, len(TEXTO) // 2, len(TEXTO) - 3])
+def test_truncado_es_invalido(corte):
+    with pytest.raises(RespuestaInvalida):
+        parsear_respuesta(TEXTO[:corte])
+
+def test_truncado_no_devuelve_un_riesgo_anidado():
+    # Los riesgos completos dentro de un objeto truncado no son "el" objeto de la respuesta
+    truncado = TEXTO[:TEXTO.rindex('{"titulo": "Estancamiento"') + 10]
+    with pytest.raises(RespuestaInvalida, match="objeto JSON completo"):
+        decodificar(truncado)
+
+@pytest.mark.parametrize("texto", [
+    "", "sin json", "[1, 2, 3]", "{" * 20000 + " sin cerrar",
+    pytest.param('{"a":' * 5000 + "x y", id="anidado-mas-alla-del-limite-de-recursion"),
+])
+def test_sin_objeto(texto):
+    with pytest.raises(RespuestaInvalida):
+        parsear_respuesta(texto)
+
+@pytest.mark.parametrize("prosa", [
+    "\n\nEspero que el análisis sirva.",
+    "\n\n(respuesta cortada por límite de tokens) {nota}",
+])
+def test_truncado_seguido_de_prosa_no_devuelve_un_riesgo(prosa):
+    # El error de decodificación ya no cae al final del texto: igual se descarta lo anidado
+    truncado = TEXTO[:TEXTO.rindex('{"titulo": "Estancamiento"') + 10] + prosa
+    with pytest.raises(RespuestaInvalida, match="objeto JSON completo"):
+        decodificar(truncado)
+
+def test_esquema_invalido():
+    with pytest.raises(RespuestaInvalida, match="no cumple el esquema"):
+        parsear_respuesta(json.dumps({"resumen": "x", "score_coherencia": 500, "riesgos": []}))
+
+def _mutar(texto: str, azar: random.Random) -> str:
+    mutaciones = [
+        lambda t: t[:azar.randint(0, len(t))],
+        lambda t: f"Respuesta {{borrador}}: \"{t}\" fin",
+        lambda t: f"```json\n{t}\n```\nNota: revisar {{x}}.",
+        lambda t: "{" * azar.randint(1, 5) + " texto " + t,
+        lambda t: t.replace(",", "", 1),
+        lambda t: t + "}" * azar.randint(1, 3),
+        lambda t: "".join(c for c in t if azar.random() > 0.01),
+        lambda t: '{"a":' * azar.randint(500, 5000) + t[:azar.randint(0, len(t))] + " x y",
+        lambda t: t[:azar.randint(0, len(t))] + "\n\nNota final del modelo.",
+    ]
+    for _ in range(azar.randint(1, 3)):
+        texto = azar.choice(mutaciones)(texto)
+    return texto
+
+def test_fuzz_solo_falla_con_respuesta_invalida():
+    azar = random.Random(1234)
+    recuperadas = 0
+    for _ in range(3000):
+        texto = _mutar(TEXTO, azar)
+        try:
+            contenido, _ = parsear_respuesta(texto)
+        except RespuestaInvalida:
+            continue
+        recuperadas += 1
+        assert set(contenido) == {"resumen", "score_coherencia", "riesgos"}
+    assert recuperadas > 0
@@ -0,0 +1,65 @@
+import uuid
+from datetime import date, datetime
+
+from sqlalchemy import MetaData, insert, select, func, text
+
+from app.config.settings import settings
+from app.db.base import Base
+from app.db.esquema import sincronizar_esquema
+from app.db.particiones import (
+    TABLAS_PARTICIONADAS, convertir_tabla, es_particionada, inicio_mes, nombre_particion, particiones, sumar_meses
+)
+
+def _particiones_en_plan(conexion, tabla: str, mes: date) -> list:
+    """Particiones que toca el EXPLAIN de una consulta acotada a un mes: con poda, solo la de ese mes."""
+    columna = TABLAS_PARTICIONADAS[tabla]
+    plan = conexion.execute(
+        text(f"EXPLAIN SELECT count(*) FROM {tabla} WHERE {columna} >= :desde AND {columna} < :hasta"),
+        {"desde": mes, "hasta": sumar_meses(mes, 1)}
+    ).scalars().all()
+    return sorted({nombre for nombre, _ in particiones(conexion, tabla) if any(nombre in linea for linea in plan)})
+
+def test_sumar_meses_y_nombres():
+    assert sumar_meses(date(2026, 11, 1), 2) == date(2027, 1, 1)
+    assert sumar_meses(date(2026, 1, 1), -1) == date(2025, 12, 1)
+    assert inicio_mes(datetime(2026, 10, 17, 13, 5)) == date(2026, 10, 1)
+    assert nombre_particion("invocacion_llm", date(2027, 1, 1)) == "invocacion_llm_p2027_01"
+
+def test_poda_por_mes_en_esquema_nuevo(postgres):
+    actual = inicio_mes(datetime.utcnow())
+    with postgres.begin() as conexion:
+        sincronizar_esquema(conexion)
+
+    with postgres.connect() as conexion:
+        for tabla in TABLAS_PARTICIONADAS:
+            assert es_particionada(conexion, tabla)
+            for mes in (actual, sumar_meses(actual, settings.AUDITORIA_PARTICIONES_ADELANTE)):
+                assert _particiones_en_plan(conexion, tabla, mes) == [nombre_particion(tabla, mes)]
+
+def test_conversion_de_tablas_comunes_conserva_filas_y_poda(postgres):
+    # Base anterior al particionado: las mismas tablas, comunes
+    legado = MetaData()
+    for tabla in Base.metadata.sorted_tables:
+        tabla.to_metadata(legado)
+    for tabla in TABLAS_PARTICIONADAS:
+        legado.tables[tabla].dialect_options["postgresql"]["partition_by"] = None
+    actual = inicio_mes(datetime.utcnow())
+    viejo = sumar_meses(actual, -3)
+    with postgres.begin() as conexion:
+        legado.create_all(conexion)
+        conexion.execute(insert(legado.tables["invocacion_llm"]), [
+            {"id": uuid.uuid4(), "modelo_usado": "stub/model", "invocado_at": datetime(viejo.year, viejo.month, 15)},
+            {"id": uuid.uuid4(), "modelo_usado": "stub/model", "invocado_at": datetime.utcnow()},
+        ])
+
+    with postgres.begin() as conexion:
+        for tabla in TABLAS_PARTICIONADAS:
+            assert not es_particionada(conexion, tabla)
+            convertir_tabla(conexion, tabla)
+
+    with postgres.connect() as conexion:
+        assert conexion.execute(select(func.count()).select_from(text("invocacion_llm"))).scalar() == 2
+        for tabla in TABLAS_PARTICIONADAS:
+            assert es_particionada(conexion, tabla)
+        assert _particiones_en_plan(conexion, "invocacion_llm", viejo) == [nombre_particion("invocacion_llm", viejo)]
+        assert _particiones_en_plan(conexion, "invocacion_llm", actual) == [nombre_particion("invocacion_llm", actual)]
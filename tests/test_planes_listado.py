@@ -0,0 +1,96 @@
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, text
+
+from app.db.base import Base
+from app.models.analisis import Analisis, EstadoAnalisis, ResultadoAnalisis, ObservacionGenerada
+from app.services.analisis_worker import consulta_reclamo
+from benchmarks.bench_listado import NIVELES, Explain, escenarios, scans_secuenciales
+
+# Índice que cada consulta tiene que usar (el resto solo no debe recorrer tablas)
+ESPERADOS = {
+    "primera_pagina": ["ix_analisis_fecha_id"],
+    "por_proyecto": ["ix_analisis_proyecto_fecha_id"],
+    "proyecto_30_dias_critico": ["ix_analisis_proyecto_fecha_id", "ix_observacion_resultado_nivel"],
+    "pagina_profunda": ["ix_analisis_fecha_id"],
+    "reclamo": ["ix_analisis_estado_fecha"],
+}
+
+def _filas(total: int, proyectos: int, semilla: int = 7) -> tuple:
+    azar = random.Random(semilla)
+    ahora = datetime.utcnow()
+    analisis, resultados, observaciones = [], [], []
+    for _ in range(total):
+        analisis_id, resultado_id = uuid.uuid4(), uuid.uuid4()
+        completado = azar.random() < 0.9
+        analisis.append({
+            "id": analisis_id,
+            "proyecto_codigo": f"PRJ-{azar.randrange(proyectos):05d}",
+            "fecha_solicitud": ahora - timedelta(seconds=azar.randrange(365 * 86400)),
+            "estado": EstadoAnalisis.COMPLETADO if completado else azar.choice(list(EstadoAnalisis)),
+            "intentos": 1
+        })
+        if not completado:
+            continue
+        cantidad = azar.choice([0, 0, 1, 2, 3])
+        resultados.append({
+            "id": resultado_id, "analisis_id": analisis_id, "resumen_general": "Sintético",
+            "score_coherencia": azar.uniform(40, 100), "detecta_riesgos": cantidad > 0
+        })
+        observaciones.extend(
+            {"id": uuid.uuid4(), "resultado_id": resultado_id, "titulo": "Riesgo",
+             "descripcion": "Sintético", "nivel": azar.choice(NIVELES)}
+            for _ in range(cantidad)
+        )
+    return analisis, resultados, observaciones
+
+def _consultas(analisis: list) -> dict:
+    """Las del listado (como las pide el endpoint, con limit+1) y el reclamo de los workers."""
+    ordenadas = sorted(analisis, key=lambda a: (a["fecha_solicitud"], a["id"]), reverse=True)
+    profunda = ordenadas[int(len(ordenadas) * 0.9)]
+    consultas = {
+        nombre: consulta.limit(51)
+        for nombre, consulta in escenarios(analisis[0]["proyecto_codigo"], (profunda["fecha_solicitud"], profunda["id"])).items()
+    }
+    consultas["reclamo"] = consulta_reclamo()
+    return consultas
+
+def _verificar(planes: dict):
+    for nombre, plan in planes.items():
+        assert not scans_secuenciales(plan), (nombre, plan)
+        for indice in ESPERADOS.get(nombre, []):
+            assert any(indice in linea for linea in plan), (nombre, indice, plan)
+
+async def test_planes_usan_los_indices_sqlite(db):
+    analisis, resultados, observaciones = _filas(3_000, proyectos=100)
+    await db.execute(insert(Analisis), analisis)
+    await db.execute(insert(ResultadoAnalisis), resultados)
+    await db.execute(insert(ObservacionGenerada), observaciones)
+    await db.execute(text("ANALYZE"))
+    await db.commit()
+
+    planes = {
+        nombre: [str(f[-1]) for f in (await db.execute(Explain(consulta))).all()]
+        for nombre, consulta in _consultas(analisis).items()
+    }
+    _verificar(planes)
+    # Keyset: la página profunda arranca buscando en el índice, no recorriéndolo
+    assert any(linea.startswith("SEARCH analisis USING INDEX ix_analisis_fecha_id") for linea in planes["pagina_profunda"])
+
+def test_planes_usan_los_indices_postgres(postgres):
+    Base.metadata.create_all(bind=postgres)
+    analisis, resultados, observaciones = _filas(50_000, proyectos=1_000)
+    with postgres.begin() as conexion:
+        conexion.execute(insert(Analisis), analisis)
+        conexion.execute(insert(ResultadoAnalisis), resultados)
+        conexion.execute(insert(ObservacionGenerada), observaciones)
+        conexion.execute(text("ANALYZE"))
+
+    with postgres.connect() as conexion:
+        planes = {
+            nombre: [str(f[-1]) for f in conexion.execute(Explain(consulta)).all()]
+            for nombre, consulta in _consultas(analisis).items()
+        }
+    _verificar(planes)
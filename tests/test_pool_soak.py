@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import text
+
+from app.api.dependencies import get_async_db
+from app.config.settings import settings
+from app.db import base as db_base
+
+POOL_SIZE, MAX_OVERFLOW = 3, 2
+CAPACIDAD = POOL_SIZE + MAX_OVERFLOW
+
+@pytest.fixture
+async def pool_chico(monkeypatch):
+    """Engines nuevos con un pool de CAPACIDAD conexiones y timeout corto."""
+    await db_base.cerrar_engines()
+    monkeypatch.setattr(settings, "DB_POOL_SIZE", POOL_SIZE)
+    monkeypatch.setattr(settings, "DB_MAX_OVERFLOW", MAX_OVERFLOW)
+    monkeypatch.setattr(settings, "DB_POOL_TIMEOUT_SEGUNDOS", 0.5)
+    db_base.crear_engines()
+    yield db_base.async_engine.sync_engine.pool
+    await db_base.cerrar_engines()
+
+async def _fase(concurrencia: int, segundos: float, retencion: float = 0.02) -> dict:
+    """Como bench_pool: cada "request" toma una conexión por get_async_db, hace SELECT 1 y la retiene."""
+    resultados = {"ok": 0, "rechazadas_503": 0, "errores": 0}
+    fin = time.perf_counter() + segundos
+
+    async def cliente():
+        while time.perf_counter() < fin:
+            try:
+                async for db in get_async_db():
+                    await db.execute(text("SELECT 1"))
+                    await asyncio.sleep(retencion)
+                resultados["ok"] += 1
+            except HTTPException as e:
+                resultados["rechazadas_503" if e.status_code == 503 else "errores"] += 1
+            except Exception:
+                resultados["errores"] += 1
+
+    await asyncio.gather(*(cliente() for _ in range(concurrencia)))
+    return resultados
+
+@pytest.mark.slow
+async def test_pool_sin_timeouts_ni_fugas_bajo_capacidad(pool_chico):
+    resultados = await _fase(CAPACIDAD - 1, segundos=2)
+
+    assert resultados["ok"] > 0
+    assert resultados["rechazadas_503"] == 0
+    assert resultados["errores"] == 0
+    assert pool_chico.checkedout() == 0
+
+@pytest.mark.slow
+async def test_pool_se_recupera_tras_sobrecarga(pool_chico):
+    sobrecarga = await _fase(CAPACIDAD * 4, segundos=2, retencion=0.2)
+    # Agotado, responde 503 rápido en vez de colgarse, y no pierde conexiones
+    assert sobrecarga["rechazadas_503"] > 0
+    assert sobrecarga["errores"] == 0
+    assert pool_chico.checkedout() == 0
+
+    recuperacion = await _fase(1, segundos=0.5)
+    assert recuperacion["ok"] > 0
+    assert recuperacion["rechazadas_503"] == 0
+    assert pool_chico.checkedout() == 0
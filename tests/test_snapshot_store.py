@@ -0,0 +1,82 @@
+import uuid
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.orm import selectinload
+
+from app.config.settings import settings
+from app.models.analisis import Analisis, PayloadSnapshot
+from app.schemas.snapshot import SnapshotCreate
+from app.services import snapshot_store
+from app.services.analisis_service import AnalisisService
+from app.services.snapshot_store import guardar_payload, leer_payload
+
+zstd = pytest.param("zstd", marks=pytest.mark.skipif(snapshot_store.zstandard is None, reason="sin zstandard"))
+
+def _datos(marca: str) -> dict:
+    return {
+        "proyecto": {"codigo": marca, "nombre": "Edificio Ñandú", "superficie_m2": 1250.5},
+        "etapas": [{"nombre": "Losa", "avance_estimado": 40, "fechas": {"inicio": "2025-01-01", "fin": None}}],
+        "registros_avance": [{"fecha": "2025-01-02", "porcentaje_avance": 12, "presenta_desvios": False}] * 3,
+    }
+
+def _reordenado(valor):
+    """Mismo contenido con las claves en orden inverso."""
+    if isinstance(valor, dict):
+        return {k: _reordenado(valor[k]) for k in reversed(list(valor))}
+    if isinstance(valor, list):
+        return [_reordenado(v) for v in valor]
+    return valor
+
+async def _filas(db, hash_: str) -> list:
+    return (await db.execute(
+        select(PayloadSnapshot).where(PayloadSnapshot.hash == hash_).execution_options(populate_existing=True)
+    )).scalars().all()
+
+@pytest.mark.parametrize("formato", ["jsonb", zstd])
+async def test_ida_y_vuelta_sin_duplicar(db, formato):
+    datos = _datos(f"STORE-{uuid.uuid4().hex[:8]}")
+    hash_ = await guardar_payload(db, datos, formato)
+    # Mismo contenido en otro orden (y en otro formato): mismo hash, DO NOTHING sobre la fila existente
+    assert await guardar_payload(db, _reordenado(datos), formato) == hash_
+    assert await guardar_payload(db, datos, "zstd" if formato == "jsonb" else "jsonb") == hash_
+    await db.commit()
+
+    [fila] = await _filas(db, hash_)
+    assert fila.formato == formato
+    assert fila.tamano_original == len(snapshot_store.serializar(datos))
+    if formato == "zstd":
+        assert fila.contenido_json is None and len(fila.contenido_zstd) < fila.tamano_original
+    else:
+        assert fila.contenido_zstd is None
+    assert snapshot_store.decodificar(fila) == datos
+
+async def test_analisis_con_el_mismo_snapshot_comparten_payload(db, monkeypatch):
+    monkeypatch.setattr(settings, "SNAPSHOT_ALMACENAMIENTO", "jsonb")
+    datos = _datos(f"STORE-{uuid.uuid4().hex[:8]}")
+    servicio = AnalisisService(db)
+    ids = [
+        (await servicio.crear_analisis(SnapshotCreate(proyecto_codigo="STORE", datos=d))).id
+        for d in (datos, _reordenado(datos))
+    ]
+    await db.commit()
+
+    analisis = (await db.execute(
+        select(Analisis).options(selectinload(Analisis.snapshot)).where(Analisis.id.in_(ids))
+    )).scalars().all()
+    hashes = {a.snapshot.payload_hash for a in analisis}
+    assert len(hashes) == 1
+    assert await db.scalar(select(func.count()).select_from(PayloadSnapshot).where(PayloadSnapshot.hash.in_(hashes))) == 1
+    for a in analisis:
+        assert await leer_payload(db, a.snapshot) == datos
+
+async def test_lectura_del_texto_legado(db, monkeypatch):
+    monkeypatch.setattr(settings, "SNAPSHOT_ALMACENAMIENTO", "texto")
+    datos = _datos(f"STORE-{uuid.uuid4().hex[:8]}")
+    analisis = await AnalisisService(db).crear_analisis(SnapshotCreate(proyecto_codigo="STORE", datos=datos))
+    await db.commit()
+    analisis = (await db.execute(
+        select(Analisis).options(selectinload(Analisis.snapshot)).where(Analisis.id == analisis.id)
+    )).scalar_one()
+    assert analisis.snapshot.payload_hash is None
+    assert await leer_payload(db, analisis.snapshot) == datos
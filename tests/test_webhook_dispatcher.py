@@ -0,0 +1,159 @@
+import asyncio
+import json
+import uuid
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import delete, select, update
+
+from app.config.settings import settings
+from app.models.analisis import Analisis, EstadoAnalisis, EstadoWebhook, WebhookOutbox
+from app.services import http_clients, procesador_analisis
+from app.services.analisis_worker import AnalisisWorker
+from app.services.procesador_analisis import ProcesadorAnalisis
+from app.services.webhook_client import WebhookClient
+from app.services.webhook_dispatcher import DespachadorWebhooks
+from benchmarks.stub_openrouter import crear_app
+
+async def _encolar(db, total: int):
+    """Outbox limpio (la base es compartida entre pruebas) con `total` notificaciones."""
+    await db.execute(delete(WebhookOutbox))
+    for _ in range(total):
+        analisis = Analisis(id=uuid.uuid4(), proyecto_codigo="TEST-WH", estado=EstadoAnalisis.COMPLETADO)
+        db.add(analisis)
+        WebhookClient.encolar_finalizacion(db, analisis)
+    await db.commit()
+
+def _receptor(monkeypatch, **opciones):
+    """Stub en proceso (ASGI) como cliente "webhook" compartido."""
+    stub = crear_app(**opciones)
+    cliente = httpx.AsyncClient(transport=httpx.ASGITransport(app=stub))
+    monkeypatch.setitem(http_clients._clientes, "webhook", cliente)
+    return stub
+
+async def test_lote_lento_sin_perdidas_ni_duplicados(db, monkeypatch):
+    # Un host lento con concurrencia 1: el lote tarda más que un timeout HTTP.
+    # Con el alquiler viejo (2 timeouts fijos) la segunda réplica lo reclamaba a mitad de camino
+    monkeypatch.setattr(settings, "WEBHOOK_URL", "http://receptor.test/webhook")
+    monkeypatch.setattr(settings, "WEBHOOK_LOTE", 10)
+    monkeypatch.setattr(settings, "WEBHOOK_CONCURRENCIA_POR_HOST", 1)
+    monkeypatch.setattr(settings, "WEBHOOK_CONNECT_TIMEOUT_SEGUNDOS", 0.05)
+    monkeypatch.setattr(settings, "WEBHOOK_READ_TIMEOUT_SEGUNDOS", 0.1)
+    stub = _receptor(monkeypatch, latencia_webhook_ms=60)
+    await _encolar(db, 10)
+
+    replica_a, replica_b = DespachadorWebhooks(), DespachadorWebhooks()
+    lote_a = asyncio.create_task(replica_a.despachar_lote())
+    await asyncio.sleep(0.05) # que A reclame primero
+    while not lote_a.done():
+        await replica_b.despachar_lote()
+        await asyncio.sleep(0.05)
+    assert await lote_a == 10
+
+    filas = (await db.execute(select(WebhookOutbox).execution_options(populate_existing=True))).scalars().all()
+    assert len(filas) == 10
+    assert all(f.estado == EstadoWebhook.ENTREGADO and f.intentos == 1 for f in filas)
+    assert stub.state.webhooks_recibidos == {str(f.id): 1 for f in filas}
+
+async def test_reintentos_hasta_entregar_todo(db, monkeypatch):
+    monkeypatch.setattr(settings, "WEBHOOK_URL", "http://receptor.test/webhook")
+    monkeypatch.setattr(settings, "WEBHOOK_BACKOFF_BASE_SEGUNDOS", 0.01)
+    monkeypatch.setattr(settings, "WEBHOOK_BACKOFF_MAX_SEGUNDOS", 0.05)
+    monkeypatch.setattr(settings, "WEBHOOK_MAX_INTENTOS", 50)
+    stub = _receptor(monkeypatch, fallo_webhook_pct=30)
+    await _encolar(db, 12)
+
+    despachador = DespachadorWebhooks()
+    for _ in range(200):
+        await despachador.despachar_lote()
+        pendientes = (await db.execute(
+            select(WebhookOutbox.id).where(WebhookOutbox.estado == EstadoWebhook.PENDIENTE)
+        )).all()
+        if not pendientes:
+            break
+        await asyncio.sleep(0.02)
+
+    filas = (await db.execute(select(WebhookOutbox).execution_options(populate_existing=True))).scalars().all()
+    assert all(f.estado == EstadoWebhook.ENTREGADO for f in filas)
+    assert stub.state.webhooks_recibidos == {str(f.id): 1 for f in filas}
+    # Cada intento quedó contado: las respuestas 503 más la entrega final
+    assert sum(f.intentos for f in filas) == stub.state.solicitudes
+
+async def test_resultado_descartado_si_el_alquiler_cambio_de_manos(db, monkeypatch):
+    monkeypatch.setattr(settings, "WEBHOOK_URL", "http://receptor.test/webhook")
+    _receptor(monkeypatch)
+    await _encolar(db, 1)
+
+    despachador = DespachadorWebhooks()
+    [notificacion] = await despachador._reclamar(db)
+    # Venció el alquiler y otra réplica la reclamó: el vencimiento ya no es el nuestro
+    await db.execute(
+        update(WebhookOutbox)
+        .where(WebhookOutbox.id == notificacion.id)
+        .values(proximo_intento_at=notificacion.proximo_intento_at + timedelta(seconds=30))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+    await despachador._registrar(notificacion, None)
+    fila = (await db.execute(
+        select(WebhookOutbox).where(WebhookOutbox.id == notificacion.id).execution_options(populate_existing=True)
+    )).scalar_one()
+    assert fila.estado == EstadoWebhook.PENDIENTE
+    assert (fila.intentos or 0) == 0
+
+class ClienteFijo:
+    def __init__(self, *args, **kwargs):
+        self.modelos_fallback = ["modelo/prueba"]
+        self.modelo_exitoso = None
+
+    async def enviar_prompt(self, system_prompt, user_prompt, intentos=None):
+        intentos.append({
+            "modelo": "modelo/prueba", "invocado_at": datetime.utcnow(), "exitosa": True, "ganadora": True,
+            "error": None, "tokens_prompt": 10, "tokens_respuesta": 10, "duracion_ms": 1, "espera_cola_ms": 0
+        })
+        self.modelo_exitoso = "modelo/prueba"
+        return {"choices": [{"message": {"content": json.dumps({"resumen": "ok", "score_coherencia": 90, "riesgos": []})}}]}
+
+async def test_iniciar_y_completar_solo_escriben_el_outbox(db, monkeypatch):
+    from app.main import app
+
+    monkeypatch.setattr(settings, "WEBHOOK_URL", "http://receptor.test/webhook")
+    monkeypatch.setattr(settings, "REGLAS_MODO", "senales")
+    monkeypatch.setattr(settings, "LLM_CACHE_HABILITADO", False)
+    monkeypatch.setattr(settings, "ANALISIS_INCREMENTAL_HABILITADO", False)
+    monkeypatch.setattr(procesador_analisis, "LLMClient", ClienteFijo)
+    stub = _receptor(monkeypatch)
+    entregas = []
+    entregar = WebhookClient.entregar
+
+    async def entregar_contando(self, notificacion):
+        entregas.append(notificacion.id)
+        return await entregar(self, notificacion)
+    monkeypatch.setattr(WebhookClient, "entregar", entregar_contando)
+    await db.execute(delete(WebhookOutbox))
+    # La base es compartida: que el reclamo encuentre solo el nuestro
+    await db.execute(update(Analisis).where(Analisis.estado == EstadoAnalisis.PENDIENTE).values(estado=EstadoAnalisis.ERROR))
+    await db.commit()
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://api.test") as cliente:
+        respuesta = await cliente.post(f"{settings.API_V1_STR}/analisis/iniciar", json={
+            "proyecto_codigo": "TEST-WH", "datos": {"registros_avance": [{"fecha": "2025-01-01", "porcentaje_avance": 10}]}
+        })
+    assert respuesta.status_code == 202
+    assert (await db.execute(select(WebhookOutbox.id))).all() == []
+
+    analisis = await AnalisisWorker(concurrencia=1)._reclamar(db)
+    assert str(analisis.id) == respuesta.json()["analisis_id"]
+    await ProcesadorAnalisis(db).procesar(analisis)
+
+    # Completado: la notificación quedó en el outbox, sin ningún intento de entrega en línea
+    [notificacion] = (await db.execute(select(WebhookOutbox).execution_options(populate_existing=True))).scalars().all()
+    assert notificacion.analisis_id == analisis.id
+    assert notificacion.estado == EstadoWebhook.PENDIENTE and not notificacion.intentos
+    assert entregas == [] and stub.state.solicitudes == 0
+
+    # La entrega es cosa del despachador
+    assert await DespachadorWebhooks().despachar_lote() == 1
+    assert entregas == [notificacion.id]
+    assert stub.state.webhooks_recibidos == {str(notificacion.id): 1}